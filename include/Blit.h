@@ -9,22 +9,70 @@
 #include "Constants.h"
 #include "Oscillator.h"
 
+const float leakRadius = 0.999; // pole radius of the leaky integrator
+// The triangle integrates twice, lifting the BpBLIT's tiny spurs near dc by (f/f_spur)^2.
+// Its leak is widened to this fraction of its frequency (in radians per sample), so they are cut instead
+const float triangleLeak = 0.05;
+const uint32_t maxIntegrators = 2;
+
+// Leaky integrator combined with a DC blocker: b = [1, -1], a = [1, -2r, r^2], with the input scaled by gain
+class LeakyIntegrator_t {
+   float gain;
+   float radius;
+   // the state is kept in double precision, the double pole amplifies rounding errors ~10^4 times
+   double xPrev;
+   double w; // output of the first section
+   double y;
+
+   public:
+   LeakyIntegrator_t();
+   void set_gain(float gain);
+   float get_gain();
+   void set_radius(float radius);
+   float get_radius();
+   void prime(double x, double w, double y);
+   void step(float * x, uint32_t n); // in place
+};
+
+// What Blit_t and BpBlit_t work out from a frequency, so it can be done ahead of time and set with set_coeffs
+struct BlitCoeffs_t {
+   OscCoeffs_t lfo;
+   OscCoeffs_t hfo;
+   float m;
+   float dc;
+   float lfoOmega;
+   float freq;          // as it was asked for, before it's limited (the triangle is scaled by it)
+
+   void set_freq(float freq);       // for a BLIT
+   void set_bp_freq(float freq);    // for a BpBLIT
+};
+
 class Blit_t {
-   float lfSin[blockSize];
-   float hfSin[blockSize];
-   float lfCos[blockSize];
-   float hfCos[blockSize];
+   float lfSin[chunkSize];
+   float hfSin[chunkSize];
+   float lfCos[chunkSize];
+   float hfCos[chunkSize];
 
    protected:
    Oscillator_t lfo;
    Oscillator_t hfo;
    float m;
+   float invM;          // 1/m
+   float sinThreshold;  // threshold/m^2, below this |lfSin|^2 the msinc is too close to 0/0
+   float dc;            // mean of the output, removed before integrating
+   float lfoOmega;      // lfo frequency, in radians per sample
+   void set_m(float m);
    void sync_phase(void);
+   void prime(LeakyIntegrator_t * integrators, uint32_t stages);
+   void step_chunk(float * out, uint32_t n);
+   void msinc(float * out, uint32_t n);
+   void step_integrated(float * out, uint32_t n, LeakyIntegrator_t * integrators, uint32_t stages);
 
    public:
    Blit_t();
    void set_freq(float freq);
-   void step(float * out);
+   void set_coeffs(const BlitCoeffs_t * coeffs);
+   void step(float * out, uint32_t n);
 };
 
 class BpBlit_t: public Blit_t {
@@ -32,4 +80,35 @@ class BpBlit_t: public Blit_t {
    void set_freq(float freq);
 };
 
+// The band limited waveforms are integrated BLITs, with the integrator run in the BLIT loop
+class Sawtooth_t: public Blit_t {
+   LeakyIntegrator_t integrator;
+
+   public:
+   Sawtooth_t();
+   void set_freq(float freq);
+   void set_coeffs(const BlitCoeffs_t * coeffs);
+   void step(float * out, uint32_t n);
+};
+
+class Square_t: public BpBlit_t {
+   LeakyIntegrator_t integrator;
+
+   public:
+   Square_t();
+   void set_freq(float freq);
+   void set_coeffs(const BlitCoeffs_t * coeffs);
+   void step(float * out, uint32_t n);
+};
+
+class Triangle_t: public BpBlit_t {
+   LeakyIntegrator_t integrators[maxIntegrators]; // square wave, then the triangle
+
+   public:
+   Triangle_t();
+   void set_freq(float freq);
+   void set_coeffs(const BlitCoeffs_t * coeffs);
+   void step(float * out, uint32_t n);
+};
+
 #endif // BLIT_H_
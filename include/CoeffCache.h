@@ -0,0 +1,46 @@
+/* MXCS Engine Filter Coefficient Cache header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef COEFF_CACHE_H_
+#define COEFF_CACHE_H_
+
+#include <stdint.h>
+
+const uint32_t coeffCacheSets = 64;     // must be a power of 2
+const uint32_t coeffCacheWays = 4;
+const uint32_t freqMantissaBits = 8;    // frequencies are quantised to within 2^-8 (about 7 cents)
+const uint32_t resMantissaBits = 12;
+
+enum BiquadType_e {
+    lowpassBiquad = 0,
+    highpassBiquad = 1
+};
+
+struct CoeffEntry_t {
+    uint32_t freqKey;
+    uint32_t resKey;
+    float samplingFrequency;
+    uint32_t type;
+    uint32_t lastUsed;
+    bool valid;
+    float b[3];
+    float a[3];
+};
+
+// Set associative cache of biquad coefficients, with least recently used eviction
+// keyed on quantised frequency/resonance, and the sampling frequency
+class CoeffCache_t {
+    CoeffEntry_t entries[coeffCacheSets][coeffCacheWays];
+    uint32_t clock;
+    uint32_t hits;
+    uint32_t misses;
+
+    public:
+    CoeffCache_t();
+    const CoeffEntry_t * lookup(BiquadType_e type, float f, float res, float samplingFrequency);
+    uint32_t get_hits();
+    uint32_t get_misses();
+    void clear();
+};
+
+#endif // COEFF_CACHE_H_
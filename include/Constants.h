@@ -6,7 +6,10 @@
 #define CONSTANTS_H
 #include <stdint.h>
 
-const uint8_t blockSize = 128;
+const uint32_t defaultBlockSize = 128;
+const uint32_t maxBlockSize = 8192;
+const uint32_t chunkSize = 128; // size of scratch buffers, longer blocks are processed in chunks
 const uint8_t notes = 128;
+const uint16_t maxVoices = 256;
 
 #endif // CONSTANTS_H
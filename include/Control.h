@@ -0,0 +1,87 @@
+/* MXCS Engine Control header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef CONTROL_H_
+#define CONTROL_H_
+
+// Passing changes from a control thread (UI, network...) to the audio thread without locks.
+// Everything here has exactly one producer (the control thread) and one consumer (the audio thread),
+// and neither side ever waits for the other
+
+#include <atomic>
+#include <stdint.h>
+#include "CoeffCache.h"
+#include "Envelope.h"
+#include "Voice.h"
+
+const uint32_t commandQueueSize = 1024;    // must be a power of 2
+const uint32_t cacheLineSize = 64;
+
+enum CommandType_e {
+    commandParameter = 0,
+    commandPress = 1,
+    commandRelease = 2,
+    commandPatch = 3        // apply the newest patch in the PatchBuffer_t
+};
+
+struct Command_t {
+    uint8_t type;           // CommandType_e
+    uint8_t note;           // for presses and releases
+    uint16_t parameter;     // Parameter_e, for parameter changes
+    float value;
+};
+
+// Wait-free ring of commands
+class CommandQueue_t {
+    Command_t commands[commandQueueSize];
+    // each index is only written by one side, and kept on its own cache line so the sides don't contend
+    alignas(cacheLineSize) std::atomic<uint32_t> head;  // next command to pop, written by the consumer
+    alignas(cacheLineSize) std::atomic<uint32_t> tail;  // next free slot, written by the producer
+
+    public:
+    CommandQueue_t();
+    bool push(Command_t command);       // producer, false if the queue is full
+    bool full() const;                  // producer, a push straight after this succeeds if it's false
+    bool pop(Command_t * command);      // consumer, false if the queue is empty
+};
+
+// Everything a patch sets, with the expensive parts (envelope increments, filter coefficients)
+// worked out by the control thread, so applying it on the audio thread is just copying
+struct SynthPatch_t {
+    EnvelopeSettings_t envelope;
+    float sustain;
+    float modFreq;
+    float modDepth;
+    float lpF;
+    float lpRes;
+    float hpF;
+    float hpRes;
+    float lpB[3];
+    float lpA[3];
+    float hpB[3];
+    float hpA[3];
+    Generator_e generator;
+
+    SynthPatch_t(float samplingFrequency);
+};
+
+// Triple buffered patch: the producer fills in its own slot and swaps it with the shared one,
+// the consumer swaps its slot with the shared one when there is something new there.
+// So the producer can always write, and the consumer always has a complete patch to read
+class PatchBuffer_t {
+    SynthPatch_t slots[3];
+    std::atomic<uint8_t> shared;    // index of the slot in between, with newPatch set if it hasn't been taken
+    uint8_t back;                   // producer's slot
+    uint8_t front;                  // consumer's slot
+    float samplingFrequency;
+    CoeffCache_t cache;             // the producer's own, the consumer's cache isn't thread safe
+
+    public:
+    PatchBuffer_t(float samplingFrequency);
+    SynthPatch_t * edit();          // producer, the slot to fill in
+    void set_filters(SynthPatch_t * patch, float lpF, float lpRes, float hpF, float hpRes);
+    void publish();                 // producer, makes the edited patch the newest
+    const SynthPatch_t * take();    // consumer, the newest patch (the last one taken, if nothing is new)
+};
+
+#endif // CONTROL_H_
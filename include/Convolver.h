@@ -0,0 +1,66 @@
+/* MXCS Core Convolver header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef CONVOLVER_H_
+#define CONVOLVER_H_
+
+#include <stdint.h>
+#include <vector>
+#include "Fft.h"
+
+const uint32_t partitionGrowth = 4;     // non-uniform partitions grow by this factor from one stage to the next
+
+// One stage of uniformly partitioned overlap-save convolution, with a frequency domain delay line.
+// The impulse response is cut into partitions of size samples, and the spectrum of the input is kept for as many
+// partition lengths, so each output is the sum of each past input spectrum times one partition spectrum.
+// It takes its input a block at a time, and transforms once it has size samples.
+// Its output covers the time from the block it transformed on to size samples later,
+// so a stage bigger than the block needs size - block samples of the response in front of it
+class ConvolverStage_t {
+    Fft_t fft;
+    uint32_t size;                  // samples per partition
+    uint32_t partitions;
+    uint32_t bins;
+    std::vector<float> responseRe;  // the spectrum of each partition of the impulse response, bins each
+    std::vector<float> responseIm;
+    std::vector<float> delayRe;     // the frequency domain delay line, the spectra of the last partitions inputs
+    std::vector<float> delayIm;
+    uint32_t newest;                // partition in the delay line holding the latest input
+    std::vector<float> accRe;
+    std::vector<float> accIm;
+    std::vector<float> window;      // the last FFT size input samples, the new ones are filled in at the end
+    uint32_t filled;                // new samples in the window
+    std::vector<float> result;      // the last inverse transform, the output is the last size samples of it
+    uint32_t readIndex;
+
+    void transform();
+
+    public:
+    ConvolverStage_t(const float * response, uint32_t length, uint32_t size);
+    void reset();
+    void step(const float * in, float * out, uint32_t n);   // adds the output to out
+};
+
+// FIR convolution with a long impulse response, a block at a time.
+// The output of each block includes the input from the same block, so there is no latency beyond the block.
+// With uniform partitions (the size of a block) the cost of the frequency domain delay line grows with the
+// number of blocks in the response, so small blocks get expensive. Non-uniform partitions keep the
+// block sized stage at the start of the response, where it's needed for the latency, and cover the rest with
+// stages partitionGrowth times bigger each time, up to maxPartition.
+// Memory is only allocated by configure
+class Convolver_t {
+    std::vector<ConvolverStage_t> stages;
+    std::vector<float> input;       // a copy of the block, so it can be convolved in place
+    uint32_t blockSize;
+
+    public:
+    Convolver_t();
+    // length 0 removes the response. maxPartition of blockSize or less gives uniform partitions
+    void configure(const float * response, uint32_t length, uint32_t blockSize, uint32_t maxPartition = 0);
+    void reset();                   // clears the input, keeping the response
+    bool is_active();
+    uint32_t get_stages();
+    void step(const float * in, float * out);   // one block, in and out can be the same
+};
+
+#endif // CONVOLVER_H_
@@ -7,15 +7,22 @@
 #include <stdint.h>
 
 // could make a template out of this, but implementing specifically for floats now
+// capacity is rounded up to a power of 2, so the memory needs to be capacity(length) long
 class DelayLine_t {
     float * memory;
-    int32_t length;
-    int32_t index;
+    uint32_t length;
+    uint32_t mask;
+    uint32_t index;     // where the next sample will be written, wraps around
 
     public:
-    DelayLine_t(float * memory_, int32_t length);
+    DelayLine_t(float * memory_, uint32_t length);
+    static uint32_t capacity(uint32_t length);
     void insert(float);
     float access(uint32_t delay);
+    float access_linear(float delay);
+    float access_allpass(float delay, float * state);
+    void write(const float * in, uint32_t n);
+    void read(float * out, uint32_t n, uint32_t delay);
 };
 
 #endif // DELAY_LINE_H_
@@ -0,0 +1,59 @@
+/* MXCS Engine C API
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef ENGINE_H_
+#define ENGINE_H_
+
+#include <stddef.h>
+#include <stdint.h>
+#include "Error.h"
+#include "Event.h"
+#include "Patch.h"
+#include "Profile.h"
+#include "RenderCache.h"
+
+// opaque handles, only ever used through the functions below
+typedef struct MxcsEngine_t MxcsEngine_t;
+typedef struct MxcsMidi_t MxcsMidi_t;
+
+extern "C" {
+    MxcsEngine_t * mxcs_create(float samplingFrequency, unsigned int voices, unsigned int blockSize);
+    void mxcs_destroy(MxcsEngine_t * engine);
+    unsigned int mxcs_block_size(MxcsEngine_t * engine);
+    MxcsError_t mxcs_set_parameter(MxcsEngine_t * engine, unsigned int parameter, float value);
+    MxcsError_t mxcs_press(MxcsEngine_t * engine, unsigned int note);
+    MxcsError_t mxcs_release(MxcsEngine_t * engine, unsigned int note);
+    MxcsError_t mxcs_schedule(MxcsEngine_t * engine, const Event_t * events, unsigned int nEvents);
+    MxcsError_t mxcs_flush_events(MxcsEngine_t * engine);
+    unsigned int mxcs_get_time(MxcsEngine_t * engine);
+    MxcsError_t mxcs_step(MxcsEngine_t * engine, float * out, unsigned int blocks);
+    MxcsError_t mxcs_step_pcm(MxcsEngine_t * engine, void * out, unsigned int blocks, unsigned int format);
+    MxcsError_t mxcs_apply_patch(MxcsEngine_t * engine, const Patch_t * patch);
+    MxcsError_t mxcs_set_impulse_response(MxcsEngine_t * engine, const float * response, unsigned int length,\
+                                          unsigned int maxPartition);
+    MxcsError_t mxcs_render(const Patch_t * patch, float samplingFrequency,\
+                            const Event_t * events, unsigned int nEvents,\
+                            float * out, unsigned int n);
+    MxcsError_t mxcs_get_profile(MxcsEngine_t * engine, Profile_t * profile);
+    MxcsError_t mxcs_reset_profile(MxcsEngine_t * engine);
+    MxcsError_t mxcs_set_render_cache(MxcsEngine_t * engine, size_t bytes);
+    MxcsError_t mxcs_get_render_cache_stats(MxcsEngine_t * engine, RenderCacheStats_t * stats);
+    // thread safe control: one other thread can post changes while the engine renders,
+    // they are applied at the start of the next block (everything else must be called from the rendering thread)
+    MxcsError_t mxcs_post_parameter(MxcsEngine_t * engine, unsigned int parameter, float value);
+    MxcsError_t mxcs_post_press(MxcsEngine_t * engine, unsigned int note);
+    MxcsError_t mxcs_post_release(MxcsEngine_t * engine, unsigned int note);
+    MxcsError_t mxcs_post_patch(MxcsEngine_t * engine, const Patch_t * patch);
+    // instruction set used by every engine, see Isa_e
+    unsigned int mxcs_get_isa();
+    MxcsError_t mxcs_set_isa(unsigned int isa);
+    bool mxcs_isa_supported(unsigned int isa);
+    // Standard MIDI File reader, streams the note events in a file
+    MxcsMidi_t * mxcs_midi_create();
+    void mxcs_midi_destroy(MxcsMidi_t * midi);
+    MxcsError_t mxcs_midi_open(MxcsMidi_t * midi, const uint8_t * data, size_t size, float samplingFrequency);
+    MxcsError_t mxcs_midi_read(MxcsMidi_t * midi, Event_t * events, unsigned int n, unsigned int * count);
+    unsigned int mxcs_midi_time(MxcsMidi_t * midi);
+}
+
+#endif // ENGINE_H_
@@ -4,6 +4,10 @@
 #ifndef ENVELOPE_H_
 #define ENVELOPE_H_
 
+#include <stdint.h>
+
+const uint32_t envLanes = 8; // samples calculated at once during a ramp
+
 class EnvelopeSettings_t {
     float samplingFrequency;
     float a;
@@ -18,6 +22,12 @@ class EnvelopeSettings_t {
     float dIncrement;
     float sMag;
     float rIncrement;
+    float aLog;                 // log of each increment, for working out the length of a stage
+    float dLog;
+    float rLog;
+    float aPowers[envLanes];    // increment^(k+1), for ramping several samples at once
+    float dPowers[envLanes];
+    float rPowers[envLanes];
 
     EnvelopeSettings_t(float samplingFrequency);
     void set_attack(float a);
@@ -27,21 +37,25 @@ class EnvelopeSettings_t {
 };
 
 class Envelope_t {
-    void (Envelope_t::*run_state)(void);
+    uint32_t (Envelope_t::*run_state)(float * envelope, uint32_t n);
     EnvelopeSettings_t * settings;
     float amp;
 
-    void run_off();
-    void run_attack();
-    void run_decay();
-    void run_sustain();
-    void run_release();
+    uint32_t ramp_length(float target, float incrementLog, bool rising, uint32_t n);
+    void ramp(float * envelope, uint32_t n, const float * powers);
+    uint32_t run_off(float * envelope, uint32_t n);
+    uint32_t run_attack(float * envelope, uint32_t n);
+    uint32_t run_decay(float * envelope, uint32_t n);
+    uint32_t run_sustain(float * envelope, uint32_t n);
+    uint32_t run_release(float * envelope, uint32_t n);
 
     public:
     Envelope_t(EnvelopeSettings_t * _settings);
-    void step(float * envelope);
+    void step(float * envelope, uint32_t n);
     void press();
     void release();
+    bool is_active();
+    float get_amp();
 };
 
 #endif // ENVELOPE_H_
@@ -6,7 +6,14 @@
 #include <stdint.h>
 
 #define SUCCESS 0
+#define ERROR_INVALID_HANDLE 1
+#define ERROR_INVALID_PARAMETER 2
+#define ERROR_INVALID_VALUE 3
+#define ERROR_OUT_OF_MEMORY 4
+#define ERROR_QUEUE_FULL 5
+#define ERROR_UNSUPPORTED 6
+#define ERROR_INVALID_DATA 7
 
 typedef uint32_t MxcsError_t;
 
-#endif // ERROR_H_
\ No newline at end of file
+#endif // ERROR_H_
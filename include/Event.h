@@ -0,0 +1,20 @@
+/* MXCS Engine Note Events
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef EVENT_H_
+#define EVENT_H_
+
+#include <stdint.h>
+
+enum EventType_e {
+    releaseEvent = 0,
+    pressEvent = 1
+};
+
+struct Event_t {
+    uint32_t time;  // sample the event happens at
+    uint8_t type;   // EventType_e
+    uint8_t note;   // MIDI note
+};
+
+#endif // EVENT_H_
@@ -0,0 +1,29 @@
+/* MXCS Engine Event Queue header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef EVENT_QUEUE_H_
+#define EVENT_QUEUE_H_
+
+#include <stdint.h>
+#include "Event.h"
+
+const uint32_t eventQueueSize = 1024; // must be a power of 2
+
+// Fixed size queue of events, kept sorted by time
+class EventQueue_t {
+    Event_t events[eventQueueSize];
+    uint32_t head;
+    uint32_t count;
+
+    public:
+    EventQueue_t();
+    bool push(Event_t event);
+    bool empty();
+    const Event_t * peek();
+    uint32_t size();
+    const Event_t * at(uint32_t i);     // i events after the earliest
+    void pop();
+    void clear();
+};
+
+#endif // EVENT_QUEUE_H_
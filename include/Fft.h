@@ -0,0 +1,36 @@
+/* MXCS Core FFT header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef FFT_H_
+#define FFT_H_
+
+#include <stdint.h>
+#include <vector>
+
+// Real FFT of a power of 2 size, done as a complex FFT of half the size (radix 2, decimation in time).
+// Spectra are kept with the real and imaginary parts in separate arrays, size/2 + 1 bins of each.
+// All the memory is allocated by set_size, transforms don't allocate
+class Fft_t {
+    uint32_t size;                  // real samples
+    uint32_t half;                  // size of the complex FFT
+    std::vector<uint32_t> reversed; // bit reversed index of each complex sample
+    std::vector<float> twiddleRe;   // for each pass, the twiddles for a span of h are at h - 1
+    std::vector<float> twiddleIm;
+    std::vector<float> inverseIm;   // the conjugate twiddles, for the inverse
+    std::vector<float> splitRe;     // e^(-2 pi i k/size), to split the spectrum of the real signal
+    std::vector<float> splitIm;
+    std::vector<float> workRe;
+    std::vector<float> workIm;
+
+    void transform(bool inverse);
+
+    public:
+    Fft_t(uint32_t size = 2);
+    void set_size(uint32_t size);   // rounded up to a power of 2, at least 2
+    uint32_t get_size();
+    uint32_t bins();
+    void forward(const float * in, float * re, float * im);     // size samples to bins() bins
+    void inverse(const float * re, const float * im, float * out);  // the exact inverse, including the 1/size
+};
+
+#endif // FFT_H_
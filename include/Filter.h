@@ -5,8 +5,13 @@
 #define FILTER_H_
 
 #include <stdint.h>
+#include <complex>
+#include "CoeffCache.h"
 #include "DelayLine.h"
 
+const uint32_t maxSosOrder = 16;
+const uint32_t maxSosSections = maxSosOrder/2;
+
 class IIR_Filter_t {
     protected:
     float * a;
@@ -16,7 +21,7 @@ class IIR_Filter_t {
     public:
     void set_coeffs(float * b, float * a);
     void configure_lp(float frequency, float depth);
-    virtual void step(float * in, float * out) = 0;
+    virtual void step(float * in, float * out, uint32_t n) = 0;
 };
 
 class Filter_DFI_t: public IIR_Filter_t {
@@ -25,7 +30,7 @@ class Filter_DFI_t: public IIR_Filter_t {
     public:
     Filter_DFI_t();
     Filter_DFI_t(float * memory, float * b, float * a, uint32_t order);
-    void step(float * in, float * out);
+    void step(float * in, float * out, uint32_t n);
 };
 
 class Filter_DFII_t: public IIR_Filter_t {
@@ -33,7 +38,7 @@ class Filter_DFII_t: public IIR_Filter_t {
     public:
     Filter_DFII_t();
     Filter_DFII_t(float * memory, float * b, float * a, uint32_t order);
-    void step(float * in, float * out);
+    void step(float * in, float * out, uint32_t n);
 };
 
 class Filter_TDFI_t: public IIR_Filter_t {
@@ -42,7 +47,7 @@ class Filter_TDFI_t: public IIR_Filter_t {
     public:
     Filter_TDFI_t();
     Filter_TDFI_t(float * memory, float * b, float * a, uint32_t order);
-    void step(float * in, float * out);
+    void step(float * in, float * out, uint32_t n);
 };
 
 class Filter_TDFII_t: public IIR_Filter_t {
@@ -50,21 +55,47 @@ class Filter_TDFII_t: public IIR_Filter_t {
     public:
     Filter_TDFII_t();
     Filter_TDFII_t(float * memory, float * b, float * a, uint32_t order);
-    void step(float * in, float * out);
+    void step(float * in, float * out, uint32_t n);
 };
 
+void lowpass_coeffs(float f, float resonance, float samplingFrequency, float * b, float * a);
+void highpass_coeffs(float f, float resonance, float samplingFrequency, float * b, float * a);
+
 class Biquad_Filter_t: public IIR_Filter_t {
     float samplingFrequency;
     float state[2];
     float a[3];
     float b[3];
+    float aTarget[3];       // coefficients to ramp to over the next step
+    float bTarget[3];
+    bool ramping;
+    CoeffCache_t * cache;   // optional, shared between filters
+    void configure(BiquadType_e type, float f, float res, bool ramp);
     public:
-    Biquad_Filter_t(float samplingFrequency);
+    Biquad_Filter_t(float samplingFrequency, CoeffCache_t * cache = nullptr);
     Biquad_Filter_t(float samplingFrequency, float * b, float * a);
-    void step(float * in, float * out);
+    void step(float * in, float * out, uint32_t n);
     void set_coeffs(float * b, float * a);
-    void configure_lowpass(float f, float res);
-    void configure_highpass(float f, float res);
+    void ramp_coeffs(float * b, float * a);    // interpolated to over the next step, instead of changed straight away
+    void configure_lowpass(float f, float res, bool ramp = false);
+    void configure_highpass(float f, float res, bool ramp = false);
+};
+
+// arbitrary order filter, factored into a cascade of second order sections
+class Filter_SOS_t: public IIR_Filter_t {
+    uint32_t sections;
+    float sosB[maxSosSections][3];
+    float sosA[maxSosSections][3];
+    float state[maxSosSections][2];
+
+    public:
+    Filter_SOS_t();
+    Filter_SOS_t(float * b, float * a, uint32_t order);
+    void set_coeffs(float * b, float * a, uint32_t order);
+    void set_zpk(const std::complex<double> * zeros, uint32_t nZeros,\
+                 const std::complex<double> * poles, uint32_t nPoles, double gain);
+    uint32_t get_sections();
+    void step(float * in, float * out, uint32_t n);
 };
 
 #endif // FILTER_H_
@@ -0,0 +1,47 @@
+/* MXCS Core Kernels header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef KERNELS_H_
+#define KERNELS_H_
+
+#include <stdint.h>
+
+// instruction sets the kernels are built for, all in the same library
+enum Isa_e {
+    isaGeneric = 0,     // whatever the compiler targets by default (SSE2 on x86-64)
+    isaAVX2 = 1,        // AVX2 and FMA
+    isaAVX512 = 2,      // AVX-512 (F and VL), AVX2 and FMA
+    isaCount = 3
+};
+
+// The hot loops, one copy per instruction set. Each works on a chunk of samples
+struct Kernels_t {
+    // rotating phasor, see Oscillator_t::step. yrPrev/yjPrev are the previous sample, updated to the last one
+    void (*oscillator)(const float * cosK, const float * sinK, float * yrPrev, float * yjPrev,\
+                       float * yr, float * yj, uint32_t n);
+    // msinc from the oscillator outputs, see Blit_t::msinc
+    void (*msinc)(const float * lfCos, const float * lfSin, const float * hfCos, const float * hfSin,\
+                  float invM, float sinThreshold, float * out, uint32_t n);
+    // transposed direct form II biquad, a[0] is assumed to be 1
+    void (*biquad)(const float * b, const float * a, float * state, const float * in, float * out, uint32_t n);
+    // the same, with the coefficients for sample k at b + (k+1)*bStep, a + (k+1)*aStep
+    void (*biquad_ramp)(const float * b, const float * a, const float * bStep, const float * aStep,\
+                        float * state, const float * in, float * out, uint32_t n);
+    // geometric ramp from start, powers are the increment^(k+1) for each of envLanes samples. Returns the last sample
+    float (*ramp)(const float * powers, float start, float * out, uint32_t n);
+    void (*multiply)(float * out, const float * in, uint32_t n);     // out *= in
+    void (*accumulate)(float * out, const float * in, uint32_t n);   // out += in
+    // complex multiply accumulate, acc += x*h, with the real and imaginary parts in separate arrays
+    void (*complex_mac)(float * accRe, float * accIm, const float * xRe, const float * xIm,\
+                        const float * hRe, const float * hIm, uint32_t n);
+};
+
+extern const Kernels_t * kernels;   // the best kernels this CPU supports, picked when the library is loaded
+
+bool isa_supported(Isa_e isa);
+Isa_e get_isa();
+bool set_isa(Isa_e isa);            // override the choice (e.g. for benchmarking), false if the CPU doesn't support it
+Isa_e best_isa();
+const char * isa_name(Isa_e isa);
+
+#endif // KERNELS_H_
@@ -0,0 +1,50 @@
+/* MXCS Standard MIDI File reader header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef MIDI_H_
+#define MIDI_H_
+
+#include <stddef.h>
+#include <stdint.h>
+#include "Error.h"
+#include "Event.h"
+
+const uint32_t maxMidiTracks = 256;
+const uint32_t defaultTempo = 500000;   // microseconds per quarter note, until there's a tempo event
+
+// read position in one track chunk
+struct MidiTrack_t {
+    const uint8_t * pos;
+    const uint8_t * end;
+    uint64_t tick;          // of the next event
+    uint8_t runningStatus;  // 0 when there isn't one
+    bool done;
+};
+
+// Reads note events from a Standard MIDI File (format 0, 1 or 2) in memory, a few at a time,
+// with the tracks merged into time order and the ticks converted to samples with the tempo map.
+// The data isn't copied, so it needs to outlive the reader
+class MidiReader_t {
+    MidiTrack_t tracks[maxMidiTracks];
+    uint32_t nTracks;
+    double samplingFrequency;
+    uint16_t ticksPerQuarter;   // 0 for SMPTE time, which ignores tempo events
+    double samplesPerTick;
+    uint64_t tempoTick;         // tick and sample of the last tempo change
+    double tempoSample;
+    uint32_t time;              // sample of the last event read, of any kind
+    MxcsError_t error;
+
+    bool next_delta(MidiTrack_t * track);
+    bool step_track(MidiTrack_t * track, Event_t * event);
+    bool to_samples(uint64_t tick, uint32_t * sample);
+
+    public:
+    MidiReader_t();
+    MxcsError_t open(const uint8_t * data, size_t size, float samplingFrequency);
+    MxcsError_t read(Event_t * events, uint32_t n, uint32_t * count);
+    uint32_t get_time();
+    uint32_t get_tracks();
+};
+
+#endif // MIDI_H_
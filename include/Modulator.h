@@ -4,17 +4,21 @@
 #ifndef MODULATOR_H_
 #define MODULATOR_H_
 
+#include <stdint.h>
 #include "Oscillator.h"
 
 class Modulator_t {
     float samplingFrequency;
+    float targetRatio;
+    bool ramping;
     public:
     Oscillator_t lfo;
     float modRatio;
 
     Modulator_t(float samplingFrequency);
     void set_freq(float frequency);
-    void step(float * signal);
+    void ramp_ratio(float ratio);   // interpolated to over the next step, instead of changed straight away
+    void step(float * signal, uint32_t n);
 };
 
 #endif // MODULATOR_H_
@@ -4,20 +4,33 @@
 #ifndef OSCILLATOR_H
 #define OSCILLATOR_H
 
+#include <stdint.h>
+
+const uint32_t oscLanes = 8; // samples calculated at once from the same starting sample
+const uint32_t renormInterval = 128; // samples between power normalisations
+
+// The rotations for a frequency, worked out ahead of time so an oscillator can be retuned with a copy
+struct OscCoeffs_t {
+    float rotR[oscLanes];   // cos((k+1)*theta)
+    float rotJ[oscLanes];   // sin((k+1)*theta)
+
+    void set_freq(float f);
+};
+
 // Two channels in and out, only control over phase/magnitude is through starting impulse
 class Oscillator_t {
-    float c;        // cos(theta)
-    float s;        // sin(theta)
+    OscCoeffs_t rot;
     float yrPrev;   // yr[n-1]
     float yjPrev;   // yj[n-1]
 
     public:
     Oscillator_t();
     void set_freq(float f);
+    void set_coeffs(const OscCoeffs_t * coeffs);
     float get_phase();
     void adjust_phase(float phase);
-    void step(float * cosOut, float * sinOut);
-    void step(float * out);
+    void step(float * cosOut, float * sinOut, uint32_t n);
+    void step(float * out, uint32_t n);
 };
 
 #endif
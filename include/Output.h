@@ -0,0 +1,35 @@
+/* MXCS Core PCM Output header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef OUTPUT_H_
+#define OUTPUT_H_
+
+#include <stdint.h>
+
+enum SampleFormat_e {
+    formatFloat32 = 0,
+    formatInt16 = 1,
+    formatInt24 = 2,    // packed, 3 bytes per sample, little endian
+    formatInt32 = 3
+};
+
+const uint32_t ditherSeed = 2463534242u;
+
+uint32_t sample_bytes(SampleFormat_e format);
+
+// Converts float samples (full scale is +/-1) to integer PCM, clipped to the range of the format.
+// 16 and 24 bit samples get TPDF dither of +/-1 LSB. 32 bit samples don't need it,
+// float32 only has 24 bits of mantissa so there's no quantisation below it to decorrelate
+class PcmOutput_t {
+    uint32_t state;     // xorshift32, for the dither
+    bool dither;
+
+    float tpdf();
+
+    public:
+    PcmOutput_t();
+    void set_dither(bool dither);
+    void convert(const float * in, uint8_t * out, uint32_t n, SampleFormat_e format);
+};
+
+#endif // OUTPUT_H_
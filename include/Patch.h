@@ -0,0 +1,43 @@
+/* MXCS Engine Parameters and Patches
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef PATCH_H_
+#define PATCH_H_
+
+#include <stdint.h>
+
+enum Parameter_e {
+    paramAttack = 0,
+    paramDecay = 1,
+    paramSustain = 2,
+    paramRelease = 3,
+    paramModFreq = 4,
+    paramModDepth = 5,
+    paramLpfFreq = 6,
+    paramLpfRes = 7,
+    paramHpfFreq = 8,
+    paramHpfRes = 9,
+    paramGenerator = 10,
+    paramStealPolicy = 11,
+    paramSmoothing = 12,    // time constant (in seconds) for changes to continuous parameters, 0 for none
+    paramDither = 13        // 1 to dither 16 and 24 bit output, 0 to just round
+};
+
+// all the settings needed to configure an engine in one go
+struct Patch_t {
+    float attack;
+    float decay;
+    float sustain;
+    float release;
+    float modFreq;
+    float modDepth;
+    float lpfFreq;
+    float lpfRes;
+    float hpfFreq;
+    float hpfRes;
+    uint32_t generator;
+    uint32_t voices;
+    uint32_t blockSize;     // 0 for the default block size
+};
+
+#endif // PATCH_H_
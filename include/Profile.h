@@ -0,0 +1,87 @@
+/* MXCS Core Profiling header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef PROFILE_H_
+#define PROFILE_H_
+
+#include <stdint.h>
+
+// stages of Synth_t::step, in order
+enum ProfileStage_e {
+    stageVoices = 0,    // events and voices
+    stageMod = 1,
+    stageLpf = 2,
+    stageHpf = 3,
+    stageConvolver = 4,
+    profileStages = 5
+};
+
+const float loadBlocks = 32;    // the load is averaged over roughly this many blocks
+
+// read out through mxcs_get_profile, so it's kept C compatible
+struct Profile_t {
+    uint64_t lastCycles[profileStages];     // cycles each stage took in the last block
+    uint64_t totalCycles[profileStages];    // since the last reset
+    uint64_t blocks;                        // blocks run since the last reset
+    float load;         // % of the time available for a block that was used, averaged over recent blocks
+    float peakLoad;     // highest single block load
+    uint32_t overruns;  // blocks that took longer than the time available
+};
+
+#ifdef SYNTH_PROFILE_
+#include <chrono>
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#endif
+
+static inline uint64_t profile_cycles() {
+    // the time stamp counter on x86, the virtual counter on arm (a fixed rate timer, rather than cycles)
+#if defined(__x86_64__) || defined(__i386__)
+    return __rdtsc();
+#elif defined(__aarch64__)
+    uint64_t ticks;
+    __asm__ volatile("mrs %0, cntvct_el0" : "=r"(ticks));
+    return ticks;
+#else
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+#endif
+}
+
+// Counts the cycles spent in each stage, and how much of the time available each block uses
+class Profiler_t {
+    Profile_t profile;
+    uint64_t stageStart;
+    std::chrono::steady_clock::time_point blockStart;
+
+    public:
+    Profiler_t();
+    void reset();
+    void start_block() {
+        blockStart = std::chrono::steady_clock::now();
+        stageStart = profile_cycles();
+    }
+    void end_stage(ProfileStage_e stage) {
+        uint64_t now = profile_cycles();
+        profile.lastCycles[stage] = now - stageStart;
+        profile.totalCycles[stage] += now - stageStart;
+        stageStart = now;
+    }
+    void end_block(float deadline);
+    const Profile_t * get_profile();
+};
+
+#else
+// Profiling compiled out, every call is empty so nothing is left in the hot path
+class Profiler_t {
+    public:
+    void reset() {}
+    void start_block() {}
+    void end_stage(ProfileStage_e) {}
+    void end_block(float) {}
+    const Profile_t * get_profile() { return nullptr; }
+};
+
+#endif // SYNTH_PROFILE_
+
+#endif // PROFILE_H_
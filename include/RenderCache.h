@@ -0,0 +1,78 @@
+/* MXCS Core Render Cache header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef RENDER_CACHE_H_
+#define RENDER_CACHE_H_
+
+#include <stddef.h>
+#include <stdint.h>
+#include <list>
+#include <memory>
+#include <unordered_map>
+#include <vector>
+
+const uint32_t renderAmpStride = 128;   // samples between the envelope amplitudes kept with a note
+
+// Everything a voice's output depends on, from the press until it goes quiet
+// (the envelope by its increments, so they compare the same whichever way they were set)
+struct RenderKey_t {
+    float aIncrement;
+    float dIncrement;
+    float sMag;
+    float rIncrement;
+    uint32_t generator;
+    uint32_t note;
+    uint32_t gate;      // samples from the press to the release
+
+    bool operator==(const RenderKey_t & other) const;
+};
+
+struct RenderKeyHash_t {
+    size_t operator()(const RenderKey_t & key) const;
+};
+
+// A voice's output for one note, before the modulation and filters
+struct RenderedNote_t {
+    std::vector<float> samples;
+    std::vector<float> amps;    // envelope amplitude every renderAmpStride samples, for stealing the quietest voice
+};
+
+// read out through mxcs_get_render_cache_stats, so it's kept C compatible
+struct RenderCacheStats_t {
+    uint64_t hits;
+    uint64_t misses;        // rendered and recorded
+    uint64_t bypasses;      // notes that couldn't be cached (see Synth_t::press_note)
+    uint64_t evictions;
+    uint64_t bytes;         // held by the cached notes
+    uint32_t entries;
+};
+
+// Rendered notes, least recently used are evicted to keep them within a budget of bytes.
+// Notes are shared with the voices playing them, so evicting one doesn't cut it off.
+// Allocates as notes are recorded, so it's for rendering offline rather than in real time
+class RenderCache_t {
+    struct Entry_t {
+        RenderKey_t key;
+        std::shared_ptr<const RenderedNote_t> note;
+        size_t bytes;
+    };
+    std::list<Entry_t> entries;     // most recently used first
+    std::unordered_map<RenderKey_t, std::list<Entry_t>::iterator, RenderKeyHash_t> index;
+    size_t budget;
+    RenderCacheStats_t stats;
+
+    void evict(size_t budget);
+
+    public:
+    RenderCache_t();
+    void set_budget(size_t bytes);  // 0 turns it off
+    bool is_enabled();
+    bool fits(size_t samples);
+    std::shared_ptr<const RenderedNote_t> lookup(const RenderKey_t & key);   // nullptr on a miss
+    void insert(const RenderKey_t & key, std::shared_ptr<RenderedNote_t> note);
+    void bypass();
+    void clear();
+    const RenderCacheStats_t * get_stats();
+};
+
+#endif // RENDER_CACHE_H_
@@ -0,0 +1,27 @@
+/* MXCS Core Parameter Smoother header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef SMOOTHER_H_
+#define SMOOTHER_H_
+
+#include <stdint.h>
+
+// One pole smoothing of a control value towards its target, worked out once per block.
+// The value covers a fixed fraction of the distance each block, and snaps to the target once it's within threshold
+class Smoother_t {
+    float value;
+    float target;
+    float decay;        // fraction of the distance left after each block, 0 jumps straight to the target
+    float threshold;
+
+    public:
+    Smoother_t(float value, float threshold);
+    void set_time(float time, float samplingFrequency, uint32_t blockSize);    // time constant, in seconds
+    void set_target(float target);
+    void jump(float value);     // straight to value, without smoothing
+    bool is_settled();
+    float step();               // moves on one block, returns the value at the end of it
+    float get_value();
+};
+
+#endif // SMOOTHER_H_
@@ -5,29 +5,104 @@
 #define SYNTH_H_
 
 #include <stdint.h>
+#include <vector>
 #include "Constants.h"
+#include "Control.h"
+#include "Convolver.h"
+#include "Error.h"
+#include "Event.h"
+#include "EventQueue.h"
 #include "Voice.h"
 #include "Modulator.h"
+#include "Output.h"
+#include "CoeffCache.h"
 #include "Filter.h"
+#include "Patch.h"
+#include "Profile.h"
+#include "RenderCache.h"
+#include "Smoother.h"
 
-// Defining a monophonic synth for now
+const uint16_t defaultVoices = 16;
+
+enum StealPolicy_e {
+    stealOldest = 0,
+    stealQuietest = 1
+};
+
+// Polyphonic synth, with a fixed pool of voices
 class Synth_t {
     float samplingFrequency;
     EnvelopeSettings_t envelopeSettings;
     Generator_e generator;
-    Voice_t voice;
+    std::vector<Voice_t> voices;
+    uint16_t voiceCount;
+    StealPolicy_e stealPolicy;
+    int16_t noteVoices[notes];      // voice playing each note, or noVoice
+    uint8_t voiceNotes[maxVoices];  // note played by each voice
+    uint16_t freeVoices[maxVoices]; // stack of idle voices
+    uint16_t freeCount;
+    int16_t olderVoices[maxVoices]; // active voices are kept in a doubly linked list,
+    int16_t newerVoices[maxVoices]; // ordered from oldest to newest press
+    int16_t oldestVoice;
+    int16_t newestVoice;
+    float voiceBuffer[chunkSize];   // voices are mixed a chunk at a time
     Modulator_t mod;
+    CoeffCache_t coeffCache;        // shared by the filters, so sweeps mostly avoid recalculating
     Biquad_Filter_t lpFilter;
     float lpF;
     float lpRes;
     Biquad_Filter_t hpFilter;
     float hpF;
     float hpRes;
+    float smoothingTime;            // time constant for the continuous parameters, 0 for none
+    Smoother_t modFSmoother;
+    Smoother_t modDepthSmoother;
+    Smoother_t sustainSmoother;     // dB
+    Smoother_t lpFSmoother;         // octaves (log2 Hz), so sweeps are even in pitch
+    Smoother_t lpResSmoother;
+    Smoother_t hpFSmoother;
+    Smoother_t hpResSmoother;
+    Convolver_t convolver;          // after the filters, when there's an impulse response
+    std::vector<float> impulseResponse; // kept to reconfigure the convolver when the block size changes
+    uint32_t maxPartition;
     float frequencyTable[notes];
-    uint8_t currentNote;
+    NoteCoeffs_t noteCoeffs[notes]; // so pressing a note only copies its generator's settings
+    EventQueue_t events;
+    CommandQueue_t commands;        // from the control thread, applied at the start of each block
+    PatchBuffer_t patches;
+    uint32_t sampleCount;           // time at the start of the next block
+    uint32_t blockSize;
+    Profiler_t profiler;            // empty unless built with SYNTH_PROFILE_
+    PcmOutput_t output;
+    std::vector<float> pcmBlock;    // a block before it's converted, by step_pcm
+    std::vector<float> partBlock;   // the start of the next block, run early by flush_events
+    uint32_t partOffset;            // how much of it has been run
+    bool blockStarted;              // the commands and smoothing for the next block have been applied
+    RenderCache_t renderCache;      // off unless it's given a budget
+    RenderKey_t recordKeys[maxVoices];      // what each recording voice is rendering
+    uint32_t recordVersions[maxVoices];     // settingsVersion when it was pressed
+    uint32_t settingsVersion;       // changed with anything the voices' output depends on
+
+    int16_t allocate_voice();
+    int16_t steal_voice();
+    void link_voice(int16_t voice);
+    void unlink_voice(int16_t voice);
+    void free_voice(int16_t voice);
+    void mix_voices(float * out, uint32_t n);
+    void press_note(uint8_t note, uint32_t gate);
+    uint32_t scheduled_gate(const Event_t * press);
+    void apply_event(const Event_t * event);
+    void apply_commands();
+    void apply_patch(const SynthPatch_t * patch);
+    bool smoothing_settled();
+    void update_smoothers();
+    void smooth_parameters();
+    void start_block();
+    uint32_t run_events(float * out, uint32_t offset);
 
     public:
-    Synth_t(float _samplingFrequency);
+    Synth_t(float _samplingFrequency, uint16_t _voiceCount = defaultVoices,\
+            uint32_t _blockSize = defaultBlockSize);
     void set_attack(float a);
     void set_decay(float d);
     void set_sustain(float s);
@@ -39,9 +114,35 @@ class Synth_t {
     void set_hpf_freq(float freq);
     void set_hpf_res(float res);
     void set_generator(Generator_e gen);
+    void set_steal_policy(StealPolicy_e policy);
+    void set_smoothing(float time);
+    void set_dither(bool dither);
+    // allocates, so not for the audio thread. length 0 removes it
+    void set_impulse_response(const float * response, uint32_t length, uint32_t maxPartition);
+    MxcsError_t set_parameter(uint32_t parameter, float value);
+    // caches the output of scheduled notes, see press_note. 0 bytes turns it off (and empties it)
+    void set_render_cache(size_t bytes);
+    const RenderCacheStats_t * get_render_cache_stats();
+    uint16_t get_active_voices();
+    void set_block_size(uint32_t size);
+    uint32_t get_block_size();
     void press(uint8_t note);
     void release(uint8_t note);
+    bool schedule(Event_t event);
+    uint32_t get_time();
+    // Applies the events queued for the next block, so more can be queued for it. Shouldn't be followed by
+    // a change of block size before the next step
+    void flush_events();
     void step(float * out);
+    void step_pcm(uint8_t * out, SampleFormat_e format);    // the same, converted to format after the filters
+    // Can be called from one other (control) thread while step runs, they are applied at the start of the next block.
+    // They never wait, and return ERROR_QUEUE_FULL if the audio thread has fallen behind
+    MxcsError_t post_parameter(uint32_t parameter, float value);
+    MxcsError_t post_press(uint8_t note);
+    MxcsError_t post_release(uint8_t note);
+    MxcsError_t post_patch(const Patch_t * patch);
+    const Profile_t * get_profile();    // nullptr without SYNTH_PROFILE_
+    void reset_profile();
 
     #ifdef SYNTH_TEST_
     float * get_freq_table();
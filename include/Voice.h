@@ -4,14 +4,31 @@
 
 #ifndef VOICE_H_
 #define VOICE_H_
+#include <memory>
 #include "Blit.h"
 #include "Envelope.h"
 #include "Oscillator.h"
+#include "RenderCache.h"
+#include "Wavetable.h"
 
 enum Generator_e {
     sine = 0,
     blit = 1,
-    bpblit = 2
+    bpblit = 2,
+    sawtooth = 3,
+    square = 4,
+    triangle = 5,
+    wavetable = 6
+};
+
+// Every generator's settings for a note, worked out when the synth is made so a press doesn't need any trig
+struct NoteCoeffs_t {
+    OscCoeffs_t sine;
+    BlitCoeffs_t blit;              // the sawtooth's too
+    BlitCoeffs_t bpBlit;            // the square's and triangle's too
+    WavetableCoeffs_t wavetable;
+
+    void set_freq(float f);
 };
 
 class Voice_t {
@@ -19,13 +36,32 @@ class Voice_t {
     Oscillator_t osc;
     Blit_t blitOsc;
     BpBlit_t bpBlitOsc;
+    Sawtooth_t sawtoothOsc;
+    Square_t squareOsc;
+    Triangle_t triangleOsc;
+    Wavetable_t wavetableOsc;
     Generator_e * generator;
+    const NoteCoeffs_t * coeffs;    // of the note being played
+    uint32_t configured;            // a bit for each generator set to the note, they're set when they're first run
+    std::shared_ptr<const RenderedNote_t> playback;     // a cached note, played instead of rendering
+    uint32_t playIndex;
+    std::shared_ptr<RenderedNote_t> recording;          // the note being rendered, for the cache
+
+    void play_cached(float * out, uint32_t n);
+    void configure(Generator_e gen);
 
     public:
     Voice_t(EnvelopeSettings_t * settings, Generator_e * generator);
-    void step(float * out);
-    void press(float f);
+    void step(float * out, uint32_t n);
+    void press(const NoteCoeffs_t * note);
+    void play(std::shared_ptr<const RenderedNote_t> note);  // instead of press, the release is already in it
+    void record(uint32_t expectedLength);                   // after press, keeps the output until it finishes
+    std::shared_ptr<RenderedNote_t> take_recording();
+    bool is_playing();
+    bool is_recording();
     void release();
+    bool is_active();
+    float get_amp();
 };
 
 #endif // define VOICE_H_
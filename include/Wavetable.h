@@ -0,0 +1,48 @@
+/* MXCS Core Wavetable header
+   copyright Maximilian Cornwell 2024
+*/
+#ifndef WAVETABLE_H_
+#define WAVETABLE_H_
+
+#include <stdint.h>
+
+const uint32_t tableBits = 11;
+const uint32_t tableSize = 1 << tableBits;
+const uint32_t mipLevels = 10;                  // one per octave
+const uint32_t maxHarmonics = tableSize/4;      // harmonics in the first level, kept well below the table's nyquist
+                                                // so the images from the linear interpolation are small
+const float maxHarmonicFreq = 0.4;              // highest harmonic a level may put out, same as the BLIT
+
+// Band limited sawtooths, level l has maxHarmonics >> l harmonics.
+// Read only once built, so a single set is shared by every voice
+struct SawTables_t {
+    float levels[mipLevels][tableSize + 1];    // the last sample repeats the first, for interpolation
+
+    SawTables_t();
+};
+
+const SawTables_t * saw_tables();
+
+// What Wavetable_t works out from a frequency, so it can be done ahead of time and set with set_coeffs
+struct WavetableCoeffs_t {
+    uint32_t increment;
+    uint32_t level;
+
+    void set_freq(float freq);
+};
+
+// Phase accumulator oscillator, reading the sawtooth level with the most harmonics that won't alias
+class Wavetable_t {
+    const SawTables_t * tables;
+    const float * table;
+    uint32_t phase;         // a full turn is 2^32
+    uint32_t increment;
+
+    public:
+    Wavetable_t(const SawTables_t * tables = saw_tables());
+    void set_freq(float freq);
+    void set_coeffs(const WavetableCoeffs_t * coeffs);
+    void step(float * out, uint32_t n);
+};
+
+#endif // WAVETABLE_H_
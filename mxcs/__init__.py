@@ -0,0 +1,8 @@
+''' MXCS Engine Python interface
+    copyright Maximilian Cornwell 2024 '''
+from mxcs.library import MxcsError
+from mxcs.engine import Engine, Generator, Isa, Parameter, SampleFormat, StealPolicy, get_isa, pcm_buffer, set_isa, \
+    supported_isas
+from mxcs.batch import BatchResult, make_events, make_patches, render_batch
+from mxcs.midi import MidiReader, read_midi
+from mxcs.render import RenderStats, WavWriter, load_patch, load_score, render_to_wav
@@ -0,0 +1,49 @@
+''' Command line interface to the engine
+    copyright Maximilian Cornwell 2024
+
+    python -m mxcs render patch.json score.json out.wav     # stream a score into a WAV file
+    python -m mxcs render patch.json score.mid out.wav      # or a Standard MIDI File
+    '''
+import argparse
+import sys
+
+from mxcs.engine import SampleFormat
+from mxcs.render import default_chunk, default_tail, load_patch, load_score, render_to_wav
+
+
+def render(args: argparse.Namespace) -> int:
+    ''' Render a score with a patch into a WAV file, and report the throughput '''
+    patch = load_patch(args.patch)
+    events, duration = load_score(args.score, args.fs, args.tail)
+    if args.duration is not None:
+        duration = args.duration
+    stats = render_to_wav(args.output, patch, events, round(duration*args.fs), args.fs, args.chunk,
+                          SampleFormat[args.format.upper()])
+    print(f'Rendered {stats.samples/args.fs:.1f} s of audio in {stats.seconds:.2f} s '
+          f'({stats.realtime_factor:.0f}x real time)')
+    return 0
+
+
+def main(argv: list = None) -> int:
+    ''' Run a command, returns the exit status '''
+    parser = argparse.ArgumentParser(prog='python -m mxcs', description='MXCS synthesiser engine')
+    commands = parser.add_subparsers(dest='command', required=True)
+    render_parser = commands.add_parser('render', help='stream a score into a WAV file')
+    render_parser.add_argument('patch', help='patch settings, as JSON')
+    render_parser.add_argument('score', help='events, as JSON or a Standard MIDI File (.mid)')
+    render_parser.add_argument('output', help='WAV file to write')
+    render_parser.add_argument('--fs', type=int, default=48000, help='sampling frequency (Hz)')
+    render_parser.add_argument('--duration', type=float,
+                               help='seconds to render, by default the duration in the score')
+    render_parser.add_argument('--tail', type=float, default=default_tail,
+                               help='seconds to render after the last event (or the end of a MIDI file), '
+                               'if the score has no duration')
+    render_parser.add_argument('--chunk', type=int, default=default_chunk, help='samples rendered at a time')
+    render_parser.add_argument('--format', choices=[sample_format.name.lower() for sample_format in SampleFormat],
+                               default='float32', help='sample format of the WAV file, integers are dithered')
+    render_parser.set_defaults(run=render)
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
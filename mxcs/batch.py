@@ -0,0 +1,67 @@
+''' Renders many patches at once across a pool of threads
+    copyright Maximilian Cornwell 2024 '''
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from mxcs.library import engine_lib, event_dtype, patch_dtype, PRESS_EVENT, RELEASE_EVENT
+
+
+default_patch = {'attack': 0.01, 'decay': 0.1, 'sustain': -6, 'release': 0.1,
+                 'mod_freq': 0, 'mod_depth': 0,
+                 'lpf_freq': 20000, 'lpf_res': -3,
+                 'hpf_freq': 20, 'hpf_res': -3,
+                 'generator': 0, 'voices': 16, 'block_size': 128}
+
+
+class BatchResult(NamedTuple):
+    ''' Output of render_batch '''
+    out: np.ndarray      # one row per patch
+    timings: np.ndarray  # seconds spent rendering each patch
+
+
+def make_patches(count: int, **fields) -> np.ndarray:
+    ''' Create an array of patches. Fields override the defaults, and can be scalars or arrays '''
+    patches = np.zeros(count, dtype=patch_dtype)
+    for name, value in (default_patch | fields).items():
+        patches[name] = value
+    return patches
+
+
+def make_events(presses: Sequence, press_notes: Sequence, releases: Sequence, release_notes: Sequence) -> np.ndarray:
+    ''' Build a time sorted event array from press and release times (in samples) '''
+    events = np.zeros(len(presses) + len(releases), dtype=event_dtype)
+    events['time'] = np.concatenate([presses, releases])
+    events['type'] = np.concatenate([np.full(len(presses), PRESS_EVENT), np.full(len(releases), RELEASE_EVENT)])
+    events['note'] = np.concatenate([press_notes, release_notes])
+    return events[np.argsort(events['time'], kind='stable')]
+
+
+def render_batch(patches: np.ndarray, events: np.ndarray | Sequence[np.ndarray],
+                 n_samples: int, sampling_frequency: float, workers: int | None = None) -> BatchResult:
+    ''' Render each patch with its own events (or one event array shared by all patches).
+        Each patch is rendered with its own engine in a worker thread. ctypes releases the GIL
+        for the duration of each render, so the renders run in parallel. '''
+    patches = np.ascontiguousarray(patches, dtype=patch_dtype)
+    if isinstance(events, np.ndarray):
+        events = len(patches)*[events]
+    if len(events) != len(patches):
+        raise ValueError(f'{len(events)} event arrays given for {len(patches)} patches')
+    events = [np.ascontiguousarray(e, dtype=event_dtype) for e in events]
+    out = np.empty((len(patches), n_samples), dtype=np.single)
+    timings = np.empty(len(patches))
+
+    def render(index: int) -> None:
+        start = time.perf_counter()
+        engine_lib.mxcs_render(patches[index:index+1], sampling_frequency,
+                               events[index], len(events[index]),
+                               out[index], n_samples)
+        timings[index] = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        # consume the results so exceptions from the workers are raised here
+        list(executor.map(render, range(len(patches))))
+    return BatchResult(out, timings)
@@ -0,0 +1,270 @@
+''' Streaming interface to a persistent engine instance
+    copyright Maximilian Cornwell 2024 '''
+from enum import IntEnum
+import threading
+
+import numpy as np
+
+from mxcs.library import engine_lib, event_dtype, patch_dtype, profile_dtype, profile_stages, render_cache_dtype, \
+    PRESS_EVENT, RELEASE_EVENT
+
+
+class Parameter(IntEnum):
+    ''' Engine parameters, matches Parameter_e '''
+    ATTACK = 0
+    DECAY = 1
+    SUSTAIN = 2
+    RELEASE = 3
+    MOD_FREQ = 4
+    MOD_DEPTH = 5
+    LPF_FREQ = 6
+    LPF_RES = 7
+    HPF_FREQ = 8
+    HPF_RES = 9
+    GENERATOR = 10
+    STEAL_POLICY = 11
+    SMOOTHING = 12      # time constant (in seconds) for changes to the continuous parameters, 0 for none
+    DITHER = 13         # 1 (the default) to dither 16 and 24 bit output, 0 to just round
+
+
+class Generator(IntEnum):
+    ''' Voice generator types, matches Generator_e '''
+    SINE = 0
+    BLIT = 1
+    BP_BLIT = 2
+    SAWTOOTH = 3
+    SQUARE = 4
+    TRIANGLE = 5
+    WAVETABLE = 6
+
+
+class StealPolicy(IntEnum):
+    ''' Voice stealing policies, matches StealPolicy_e '''
+    OLDEST = 0
+    QUIETEST = 1
+
+
+class SampleFormat(IntEnum):
+    ''' Output sample formats, matches SampleFormat_e '''
+    FLOAT32 = 0
+    INT16 = 1
+    INT24 = 2   # packed little endian, 3 bytes per sample
+    INT32 = 3
+
+
+# numpy types of the samples, 24 bit samples are rows of 3 bytes
+sample_dtypes = {SampleFormat.FLOAT32: np.dtype(np.single), SampleFormat.INT16: np.dtype(np.int16),
+                 SampleFormat.INT24: np.dtype(np.uint8), SampleFormat.INT32: np.dtype(np.int32)}
+sample_bytes = {SampleFormat.FLOAT32: 4, SampleFormat.INT16: 2, SampleFormat.INT24: 3, SampleFormat.INT32: 4}
+
+
+def pcm_buffer(samples: int, sample_format: SampleFormat) -> np.ndarray:
+    ''' An uninitialised array to render samples into, shaped (samples, 3) for 24 bit samples '''
+    sample_format = SampleFormat(sample_format)
+    shape = (samples, 3) if sample_format == SampleFormat.INT24 else samples
+    return np.empty(shape, dtype=sample_dtypes[sample_format])
+
+
+class Isa(IntEnum):
+    ''' Instruction sets the DSP kernels are built for, matches Isa_e '''
+    GENERIC = 0
+    AVX2 = 1
+    AVX512 = 2
+
+
+def get_isa() -> Isa:
+    ''' Instruction set the kernels are running with, the best one the CPU supports unless overridden '''
+    return Isa(engine_lib.mxcs_get_isa())
+
+
+def set_isa(isa: Isa) -> None:
+    ''' Override the instruction set (e.g. to benchmark each one), for every engine.
+        Raises MxcsError if the CPU doesn't support it. Shouldn't be changed while rendering '''
+    engine_lib.mxcs_set_isa(isa)
+
+
+def supported_isas() -> list:
+    ''' Instruction sets this CPU can run '''
+    return [isa for isa in Isa if engine_lib.mxcs_isa_supported(isa)]
+
+
+class Engine:
+    ''' A persistent engine, rendered incrementally block by block.
+        State is kept between calls, so a score can be rendered in pieces.
+        Rendering and everything else should happen on one thread, except the post_ methods,
+        which can be called from other threads while it renders. '''
+    _handle = None
+
+    def __init__(self, sampling_frequency: float, voices: int = 16, block_size: int = 128):
+        ''' block_size is clamped to 1-8192 samples, the block_size attribute has the actual value '''
+        if not sampling_frequency > 0:
+            raise ValueError('sampling_frequency should be positive')
+        self.sampling_frequency = sampling_frequency
+        self._handle = engine_lib.mxcs_create(sampling_frequency, voices, block_size)
+        if not self._handle:
+            raise MemoryError('Unable to allocate engine')
+        self.block_size = engine_lib.mxcs_block_size(self._handle)
+        # the engine's control queue only takes one producer at a time
+        self._post_lock = threading.Lock()
+
+    def close(self) -> None:
+        ''' Free the engine, it can't be used afterwards '''
+        if self._handle:
+            engine_lib.mxcs_destroy(self._handle)
+            self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def set(self, parameter: Parameter, value: float) -> None:
+        ''' Set a single parameter '''
+        engine_lib.mxcs_set_parameter(self._handle, parameter, value)
+
+    def configure(self, **parameters: float) -> None:
+        ''' Set parameters by name, e.g. configure(attack=0.1, lpf_freq=1000) '''
+        for name, value in parameters.items():
+            self.set(Parameter[name.upper()], value)
+
+    def apply_patch(self, patch: np.ndarray) -> None:
+        ''' Apply every setting in a patch (see mxcs.batch.make_patches), except the number of voices '''
+        engine_lib.mxcs_apply_patch(self._handle, np.atleast_1d(np.asarray(patch, dtype=patch_dtype)))
+
+    def set_impulse_response(self, response: np.ndarray, max_partition: int = 0) -> None:
+        ''' Convolve the output with an impulse response (e.g. a cabinet or a room), after the filters.
+            It adds no latency. Partitions are the size of a block, unless max_partition is bigger,
+            when they grow from a block up to max_partition samples, which is cheaper for small blocks
+            and long responses. An empty response removes it. Allocates, so it shouldn't be called while
+            rendering in real time '''
+        response = np.ascontiguousarray(response, dtype=np.single).ravel()
+        engine_lib.mxcs_set_impulse_response(self._handle, response, len(response), max_partition)
+
+    def press(self, note: int) -> None:
+        ''' Press a MIDI note '''
+        engine_lib.mxcs_press(self._handle, note)
+
+    def release(self, note: int) -> None:
+        ''' Release a MIDI note '''
+        engine_lib.mxcs_release(self._handle, note)
+
+    @property
+    def time(self) -> int:
+        ''' Time (in samples) at the start of the next block '''
+        return engine_lib.mxcs_get_time(self._handle)
+
+    def schedule(self, events: np.ndarray) -> None:
+        ''' Queue events (see mxcs.batch.make_events) to happen on particular samples.
+            Times are in samples since the engine was created. '''
+        events = np.ascontiguousarray(events, dtype=event_dtype)
+        engine_lib.mxcs_schedule(self._handle, events, len(events))
+
+    def flush_events(self) -> None:
+        ''' Apply the events scheduled for the next block, so that more can be scheduled for it.
+            Only event_queue_size events fit in the queue, this is for blocks with more than that.
+            The voices are run up to the last of them, those samples are the start of the next block rendered '''
+        engine_lib.mxcs_flush_events(self._handle)
+
+    def schedule_press(self, note: int, time: int) -> None:
+        ''' Press a MIDI note on a particular sample '''
+        self.schedule(np.array([(time, PRESS_EVENT, note)], dtype=event_dtype))
+
+    def schedule_release(self, note: int, time: int) -> None:
+        ''' Release a MIDI note on a particular sample '''
+        self.schedule(np.array([(time, RELEASE_EVENT, note)], dtype=event_dtype))
+
+    def render(self, out: np.ndarray) -> np.ndarray:
+        ''' Render into a preallocated, contiguous float32 array (no copies are made).
+            The size of out needs to be a multiple of the block size. '''
+        blocks, remainder = divmod(out.size, self.block_size)
+        if remainder:
+            raise ValueError(f'Output size ({out.size}) is not a multiple of the block size ({self.block_size})')
+        engine_lib.mxcs_step(self._handle, out, blocks)
+        return out
+
+    def render_pcm(self, out: np.ndarray, sample_format: SampleFormat) -> np.ndarray:
+        ''' Render into a preallocated, contiguous array of samples in sample_format (see pcm_buffer),
+            converted by the engine as it renders. Integer samples are clipped to full scale,
+            and 16 and 24 bit samples are dithered unless Parameter.DITHER is 0 '''
+        sample_format = SampleFormat(sample_format)
+        if out.dtype != sample_dtypes[sample_format]:
+            raise TypeError(f'{sample_format.name} samples need a {sample_dtypes[sample_format]} array, '
+                            f'not {out.dtype}')
+        samples, remainder = divmod(out.nbytes, sample_bytes[sample_format])
+        if remainder:
+            raise ValueError(f'Output ({out.nbytes} bytes) is not a whole number of {sample_format.name} samples')
+        blocks, remainder = divmod(samples, self.block_size)
+        if remainder:
+            raise ValueError(f'Output size ({samples}) is not a multiple of the block size ({self.block_size})')
+        if sample_format == SampleFormat.FLOAT32:
+            engine_lib.mxcs_step(self._handle, out, blocks)
+        else:
+            engine_lib.mxcs_step_pcm(self._handle, out, blocks, sample_format)
+        return out
+
+    def render_blocks(self, blocks: int, sample_format: SampleFormat = SampleFormat.FLOAT32) -> np.ndarray:
+        ''' Render a number of blocks into a new array '''
+        return self.render_pcm(pcm_buffer(blocks*self.block_size, sample_format), sample_format)
+
+    def post_set(self, parameter: Parameter, value: float) -> None:
+        ''' Set a parameter from another thread, at the start of the next block rendered.
+            Never waits for the rendering thread, raises MxcsError (ERROR_QUEUE_FULL) if it has fallen behind '''
+        with self._post_lock:
+            engine_lib.mxcs_post_parameter(self._handle, parameter, value)
+
+    def post_press(self, note: int) -> None:
+        ''' Press a MIDI note from another thread, at the start of the next block '''
+        with self._post_lock:
+            engine_lib.mxcs_post_press(self._handle, note)
+
+    def post_release(self, note: int) -> None:
+        ''' Release a MIDI note from another thread, at the start of the next block '''
+        with self._post_lock:
+            engine_lib.mxcs_post_release(self._handle, note)
+
+    def post_patch(self, patch: np.ndarray) -> None:
+        ''' Apply a patch from another thread, at the start of the next block. It's worked out on this thread,
+            so the rendering thread only has to swap it in '''
+        with self._post_lock:
+            engine_lib.mxcs_post_patch(self._handle, np.atleast_1d(np.asarray(patch, dtype=patch_dtype)))
+
+    def profile(self) -> dict:
+        ''' Stage timings (in cycles) and CPU load (as a % of the time available per block) since the last reset.
+            Raises MxcsError (ERROR_UNSUPPORTED) unless the engine was built with SYNTH_PROFILE_ '''
+        profile = np.zeros(1, dtype=profile_dtype)
+        engine_lib.mxcs_get_profile(self._handle, profile)
+        return profile_to_dict(profile[0])
+
+    def reset_profile(self) -> None:
+        ''' Clear the stage timings, load and overrun count '''
+        engine_lib.mxcs_reset_profile(self._handle)
+
+    def set_render_cache(self, budget: int) -> None:
+        ''' Cache the output of notes, up to budget bytes (0 turns it off and empties it).
+            A scheduled note is cached if its release has already been scheduled when it's pressed,
+            and it gets an idle voice. Repeats of it (same envelope, generator, note and gate length)
+            play back the first one before the modulation and filters, instead of being rendered again.
+            The oscillators start at the phase they had the first time, and changes to the envelope or generator
+            while a repeat plays don't affect it. Least recently used notes are evicted to stay within the budget.
+            Recording notes allocates, so it's for rendering offline '''
+        engine_lib.mxcs_set_render_cache(self._handle, budget)
+
+    def render_cache_stats(self) -> dict:
+        ''' Hits, misses, bypasses (notes that couldn't be cached) and evictions, and the entries and bytes held '''
+        stats = np.zeros(1, dtype=render_cache_dtype)
+        engine_lib.mxcs_get_render_cache_stats(self._handle, stats)
+        return {name: int(stats[0][name]) for name in render_cache_dtype.names}
+
+
+def profile_to_dict(profile: np.void) -> dict:
+    ''' Unpack a profile_dtype record, with the cycle counts keyed by stage '''
+    return {'last_cycles': dict(zip(profile_stages, profile['last_cycles'].tolist())),
+            'total_cycles': dict(zip(profile_stages, profile['total_cycles'].tolist())),
+            'blocks': int(profile['blocks']),
+            'load': float(profile['load']),
+            'peak_load': float(profile['peak_load']),
+            'overruns': int(profile['overruns'])}
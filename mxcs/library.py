@@ -0,0 +1,124 @@
+''' Loads the engine library and declares its C API
+    copyright Maximilian Cornwell 2024 '''
+import ctypes
+import os
+
+import numpy as np
+
+
+SUCCESS = 0
+ERROR_INVALID_HANDLE = 1
+ERROR_INVALID_PARAMETER = 2
+ERROR_INVALID_VALUE = 3
+ERROR_OUT_OF_MEMORY = 4
+ERROR_QUEUE_FULL = 5
+ERROR_UNSUPPORTED = 6
+ERROR_INVALID_DATA = 7
+
+error_messages = {ERROR_INVALID_HANDLE: 'invalid engine handle',
+                  ERROR_INVALID_PARAMETER: 'invalid parameter',
+                  ERROR_INVALID_VALUE: 'invalid value',
+                  ERROR_OUT_OF_MEMORY: 'out of memory',
+                  ERROR_QUEUE_FULL: 'event or command queue full',
+                  ERROR_UNSUPPORTED: 'not supported by this build of the engine',
+                  ERROR_INVALID_DATA: 'invalid or corrupt data'}
+
+
+class MxcsError(RuntimeError):
+    ''' Raised when the engine returns an error code '''
+    def __init__(self, code: int):
+        super().__init__(error_messages.get(code, f'engine error {code}'))
+        self.code = code
+
+
+def check(result: int, func, args) -> int:
+    ''' ctypes errcheck hook, turns error codes into exceptions '''
+    if result != SUCCESS:
+        raise MxcsError(result)
+    return result
+
+
+# matches Patch_t
+patch_dtype = np.dtype([('attack', np.single), ('decay', np.single),
+                        ('sustain', np.single), ('release', np.single),
+                        ('mod_freq', np.single), ('mod_depth', np.single),
+                        ('lpf_freq', np.single), ('lpf_res', np.single),
+                        ('hpf_freq', np.single), ('hpf_res', np.single),
+                        ('generator', np.uint32), ('voices', np.uint32),
+                        ('block_size', np.uint32)], align=True)
+
+# matches Event_t
+event_dtype = np.dtype([('time', np.uint32), ('type', np.uint8), ('note', np.uint8)], align=True)
+RELEASE_EVENT = 0
+PRESS_EVENT = 1
+event_queue_size = 1024     # matches eventQueueSize, events that can be scheduled ahead of the engine
+
+# matches Profile_t, stages in the order of ProfileStage_e
+profile_stages = ['voices', 'mod', 'lpf', 'hpf', 'convolver']
+profile_dtype = np.dtype([('last_cycles', np.uint64, (len(profile_stages),)),
+                          ('total_cycles', np.uint64, (len(profile_stages),)),
+                          ('blocks', np.uint64), ('load', np.single), ('peak_load', np.single),
+                          ('overruns', np.uint32)], align=True)
+
+# matches RenderCacheStats_t
+render_cache_dtype = np.dtype([('hits', np.uint64), ('misses', np.uint64), ('bypasses', np.uint64),
+                               ('evictions', np.uint64), ('bytes', np.uint64), ('entries', np.uint32)], align=True)
+
+float_array = np.ctypeslib.ndpointer(dtype=np.single, flags=['C_CONTIGUOUS', 'WRITEABLE'])
+float_in_array = np.ctypeslib.ndpointer(dtype=np.single, flags='C_CONTIGUOUS')
+patch_array = np.ctypeslib.ndpointer(dtype=patch_dtype, flags='C_CONTIGUOUS')
+event_array = np.ctypeslib.ndpointer(dtype=event_dtype, flags='C_CONTIGUOUS')
+profile_array = np.ctypeslib.ndpointer(dtype=profile_dtype, flags=['C_CONTIGUOUS', 'WRITEABLE'])
+render_cache_array = np.ctypeslib.ndpointer(dtype=render_cache_dtype, flags=['C_CONTIGUOUS', 'WRITEABLE'])
+byte_array = np.ctypeslib.ndpointer(dtype=np.uint8, flags='C_CONTIGUOUS')
+event_out_array = np.ctypeslib.ndpointer(dtype=event_dtype, flags=['C_CONTIGUOUS', 'WRITEABLE'])
+pcm_array = np.ctypeslib.ndpointer(flags=['C_CONTIGUOUS', 'WRITEABLE'])     # any sample format
+handle = ctypes.c_void_p
+
+# argtypes are declared once here, rather than on every call
+engine_lib = ctypes.CDLL(os.environ.get('MXCS_LIBRARY', 'mxcs.so'))
+engine_lib.mxcs_create.argtypes = [ctypes.c_float, ctypes.c_uint, ctypes.c_uint]
+engine_lib.mxcs_create.restype = handle
+engine_lib.mxcs_destroy.argtypes = [handle]
+engine_lib.mxcs_destroy.restype = None
+engine_lib.mxcs_block_size.argtypes = [handle]
+engine_lib.mxcs_block_size.restype = ctypes.c_uint
+engine_lib.mxcs_get_time.argtypes = [handle]
+engine_lib.mxcs_get_time.restype = ctypes.c_uint
+engine_lib.mxcs_get_isa.argtypes = []
+engine_lib.mxcs_get_isa.restype = ctypes.c_uint
+engine_lib.mxcs_isa_supported.argtypes = [ctypes.c_uint]
+engine_lib.mxcs_isa_supported.restype = ctypes.c_bool
+engine_lib.mxcs_midi_create.argtypes = []
+engine_lib.mxcs_midi_create.restype = handle
+engine_lib.mxcs_midi_destroy.argtypes = [handle]
+engine_lib.mxcs_midi_destroy.restype = None
+engine_lib.mxcs_midi_time.argtypes = [handle]
+engine_lib.mxcs_midi_time.restype = ctypes.c_uint
+for name, argtypes in [('mxcs_set_parameter', [handle, ctypes.c_uint, ctypes.c_float]),
+                       ('mxcs_press', [handle, ctypes.c_uint]),
+                       ('mxcs_release', [handle, ctypes.c_uint]),
+                       ('mxcs_schedule', [handle, event_array, ctypes.c_uint]),
+                       ('mxcs_flush_events', [handle]),
+                       ('mxcs_step', [handle, float_array, ctypes.c_uint]),
+                       ('mxcs_step_pcm', [handle, pcm_array, ctypes.c_uint, ctypes.c_uint]),
+                       ('mxcs_apply_patch', [handle, patch_array]),
+                       ('mxcs_set_impulse_response', [handle, float_in_array, ctypes.c_uint, ctypes.c_uint]),
+                       ('mxcs_render', [patch_array, ctypes.c_float,
+                                        event_array, ctypes.c_uint,
+                                        float_array, ctypes.c_uint]),
+                       ('mxcs_get_profile', [handle, profile_array]),
+                       ('mxcs_reset_profile', [handle]),
+                       ('mxcs_set_render_cache', [handle, ctypes.c_size_t]),
+                       ('mxcs_get_render_cache_stats', [handle, render_cache_array]),
+                       ('mxcs_set_isa', [ctypes.c_uint]),
+                       ('mxcs_post_parameter', [handle, ctypes.c_uint, ctypes.c_float]),
+                       ('mxcs_post_press', [handle, ctypes.c_uint]),
+                       ('mxcs_post_release', [handle, ctypes.c_uint]),
+                       ('mxcs_post_patch', [handle, patch_array]),
+                       ('mxcs_midi_open', [handle, byte_array, ctypes.c_size_t, ctypes.c_float]),
+                       ('mxcs_midi_read', [handle, event_out_array, ctypes.c_uint, ctypes.POINTER(ctypes.c_uint)])]:
+    function = getattr(engine_lib, name)
+    function.argtypes = argtypes
+    function.restype = ctypes.c_uint32
+    function.errcheck = check
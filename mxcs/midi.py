@@ -0,0 +1,92 @@
+''' Reads note events from Standard MIDI Files
+    copyright Maximilian Cornwell 2024 '''
+import ctypes
+import mmap
+
+import numpy as np
+
+from mxcs.library import engine_lib, event_dtype
+
+
+default_chunk = 2**14   # events read at a time
+
+
+class MidiReader:
+    ''' Streams the note events in a Standard MIDI File, in time order, a chunk at a time.
+        The file is memory mapped and parsed in C++ straight into event arrays (see mxcs.batch.make_events),
+        with the tracks merged, the tempo map applied and every channel played on the one engine.
+        Iterating gives each chunk of events, so it can be passed to mxcs.render.render_to_wav '''
+    _handle = None
+    _map = None
+    _data = None
+
+    def __init__(self, path: str, sampling_frequency: float, chunk: int = default_chunk):
+        self.chunk = chunk
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        # the reader keeps pointers into the data, so it's kept until the reader is closed
+        self._data = np.frombuffer(self._map, dtype=np.uint8)
+        self._handle = engine_lib.mxcs_midi_create()
+        if not self._handle:
+            self.close()
+            raise MemoryError('Unable to allocate MIDI reader')
+        try:
+            engine_lib.mxcs_midi_open(self._handle, self._data, self._data.size, sampling_frequency)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        ''' Free the reader and unmap the file '''
+        if self._handle:
+            engine_lib.mxcs_midi_destroy(self._handle)
+            self._handle = None
+        # the map is closed once nothing refers to the data (an exception from open may still hold it)
+        self._data = None
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def time(self) -> int:
+        ''' Time (in samples) of the last event read, including ones that aren't notes.
+            Once the whole file has been read, this is the end of the longest track '''
+        return engine_lib.mxcs_midi_time(self._handle)
+
+    def read(self, n: int | None = None) -> np.ndarray:
+        ''' The next n (by default, chunk) note events. Fewer are returned at the end of the file '''
+        events = np.empty(self.chunk if n is None else n, dtype=event_dtype)
+        count = ctypes.c_uint()
+        engine_lib.mxcs_midi_read(self._handle, events, len(events), ctypes.byref(count))
+        return events[:count.value]
+
+    def __iter__(self):
+        while True:
+            events = self.read()
+            if len(events):
+                yield events
+            if len(events) < self.chunk:
+                return
+
+
+def read_midi(path: str, sampling_frequency: float) -> tuple:
+    ''' Every note event in a file, returns (events, end time in samples) '''
+    with MidiReader(path, sampling_frequency) as reader:
+        chunks = list(reader)
+        events = np.concatenate(chunks) if chunks else np.zeros(0, dtype=event_dtype)
+        return events, reader.time
+
+
+def midi_end(path: str, sampling_frequency: float) -> int:
+    ''' Time (in samples) at the end of the longest track, found by reading through the file '''
+    with MidiReader(path, sampling_frequency) as reader:
+        for _ in reader:
+            pass
+        return reader.time
@@ -0,0 +1,166 @@
+''' Streams long renders from the engine straight into a WAV file, in constant memory
+    copyright Maximilian Cornwell 2024 '''
+import json
+import struct
+import time
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from mxcs.batch import default_patch, make_patches
+from mxcs.engine import Engine, Generator, pcm_buffer, sample_bytes, sample_dtypes, SampleFormat
+from mxcs.library import event_dtype, event_queue_size, PRESS_EVENT, RELEASE_EVENT
+from mxcs.midi import midi_end, MidiReader
+
+
+default_chunk = 2**16   # samples rendered and written at a time
+default_tail = 1.0      # seconds rendered after the last event, when the score doesn't give a duration
+max_samples = 2**32 - 1 # engine time is a 32 bit sample count
+event_types = {'press': PRESS_EVENT, 'release': RELEASE_EVENT}
+
+
+class WavWriter:
+    ''' Writes a mono WAV file a chunk at a time, as 32 bit float or 16/24/32 bit integer PCM.
+        The sizes in the header are filled in by close.
+        Files that outgrow the 4 GiB limit of RIFF are written as RF64, the JUNK chunk is reserved for that '''
+    max_riff_size = 2**32 - 1
+
+    def __init__(self, path: str, sampling_frequency: int, sample_format: SampleFormat = SampleFormat.FLOAT32):
+        self.sampling_frequency = int(sampling_frequency)
+        self.sample_format = SampleFormat(sample_format)
+        self.samples = 0
+        self._file = open(path, 'wb')
+        self._file.write(self._header())
+
+    def _header(self) -> bytes:
+        width = sample_bytes[self.sample_format]
+        data_size = width*self.samples
+        # integers are plain PCM, which doesn't have a fact chunk
+        is_float = self.sample_format == SampleFormat.FLOAT32
+        fmt = struct.pack('<HHIIHH', 3 if is_float else 1, 1, self.sampling_frequency,
+                          width*self.sampling_frequency, width, 8*width)
+        fmt += struct.pack('<H', 0) if is_float else b''
+        chunks_size = 4 + (8 + 28) + (8 + len(fmt)) + (8 + 4)*is_float + 8
+        riff_size = chunks_size + data_size
+        if riff_size <= self.max_riff_size:
+            return b''.join([struct.pack('<4sI4s', b'RIFF', riff_size, b'WAVE'),
+                             struct.pack('<4sI', b'JUNK', 28), bytes(28),
+                             struct.pack('<4sI', b'fmt ', len(fmt)), fmt,
+                             struct.pack('<4sII', b'fact', 4, self.samples) if is_float else b'',
+                             struct.pack('<4sI', b'data', data_size)])
+        # the 32 bit sizes are set to -1, and the real ones are in the ds64 chunk
+        return b''.join([struct.pack('<4sI4s', b'RF64', 2**32 - 1, b'WAVE'),
+                         struct.pack('<4sIQQQI', b'ds64', 28, riff_size, data_size, self.samples, 0),
+                         struct.pack('<4sI', b'fmt ', len(fmt)), fmt,
+                         struct.pack('<4sII', b'fact', 4, 2**32 - 1) if is_float else b'',
+                         struct.pack('<4sI', b'data', 2**32 - 1)])
+
+    def write(self, samples: np.ndarray) -> None:
+        ''' Append samples to the file, in its sample format (see mxcs.pcm_buffer) '''
+        samples = np.ascontiguousarray(samples, dtype=sample_dtypes[self.sample_format].newbyteorder('<'))
+        self._file.write(memoryview(samples).cast('B'))
+        self.samples += samples.nbytes//sample_bytes[self.sample_format]
+
+    def close(self) -> None:
+        ''' Fill in the header and close the file '''
+        if not self._file.closed:
+            self._file.seek(0)
+            self._file.write(self._header())
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RenderStats(NamedTuple):
+    ''' Output of render_to_wav '''
+    samples: int
+    seconds: float          # time spent rendering and writing
+    realtime_factor: float  # seconds of audio rendered per second
+
+
+def load_patch(path: str) -> np.void:
+    ''' Read a patch from JSON, an object with any of the fields of mxcs.batch.default_patch.
+        The generator can be given by name, e.g. "sawtooth" '''
+    with open(path, encoding='utf-8') as file:
+        fields = json.load(file)
+    unknown = set(fields) - set(default_patch)
+    if unknown:
+        raise ValueError(f'unknown patch fields {", ".join(sorted(unknown))}, '
+                         f'the fields are {", ".join(default_patch)}')
+    if isinstance(fields.get('generator'), str):
+        fields['generator'] = Generator[fields['generator'].upper()]
+    return make_patches(1, **fields)[0]
+
+
+def load_score(path: str, sampling_frequency: float, tail: float = default_tail) -> tuple:
+    ''' Read a score, returns (events, duration in seconds).
+        A Standard MIDI File (.mid/.midi) is streamed with a MidiReader, and lasts until the end of its longest track.
+        Otherwise the score is JSON, an object with a list of [time (seconds), "press"/"release", note] events,
+        and optionally a duration.
+        Without a duration, tail seconds are added on after the last event, for the releases '''
+    if path.lower().endswith(('.mid', '.midi')):
+        end = midi_end(path, sampling_frequency)
+        return MidiReader(path, sampling_frequency), end/sampling_frequency + tail
+    with open(path, encoding='utf-8') as file:
+        score = json.load(file)
+    events = np.zeros(len(score['events']), dtype=event_dtype)
+    for i, (seconds, event_type, note) in enumerate(score['events']):
+        if event_type not in event_types:
+            raise ValueError(f'unknown event type {event_type}, expected press or release')
+        events[i] = (round(seconds*sampling_frequency), event_types[event_type], note)
+    events = events[np.argsort(events['time'], kind='stable')]
+    duration = score.get('duration')
+    if duration is None:
+        duration = (events['time'][-1]/sampling_frequency if len(events) else 0) + tail
+    return events, duration
+
+
+def render_to_wav(path: str, patch: np.void, events: np.ndarray | Iterable[np.ndarray], n_samples: int,
+                  sampling_frequency: int, chunk: int = default_chunk,
+                  sample_format: SampleFormat = SampleFormat.FLOAT32) -> RenderStats:
+    ''' Render n_samples of a score into a WAV file. The events (in samples) are an array sorted by time,
+        or an iterable of them in order (e.g. a MidiReader), which is only read as far ahead as needed.
+        One chunk is rendered at a time, and events are scheduled just ahead of the chunk they are in,
+        so memory use doesn't depend on the duration or the number of events.
+        Integer formats are converted (and dithered) by the engine, straight into the buffer that is written '''
+    if not 0 <= n_samples <= max_samples:
+        raise ValueError(f'Can only render up to {max_samples} samples')
+    chunks = iter([events] if isinstance(events, np.ndarray) else events)
+    pending = np.zeros(0, dtype=event_dtype)
+    exhausted = False
+    start = time.perf_counter()
+    with Engine(sampling_frequency, int(patch['voices']), int(patch['block_size'])) as engine, \
+         WavWriter(path, sampling_frequency, sample_format) as writer:
+        engine.apply_patch(patch)
+        block_size = engine.block_size
+        out = pcm_buffer(max(1, chunk//block_size)*block_size, sample_format)
+        while writer.samples < n_samples:
+            blocks = min(len(out), n_samples - writer.samples + block_size - 1)//block_size
+            end = engine.time + blocks*block_size
+            # read ahead until there's an event after the end of the chunk
+            while not exhausted and (len(pending) == 0 or pending['time'][-1] < end):
+                events = next(chunks, None)
+                if events is None:
+                    exhausted = True
+                else:
+                    pending = np.concatenate([pending, np.asarray(events, dtype=event_dtype)])
+            # every event before the end of the chunk needs to fit in the queue, if not the chunk is shortened.
+            # If even the first block has more, they are scheduled a queue full at a time, flushing in between
+            times = pending['time']
+            last = np.searchsorted(times, end)
+            if last > event_queue_size:
+                blocks = max(1, (int(times[event_queue_size]) - engine.time)//block_size)
+                last = np.searchsorted(times, engine.time + blocks*block_size)
+            for first in range(0, last, event_queue_size):
+                if first:
+                    engine.flush_events()
+                engine.schedule(pending[first:min(first + event_queue_size, last)])
+            pending = pending[last:]
+            rendered = engine.render_pcm(out[:blocks*block_size], sample_format)
+            writer.write(rendered[:n_samples - writer.samples])
+    seconds = time.perf_counter() - start
+    return RenderStats(n_samples, seconds, n_samples/(sampling_frequency*seconds))
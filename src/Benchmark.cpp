@@ -0,0 +1,287 @@
+/* MXCS Core benchmarks
+   copyright Maximilian Cornwell 2024
+*/
+// Times each DSP block on its own, and the whole synth, for test/benchmark.py.
+// Only built into the test library
+
+#ifdef SYNTH_TEST_
+#include <chrono>
+#include <vector>
+#include <stdint.h>
+#include <string.h>
+#include <math.h>
+#include "Blit.h"
+#include "Constants.h"
+#include "Convolver.h"
+#include "Envelope.h"
+#include "Filter.h"
+#include "Modulator.h"
+#include "Oscillator.h"
+#include "Synth.h"
+#include "Voice.h"
+#include "Wavetable.h"
+
+enum Benchmark_e {
+    benchOscillator = 0,
+    benchBlit,
+    benchBpBlit,
+    benchSawtooth,
+    benchSquare,
+    benchTriangle,
+    benchWavetable,
+    benchEnvelope,
+    benchModulator,
+    benchDFI,
+    benchDFII,
+    benchTDFI,
+    benchTDFII,
+    benchSOS,
+    benchBiquad,
+    benchFirDirect,     // the same FIR response, direct form
+    benchFirFft,        // and uniformly partitioned
+    benchFirFftLong,    // a longer response, uniform
+    benchFirFftNuLong,  // and non-uniform partitions
+    benchNoteOn,        // pressing a note on every voice
+    benchSynth,     // one per generator from here
+    benchCount = benchSynth + wavetable + 1
+};
+
+static const char * benchNames[benchCount] = {
+    "oscillator", "blit", "bp_blit", "sawtooth", "square", "triangle", "wavetable",
+    "envelope", "modulator",
+    "filter_dfi", "filter_dfii", "filter_tdfi", "filter_tdfii", "filter_sos", "biquad",
+    "fir_direct_4k", "fir_fft_4k", "fir_fft_64k", "fir_fft_nu_64k", "note_on",
+    "synth_sine", "synth_blit", "synth_bp_blit", "synth_sawtooth", "synth_square", "synth_triangle",
+    "synth_wavetable"
+};
+
+const float benchNote = 440;        // Hz, for the generators
+const float benchCutoff = 2000;     // Hz, for the filters
+const uint8_t benchChord[] = {48, 55, 60, 64, 67, 72, 76, 79};
+const uint32_t benchTaps = 4096;            // FIR responses, direct form is only timed with the short one
+const uint32_t benchLongTaps = 65536;
+const uint32_t benchMaxPartition = 8192;    // for the non-uniform partitions
+
+template <typename Step_t>
+static double time_blocks(Step_t step, uint32_t blockSize, uint32_t samples) {
+    // run step over whole blocks until samples have been processed, returns the time taken in seconds
+    auto start = std::chrono::steady_clock::now();
+    for (uint32_t i = 0; i + blockSize <= samples; i += blockSize) {
+        step();
+    }
+    auto end = std::chrono::steady_clock::now();
+    return std::chrono::duration<double>(end - start).count();
+}
+
+template <typename Generator_t>
+static double time_generator(uint32_t blockSize, float fs, uint32_t samples, float * out) {
+    Generator_t generator;
+    generator.set_freq(benchNote/fs);
+    return time_blocks([&]() { generator.step(out, blockSize); }, blockSize, samples);
+}
+
+static double time_filter(IIR_Filter_t * filter, uint32_t blockSize, uint32_t samples, float * in, float * out) {
+    return time_blocks([&]() { filter->step(in, out, blockSize); }, blockSize, samples);
+}
+
+static std::vector<float> bench_response(uint32_t taps) {
+    // something like a room, noise decaying by 60 dB
+    std::vector<float> response(taps);
+    uint32_t state = 1;
+    for (uint32_t k = 0; k < taps; k++) {
+        state = 1664525*state + 1013904223;
+        response[k] = ((float)state/4294967296.0f - 0.5f)*expf(-6.9f*k/taps);
+    }
+    return response;
+}
+
+static double time_fir_direct(uint32_t taps, uint32_t blockSize, uint32_t samples, float * in, float * out) {
+    // a multiply add of the whole block per tap, which vectorises (unlike a dot product per sample)
+    std::vector<float> response = bench_response(taps);
+    std::vector<float> history(taps - 1 + blockSize);   // the input, oldest first
+    return time_blocks([&]() {
+        memmove(history.data(), history.data() + blockSize, (taps - 1)*sizeof(float));
+        memcpy(history.data() + taps - 1, in, blockSize*sizeof(float));
+        memset(out, 0, blockSize*sizeof(float));
+        for (uint32_t k = 0; k < taps; k++) {
+            const float h = response[k];
+            const float * x = history.data() + taps - 1 - k;
+            for (uint32_t i = 0; i < blockSize; i++) {
+                out[i] += h*x[i];
+            }
+        }
+    }, blockSize, samples);
+}
+
+static double time_fir_fft(uint32_t taps, uint32_t maxPartition, uint32_t blockSize, uint32_t samples,
+                           float * in, float * out) {
+    std::vector<float> response = bench_response(taps);
+    Convolver_t convolver;
+    convolver.configure(response.data(), taps, blockSize, maxPartition);
+    return time_blocks([&]() { convolver.step(in, out); }, blockSize, samples);
+}
+
+extern "C" {
+    unsigned int benchmark_count() {
+        return benchCount;
+    }
+
+    const char * benchmark_name(unsigned int block) {
+        return (block < benchCount) ? benchNames[block] : nullptr;
+    }
+
+    bool benchmark_optimised() {
+        // timings from unoptimised builds aren't comparable with optimised ones
+    #ifdef __OPTIMIZE__
+        return true;
+    #else
+        return false;
+    #endif
+    }
+
+    double benchmark_block(unsigned int block, unsigned int blockSize, float fs, unsigned int samples) {
+        // parameters:  block: which block to time (see benchmark_name)
+        //              blockSize: samples per call (up to maxBlockSize)
+        //              fs: sampling frequency
+        //              samples: how many samples to process, rounded down to whole blocks
+        // returns the time taken in seconds, or a negative number for invalid arguments
+        if (block >= benchCount || blockSize == 0 || blockSize > maxBlockSize) {
+            return -1;
+        }
+        std::vector<float> in(blockSize);
+        std::vector<float> out(blockSize);
+        for (uint32_t i = 0; i < blockSize; i++) {
+            in[i] = sinf(2*M_PI*benchNote*i/fs);
+        }
+        // a 4th order lowpass, two biquads multiplied together
+        float b2[3];
+        float a2[3];
+        lowpass_coeffs(benchCutoff, -3, fs, b2, a2);
+        float b[5] = {0};
+        float a[5] = {0};
+        for (uint32_t i = 0; i < 3; i++) {
+            for (uint32_t j = 0; j < 3; j++) {
+                b[i+j] += b2[i]*b2[j];
+                a[i+j] += a2[i]*a2[j];
+            }
+        }
+        const uint32_t order = 4;
+        std::vector<float> memory(2*DelayLine_t::capacity(order) + 2*order);
+
+        switch (block) {
+        case benchOscillator: {
+            Oscillator_t osc;
+            osc.set_freq(benchNote/fs);
+            return time_blocks([&]() { osc.step(out.data(), blockSize); }, blockSize, samples);
+        }
+        case benchBlit:
+            return time_generator<Blit_t>(blockSize, fs, samples, out.data());
+        case benchBpBlit:
+            return time_generator<BpBlit_t>(blockSize, fs, samples, out.data());
+        case benchSawtooth:
+            return time_generator<Sawtooth_t>(blockSize, fs, samples, out.data());
+        case benchSquare:
+            return time_generator<Square_t>(blockSize, fs, samples, out.data());
+        case benchTriangle:
+            return time_generator<Triangle_t>(blockSize, fs, samples, out.data());
+        case benchWavetable:
+            return time_generator<Wavetable_t>(blockSize, fs, samples, out.data());
+        case benchEnvelope: {
+            // pressed and released every 100ms, so every state is visited
+            EnvelopeSettings_t settings(fs);
+            settings.set_attack(0.01);
+            settings.set_decay(0.02);
+            settings.set_sustain(-6);
+            settings.set_release(0.03);
+            Envelope_t envelope(&settings);
+            uint32_t period = (uint32_t)(0.1f*fs);
+            uint32_t n = 0;
+            return time_blocks([&]() {
+                if (n % period < blockSize) {
+                    envelope.press();
+                } else if ((n + period/2) % period < blockSize) {
+                    envelope.release();
+                }
+                envelope.step(out.data(), blockSize);
+                n += blockSize;
+            }, blockSize, samples);
+        }
+        case benchModulator: {
+            Modulator_t modulator(fs);
+            modulator.modRatio = 0.5;
+            modulator.set_freq(2);
+            return time_blocks([&]() { modulator.step(out.data(), blockSize); }, blockSize, samples);
+        }
+        case benchDFI: {
+            Filter_DFI_t filter(memory.data(), b, a, order);
+            return time_filter(&filter, blockSize, samples, in.data(), out.data());
+        }
+        case benchDFII: {
+            Filter_DFII_t filter(memory.data(), b, a, order);
+            return time_filter(&filter, blockSize, samples, in.data(), out.data());
+        }
+        case benchTDFI: {
+            Filter_TDFI_t filter(memory.data(), b, a, order);
+            return time_filter(&filter, blockSize, samples, in.data(), out.data());
+        }
+        case benchTDFII: {
+            Filter_TDFII_t filter(memory.data(), b, a, order);
+            return time_filter(&filter, blockSize, samples, in.data(), out.data());
+        }
+        case benchSOS: {
+            Filter_SOS_t filter(b, a, order);
+            return time_filter(&filter, blockSize, samples, in.data(), out.data());
+        }
+        case benchBiquad: {
+            Biquad_Filter_t filter(fs);
+            filter.configure_lowpass(benchCutoff, -3);
+            return time_filter(&filter, blockSize, samples, in.data(), out.data());
+        }
+        case benchFirDirect:
+            return time_fir_direct(benchTaps, blockSize, samples, in.data(), out.data());
+        case benchFirFft:
+            return time_fir_fft(benchTaps, 0, blockSize, samples, in.data(), out.data());
+        case benchFirFftLong:
+            return time_fir_fft(benchLongTaps, 0, blockSize, samples, in.data(), out.data());
+        case benchFirFftNuLong:
+            return time_fir_fft(benchLongTaps, benchMaxPartition, blockSize, samples, in.data(), out.data());
+        case benchNoteOn: {
+            // every block, each voice is pressed with a note of the chord and run for a sample (when its generator
+            // is set to the note). The BLIT, so that's more than a copy, its oscillators are brought back in phase
+            EnvelopeSettings_t settings(fs);
+            Generator_e generator = blit;
+            std::vector<Voice_t> voices;
+            voices.reserve(maxVoices);
+            for (uint32_t v = 0; v < maxVoices; v++) {
+                voices.emplace_back(&settings, &generator);
+            }
+            NoteCoeffs_t chord[sizeof(benchChord)];
+            for (uint32_t i = 0; i < sizeof(benchChord); i++) {
+                chord[i].set_freq(benchNote*exp2f((benchChord[i] - 69)/12.0f)/fs);
+            }
+            return time_blocks([&]() {
+                for (uint32_t v = 0; v < maxVoices; v++) {
+                    voices[v].press(&chord[v % sizeof(benchChord)]);
+                    voices[v].step(out.data(), 1);
+                }
+            }, blockSize, samples);
+        }
+        default: {
+            // the full chain: a held chord through the voices, modulator and filters
+            Synth_t synth(fs, sizeof(benchChord), blockSize);
+            synth.set_generator((Generator_e)(block - benchSynth));
+            synth.set_attack(0.01);
+            synth.set_decay(0.1);
+            synth.set_sustain(-6);
+            synth.set_mod_f(2);
+            synth.set_mod_depth(0.5);
+            synth.set_lpf_freq(benchCutoff);
+            for (uint8_t note : benchChord) {
+                synth.press(note);
+            }
+            return time_blocks([&]() { synth.step(out.data()); }, blockSize, samples);
+        }
+        }
+    }
+}
+#endif // SYNTH_TEST_
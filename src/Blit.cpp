@@ -2,8 +2,11 @@
    copyright Maximilian Cornwell 2023
 */
 
+#include <math.h>
+#include <complex>
 #include "Blit.h"
 #include "Constants.h"
+#include "Kernels.h"
 
 
 const float threshold = 0.005; // Could be further refined?
@@ -11,32 +14,102 @@ const float threshold = 0.005; // Could be further refined?
 float blit_m(float f);
 
 Blit_t::Blit_t() {
-    m = 0;
+    set_m(0);
+    dc = 0;
+    lfoOmega = 0;
 }
 
-void Blit_t::set_freq(float freq) {
+void Blit_t::set_m(float _m) {
+    // the division and the threshold scaling are done once here, rather than every sample
+    m = _m;
+    if (m > 0) {
+        invM = 1/m;
+        sinThreshold = threshold/(m*m);
+    } else {
+        // not configured, always use the cosine ratio (as the per sample check would)
+        invM = 0;
+        sinThreshold = INFINITY;
+    }
+}
+
+void BlitCoeffs_t::set_freq(float _freq) {
+    freq = _freq;
     m = blit_m(freq);
-    if (freq > 0.4) {
-        freq = 0; // frequencies above 0.4 are unsupproted
+    dc = (m > 0) ? 1/m : 0; // the msinc is an average of m harmonics, including dc
+    if (_freq > 0.4) {
+        _freq = 0; // frequencies above 0.4 are unsupproted
     }
-    lfo.set_freq(freq/2.f);
-    hfo.set_freq(m*freq/2.f);
+    lfo.set_freq(_freq/2.f);
+    hfo.set_freq(m*_freq/2.f);
+    lfoOmega = M_PI*_freq;
+}
+
+void BlitCoeffs_t::set_bp_freq(float _freq) {
+    freq = _freq;
+    if (_freq > 0.2) {
+        _freq = 0; // frequencies above 0.25 aren't supported by bpblit!
+    }
+    m = blit_m(2*_freq) - 1;
+    dc = 0;
+    lfo.set_freq(_freq);
+    hfo.set_freq(m*_freq);
+    lfoOmega = 2*M_PI*_freq;
+}
+
+void Blit_t::set_freq(float freq) {
+    BlitCoeffs_t coeffs;
+    coeffs.set_freq(freq);
+    set_coeffs(&coeffs);
+}
+
+void Blit_t::set_coeffs(const BlitCoeffs_t * coeffs) {
+    // the phase of the last note carries on, so the high frequency oscillator is brought back in line with it
+    set_m(coeffs->m);
+    dc = coeffs->dc;
+    lfo.set_coeffs(&coeffs->lfo);
+    hfo.set_coeffs(&coeffs->hfo);
+    lfoOmega = coeffs->lfoOmega;
     sync_phase();
 }
 
-void Blit_t::step(float * out) {
-    lfo.step(lfCos, lfSin);
-    hfo.step(hfCos, hfSin);
-    // calculate msinc
-    for(uint8_t i = 0; i<blockSize; i++) {
-        out[i] = hfSin[i]/(m*lfSin[i]);
-        if ((m*m*lfSin[i]*lfSin[i] < threshold) || (out[i]*out[i] > 1)) {
-            out[i] = hfCos[i]/(lfCos[i]);
-        }
+void Blit_t::step(float * out, uint32_t n) {
+    // the scratch buffers are only chunkSize long, so longer blocks are run a chunk at a time
+    for (uint32_t i = 0; i < n; i += chunkSize) {
+        step_chunk(out + i, (n - i < chunkSize) ? n - i : chunkSize);
     }
+}
+
+void Blit_t::step_chunk(float * out, uint32_t n) {
+    lfo.step(lfCos, lfSin, n);
+    hfo.step(hfCos, hfSin, n);
+    msinc(out, n);
     sync_phase();
 }
 
+inline void Blit_t::msinc(float * out, uint32_t n) {
+    // msinc of the first n samples in the scratch buffers
+    kernels->msinc(lfCos, lfSin, hfCos, hfSin, invM, sinThreshold, out, n);
+}
+
+void Blit_t::step_integrated(float * out, uint32_t n, LeakyIntegrator_t * integrators, uint32_t stages) {
+    // like step, but each chunk is run through the integrators while it is still in cache,
+    // rather than filtering the whole output again afterwards
+    for (uint32_t start = 0; start < n; start += chunkSize) {
+        uint32_t len = (n - start < chunkSize) ? n - start : chunkSize;
+        float * chunk = out + start;
+        lfo.step(lfCos, lfSin, len);
+        hfo.step(hfCos, hfSin, len);
+        msinc(chunk, len);
+        for (uint32_t i = 0; i < len; i++) {
+            chunk[i] -= dc;
+        }
+        for (uint32_t stage = 0; stage < stages; stage++) {
+            integrators[stage].step(chunk, len);
+        }
+        sync_phase();
+    }
+}
+
 void Blit_t::sync_phase(void) {
     // PLL, needed to keep low/high frequencies in sync
     // might be better to adjust frequency instead of phase!
@@ -45,14 +118,164 @@ void Blit_t::sync_phase(void) {
     hfo.adjust_phase(phase_error);
 }
 
+void Blit_t::prime(LeakyIntegrator_t * integrators, uint32_t stages) {
+    // Start the integrators in their steady state, as if the BLIT had always been running.
+    // From rest, the offset left by the first pulse takes the leaky integrator so long to settle
+    // that the output swings to many times its amplitude (hundreds of times, for the triangle).
+    // The steady state is summed up harmonic by harmonic. Without its dc, the msinc is
+    // (2/m)*sum(cos(k*phase)), over k = 2, 4, .. m-1 for a BLIT (odd m), or k = 1, 3, .. m-1 for a BpBLIT (even m)
+    double xPrev[maxIntegrators] = {0};
+    double w[maxIntegrators] = {0};
+    double y[maxIntegrators] = {0};
+    uint32_t harmonics = (lfoOmega > 0) ? (uint32_t)m/2 : 0;
+    double first = ((uint32_t)m % 2) ? 2 : 1;
+    double phase = lfo.get_phase();
+    // the harmonic at the last sample, and z^-1 at its frequency
+    std::complex<double> harmonic = std::polar(2.0/m, first*phase);
+    std::complex<double> delay = std::polar(1.0, -first*lfoOmega);
+    const std::complex<double> harmonicStep = std::polar(1.0, 2*phase);
+    const std::complex<double> delayStep = std::polar(1.0, -2.0*lfoOmega);
+    for (uint32_t k = 0; k < harmonics; k++) {
+        std::complex<double> x = harmonic;
+        for (uint32_t stage = 0; stage < stages; stage++) {
+            // 1/(1 - r z^-1), complex division is slow, so it's done once per stage
+            std::complex<double> leak = 1.0 - (double)integrators[stage].get_radius()*delay;
+            std::complex<double> invLeak = std::conj(leak)/std::norm(leak);
+            std::complex<double> stageW = (double)integrators[stage].get_gain()*(1.0 - delay)*x*invLeak;
+            std::complex<double> stageY = stageW*invLeak;
+            xPrev[stage] += x.real();
+            w[stage] += stageW.real();
+            y[stage] += stageY.real();
+            x = stageY;
+        }
+        harmonic *= harmonicStep;
+        delay *= delayStep;
+    }
+    for (uint32_t stage = 0; stage < stages; stage++) {
+        integrators[stage].prime(xPrev[stage], w[stage], y[stage]);
+    }
+}
+
 void BpBlit_t::set_freq(float freq) {
-    if (freq > 0.2) {
-        freq = 0; // frequencies above 0.25 aren't supported by bpblit!
+    BlitCoeffs_t coeffs;
+    coeffs.set_bp_freq(freq);
+    set_coeffs(&coeffs);
+}
+
+LeakyIntegrator_t::LeakyIntegrator_t() {
+    gain = 1;
+    radius = leakRadius;
+    xPrev = 0;
+    w = 0;
+    y = 0;
+}
+
+void LeakyIntegrator_t::set_gain(float _gain) {
+    gain = _gain;
+}
+
+float LeakyIntegrator_t::get_gain() {
+    return gain;
+}
+
+void LeakyIntegrator_t::set_radius(float _radius) {
+    radius = _radius;
+}
+
+float LeakyIntegrator_t::get_radius() {
+    return radius;
+}
+
+void LeakyIntegrator_t::prime(double _xPrev, double _w, double _y) {
+    // set the last input, and the last outputs of both sections
+    xPrev = _xPrev;
+    w = _w;
+    y = _y;
+}
+
+void LeakyIntegrator_t::step(float * x, uint32_t n) {
+    // run as two one pole sections, (1 - z^-1)/(1 - r z^-1) then 1/(1 - r z^-1).
+    // The double pole is badly conditioned in direct form, rounding 2r and r^2 to floats moves it noticeably
+    const double r = radius;
+    double xPrev_ = xPrev;
+    double w_ = w;
+    double y_ = y;
+    for (uint32_t i = 0; i < n; i++) {
+        w_ = gain*(x[i] - xPrev_) + r*w_;
+        y_ = w_ + r*y_;
+        xPrev_ = x[i];
+        x[i] = y_;
     }
-    m = blit_m(2*freq) - 1;
-    lfo.set_freq(freq);
-    hfo.set_freq(m*freq);
-    sync_phase();
+    xPrev = xPrev_;
+    w = w_;
+    y = y_;
+}
+
+Sawtooth_t::Sawtooth_t() {
+    integrator.set_gain(2);
+}
+
+void Sawtooth_t::set_freq(float freq) {
+    BlitCoeffs_t coeffs;
+    coeffs.set_freq(freq);
+    set_coeffs(&coeffs);
+}
+
+void Sawtooth_t::set_coeffs(const BlitCoeffs_t * coeffs) {
+    Blit_t::set_coeffs(coeffs);
+    prime(&integrator, 1);
+}
+
+void Sawtooth_t::step(float * out, uint32_t n) {
+    step_integrated(out, n, &integrator, 1);
+}
+
+Square_t::Square_t() {
+    integrator.set_gain(2);
+}
+
+void Square_t::set_freq(float freq) {
+    BlitCoeffs_t coeffs;
+    coeffs.set_bp_freq(freq);
+    set_coeffs(&coeffs);
+}
+
+void Square_t::set_coeffs(const BlitCoeffs_t * coeffs) {
+    BpBlit_t::set_coeffs(coeffs);
+    prime(&integrator, 1);
+}
+
+void Square_t::step(float * out, uint32_t n) {
+    step_integrated(out, n, &integrator, 1);
+}
+
+Triangle_t::Triangle_t() {
+    integrators[0].set_gain(2);
+}
+
+void Triangle_t::set_freq(float freq) {
+    BlitCoeffs_t coeffs;
+    coeffs.set_bp_freq(freq);
+    set_coeffs(&coeffs);
+}
+
+void Triangle_t::set_coeffs(const BlitCoeffs_t * coeffs) {
+    BpBlit_t::set_coeffs(coeffs);
+    // scaled so the amplitude doesn't depend on the frequency
+    integrators[1].set_gain(4*coeffs->freq);
+    // low notes keep the usual leak, which is already well below them
+    float radius = 1 - triangleLeak*2*(float)M_PI*coeffs->freq;
+    if (radius > leakRadius) {
+        radius = leakRadius;
+    }
+    for (uint32_t stage = 0; stage < maxIntegrators; stage++) {
+        integrators[stage].set_radius(radius);
+    }
+    prime(integrators, maxIntegrators);
+}
+
+void Triangle_t::step(float * out, uint32_t n) {
+    step_integrated(out, n, integrators, maxIntegrators);
 }
 
 float blit_m(float f) {
@@ -68,8 +291,8 @@ extern "C" {
         Blit_t blit;
 
         blit.set_freq(f);
-        for(unsigned int i = 0; i < samples-blockSize; i+=blockSize) {
-            blit.step(&out[i]);
+        for(unsigned int i = 0; i < samples-defaultBlockSize; i+=defaultBlockSize) {
+            blit.step(&out[i], defaultBlockSize);
         }
     }
 
@@ -77,8 +300,32 @@ extern "C" {
         BpBlit_t bpBlit;
 
         bpBlit.set_freq(f);
-        for(unsigned int i = 0; i < samples-blockSize; i+=blockSize) {
-            bpBlit.step(&out[i]);
+        for(unsigned int i = 0; i < samples-defaultBlockSize; i+=defaultBlockSize) {
+            bpBlit.step(&out[i], defaultBlockSize);
+        }
+    }
+
+    void test_integrated_blit(float * out, float f, unsigned int gen, unsigned int samples) {
+        // gen: 0 sawtooth, 1 square, 2 triangle
+        Sawtooth_t sawtooth;
+        Square_t square;
+        Triangle_t triangle;
+
+        sawtooth.set_freq(f);
+        square.set_freq(f);
+        triangle.set_freq(f);
+        for(unsigned int i = 0; i < samples-defaultBlockSize; i+=defaultBlockSize) {
+            switch (gen) {
+            case 0:
+                sawtooth.step(&out[i], defaultBlockSize);
+                break;
+            case 1:
+                square.step(&out[i], defaultBlockSize);
+                break;
+            default:
+                triangle.step(&out[i], defaultBlockSize);
+                break;
+            }
         }
     }
 
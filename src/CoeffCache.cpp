@@ -0,0 +1,101 @@
+/* MXCS Engine Filter Coefficient Cache implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <string.h>
+#include "CoeffCache.h"
+#include "Filter.h"
+
+const uint32_t setMask = coeffCacheSets - 1;
+
+static uint32_t float_bits(float x) {
+    uint32_t bits;
+    memcpy(&bits, &x, sizeof(bits));
+    return bits;
+}
+
+static float bits_float(uint32_t bits) {
+    float x;
+    memcpy(&x, &bits, sizeof(x));
+    return x;
+}
+
+static uint32_t quantise(float x, uint32_t mantissaBits) {
+    // drops the low bits of the mantissa, so every key covers the same fraction of an octave
+    return float_bits(x) >> (23 - mantissaBits);
+}
+
+static float representative(uint32_t key, uint32_t mantissaBits) {
+    // the value in the middle of the range covered by key
+    uint32_t shift = 23 - mantissaBits;
+    return bits_float((key << shift) | (1u << (shift - 1)));
+}
+
+CoeffCache_t::CoeffCache_t() {
+    clear();
+}
+
+const CoeffEntry_t * CoeffCache_t::lookup(BiquadType_e type, float f, float res, float samplingFrequency) {
+    // returns normalised coefficients (a[0] = 1) for the quantised frequency/resonance
+    // on a miss they are calculated, replacing the least recently used entry in the set
+    uint32_t freqKey = quantise(f, freqMantissaBits);
+    uint32_t resKey = quantise(res, resMantissaBits);
+    uint32_t hash = freqKey*2654435761u ^ resKey*40503u ^ float_bits(samplingFrequency) ^ type;
+    CoeffEntry_t * set = entries[(hash ^ (hash >> 16)) & setMask];
+    CoeffEntry_t * victim = &set[0];
+    clock++;
+    for (uint32_t way = 0; way < coeffCacheWays; way++) {
+        CoeffEntry_t * entry = &set[way];
+        if (entry->valid && entry->freqKey == freqKey && entry->resKey == resKey &&
+            entry->samplingFrequency == samplingFrequency && entry->type == type) {
+            entry->lastUsed = clock;
+            hits++;
+            return entry;
+        }
+        if (!entry->valid || (victim->valid && (int32_t)(entry->lastUsed - victim->lastUsed) < 0)) {
+            // empty, or used less recently (compared as a signed difference, so the clock can wrap)
+            victim = entry;
+        }
+    }
+    misses++;
+    // the coefficients are calculated at the middle of the range, so they are the same for every value in it
+    float fq = representative(freqKey, freqMantissaBits);
+    float resq = representative(resKey, resMantissaBits);
+    if (type == lowpassBiquad) {
+        lowpass_coeffs(fq, resq, samplingFrequency, victim->b, victim->a);
+    } else {
+        highpass_coeffs(fq, resq, samplingFrequency, victim->b, victim->a);
+    }
+    for (uint32_t i = 0; i < 3; i++) {
+        victim->b[i] /= victim->a[0];
+    }
+    victim->a[2] /= victim->a[0];
+    victim->a[1] /= victim->a[0];
+    victim->a[0] = 1;
+    victim->freqKey = freqKey;
+    victim->resKey = resKey;
+    victim->samplingFrequency = samplingFrequency;
+    victim->type = type;
+    victim->lastUsed = clock;
+    victim->valid = true;
+    return victim;
+}
+
+uint32_t CoeffCache_t::get_hits() {
+    return hits;
+}
+
+uint32_t CoeffCache_t::get_misses() {
+    return misses;
+}
+
+void CoeffCache_t::clear() {
+    for (uint32_t set = 0; set < coeffCacheSets; set++) {
+        for (uint32_t way = 0; way < coeffCacheWays; way++) {
+            entries[set][way].valid = false;
+            entries[set][way].lastUsed = 0;
+        }
+    }
+    clock = 0;
+    hits = 0;
+    misses = 0;
+}
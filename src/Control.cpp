@@ -0,0 +1,146 @@
+/* MXCS Engine Control implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include "Control.h"
+
+const uint32_t commandMask = commandQueueSize - 1;
+const uint8_t newPatch = 4;     // flag in PatchBuffer_t::shared, above the slot index
+const uint8_t slotMask = 3;
+
+CommandQueue_t::CommandQueue_t(): head(0), tail(0) {}
+
+bool CommandQueue_t::push(Command_t command) {
+    // the indices count up forever (wrapping), so full and empty can be told apart
+    const uint32_t t = tail.load(std::memory_order_relaxed);
+    if (t - head.load(std::memory_order_acquire) == commandQueueSize) {
+        return false;
+    }
+    commands[t & commandMask] = command;
+    // release: the command is written before the consumer can see the new tail
+    tail.store(t + 1, std::memory_order_release);
+    return true;
+}
+
+bool CommandQueue_t::full() const {
+    // only the consumer moves head, and only forwards, so the queue can't fill up again before the producer pushes
+    return tail.load(std::memory_order_relaxed) - head.load(std::memory_order_acquire) == commandQueueSize;
+}
+
+bool CommandQueue_t::pop(Command_t * command) {
+    const uint32_t h = head.load(std::memory_order_relaxed);
+    if (h == tail.load(std::memory_order_acquire)) {
+        return false;
+    }
+    *command = commands[h & commandMask];
+    // release: the command is read before the producer can reuse its slot
+    head.store(h + 1, std::memory_order_release);
+    return true;
+}
+
+SynthPatch_t::SynthPatch_t(float samplingFrequency): envelope(samplingFrequency), sustain(0), modFreq(0), modDepth(0),
+                                                     lpF(20000), lpRes(-3), hpF(20), hpRes(-3),
+                                                     lpB{1, 0, 0}, lpA{1, 0, 0}, hpB{1, 0, 0}, hpA{1, 0, 0},
+                                                     generator(sine) {}
+
+PatchBuffer_t::PatchBuffer_t(float _samplingFrequency):
+    slots{SynthPatch_t(_samplingFrequency), SynthPatch_t(_samplingFrequency), SynthPatch_t(_samplingFrequency)},
+    shared(1), back(0), front(2), samplingFrequency(_samplingFrequency) {}
+
+SynthPatch_t * PatchBuffer_t::edit() {
+    return &slots[back];
+}
+
+void PatchBuffer_t::set_filters(SynthPatch_t * patch, float lpF, float lpRes, float hpF, float hpRes) {
+    // the coefficients come from a cache like the synth's, so they are exactly what setting the parameters would give
+    const CoeffEntry_t * lp = cache.lookup(lowpassBiquad, lpF, lpRes, samplingFrequency);
+    const CoeffEntry_t * hp = cache.lookup(highpassBiquad, hpF, hpRes, samplingFrequency);
+    patch->lpF = lpF;
+    patch->lpRes = lpRes;
+    patch->hpF = hpF;
+    patch->hpRes = hpRes;
+    for (uint32_t i = 0; i < 3; i++) {
+        patch->lpB[i] = lp->b[i];
+        patch->lpA[i] = lp->a[i];
+        patch->hpB[i] = hp->b[i];
+        patch->hpA[i] = hp->a[i];
+    }
+}
+
+void PatchBuffer_t::publish() {
+    // acq_rel: the patch is written before it's shared, and the slot coming back has been finished with
+    back = shared.exchange(back | newPatch, std::memory_order_acq_rel) & slotMask;
+}
+
+const SynthPatch_t * PatchBuffer_t::take() {
+    if (shared.load(std::memory_order_relaxed) & newPatch) {
+        front = shared.exchange(front, std::memory_order_acq_rel) & slotMask;
+    }
+    return &slots[front];
+}
+
+#ifdef SYNTH_TEST_
+#include <new>
+
+extern "C" {
+    // the two sides of each are called from different Python threads, to check they don't need locks
+    CommandQueue_t * test_command_queue_create() {
+        return new (std::nothrow) CommandQueue_t;
+    }
+
+    void test_command_queue_destroy(CommandQueue_t * queue) {
+        delete queue;
+    }
+
+    bool test_command_queue_push(CommandQueue_t * queue, unsigned int value) {
+        // value is split over the fields, so a torn command would show up
+        Command_t command = {(uint8_t)value, (uint8_t)(value >> 8), (uint16_t)(value >> 16), (float)value};
+        return queue->push(command);
+    }
+
+    bool test_command_queue_pop(CommandQueue_t * queue, unsigned int * value) {
+        // value: the pushed value, or -1 if the command was torn
+        Command_t command;
+        if (!queue->pop(&command)) {
+            return false;
+        }
+        *value = command.type | (command.note << 8) | (command.parameter << 16);
+        if (command.value != (float)*value) {
+            *value = -1;
+        }
+        return true;
+    }
+
+    PatchBuffer_t * test_patch_buffer_create(float fs) {
+        return new (std::nothrow) PatchBuffer_t(fs);
+    }
+
+    void test_patch_buffer_destroy(PatchBuffer_t * buffer) {
+        delete buffer;
+    }
+
+    void test_patch_buffer_publish(PatchBuffer_t * buffer, float value) {
+        // every field of the patch is set to value
+        SynthPatch_t * patch = buffer->edit();
+        patch->sustain = patch->modFreq = patch->modDepth = value;
+        patch->lpF = patch->lpRes = patch->hpF = patch->hpRes = value;
+        for (uint32_t i = 0; i < 3; i++) {
+            patch->lpB[i] = patch->lpA[i] = patch->hpB[i] = patch->hpA[i] = value;
+        }
+        buffer->publish();
+    }
+
+    bool test_patch_buffer_take(PatchBuffer_t * buffer, float * value) {
+        // value: the value of the newest patch, returns false if its fields don't all match
+        const SynthPatch_t * patch = buffer->take();
+        bool consistent = patch->sustain == patch->modFreq && patch->modDepth == patch->modFreq &&\
+                          patch->lpF == patch->modFreq && patch->lpRes == patch->modFreq &&\
+                          patch->hpF == patch->modFreq && patch->hpRes == patch->modFreq;
+        for (uint32_t i = 0; i < 3; i++) {
+            consistent = consistent && patch->lpB[i] == patch->modFreq && patch->lpA[i] == patch->modFreq &&\
+                         patch->hpB[i] == patch->modFreq && patch->hpA[i] == patch->modFreq;
+        }
+        *value = patch->modFreq;
+        return consistent;
+    }
+}
+#endif // SYNTH_TEST_
@@ -0,0 +1,146 @@
+/* MXCS Core Convolver implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <algorithm>
+#include <string.h>
+#include "Convolver.h"
+#include "Kernels.h"
+
+ConvolverStage_t::ConvolverStage_t(const float * response, uint32_t length, uint32_t _size) {
+    // params: response: the part of the impulse response this stage covers, length samples
+    //         size: samples per partition, a whole number of blocks
+    size = _size;
+    // at least twice the partition, so the last size samples of each transform aren't wrapped around
+    fft.set_size(2*size);
+    bins = fft.bins();
+    partitions = (length + size - 1)/size;
+    if (partitions == 0) {
+        partitions = 1;
+    }
+    responseRe.resize(partitions*bins);
+    responseIm.resize(partitions*bins);
+    delayRe.resize(partitions*bins);
+    delayIm.resize(partitions*bins);
+    accRe.resize(bins);
+    accIm.resize(bins);
+    window.resize(fft.get_size());
+    result.resize(fft.get_size());
+    std::vector<float> padded(fft.get_size());
+    for (uint32_t p = 0; p < partitions; p++) {
+        std::fill(padded.begin(), padded.end(), 0.0f);
+        const uint32_t start = p*size;
+        const uint32_t end = std::min(start + size, length);
+        std::copy(response + start, response + end, padded.begin());
+        fft.forward(padded.data(), responseRe.data() + p*bins, responseIm.data() + p*bins);
+    }
+    reset();
+}
+
+void ConvolverStage_t::reset() {
+    std::fill(delayRe.begin(), delayRe.end(), 0.0f);
+    std::fill(delayIm.begin(), delayIm.end(), 0.0f);
+    std::fill(window.begin(), window.end(), 0.0f);
+    std::fill(result.begin(), result.end(), 0.0f);
+    newest = 0;
+    filled = 0;
+    readIndex = fft.get_size() - size;
+}
+
+void ConvolverStage_t::transform() {
+    // the window goes into the delay line in place of the oldest input,
+    // then every input is multiplied by the partition of the response it has got up to
+    const uint32_t fftSize = fft.get_size();
+    newest = (newest + 1 == partitions) ? 0 : newest + 1;
+    fft.forward(window.data(), delayRe.data() + newest*bins, delayIm.data() + newest*bins);
+    memmove(window.data(), window.data() + size, (fftSize - size)*sizeof(float));
+    std::fill(accRe.begin(), accRe.end(), 0.0f);
+    std::fill(accIm.begin(), accIm.end(), 0.0f);
+    uint32_t input = newest;
+    for (uint32_t p = 0; p < partitions; p++) {
+        kernels->complex_mac(accRe.data(), accIm.data(), delayRe.data() + input*bins, delayIm.data() + input*bins,
+                             responseRe.data() + p*bins, responseIm.data() + p*bins, bins);
+        input = (input == 0) ? partitions - 1 : input - 1;
+    }
+    fft.inverse(accRe.data(), accIm.data(), result.data());
+    readIndex = fftSize - size;
+}
+
+void ConvolverStage_t::step(const float * in, float * out, uint32_t n) {
+    // n has to divide size, so the window fills up exactly at the end of a block
+    memcpy(window.data() + fft.get_size() - size + filled, in, n*sizeof(float));
+    filled += n;
+    if (filled == size) {
+        transform();
+        filled = 0;
+    }
+    kernels->accumulate(out, result.data() + readIndex, n);
+    readIndex += n;
+}
+
+Convolver_t::Convolver_t() {
+    blockSize = 0;
+}
+
+void Convolver_t::configure(const float * response, uint32_t length, uint32_t _blockSize, uint32_t maxPartition) {
+    // params: response: the impulse response, length samples
+    //         blockSize: samples per step
+    //         maxPartition: largest partition (in samples) for non-uniform partitions
+    // Each stage covers partitionGrowth - 1 of its partitions, which takes the response up to the point where the
+    // next stage's output starts (its size less a block). The last stage covers whatever is left
+    blockSize = _blockSize;
+    input.assign(blockSize, 0.0f);
+    stages.clear();
+    uint32_t offset = 0;
+    uint32_t size = blockSize;
+    while (offset < length) {
+        uint32_t covered = length - offset;
+        if ((uint64_t)size*partitionGrowth <= maxPartition && covered > (partitionGrowth - 1)*size) {
+            covered = (partitionGrowth - 1)*size;
+        }
+        stages.emplace_back(response + offset, covered, size);
+        offset += covered;
+        size *= partitionGrowth;
+    }
+}
+
+void Convolver_t::reset() {
+    for (ConvolverStage_t & stage : stages) {
+        stage.reset();
+    }
+}
+
+bool Convolver_t::is_active() {
+    return !stages.empty();
+}
+
+uint32_t Convolver_t::get_stages() {
+    return stages.size();
+}
+
+void Convolver_t::step(const float * in, float * out) {
+    memcpy(input.data(), in, blockSize*sizeof(float));
+    memset(out, 0, blockSize*sizeof(float));
+    for (ConvolverStage_t & stage : stages) {
+        stage.step(input.data(), out, blockSize);
+    }
+}
+
+#ifdef SYNTH_TEST_
+extern "C" {
+    unsigned int test_convolver(const float * response, unsigned int length, unsigned int blockSize,
+                                unsigned int maxPartition, const float * in, float * out, unsigned int n) {
+        // params: response: impulse response, length samples
+        //         blockSize: samples per step
+        //         maxPartition: largest partition for non-uniform partitions, 0 for uniform
+        //         in: n input samples, out: n output samples
+        //         if n is not a multiple of blockSize, the last fraction of a block won't be filled in
+        // returns the number of stages
+        Convolver_t convolver;
+        convolver.configure(response, length, blockSize, maxPartition);
+        for (unsigned int i = 0; i + blockSize <= n; i += blockSize) {
+            convolver.step(in + i, out + i);
+        }
+        return convolver.get_stages();
+    }
+}
+#endif // SYNTH_TEST_
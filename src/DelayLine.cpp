@@ -1,46 +1,139 @@
 /* MXCS Engine Delay Line implementation
    copyright Maximilian Cornwell 2024
 */
-
+#include <string.h>
 #include "DelayLine.h"
 
-DelayLine_t::DelayLine_t(float * memory_, int32_t length_) {
+DelayLine_t::DelayLine_t(float * memory_, uint32_t length_) {
     memory = memory_;
     length = length_;
-    for (uint32_t i = 0; i < length; i++) {
+    mask = length ? capacity(length) - 1 : 0;
+    index = 0;
+    for (uint32_t i = 0; i < capacity(length); i++) {
         memory[i] = 0;
     }
 }
 
-void DelayLine_t::insert(float value) {
-    index--;
-    if (index < 0) {
-        index = length - 1;
+uint32_t DelayLine_t::capacity(uint32_t length) {
+    // smallest power of 2 that fits length (0 for 0)
+    uint32_t size = 1;
+    if (length == 0) {
+        return 0;
     }
-    memory[index] = value;
+    while (size < length) {
+        size <<= 1;
+    }
+    return size;
+}
+
+void DelayLine_t::insert(float value) {
+    memory[index & mask] = value;
+    index++;
 }
 
 float DelayLine_t::access(uint32_t delay) {
+    // delay 0 is the most recently inserted sample
     // TODO add error condition?: delay > length
-    uint32_t wrapped_idx = (index + delay) % length; // there are probably more efficient ways of handling this
-    return memory[wrapped_idx];
+    return memory[(index - 1 - delay) & mask];
+}
+
+float DelayLine_t::access_linear(float delay) {
+    // fractional delay, linearly interpolated between the neighbouring samples
+    uint32_t whole = (uint32_t)delay;
+    float fraction = delay - whole;
+    float x0 = access(whole);
+    float x1 = access(whole + 1);
+    return x0 + fraction*(x1 - x0);
+}
+
+float DelayLine_t::access_allpass(float delay, float * state) {
+    // fractional delay, using a first order allpass interpolator
+    // flat magnitude response, but it needs to be read once per sample
+    // state: the previous output for this read, start it at 0
+    uint32_t whole = (uint32_t)delay;
+    float fraction = delay - whole;
+    if (fraction < 0.1f && whole > 0) {
+        // the coefficient gets close to 1 for small fractions, which rings, so use the range 0.1-1.1
+        whole--;
+        fraction += 1;
+    }
+    float eta = (1 - fraction)/(1 + fraction);
+    float y = eta*access(whole) + access(whole + 1) - eta*(*state);
+    *state = y;
+    return y;
+}
+
+void DelayLine_t::write(const float * in, uint32_t n) {
+    // inserts n samples, as (at most) two copies
+    uint32_t size = mask + 1;
+    if (n > size) {
+        // only the last samples will fit
+        index += n - size;
+        in += n - size;
+        n = size;
+    }
+    uint32_t start = index & mask;
+    uint32_t first = (n < size - start) ? n : size - start;
+    memcpy(memory + start, in, first*sizeof(float));
+    memcpy(memory, in + first, (n - first)*sizeof(float));
+    index += n;
+}
+
+void DelayLine_t::read(float * out, uint32_t n, uint32_t delay) {
+    // reads n samples in order, the last one delay samples before the most recently written
+    // i.e. after writing a block, read(out, n, delay) gives the block delayed by delay samples
+    // delay + n needs to be no more than the capacity
+    uint32_t size = mask + 1;
+    uint32_t start = (index - delay - n) & mask;
+    uint32_t first = (n < size - start) ? n : size - start;
+    memcpy(out, memory + start, first*sizeof(float));
+    memcpy(out + first, memory, (n - first)*sizeof(float));
 }
 
 #ifdef SYNTH_TEST_
 extern "C" {
+    unsigned int test_delay_line_capacity(unsigned int lineLength) {
+        return DelayLine_t::capacity(lineLength);
+    }
+
     void test_delay_line(float * in, float * out, uint32_t * delays,\
                          unsigned int ioLen, float * lineMemory, unsigned int lineLength) {
         // params: in: array of input values
         //         out: array of output values
         //         delays: amount of delay to use at each time step
         //         ioLen: length of input/output/delay arrays
-        //         lineMemory: memory to initialise delay line with
-        //         lineLength: the length of the delay line (should be no more than the memory provided)
+        //         lineMemory: memory to initialise delay line with, test_delay_line_capacity(lineLength) long
+        //         lineLength: the length of the delay line
         DelayLine_t delayLine(lineMemory, lineLength);
         for (unsigned int i = 0; i < ioLen; i++) {
             delayLine.insert(in[i]);
             out[i] = delayLine.access(delays[i]);
         }
     }
+
+    void test_delay_line_block(float * in, float * out, unsigned int ioLen, unsigned int blockSize,\
+                               unsigned int delay, float * lineMemory, unsigned int lineLength) {
+        // params: blockSize: samples to write/read at a time
+        //         delay: delay to read each block at
+        //         the rest as test_delay_line
+        DelayLine_t delayLine(lineMemory, lineLength);
+        for (unsigned int i = 0; i + blockSize <= ioLen; i += blockSize) {
+            delayLine.write(in + i, blockSize);
+            delayLine.read(out + i, blockSize, delay);
+        }
+    }
+
+    void test_delay_line_fractional(float * in, float * out, float * delays, unsigned int ioLen,\
+                                    unsigned int allpass, float * lineMemory, unsigned int lineLength) {
+        // params: delays: fractional delay to read at each time step
+        //         allpass: 1 for allpass interpolation, 0 for linear
+        //         the rest as test_delay_line
+        DelayLine_t delayLine(lineMemory, lineLength);
+        float state = 0;
+        for (unsigned int i = 0; i < ioLen; i++) {
+            delayLine.insert(in[i]);
+            out[i] = allpass ? delayLine.access_allpass(delays[i], &state) : delayLine.access_linear(delays[i]);
+        }
+    }
 }
 #endif
@@ -0,0 +1,370 @@
+/* MXCS Engine C API implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <new>
+#include <string.h>
+#include "Constants.h"
+#include "Engine.h"
+#include "Kernels.h"
+#include "Midi.h"
+#include "Synth.h"
+
+struct MxcsEngine_t {
+    Synth_t synth;
+
+    MxcsEngine_t(float samplingFrequency, uint16_t voices, uint32_t blockSize):
+        synth(samplingFrequency, voices, blockSize) {}
+};
+
+struct MxcsMidi_t {
+    MidiReader_t reader;
+};
+
+MxcsEngine_t * mxcs_create(float samplingFrequency, unsigned int voices, unsigned int blockSize) {
+    // params: samplingFrequency: sampling frequency (Hz)
+    //         voices: size of the voice pool (clamped to maxVoices)
+    //         blockSize: samples per block (clamped to maxBlockSize), 0 for the default
+    // returns a handle to the new engine, or nullptr if samplingFrequency isn't positive or it couldn't be allocated
+    if (!(samplingFrequency > 0)) {
+        return nullptr;
+    }
+    if (voices > maxVoices) {
+        voices = maxVoices;
+    }
+    if (blockSize == 0) {
+        blockSize = defaultBlockSize;
+    }
+    return new (std::nothrow) MxcsEngine_t(samplingFrequency, voices, blockSize);
+}
+
+void mxcs_destroy(MxcsEngine_t * engine) {
+    delete engine;
+}
+
+unsigned int mxcs_block_size(MxcsEngine_t * engine) {
+    return engine->synth.get_block_size();
+}
+
+MxcsError_t mxcs_set_parameter(MxcsEngine_t * engine, unsigned int parameter, float value) {
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    return engine->synth.set_parameter(parameter, value);
+}
+
+MxcsError_t mxcs_press(MxcsEngine_t * engine, unsigned int note) {
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (note >= notes) {
+        return ERROR_INVALID_VALUE;
+    }
+    engine->synth.press(note);
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_release(MxcsEngine_t * engine, unsigned int note) {
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (note >= notes) {
+        return ERROR_INVALID_VALUE;
+    }
+    engine->synth.release(note);
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_schedule(MxcsEngine_t * engine, const Event_t * events, unsigned int nEvents) {
+    // params: events: events to queue, times are in samples since the engine was created
+    //         nEvents: number of events
+    // events happen on the sample they are scheduled for, they don't need to be in order
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    for (unsigned int i = 0; i < nEvents; i++) {
+        if (events[i].note >= notes || events[i].type > pressEvent) {
+            return ERROR_INVALID_VALUE;
+        }
+        if (!engine->synth.schedule(events[i])) {
+            return ERROR_QUEUE_FULL;
+        }
+    }
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_flush_events(MxcsEngine_t * engine) {
+    // applies the events scheduled for the next block, so that more can be scheduled for it
+    // when there are more than fit in the queue. The voices are run up to the last of them,
+    // and the samples become the start of the next block rendered
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    engine->synth.flush_events();
+    return SUCCESS;
+}
+
+unsigned int mxcs_get_time(MxcsEngine_t * engine) {
+    // time (in samples) at the start of the next block
+    return engine->synth.get_time();
+}
+
+MxcsError_t mxcs_step(MxcsEngine_t * engine, float * out, unsigned int blocks) {
+    // params: out: output buffer, needs to hold blocks*blockSize samples
+    //         blocks: number of blocks to render
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    const uint32_t blockSize = engine->synth.get_block_size();
+    for (unsigned int i = 0; i < blocks; i++) {
+        engine->synth.step(out + i*blockSize);
+    }
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_step_pcm(MxcsEngine_t * engine, void * out, unsigned int blocks, unsigned int format) {
+    // params: out: output buffer, needs to hold blocks*blockSize samples in format
+    //         blocks: number of blocks to render
+    //         format: SampleFormat_e, integers are clipped and (unless paramDither is 0) dithered
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (format > formatInt32) {
+        return ERROR_INVALID_VALUE;
+    }
+    const uint32_t blockBytes = engine->synth.get_block_size()*sample_bytes((SampleFormat_e)format);
+    for (unsigned int i = 0; i < blocks; i++) {
+        engine->synth.step_pcm((uint8_t *)out + i*blockBytes, (SampleFormat_e)format);
+    }
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_set_impulse_response(MxcsEngine_t * engine, const float * response, unsigned int length,\
+                                      unsigned int maxPartition) {
+    // params: response: impulse response to convolve the output with, length samples (0 to remove it)
+    //         maxPartition: largest partition (in samples), for non-uniform partitions.
+    //                       0 (or the block size) partitions it uniformly into blocks
+    // allocates the convolver, so it shouldn't be called while rendering in real time
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (response == nullptr && length > 0) {
+        return ERROR_INVALID_VALUE;
+    }
+    try {
+        engine->synth.set_impulse_response(response, length, maxPartition);
+    } catch (const std::bad_alloc &) {
+        // rather than leave it part configured
+        engine->synth.set_impulse_response(nullptr, 0, 0);
+        return ERROR_OUT_OF_MEMORY;
+    }
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_apply_patch(MxcsEngine_t * engine, const Patch_t * patch) {
+    // applies everything in the patch except the number of voices, which is fixed at creation
+    MxcsError_t error = SUCCESS;
+    if (patch == nullptr) {
+        return ERROR_INVALID_VALUE;
+    }
+    const float values[] = {patch->attack, patch->decay, patch->sustain, patch->release,
+                            patch->modFreq, patch->modDepth,
+                            patch->lpfFreq, patch->lpfRes, patch->hpfFreq, patch->hpfRes,
+                            (float)patch->generator};
+    for (unsigned int i = 0; i < sizeof(values)/sizeof(values[0]) && error == SUCCESS; i++) {
+        error = mxcs_set_parameter(engine, paramAttack + i, values[i]);
+    }
+    return error;
+}
+
+MxcsError_t mxcs_render(const Patch_t * patch, float samplingFrequency,\
+                        const Event_t * events, unsigned int nEvents,\
+                        float * out, unsigned int n) {
+    // params: patch: settings to render with
+    //         samplingFrequency: sampling frequency (Hz)
+    //         events: note events, sorted by time (in samples)
+    //         nEvents: number of events
+    //         out: output buffer, n samples long
+    //         n: number of samples to render
+    // renders with its own engine, so it is safe to call from several threads at once
+    float lastBlock[maxBlockSize];
+    unsigned int eventCount = 0;
+    if (patch == nullptr || !(samplingFrequency > 0)) {
+        return ERROR_INVALID_VALUE;
+    }
+    MxcsEngine_t * engine = mxcs_create(samplingFrequency, patch->voices, patch->blockSize);
+    if (engine == nullptr) {
+        return ERROR_OUT_OF_MEMORY;
+    }
+    const uint32_t blockSize = engine->synth.get_block_size();
+    MxcsError_t error = mxcs_apply_patch(engine, patch);
+    for (unsigned int i = 0; i < n && error == SUCCESS; i += blockSize) {
+        // queue up everything that happens during this block, flushing the queue when it's full
+        unsigned int blockEnd = eventCount;
+        while (blockEnd < nEvents && events[blockEnd].time < i + blockSize) {
+            blockEnd++;
+        }
+        while (error == SUCCESS) {
+            unsigned int slice = (blockEnd - eventCount < eventQueueSize) ? blockEnd - eventCount : eventQueueSize;
+            error = mxcs_schedule(engine, events + eventCount, slice);
+            eventCount += slice;
+            if (eventCount == blockEnd) {
+                break;
+            }
+            engine->synth.flush_events();
+        }
+        if (i + blockSize <= n) {
+            engine->synth.step(out + i);
+        } else {
+            // the final fraction of a block
+            engine->synth.step(lastBlock);
+            memcpy(out + i, lastBlock, (n - i)*sizeof(float));
+        }
+    }
+    mxcs_destroy(engine);
+    return error;
+}
+
+MxcsError_t mxcs_get_profile(MxcsEngine_t * engine, Profile_t * profile) {
+    // params: profile: filled in with the stage timings and load since the last reset
+    // only available when built with SYNTH_PROFILE_
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (profile == nullptr) {
+        return ERROR_INVALID_VALUE;
+    }
+    const Profile_t * current = engine->synth.get_profile();
+    if (current == nullptr) {
+        return ERROR_UNSUPPORTED;
+    }
+    *profile = *current;
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_reset_profile(MxcsEngine_t * engine) {
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (engine->synth.get_profile() == nullptr) {
+        return ERROR_UNSUPPORTED;
+    }
+    engine->synth.reset_profile();
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_set_render_cache(MxcsEngine_t * engine, size_t bytes) {
+    // params: bytes: budget for caching the output of scheduled notes, 0 turns it off (and empties it)
+    // notes are recorded as they're rendered, which allocates, so it's for rendering offline
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    engine->synth.set_render_cache(bytes);
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_get_render_cache_stats(MxcsEngine_t * engine, RenderCacheStats_t * stats) {
+    // params: stats: filled in with the hits, misses etc. since the engine was created
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (stats == nullptr) {
+        return ERROR_INVALID_VALUE;
+    }
+    *stats = *engine->synth.get_render_cache_stats();
+    return SUCCESS;
+}
+
+MxcsError_t mxcs_post_parameter(MxcsEngine_t * engine, unsigned int parameter, float value) {
+    // the mxcs_post_ functions can be called from one control thread while another renders,
+    // and take effect at the start of the next block
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    return engine->synth.post_parameter(parameter, value);
+}
+
+MxcsError_t mxcs_post_press(MxcsEngine_t * engine, unsigned int note) {
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (note >= notes) {
+        return ERROR_INVALID_VALUE;
+    }
+    return engine->synth.post_press(note);
+}
+
+MxcsError_t mxcs_post_release(MxcsEngine_t * engine, unsigned int note) {
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (note >= notes) {
+        return ERROR_INVALID_VALUE;
+    }
+    return engine->synth.post_release(note);
+}
+
+MxcsError_t mxcs_post_patch(MxcsEngine_t * engine, const Patch_t * patch) {
+    // like mxcs_apply_patch, but the work is done on the calling thread, and the audio thread just swaps it in
+    if (engine == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (patch == nullptr) {
+        return ERROR_INVALID_VALUE;
+    }
+    return engine->synth.post_patch(patch);
+}
+
+unsigned int mxcs_get_isa() {
+    return get_isa();
+}
+
+MxcsError_t mxcs_set_isa(unsigned int isa) {
+    // overrides the instruction set picked when the library was loaded, e.g. to benchmark each one.
+    // Shared by every engine, so should only be changed while none are rendering
+    if (isa >= isaCount) {
+        return ERROR_INVALID_VALUE;
+    }
+    if (!set_isa((Isa_e)isa)) {
+        return ERROR_UNSUPPORTED;
+    }
+    return SUCCESS;
+}
+
+bool mxcs_isa_supported(unsigned int isa) {
+    return (isa < isaCount) && isa_supported((Isa_e)isa);
+}
+
+MxcsMidi_t * mxcs_midi_create() {
+    return new (std::nothrow) MxcsMidi_t;
+}
+
+void mxcs_midi_destroy(MxcsMidi_t * midi) {
+    delete midi;
+}
+
+MxcsError_t mxcs_midi_open(MxcsMidi_t * midi, const uint8_t * data, size_t size, float samplingFrequency) {
+    // params: data: the whole file, which isn't copied, so it needs to be kept until the reader is destroyed
+    //         size: length of data (in bytes)
+    //         samplingFrequency: sampling frequency (Hz) the event times are in
+    if (midi == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    return midi->reader.open(data, size, samplingFrequency);
+}
+
+MxcsError_t mxcs_midi_read(MxcsMidi_t * midi, Event_t * events, unsigned int n, unsigned int * count) {
+    // params: events: filled in with up to n note events, in time order
+    //         count: number of events read, less than n once the file has been read to the end
+    if (midi == nullptr) {
+        return ERROR_INVALID_HANDLE;
+    }
+    if (count == nullptr) {
+        return ERROR_INVALID_VALUE;
+    }
+    return midi->reader.read(events, n, count);
+}
+
+unsigned int mxcs_midi_time(MxcsMidi_t * midi) {
+    // time (in samples) of the last event read, including ones that aren't notes
+    return midi->reader.get_time();
+}
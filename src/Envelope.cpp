@@ -2,8 +2,10 @@
    copyright Maximilian Cornwell 2023
 */
 #include <stdint.h>
+#include <math.h>
 #include "Envelope.h"
 #include "Constants.h"
+#include "Kernels.h"
 #include "Utils.h"
 
 const float baseLevel = 0.00001;
@@ -24,6 +26,15 @@ void EnvelopeSettings_t::set_adsr() {
     dIncrement = db2mag(s/d);                  // d is a number of samples per 100 dB
     sMag = db2mag(s);                          // s is a level in dBFS
     rIncrement = db2mag(-(baseLevelDB+s)/r); // r is a number of samples
+    aLog = logf(aIncrement);
+    dLog = logf(dIncrement);
+    rLog = logf(rIncrement);
+    // calculated in double precision, so the error doesn't depend on the power
+    for (uint32_t k = 0; k < envLanes; k++) {
+        aPowers[k] = pow((double)aIncrement, k + 1);
+        dPowers[k] = pow((double)dIncrement, k + 1);
+        rPowers[k] = pow((double)rIncrement, k + 1);
+    }
 }
 
 void EnvelopeSettings_t::set_attack(float attackTime) {
@@ -52,11 +63,38 @@ Envelope_t::Envelope_t(EnvelopeSettings_t * _settings) {
     settings = _settings;
 }
 
-void Envelope_t::step(float * envelope) {
-    for(uint8_t i = 0; i < blockSize; i++) {
-        (this->*run_state)();
-        envelope[i] = amp;
-    };
+void Envelope_t::step(float * envelope, uint32_t n) {
+    // each state fills as much of the block as it can, and returns how many samples it filled,
+    // so the state is only dispatched per segment, except around the transitions
+    uint32_t i = 0;
+    while (i < n) {
+        i += (this->*run_state)(envelope + i, n - i);
+    }
+}
+
+uint32_t Envelope_t::ramp_length(float target, float incrementLog, bool rising, uint32_t n) {
+    // number of samples that can safely be ramped before amp crosses target
+    // amp*increment^k crosses target when k = log(target/amp)/log(increment)
+    // two samples are left over, so rounding can't take the ramp past the target
+    // the last few samples are run one at a time, to get the transition exactly right
+    if (rising ? amp >= target : amp <= target) {
+        // already past the target (e.g. the increment is going the wrong way)
+        return 0;
+    }
+    float samples = logf(target/amp)/incrementLog;
+    if (!(samples > 2)) {
+        // also catches NaN, e.g. before the settings have been configured
+        return 0;
+    }
+    if (samples - 1 >= n) {
+        return n;
+    }
+    return (uint32_t)samples - 1;
+}
+
+void Envelope_t::ramp(float * envelope, uint32_t n, const float * powers) {
+    // geometric ramp, each group of envLanes samples is calculated from the last sample of the previous one
+    amp = kernels->ramp(powers, amp, envelope, n);
 }
 
 void Envelope_t::press() {
@@ -70,32 +108,83 @@ void Envelope_t::release() {
     run_state = &Envelope_t::run_release;
 }
 
-void Envelope_t::run_off() {
+bool Envelope_t::is_active() {
+    return run_state != &Envelope_t::run_off;
+}
+
+float Envelope_t::get_amp() {
+    return amp;
+}
+
+uint32_t Envelope_t::run_off(float * envelope, uint32_t n) {
     amp = 0;
+    for (uint32_t i = 0; i < n; i++) {
+        envelope[i] = 0;
+    }
+    return n;
 }
 
-void Envelope_t::run_attack() {
+uint32_t Envelope_t::run_attack(float * envelope, uint32_t n) {
+    uint32_t len = ramp_length(1.0, settings->aLog, true, n);
+    if (len) {
+        ramp(envelope, len, settings->aPowers);
+        return len;
+    }
     amp *= settings->aIncrement;
     if (amp >= 1.0) {
         amp = 1.0;
         run_state = &Envelope_t::run_decay;
     }
+    envelope[0] = amp;
+    return 1;
 }
 
-void Envelope_t::run_decay() {
+uint32_t Envelope_t::run_decay(float * envelope, uint32_t n) {
+    uint32_t len = ramp_length(settings->sMag, settings->dLog, false, n);
+    if (len) {
+        ramp(envelope, len, settings->dPowers);
+        return len;
+    }
     amp *= settings->dIncrement;
     if (amp <= settings->sMag) {
         amp = settings->sMag;
         run_state = &Envelope_t::run_sustain;
     }
+    envelope[0] = amp;
+    return 1;
 }
 
-void Envelope_t::run_sustain() {
-    amp = settings->sMag;
+uint32_t Envelope_t::run_sustain(float * envelope, uint32_t n) {
+    if (amp != settings->sMag) {
+        // the sustain level has changed, glide to it rather than jumping
+        const float start = amp;
+        const float step = (settings->sMag - amp)/n;
+        for (uint32_t i = 0; i < n; i++) {
+            envelope[i] = start + (i + 1)*step;
+        }
+        amp = settings->sMag;
+        return n;
+    }
+    for (uint32_t i = 0; i < n; i++) {
+        envelope[i] = amp;
+    }
+    return n;
 }
 
-void Envelope_t::run_release() {
+uint32_t Envelope_t::run_release(float * envelope, uint32_t n) {
+    uint32_t len = ramp_length(baseLevel, settings->rLog, false, n);
+    if (len) {
+        ramp(envelope, len, settings->rPowers);
+        return len;
+    }
     amp *= settings->rIncrement; // linear shift for now
+    if (amp < baseLevel) {
+        // below -100 dB, the voice can be considered finished
+        amp = 0;
+        run_state = &Envelope_t::run_off;
+    }
+    envelope[0] = amp;
+    return 1;
 }
 
 
@@ -104,7 +193,8 @@ extern "C" {
     void test_envelope(const float a, const float d, const float s, const float r,\
                     const unsigned int presses, unsigned int pressNs[],\
                     const unsigned int releases, unsigned int releaseNs[],\
-                    const unsigned int n, const float fs, float envOut[]) {
+                    const unsigned int n, const unsigned int blockSize,\
+                    const float fs, float envOut[]) {
         // parameters:  a: attack time (in samples)
         //              d: decay time (in samples)
         //              s: sustain level (amplitude between 0 and 1)
@@ -114,7 +204,8 @@ extern "C" {
         //              releaseNs: times at which to release
         //              releaseNs: number of releases
         //              n: number of samples to iterate over.
-        //              if n is not a multiple of block_size, the last fraction of a block won't be filled in
+        //              if n is not a multiple of blockSize, the last fraction of a block won't be filled in
+        //              blockSize: number of samples to run at a time
         //              envOut: generated envelope
         EnvelopeSettings_t adsr(fs);
         Envelope_t env(&adsr);
@@ -125,15 +216,26 @@ extern "C" {
         adsr.set_sustain(s);
         adsr.set_release(r);
         for(unsigned int i=0; i+blockSize <= n; i+= blockSize) {
-            if(pressCount < presses && i >= pressNs[pressCount]) {
-                env.press();
-                pressCount++;
-            }
-            if(releaseCount < releases && i >= releaseNs[releaseCount]) {
-                env.release();
-                releaseCount++;
+            // run up to each press/release in the block, so they happen on the right sample
+            unsigned int offset = 0;
+            while((pressCount < presses && pressNs[pressCount] < i + blockSize) ||
+                  (releaseCount < releases && releaseNs[releaseCount] < i + blockSize)) {
+                bool isPress = pressCount < presses &&
+                               (releaseCount == releases || pressNs[pressCount] <= releaseNs[releaseCount]);
+                unsigned int eventN = isPress ? pressNs[pressCount] : releaseNs[releaseCount];
+                if (eventN > i + offset) {
+                    env.step(envOut + i + offset, eventN - i - offset);
+                    offset = eventN - i;
+                }
+                if (isPress) {
+                    env.press();
+                    pressCount++;
+                } else {
+                    env.release();
+                    releaseCount++;
+                }
             }
-            env.step(envOut + i);
+            env.step(envOut + i + offset, blockSize - offset);
         }
     }
 }
@@ -0,0 +1,56 @@
+/* MXCS Engine Event Queue implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include "EventQueue.h"
+
+const uint32_t indexMask = eventQueueSize - 1;
+
+EventQueue_t::EventQueue_t() {
+    clear();
+}
+
+bool EventQueue_t::push(Event_t event) {
+    // returns false if the queue is full
+    // events usually arrive in order, so this is normally just an append
+    if (count == eventQueueSize) {
+        return false;
+    }
+    uint32_t i = count;
+    // shift later events back to make space, events with the same time keep their order
+    // times are compared as a signed difference, so they can wrap around
+    while (i > 0 && (int32_t)(events[(head + i - 1) & indexMask].time - event.time) > 0) {
+        events[(head + i) & indexMask] = events[(head + i - 1) & indexMask];
+        i--;
+    }
+    events[(head + i) & indexMask] = event;
+    count++;
+    return true;
+}
+
+bool EventQueue_t::empty() {
+    return count == 0;
+}
+
+const Event_t * EventQueue_t::peek() {
+    // earliest event, only valid if the queue isn't empty
+    return &events[head];
+}
+
+uint32_t EventQueue_t::size() {
+    return count;
+}
+
+const Event_t * EventQueue_t::at(uint32_t i) {
+    // only valid for i < size()
+    return &events[(head + i) & indexMask];
+}
+
+void EventQueue_t::pop() {
+    head = (head + 1) & indexMask;
+    count--;
+}
+
+void EventQueue_t::clear() {
+    head = 0;
+    count = 0;
+}
@@ -0,0 +1,145 @@
+/* MXCS Core FFT implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <math.h>
+#include "Fft.h"
+
+Fft_t::Fft_t(uint32_t size) {
+    set_size(size);
+}
+
+void Fft_t::set_size(uint32_t _size) {
+    size = 2;
+    while (size < _size) {
+        size <<= 1;
+    }
+    half = size/2;
+    reversed.resize(half);
+    twiddleRe.resize(half);
+    twiddleIm.resize(half);
+    inverseIm.resize(half);
+    splitRe.resize(half + 1);
+    splitIm.resize(half + 1);
+    workRe.resize(half);
+    workIm.resize(half);
+    uint32_t bits = 0;
+    while ((1u << bits) < half) {
+        bits++;
+    }
+    for (uint32_t i = 0; i < half; i++) {
+        uint32_t r = 0;
+        for (uint32_t bit = 0; bit < bits; bit++) {
+            r |= ((i >> bit) & 1) << (bits - 1 - bit);
+        }
+        reversed[i] = r;
+    }
+    // calculated in double precision, the errors would build up over the passes otherwise
+    for (uint32_t h = 1; h < half; h <<= 1) {
+        for (uint32_t j = 0; j < h; j++) {
+            twiddleRe[h - 1 + j] = cos(M_PI*j/h);
+            twiddleIm[h - 1 + j] = -sin(M_PI*j/h);
+            inverseIm[h - 1 + j] = sin(M_PI*j/h);
+        }
+    }
+    for (uint32_t k = 0; k <= half; k++) {
+        splitRe[k] = cos(2*M_PI*k/size);
+        splitIm[k] = -sin(2*M_PI*k/size);
+    }
+}
+
+uint32_t Fft_t::get_size() {
+    return size;
+}
+
+uint32_t Fft_t::bins() {
+    return half + 1;
+}
+
+void Fft_t::transform(bool inverse) {
+    // in place on the work arrays, which are already in bit reversed order
+    float * re = workRe.data();
+    float * im = workIm.data();
+    const float * wIm = inverse ? inverseIm.data() : twiddleIm.data();
+    // the first pass only needs the twiddle of 1
+    for (uint32_t i = 0; i + 1 < half; i += 2) {
+        const float tRe = re[i + 1];
+        const float tIm = im[i + 1];
+        re[i + 1] = re[i] - tRe;
+        im[i + 1] = im[i] - tIm;
+        re[i] += tRe;
+        im[i] += tIm;
+    }
+    for (uint32_t h = 2; h < half; h <<= 1) {
+        const float * wr = twiddleRe.data() + h - 1;
+        const float * wi = wIm + h - 1;
+        for (uint32_t start = 0; start < half; start += 2*h) {
+            float * aRe = re + start;
+            float * aIm = im + start;
+            float * bRe = aRe + h;
+            float * bIm = aIm + h;
+            for (uint32_t j = 0; j < h; j++) {
+                const float tRe = wr[j]*bRe[j] - wi[j]*bIm[j];
+                const float tIm = wr[j]*bIm[j] + wi[j]*bRe[j];
+                bRe[j] = aRe[j] - tRe;
+                bIm[j] = aIm[j] - tIm;
+                aRe[j] += tRe;
+                aIm[j] += tIm;
+            }
+        }
+    }
+}
+
+void Fft_t::forward(const float * in, float * re, float * im) {
+    // the even samples are the real part, the odd ones the imaginary part,
+    // then the spectra of the two halves are split out of the result and combined
+    for (uint32_t n = 0; n < half; n++) {
+        workRe[reversed[n]] = in[2*n];
+        workIm[reversed[n]] = in[2*n + 1];
+    }
+    transform(false);
+    for (uint32_t k = 0; k <= half; k++) {
+        const uint32_t a = (k == half) ? 0 : k;
+        const uint32_t b = (k == 0) ? 0 : half - k;
+        const float evenRe = 0.5f*(workRe[a] + workRe[b]);
+        const float evenIm = 0.5f*(workIm[a] - workIm[b]);
+        const float oddRe = 0.5f*(workIm[a] + workIm[b]);
+        const float oddIm = 0.5f*(workRe[b] - workRe[a]);
+        re[k] = evenRe + splitRe[k]*oddRe - splitIm[k]*oddIm;
+        im[k] = evenIm + splitRe[k]*oddIm + splitIm[k]*oddRe;
+    }
+}
+
+void Fft_t::inverse(const float * re, const float * im, float * out) {
+    // the reverse of forward, the spectra of the even and odd samples are combined into one complex FFT
+    const float scale = 1.0f/size;
+    for (uint32_t k = 0; k < half; k++) {
+        const uint32_t b = half - k;
+        const float evenRe = re[k] + re[b];
+        const float evenIm = im[k] - im[b];
+        const float diffRe = re[k] - re[b];
+        const float diffIm = im[k] + im[b];
+        // rotated by the conjugate of the split twiddle
+        const float oddRe = diffRe*splitRe[k] + diffIm*splitIm[k];
+        const float oddIm = diffIm*splitRe[k] - diffRe*splitIm[k];
+        workRe[reversed[k]] = scale*(evenRe - oddIm);
+        workIm[reversed[k]] = scale*(evenIm + oddRe);
+    }
+    transform(true);
+    for (uint32_t n = 0; n < half; n++) {
+        out[2*n] = workRe[n];
+        out[2*n + 1] = workIm[n];
+    }
+}
+
+#ifdef SYNTH_TEST_
+extern "C" {
+    void test_fft(const float * in, float * re, float * im, float * out, unsigned int size) {
+        // params: in: size samples (a power of 2)
+        //         re, im: the size/2 + 1 bins of its spectrum
+        //         out: in, transformed back from re and im
+        Fft_t fft(size);
+        fft.forward(in, re, im);
+        fft.inverse(re, im, out);
+    }
+}
+#endif // SYNTH_TEST_
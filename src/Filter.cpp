@@ -3,7 +3,28 @@
 */
 #include "Constants.h"
 #include "Filter.h"
+#include "Kernels.h"
 #include <math.h>
+#include <float.h>
+#include <string.h>
+
+const uint32_t maxRootIterations = 5000; // repeated roots (e.g. all the zeros of a lowpass) converge slowly
+const double rootTolerance = 1e-14;
+const double realTolerance = 1e-9;    // roots with a smaller imaginary part are treated as real
+
+// a zero or pole, zeros can also be at infinity (i.e. a pure delay)
+struct Root_t {
+    std::complex<double> value;
+    bool infinite;
+};
+
+// one or two roots, as a polynomial in z^-1
+struct RootGroup_t {
+    double coeffs[3];
+    uint32_t size;
+    std::complex<double> position; // used for pairing zeros with poles
+    bool used;
+};
 
 void IIR_Filter_t::set_coeffs(float * b_, float * a_) {
     b = b_;
@@ -22,14 +43,14 @@ Filter_DFI_t::Filter_DFI_t():
 }
 
 Filter_DFI_t::Filter_DFI_t(float * memory_, float * b_, float * a_, uint32_t order_):
-    x_delay_line(memory_, order_), y_delay_line(memory_ + order_, order_) {
-    // memory length needs to be 2*order
+    x_delay_line(memory_, order_), y_delay_line(memory_ + DelayLine_t::capacity(order_), order_) {
+    // memory length needs to be 2*DelayLine_t::capacity(order)
     order = order_;
     set_coeffs(b_, a_);
 }
 
-void Filter_DFI_t::step(float * in, float * out) {
-    for (uint32_t i = 0; i < blockSize; i++) {
+void Filter_DFI_t::step(float * in, float * out, uint32_t n) {
+    for (uint32_t i = 0; i < n; i++) {
         out[i] = b[0]*in[i];
         for (uint32_t j=0; j<order; j++) {
             out[i] += b[j+1]*x_delay_line.access(j);
@@ -47,15 +68,16 @@ Filter_DFII_t::Filter_DFII_t():
 
 Filter_DFII_t::Filter_DFII_t(float * memory_, float * b_, float * a_, uint32_t order_):
     v_delay_line(memory_, order_) {
+    // memory length needs to be DelayLine_t::capacity(order)
     order = order_;
     set_coeffs(b_, a_);
 }
 
-void Filter_DFII_t::step(float * in, float * out) {
+void Filter_DFII_t::step(float * in, float * out, uint32_t n) {
     float v;
     float vn;
     float y;
-    for (uint32_t i = 0; i < blockSize; i++) {
+    for (uint32_t i = 0; i < n; i++) {
         v = in[i];
         y = 0;
         for (uint32_t j = 0; j < order; j++) {
@@ -83,9 +105,9 @@ Filter_TDFI_t::Filter_TDFI_t(float * memory_, float * b_, float * a_, uint32_t o
     }
 }
 
-void Filter_TDFI_t::step(float * in, float * out) {
+void Filter_TDFI_t::step(float * in, float * out, uint32_t n) {
     float v;
-    for (uint32_t i = 0; i < blockSize; i++) {
+    for (uint32_t i = 0; i < n; i++) {
         v = in[i] + back_state[0];
         out[i] = forward_state[0] + b[0]*v;
         for (uint32_t j = 0; j < order-1; j++) {
@@ -106,8 +128,8 @@ Filter_TDFII_t::Filter_TDFII_t(float * memory_, float * b_, float * a_, uint32_t
     }
 }
 
-void Filter_TDFII_t::step(float * in, float * out) {
-    for (uint32_t i = 0; i < blockSize; i++) {
+void Filter_TDFII_t::step(float * in, float * out, uint32_t n) {
+    for (uint32_t i = 0; i < n; i++) {
         out[i] = b[0]*in[i] + state[0];
         for (uint32_t j = 0; j < order-1; j++) {
             state[j] = state[j+1] + b[j+1]*in[i] - a[j+1]*out[i];
@@ -116,8 +138,9 @@ void Filter_TDFII_t::step(float * in, float * out) {
     }
 }
 
-Biquad_Filter_t::Biquad_Filter_t(float _samplingFrequency) {
+Biquad_Filter_t::Biquad_Filter_t(float _samplingFrequency, CoeffCache_t * _cache) {
     samplingFrequency = _samplingFrequency;
+    cache = _cache;
     float a_[3] = {1, 0, 0};
     float b_[3] = {1, 0, 0};
     set_coeffs(a_, b_);
@@ -127,17 +150,30 @@ Biquad_Filter_t::Biquad_Filter_t(float _samplingFrequency) {
 
 Biquad_Filter_t::Biquad_Filter_t(float _samplingFrequency, float * b_, float * a_) {
     samplingFrequency = _samplingFrequency;
+    cache = nullptr;
     set_coeffs(b_, a_);
     state[0] = 0;
     state[1] = 0;
 }
 
-void Biquad_Filter_t::step(float * in, float * out) {
-    for (uint32_t i = 0; i < blockSize; i++) {
-        out[i] = b[0]*in[i] + state[0];
-        state[0] = state[1] + b[1]*in[i] - a[1]*out[i];
-        state[1] = b[2]*in[i] - a[2]*out[i];
+void Biquad_Filter_t::step(float * in, float * out, uint32_t n) {
+    if (!ramping) {
+        kernels->biquad(b, a, state, in, out, n);
+        return;
+    }
+    // the coefficients move in a straight line to the targets, reaching them on the last sample
+    float bStep[3];
+    float aStep[3];
+    for (unsigned int i = 0; i < 3; i++) {
+        bStep[i] = (bTarget[i] - b[i])/n;
+        aStep[i] = (aTarget[i] - a[i])/n;
     }
+    kernels->biquad_ramp(b, a, bStep, aStep, state, in, out, n);
+    for (unsigned int i = 0; i < 3; i++) {
+        b[i] = bTarget[i];
+        a[i] = aTarget[i];
+    }
+    ramping = false;
 }
 
 void Biquad_Filter_t::set_coeffs(float * b_, float * a_) {
@@ -145,41 +181,400 @@ void Biquad_Filter_t::set_coeffs(float * b_, float * a_) {
         b[i] = b_[i]/a_[0];
         a[i] = a_[i]/a_[0];
     }
+    ramping = false;
+}
+
+void Biquad_Filter_t::ramp_coeffs(float * b_, float * a_) {
+    for (unsigned int i = 0; i < 3; i++) {
+        bTarget[i] = b_[i]/a_[0];
+        aTarget[i] = a_[i]/a_[0];
+    }
+    ramping = true;
 }
 
 float res_2_q(float resonance) {
     return pow(10, resonance/20);
 }
 
-void Biquad_Filter_t::configure_lowpass(float f, float resonance) {
+void lowpass_coeffs(float f, float resonance, float samplingFrequency, float * b, float * a) {
     float tau = tanf(f*M_PI/samplingFrequency);
-    float b_[3];
-    float a_[3];
     float q = res_2_q(resonance);
 
     // normalise by q?
-    b_[0] = tau*tau;
-    b_[1] = 2*tau*tau;
-    b_[2] = tau*tau;
-    a_[0] = 1 + (tau/q) + tau*tau;
-    a_[1] = (2*tau*tau) - 2;
-    a_[2] = 1 - (tau/q) + tau*tau;
-    set_coeffs(b_, a_);
+    b[0] = tau*tau;
+    b[1] = 2*tau*tau;
+    b[2] = tau*tau;
+    a[0] = 1 + (tau/q) + tau*tau;
+    a[1] = (2*tau*tau) - 2;
+    a[2] = 1 - (tau/q) + tau*tau;
 }
 
-void Biquad_Filter_t::configure_highpass(float f, float resonance) {
+void highpass_coeffs(float f, float resonance, float samplingFrequency, float * b, float * a) {
     float tau = tanf(f*M_PI/samplingFrequency);
+    float q = res_2_q(resonance);
+
+    b[0] = 1;
+    b[1] = -2;
+    b[2] = 1;
+    a[0] = 1 + (tau/q) + tau*tau;
+    a[1] = (2*tau*tau) - 2;
+    a[2] = 1 - (tau/q) + tau*tau;
+}
+
+void Biquad_Filter_t::configure(BiquadType_e type, float f, float resonance, bool ramp) {
     float b_[3];
     float a_[3];
-    float q = res_2_q(resonance);
+    if (cache) {
+        // quantised, but no transcendental functions if it has been used recently
+        const CoeffEntry_t * entry = cache->lookup(type, f, resonance, samplingFrequency);
+        for (uint32_t i = 0; i < 3; i++) {
+            b_[i] = entry->b[i];
+            a_[i] = entry->a[i];
+        }
+    } else if (type == lowpassBiquad) {
+        lowpass_coeffs(f, resonance, samplingFrequency, b_, a_);
+    } else {
+        highpass_coeffs(f, resonance, samplingFrequency, b_, a_);
+    }
+    if (ramp) {
+        ramp_coeffs(b_, a_);
+    } else {
+        set_coeffs(b_, a_);
+    }
+}
 
-    b_[0] = 1;
-    b_[1] = -2;
-    b_[2] = 1;
-    a_[0] = 1 + (tau/q) + tau*tau;
-    a_[1] = (2*tau*tau) - 2;
-    a_[2] = 1 - (tau/q) + tau*tau;
-    set_coeffs(b_, a_);
+void Biquad_Filter_t::configure_lowpass(float f, float resonance, bool ramp) {
+    configure(lowpassBiquad, f, resonance, ramp);
+}
+
+void Biquad_Filter_t::configure_highpass(float f, float resonance, bool ramp) {
+    configure(highpassBiquad, f, resonance, ramp);
+}
+
+static void find_roots(const double * coeffs, uint32_t degree, std::complex<double> * roots) {
+    // roots of coeffs[0]*z^degree + coeffs[1]*z^(degree-1) + ... + coeffs[degree], coeffs[0] can't be 0
+    // uses Durand-Kerner iteration, in double precision
+    double monic[maxSosOrder + 1];
+    for (uint32_t k = 0; k <= degree; k++) {
+        monic[k] = coeffs[k]/coeffs[0];
+    }
+    if (degree == 1) {
+        roots[0] = -monic[1];
+    } else if (degree == 2) {
+        // closed form, arranged to avoid cancellation
+        std::complex<double> sd = std::sqrt(std::complex<double>(monic[1]*monic[1] - 4*monic[2]));
+        if (monic[1]*sd.real() < 0) {
+            sd = -sd;
+        }
+        std::complex<double> q = -0.5*(monic[1] + sd);
+        roots[0] = q;
+        roots[1] = (q == 0.0) ? 0.0 : monic[2]/q;
+    } else if (degree > 2) {
+        // start on a spiral, so no two guesses are the same or conjugates
+        const std::complex<double> seed(0.4, 0.9);
+        roots[0] = 1;
+        for (uint32_t i = 1; i < degree; i++) {
+            roots[i] = roots[i-1]*seed;
+        }
+        for (uint32_t iteration = 0; iteration < maxRootIterations; iteration++) {
+            double maxDelta = 0;
+            for (uint32_t i = 0; i < degree; i++) {
+                std::complex<double> value = 1;
+                std::complex<double> denominator = 1;
+                for (uint32_t k = 1; k <= degree; k++) {
+                    value = value*roots[i] + monic[k];
+                }
+                for (uint32_t j = 0; j < degree; j++) {
+                    if (j != i) {
+                        denominator *= roots[i] - roots[j];
+                    }
+                }
+                if (denominator == 0.0) {
+                    denominator = DBL_MIN;
+                }
+                std::complex<double> delta = value/denominator;
+                roots[i] -= delta;
+                maxDelta = fmax(maxDelta, std::abs(delta)/(1 + std::abs(roots[i])));
+            }
+            if (maxDelta < rootTolerance) {
+                break;
+            }
+        }
+    }
+}
+
+static uint32_t polynomial_roots(const float * coeffs, uint32_t order, Root_t * roots, double * gain) {
+    // fills in the order roots of coeffs[0] + coeffs[1]*z^-1 + ... + coeffs[order]*z^-order
+    // leading zeros are zeros at infinity, trailing zeros are roots at the origin
+    // returns the index of the first non-zero coefficient (order + 1 if they are all 0)
+    double c[maxSosOrder + 1] = {0};
+    std::complex<double> finite[maxSosOrder];
+    uint32_t first = 0;
+    uint32_t last = order;
+    while (first <= order && coeffs[first] == 0) {
+        first++;
+    }
+    uint32_t count = 0;
+    if (first > order) {
+        // all zero, put everything at the origin
+        *gain = 0;
+        for (uint32_t i = 0; i < order; i++) {
+            roots[i] = {0, false};
+        }
+        return first;
+    }
+    while (coeffs[last] == 0) {
+        last--;
+    }
+    for (uint32_t k = first; k <= last; k++) {
+        c[k - first] = coeffs[k];
+    }
+    find_roots(c, last - first, finite);
+    for (uint32_t i = 0; i < first; i++) {
+        roots[count++] = {0, true};
+    }
+    for (uint32_t i = 0; i < last - first; i++) {
+        roots[count++] = {finite[i], false};
+    }
+    while (count < order) {
+        roots[count++] = {0, false};
+    }
+    *gain = coeffs[first];
+    return first;
+}
+
+static void multiply_factors(const Root_t & r1, const Root_t & r2, double * coeffs) {
+    // (c0 + c1*z^-1)(d0 + d1*z^-1), where a finite root r is (1 - r*z^-1) and an infinite one is z^-1
+    std::complex<double> c0 = r1.infinite ? 0.0 : 1.0;
+    std::complex<double> c1 = r1.infinite ? 1.0 : -r1.value;
+    std::complex<double> d0 = r2.infinite ? 0.0 : 1.0;
+    std::complex<double> d1 = r2.infinite ? 1.0 : -r2.value;
+    coeffs[0] = (c0*d0).real();
+    coeffs[1] = (c0*d1 + c1*d0).real();
+    coeffs[2] = (c1*d1).real();
+}
+
+static std::complex<double> root_position(const Root_t & root) {
+    return root.infinite ? std::complex<double>(DBL_MAX, 0) : root.value;
+}
+
+static uint32_t group_roots(Root_t * roots, uint32_t n, RootGroup_t * groups) {
+    // groups complex roots with their conjugates, and the real roots into neighbouring pairs
+    // so every group has real coefficients. Returns the number of groups
+    bool used[maxSosOrder] = {false};
+    Root_t reals[maxSosOrder];
+    uint32_t realCount = 0;
+    uint32_t count = 0;
+    for (uint32_t i = 0; i < n; i++) {
+        if (used[i]) {
+            continue;
+        }
+        used[i] = true;
+        std::complex<double> r = roots[i].value;
+        if (!roots[i].infinite && fabs(r.imag()) > realTolerance*fmax(1, std::abs(r))) {
+            // find the closest conjugate
+            int32_t partner = -1;
+            double closest = DBL_MAX;
+            for (uint32_t j = 0; j < n; j++) {
+                double distance = std::abs(roots[j].value - std::conj(r));
+                if (!used[j] && !roots[j].infinite && roots[j].value.imag()*r.imag() < 0 && distance < closest) {
+                    partner = j;
+                    closest = distance;
+                }
+            }
+            if (partner >= 0) {
+                used[partner] = true;
+                // average the pair, so they are exact conjugates
+                std::complex<double> p = 0.5*(r + std::conj(roots[partner].value));
+                if (p.imag() < 0) {
+                    p = std::conj(p);
+                }
+                groups[count].coeffs[0] = 1;
+                groups[count].coeffs[1] = -2*p.real();
+                groups[count].coeffs[2] = std::norm(p);
+                groups[count].size = 2;
+                groups[count].position = p;
+                groups[count].used = false;
+                count++;
+                continue;
+            }
+        }
+        // real (or couldn't be paired up)
+        Root_t real = {std::complex<double>(r.real(), 0), roots[i].infinite};
+        // keep sorted, with infinite roots at the end
+        uint32_t j = realCount;
+        while (j > 0 && root_position(reals[j-1]).real() > root_position(real).real()) {
+            reals[j] = reals[j-1];
+            j--;
+        }
+        reals[j] = real;
+        realCount++;
+    }
+    for (uint32_t i = 0; i < realCount; i += 2) {
+        if (i + 1 < realCount) {
+            multiply_factors(reals[i], reals[i+1], groups[count].coeffs);
+            groups[count].size = 2;
+            // the root closer to the unit circle is the one that matters for pairing
+            std::complex<double> p1 = root_position(reals[i]);
+            std::complex<double> p2 = root_position(reals[i+1]);
+            groups[count].position = (fabs(1 - std::abs(p1)) < fabs(1 - std::abs(p2))) ? p1 : p2;
+        } else {
+            // odd one out, first order
+            groups[count].coeffs[0] = reals[i].infinite ? 0 : 1;
+            groups[count].coeffs[1] = reals[i].infinite ? 1 : -reals[i].value.real();
+            groups[count].coeffs[2] = 0;
+            groups[count].size = 1;
+            groups[count].position = root_position(reals[i]);
+        }
+        groups[count].used = false;
+        count++;
+    }
+    return count;
+}
+
+static uint32_t build_sections(Root_t * zeros, Root_t * poles, uint32_t order, double gain,\
+                               float sosB[][3], float sosA[][3]) {
+    // pairs up zeros and poles into second order sections, returns the number of sections
+    // similar to scipy's zpk2sos: the poles closest to the unit circle get the closest zeros,
+    // and are run last
+    RootGroup_t zeroGroups[maxSosOrder];
+    RootGroup_t poleGroups[maxSosOrder];
+    group_roots(zeros, order, zeroGroups);
+    uint32_t sections = group_roots(poles, order, poleGroups);
+    if (sections == 0) {
+        // zeroth order, just a gain
+        sosB[0][0] = gain;
+        sosB[0][1] = 0;
+        sosB[0][2] = 0;
+        sosA[0][0] = 1;
+        sosA[0][1] = 0;
+        sosA[0][2] = 0;
+        return 1;
+    }
+    for (uint32_t section = sections; section > 0; section--) {
+        // find the unused pole group closest to the unit circle
+        int32_t pole = -1;
+        for (uint32_t i = 0; i < sections; i++) {
+            if (!poleGroups[i].used &&
+                (pole < 0 || std::abs(poleGroups[i].position) > std::abs(poleGroups[pole].position))) {
+                pole = i;
+            }
+        }
+        poleGroups[pole].used = true;
+        // and the closest zero group with the same number of roots
+        int32_t zero = -1;
+        double closest = DBL_MAX;
+        for (uint32_t i = 0; i < sections; i++) {
+            if (zeroGroups[i].used || zeroGroups[i].size != poleGroups[pole].size) {
+                continue;
+            }
+            double distance = std::abs(zeroGroups[i].position - poleGroups[pole].position);
+            if (zero < 0 || distance < closest) {
+                zero = i;
+                closest = distance;
+            }
+        }
+        if (zero < 0) {
+            // shouldn't happen, there are always the same number of single roots
+            for (zero = 0; zeroGroups[zero].used; zero++) {}
+        }
+        zeroGroups[zero].used = true;
+        for (uint32_t k = 0; k < 3; k++) {
+            sosB[section-1][k] = zeroGroups[zero].coeffs[k];
+            sosA[section-1][k] = poleGroups[pole].coeffs[k];
+        }
+    }
+    // the gain goes in the first section
+    for (uint32_t k = 0; k < 3; k++) {
+        sosB[0][k] *= gain;
+    }
+    return sections;
+}
+
+Filter_SOS_t::Filter_SOS_t() {
+    float b_[1] = {1};
+    float a_[1] = {1};
+    set_coeffs(b_, a_, 0);
+}
+
+Filter_SOS_t::Filter_SOS_t(float * b_, float * a_, uint32_t order_) {
+    set_coeffs(b_, a_, order_);
+}
+
+void Filter_SOS_t::set_coeffs(float * b_, float * a_, uint32_t order_) {
+    // params: b/a: numerator/denominator coefficients, both order_ + 1 long
+    // factors the polynomials, then builds sections from the roots
+    Root_t zeros[maxSosOrder];
+    Root_t poles[maxSosOrder];
+    double zeroGain;
+    double poleGain;
+    if (order_ > maxSosOrder) {
+        order_ = maxSosOrder;
+    }
+    order = order_;
+    polynomial_roots(b_, order, zeros, &zeroGain);
+    if (polynomial_roots(a_, order, poles, &poleGain) != 0) {
+        // a[0] needs to be non-zero, otherwise the filter isn't causal. Leave it silent
+        zeroGain = 0;
+        poleGain = 1;
+    }
+    sections = build_sections(zeros, poles, order, zeroGain/poleGain, sosB, sosA);
+    memset(state, 0, sizeof(state));
+}
+
+void Filter_SOS_t::set_zpk(const std::complex<double> * zeros_, uint32_t nZeros,\
+                           const std::complex<double> * poles_, uint32_t nPoles, double gain) {
+    // params: zeros_/poles_: roots of the numerator/denominator, complex ones need their conjugates
+    //         gain: overall gain
+    // if there are fewer zeros than poles (or vice versa) the rest go at the origin
+    Root_t zeros[maxSosOrder];
+    Root_t poles[maxSosOrder];
+    order = (nZeros > nPoles) ? nZeros : nPoles;
+    if (order > maxSosOrder) {
+        order = maxSosOrder;
+    }
+    for (uint32_t i = 0; i < order; i++) {
+        zeros[i] = {(i < nZeros) ? zeros_[i] : 0.0, false};
+        poles[i] = {(i < nPoles) ? poles_[i] : 0.0, false};
+    }
+    sections = build_sections(zeros, poles, order, gain, sosB, sosA);
+    memset(state, 0, sizeof(state));
+}
+
+uint32_t Filter_SOS_t::get_sections() {
+    return sections;
+}
+
+void Filter_SOS_t::step(float * in, float * out, uint32_t n) {
+    // every section is run for each sample, with the coefficients and state copied into locals.
+    // the sections of neighbouring samples don't depend on each other,
+    // so the processor can overlap them rather than waiting on one long chain per section
+    float b0[maxSosSections], b1[maxSosSections], b2[maxSosSections];
+    float a1[maxSosSections], a2[maxSosSections];
+    float s0[maxSosSections], s1[maxSosSections];
+    for (uint32_t k = 0; k < sections; k++) {
+        b0[k] = sosB[k][0];
+        b1[k] = sosB[k][1];
+        b2[k] = sosB[k][2];
+        a1[k] = sosA[k][1];
+        a2[k] = sosA[k][2];
+        s0[k] = state[k][0];
+        s1[k] = state[k][1];
+    }
+    for (uint32_t i = 0; i < n; i++) {
+        float x = in[i];
+        for (uint32_t k = 0; k < sections; k++) {
+            float y = b0[k]*x + s0[k];
+            s0[k] = s1[k] + b1[k]*x - a1[k]*y;
+            s1[k] = b2[k]*x - a2[k]*y;
+            x = y;
+        }
+        out[i] = x;
+    }
+    for (uint32_t k = 0; k < sections; k++) {
+        state[k][0] = s0[k];
+        state[k][1] = s1[k];
+    }
 }
 
 #ifdef SYNTH_TEST_
@@ -189,43 +584,76 @@ void Biquad_Filter_t::configure_highpass(float f, float resonance) {
 #define TDFI 2
 #define TDFII 3
 #define BIQUAD 4
+#define SOS 5
 
 extern "C" {
     void run_df1_filter(unsigned int order, float * memory, float * b, float * a, unsigned int ioLength, float * input, float * output) {
         Filter_DFI_t filter(memory, b, a, order);
-        for(unsigned int i=0; i+blockSize <= ioLength; i+= blockSize) {
-            filter.step(&input[i], &output[i]);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
         }
     }
 
     void run_df2_filter(unsigned int order, float * memory, float * b, float * a, unsigned int ioLength, float * input, float * output) {
         Filter_DFII_t filter(memory, b, a, order);
-        for(unsigned int i=0; i+blockSize <= ioLength; i+= blockSize) {
-            filter.step(&input[i], &output[i]);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
         }
     }
 
     void run_tdf1_filter(unsigned int order, float * memory, float * b, float * a, unsigned int ioLength, float * input, float * output) {
         Filter_TDFI_t filter(memory, b, a, order);
-        for(unsigned int i=0; i+blockSize <= ioLength; i+= blockSize) {
-            filter.step(&input[i], &output[i]);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
         }
     }
 
     void run_tdf2_filter(unsigned int order, float * memory, float * b, float * a, unsigned int ioLength, float * input, float * output) {
         Filter_TDFII_t filter(memory, b, a, order);
-        for(unsigned int i=0; i+blockSize <= ioLength; i+= blockSize) {
-            filter.step(&input[i], &output[i]);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
         }
     }
 
     void run_biquad_filter(float * b, float * a, unsigned int ioLength, float * input, float * output) {
         Biquad_Filter_t filter(1, b, a); // sampling frequency irrelevant for this test
-        for(unsigned int i=0; i+blockSize <= ioLength; i+= blockSize) {
-            filter.step(&input[i], &output[i]);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
+        }
+    }
+
+    void run_sos_filter(unsigned int order, float * b, float * a, unsigned int ioLength, float * input, float * output) {
+        Filter_SOS_t filter(b, a, order);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
         }
     }
 
+    void test_sos_zpk(unsigned int nZeros, float * zerosRe, float * zerosIm,\
+                      unsigned int nPoles, float * polesRe, float * polesIm, float gain,\
+                      unsigned int ioLength, float * input, float * output) {
+        // params: zerosRe/zerosIm, polesRe/polesIm: real/imaginary parts of the zeros/poles
+        //         gain: overall gain
+        std::complex<double> zeros[maxSosOrder];
+        std::complex<double> poles[maxSosOrder];
+        for (unsigned int i = 0; i < nZeros && i < maxSosOrder; i++) {
+            zeros[i] = std::complex<double>(zerosRe[i], zerosIm[i]);
+        }
+        for (unsigned int i = 0; i < nPoles && i < maxSosOrder; i++) {
+            poles[i] = std::complex<double>(polesRe[i], polesIm[i]);
+        }
+        Filter_SOS_t filter;
+        filter.set_zpk(zeros, nZeros, poles, nPoles, gain);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
+        }
+    }
+
+    unsigned int test_sos_sections(unsigned int order, float * b, float * a) {
+        Filter_SOS_t filter(b, a, order);
+        return filter.get_sections();
+    }
+
     void test_filter(unsigned int filterType, unsigned int order, float * memory, float * b, float * a, unsigned int ioLength, float * input, float * output) {
 
         switch (filterType)
@@ -245,6 +673,9 @@ extern "C" {
         case BIQUAD:
             run_biquad_filter(b, a, ioLength, input, output);
             break;
+        case SOS:
+            run_sos_filter(order, b, a, ioLength, input, output);
+            break;
         default:
             // don't do anything! We want things to break in this situation
             break;
@@ -254,16 +685,51 @@ extern "C" {
     void test_lowpass(float freq, float res, unsigned int ioLength, float * input, float * output, float fs) {
         Biquad_Filter_t filter(fs);
         filter.configure_lowpass(freq, res);
-        for(unsigned int i=0; i+blockSize <= ioLength; i+= blockSize) {
-            filter.step(&input[i], &output[i]);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
         }
     }
 
+    void test_cached_biquad(unsigned int highpass, unsigned int nSettings, float * freqs, float * ress,\
+                            unsigned int ioLength, float * input, float * output, float fs, unsigned int * stats) {
+        // params: highpass: 0 for lowpass, 1 for highpass
+        //         freqs/ress: frequency/resonance to use for each of nSettings runs, with the same cache
+        //         input: ioLength samples, run through the filter for each setting
+        //         output: nSettings*ioLength samples
+        //         stats: hits and misses
+        CoeffCache_t cache;
+        for (unsigned int setting = 0; setting < nSettings; setting++) {
+            Biquad_Filter_t filter(fs, &cache);
+            if (highpass) {
+                filter.configure_highpass(freqs[setting], ress[setting]);
+            } else {
+                filter.configure_lowpass(freqs[setting], ress[setting]);
+            }
+            float * out = output + setting*ioLength;
+            for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+                filter.step(&input[i], &out[i], defaultBlockSize);
+            }
+        }
+        stats[0] = cache.get_hits();
+        stats[1] = cache.get_misses();
+    }
+
     void test_highpass(float freq, float res, unsigned int ioLength, float * input, float * output, float fs) {
         Biquad_Filter_t filter(fs);
         filter.configure_highpass(freq, res);
-        for(unsigned int i=0; i+blockSize <= ioLength; i+= blockSize) {
-            filter.step(&input[i], &output[i]);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
+        }
+    }
+
+    void test_biquad_ramp(float * b, float * a, float * bEnd, float * aEnd,\
+                          unsigned int ioLength, float * input, float * output) {
+        // params: b/a: initial coefficients
+        //         bEnd/aEnd: coefficients ramped to over the first block
+        Biquad_Filter_t filter(1, b, a);
+        filter.ramp_coeffs(bEnd, aEnd);
+        for(unsigned int i=0; i+defaultBlockSize <= ioLength; i+= defaultBlockSize) {
+            filter.step(&input[i], &output[i], defaultBlockSize);
         }
     }
 
@@ -0,0 +1,262 @@
+/* MXCS Core Kernels implementation
+   copyright Maximilian Cornwell 2024
+*/
+// The loops are written once, as always inlined functions, and each instruction set gets its own
+// copy by inlining them into wrappers compiled for that target. So one library can run the
+// fastest code on whatever CPU it's loaded on, without building with -march=native
+
+#include <stdint.h>
+#include <string.h>
+#include "Envelope.h"
+#include "Kernels.h"
+#include "Oscillator.h"
+
+#define KERNEL static inline __attribute__((always_inline))
+
+KERNEL float select(bool condition, float a, float b) {
+    // condition ? a : b, as a bitwise select. The compiler won't vectorise a ternary
+    // between two divisions unless trapping maths is turned off
+    uint32_t mask = -(uint32_t)condition;
+    uint32_t aBits;
+    uint32_t bBits;
+    memcpy(&aBits, &a, sizeof(aBits));
+    memcpy(&bBits, &b, sizeof(bBits));
+    uint32_t resultBits = (aBits & mask) | (bBits & ~mask);
+    float result;
+    memcpy(&result, &resultBits, sizeof(result));
+    return result;
+}
+
+KERNEL void oscillator(const float * cosK, const float * sinK, float * yrPrev, float * yjPrev,\
+                       float * yr, float * yj, uint32_t n) {
+    // each group of oscLanes samples only depends on the last sample of the previous group,
+    // so the samples within a group are independent and can be vectorised
+    float pwr;
+    float scale;
+    float yrLast = *yrPrev;
+    float yjLast = *yjPrev;
+    // local copies, so the compiler knows writes to the outputs can't change them
+    float cosL[oscLanes];
+    float sinL[oscLanes];
+    float groupR[oscLanes];
+    float groupJ[oscLanes];
+    for (uint32_t k = 0; k < oscLanes; k++) {
+        cosL[k] = cosK[k];
+        sinL[k] = sinK[k];
+    }
+    for (uint32_t start = 0; start < n; start += oscLanes) {
+        if (start % renormInterval == 0) {
+            // need to normalise the power, otherwise magnitude will drift due to numerical error
+            // once per renormInterval samples is enough
+            pwr = yrLast*yrLast + yjLast*yjLast;
+            // scale is 1st order taylor series approximation of inverse square root
+            scale = 1.5 - 0.5*pwr;
+            yrLast = scale*yrLast;
+            yjLast = scale*yjLast;
+        }
+        // the group is calculated into local buffers, which can't alias each other or the state
+        for (uint32_t k = 0; k < oscLanes; k++) {
+            groupR[k] = cosL[k]*yrLast - sinL[k]*yjLast;
+            groupJ[k] = sinL[k]*yrLast + cosL[k]*yjLast;
+        }
+        // the final group in the block may only be partly used
+        uint32_t len = (n - start < oscLanes) ? n - start : oscLanes;
+        memcpy(yr + start, groupR, len*sizeof(float));
+        memcpy(yj + start, groupJ, len*sizeof(float));
+        yrLast = groupR[len-1];
+        yjLast = groupJ[len-1];
+    }
+    *yrPrev = yrLast;
+    *yjPrev = yjLast;
+}
+
+KERNEL void msinc(const float * lfCos, const float * lfSin, const float * hfCos, const float * hfSin,\
+                  float invM, float sinThreshold, float * out, uint32_t n) {
+    // both candidates are calculated for every sample and the right one is selected,
+    // without branches, so the loop can be vectorised. The unused one may be inf/nan, which is fine
+    for (uint32_t i = 0; i < n; i++) {
+        float sinRatio = invM*hfSin[i]/lfSin[i];
+        float cosRatio = hfCos[i]/lfCos[i];
+        bool useCos = (lfSin[i]*lfSin[i] < sinThreshold) | (sinRatio*sinRatio > 1);
+        out[i] = select(useCos, cosRatio, sinRatio);
+    }
+}
+
+KERNEL void biquad(const float * b, const float * a, float * state, const float * in, float * out, uint32_t n) {
+    // recursive, so there's nothing to vectorise, but FMA shortens the dependency chain
+    const float b0 = b[0], b1 = b[1], b2 = b[2];
+    const float a1 = a[1], a2 = a[2];
+    float s0 = state[0];
+    float s1 = state[1];
+    for (uint32_t i = 0; i < n; i++) {
+        float x = in[i];
+        float y = b0*x + s0;
+        s0 = s1 + b1*x - a1*y;
+        s1 = b2*x - a2*y;
+        out[i] = y;
+    }
+    state[0] = s0;
+    state[1] = s1;
+}
+
+KERNEL void biquad_ramp(const float * b, const float * a, const float * bStep, const float * aStep,\
+                        float * state, const float * in, float * out, uint32_t n) {
+    // coefficients are interpolated from the start rather than accumulated, so they don't drift.
+    // Interpolating between two stable filters stays stable, the (a1, a2) stability triangle is convex
+    float s0 = state[0];
+    float s1 = state[1];
+    for (uint32_t i = 0; i < n; i++) {
+        const float k = i + 1;
+        const float b0 = b[0] + k*bStep[0], b1 = b[1] + k*bStep[1], b2 = b[2] + k*bStep[2];
+        const float a1 = a[1] + k*aStep[1], a2 = a[2] + k*aStep[2];
+        float x = in[i];
+        float y = b0*x + s0;
+        s0 = s1 + b1*x - a1*y;
+        s1 = b2*x - a2*y;
+        out[i] = y;
+    }
+    state[0] = s0;
+    state[1] = s1;
+}
+
+KERNEL float ramp(const float * powers, float start, float * out, uint32_t n) {
+    // each group of envLanes samples is calculated from the last sample of the previous one
+    float group[envLanes];
+    for (uint32_t i = 0; i < n; i += envLanes) {
+        for (uint32_t k = 0; k < envLanes; k++) {
+            group[k] = start*powers[k];
+        }
+        uint32_t len = (n - i < envLanes) ? n - i : envLanes;
+        memcpy(out + i, group, len*sizeof(float));
+        start = group[len-1];
+    }
+    return start;
+}
+
+KERNEL void multiply(float * __restrict__ out, const float * __restrict__ in, uint32_t n) {
+    for (uint32_t i = 0; i < n; i++) {
+        out[i] *= in[i];
+    }
+}
+
+KERNEL void accumulate(float * __restrict__ out, const float * __restrict__ in, uint32_t n) {
+    for (uint32_t i = 0; i < n; i++) {
+        out[i] += in[i];
+    }
+}
+
+KERNEL void complex_mac(float * __restrict__ accRe, float * __restrict__ accIm, const float * __restrict__ xRe,\
+                        const float * __restrict__ xIm, const float * __restrict__ hRe, const float * __restrict__ hIm,\
+                        uint32_t n) {
+    // split real and imaginary parts, so each lane works on its own bin
+    for (uint32_t i = 0; i < n; i++) {
+        accRe[i] += xRe[i]*hRe[i] - xIm[i]*hIm[i];
+        accIm[i] += xRe[i]*hIm[i] + xIm[i]*hRe[i];
+    }
+}
+
+// a copy of every kernel compiled for target, and the table of them
+#define KERNEL_VARIANT(isa, target)\
+    target static void oscillator_##isa(const float * cosK, const float * sinK, float * yrPrev, float * yjPrev,\
+                                        float * yr, float * yj, uint32_t n) {\
+        oscillator(cosK, sinK, yrPrev, yjPrev, yr, yj, n);\
+    }\
+    target static void msinc_##isa(const float * lfCos, const float * lfSin, const float * hfCos,\
+                                   const float * hfSin, float invM, float sinThreshold, float * out, uint32_t n) {\
+        msinc(lfCos, lfSin, hfCos, hfSin, invM, sinThreshold, out, n);\
+    }\
+    target static void biquad_##isa(const float * b, const float * a, float * state,\
+                                    const float * in, float * out, uint32_t n) {\
+        biquad(b, a, state, in, out, n);\
+    }\
+    target static void biquad_ramp_##isa(const float * b, const float * a, const float * bStep, const float * aStep,\
+                                         float * state, const float * in, float * out, uint32_t n) {\
+        biquad_ramp(b, a, bStep, aStep, state, in, out, n);\
+    }\
+    target static float ramp_##isa(const float * powers, float start, float * out, uint32_t n) {\
+        return ramp(powers, start, out, n);\
+    }\
+    target static void multiply_##isa(float * out, const float * in, uint32_t n) {\
+        multiply(out, in, n);\
+    }\
+    target static void accumulate_##isa(float * out, const float * in, uint32_t n) {\
+        accumulate(out, in, n);\
+    }\
+    target static void complex_mac_##isa(float * accRe, float * accIm, const float * xRe, const float * xIm,\
+                                         const float * hRe, const float * hIm, uint32_t n) {\
+        complex_mac(accRe, accIm, xRe, xIm, hRe, hIm, n);\
+    }\
+    static const Kernels_t isa##Kernels = {oscillator_##isa, msinc_##isa, biquad_##isa,\
+                                           biquad_ramp_##isa, ramp_##isa, multiply_##isa, accumulate_##isa,\
+                                           complex_mac_##isa};
+
+KERNEL_VARIANT(generic, )
+
+#if defined(__x86_64__) || defined(__i386__)
+#define X86_KERNELS_
+KERNEL_VARIANT(avx2, __attribute__((target("avx2,fma"))))
+KERNEL_VARIANT(avx512, __attribute__((target("avx512f,avx512vl,avx2,fma"))))
+#endif
+
+static const Kernels_t * variants[isaCount] = {
+    &genericKernels,
+#ifdef X86_KERNELS_
+    &avx2Kernels,
+    &avx512Kernels,
+#else
+    nullptr,
+    nullptr,
+#endif
+};
+
+static const char * isaNames[isaCount] = {"generic", "avx2", "avx512"};
+
+const Kernels_t * kernels = &genericKernels;
+static Isa_e currentIsa = isaGeneric;
+
+bool isa_supported(Isa_e isa) {
+    switch (isa) {
+    case isaGeneric:
+        return true;
+#ifdef X86_KERNELS_
+    case isaAVX2:
+        __builtin_cpu_init();
+        return __builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma");
+    case isaAVX512:
+        __builtin_cpu_init();
+        return isa_supported(isaAVX2) && __builtin_cpu_supports("avx512f") && __builtin_cpu_supports("avx512vl");
+#endif
+    default:
+        return false;
+    }
+}
+
+Isa_e best_isa() {
+    for (int32_t isa = isaCount - 1; isa > isaGeneric; isa--) {
+        if (isa_supported((Isa_e)isa)) {
+            return (Isa_e)isa;
+        }
+    }
+    return isaGeneric;
+}
+
+Isa_e get_isa() {
+    return currentIsa;
+}
+
+bool set_isa(Isa_e isa) {
+    // not synchronised with rendering, so should be called between blocks on the audio thread, or before starting
+    if (!isa_supported(isa)) {
+        return false;
+    }
+    currentIsa = isa;
+    kernels = variants[isa];
+    return true;
+}
+
+const char * isa_name(Isa_e isa) {
+    return ((uint32_t)isa < isaCount) ? isaNames[isa] : nullptr;
+}
+
+// picks the kernels when the library is loaded. Until then (i.e. in other static initialisers) the generic ones are used
+static const bool isaSelected = set_isa(best_isa());
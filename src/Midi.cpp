@@ -0,0 +1,233 @@
+/* MXCS Standard MIDI File reader implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <string.h>
+#include "Midi.h"
+
+static uint32_t read_be(const uint8_t * data, uint32_t bytes) {
+    // big endian unsigned integer
+    uint32_t value = 0;
+    for (uint32_t i = 0; i < bytes; i++) {
+        value = (value << 8) | data[i];
+    }
+    return value;
+}
+
+static bool read_varlen(const uint8_t ** pos, const uint8_t * end, uint32_t * value) {
+    // variable length quantity: up to 4 bytes of 7 bits, most significant first, the top bit set on all but the last
+    uint32_t result = 0;
+    for (uint32_t i = 0; i < 4 && *pos < end; i++) {
+        uint8_t byte = *(*pos)++;
+        result = (result << 7) | (byte & 0x7F);
+        if (!(byte & 0x80)) {
+            *value = result;
+            return true;
+        }
+    }
+    return false;
+}
+
+MidiReader_t::MidiReader_t():
+    nTracks(0), samplingFrequency(1), ticksPerQuarter(0), samplesPerTick(0),
+    tempoTick(0), tempoSample(0), time(0), error(SUCCESS) {}
+
+MxcsError_t MidiReader_t::open(const uint8_t * data, size_t size, float fs) {
+    // params: data: the whole file
+    //         size: length of data (in bytes)
+    //         fs: sampling frequency (Hz) the event times are in
+    nTracks = 0;
+    tempoTick = 0;
+    tempoSample = 0;
+    time = 0;
+    error = SUCCESS;
+    if (data == nullptr || !(fs > 0)) {
+        return error = ERROR_INVALID_VALUE;
+    }
+    if (size < 14 || memcmp(data, "MThd", 4) || read_be(data + 4, 4) < 6 || read_be(data + 4, 4) > size - 8) {
+        return error = ERROR_INVALID_DATA;
+    }
+    if (read_be(data + 8, 2) > 2) {
+        return error = ERROR_UNSUPPORTED;
+    }
+    samplingFrequency = fs;
+    const uint16_t division = read_be(data + 12, 2);
+    if (division & 0x8000) {
+        // SMPTE time: frames per second (negated, -29 is 29.97 drop frame) and ticks per frame
+        const int8_t smpte = (int8_t)(division >> 8);
+        const double fps = (smpte == -29) ? 30000.0/1001 : -smpte;
+        const uint32_t ticksPerFrame = division & 0xFF;
+        if (fps <= 0 || ticksPerFrame == 0) {
+            return error = ERROR_INVALID_DATA;
+        }
+        ticksPerQuarter = 0;
+        samplesPerTick = samplingFrequency/(fps*ticksPerFrame);
+    } else {
+        if (division == 0) {
+            return error = ERROR_INVALID_DATA;
+        }
+        ticksPerQuarter = division;
+        samplesPerTick = samplingFrequency*defaultTempo*1e-6/ticksPerQuarter;
+    }
+    // every MTrk chunk is a track, other chunks are skipped
+    size_t pos = 8 + read_be(data + 4, 4);
+    while (size - pos >= 8) {
+        const uint32_t length = read_be(data + pos + 4, 4);
+        if (length > size - pos - 8) {
+            return error = ERROR_INVALID_DATA;
+        }
+        if (!memcmp(data + pos, "MTrk", 4)) {
+            if (nTracks == maxMidiTracks) {
+                return error = ERROR_UNSUPPORTED;
+            }
+            MidiTrack_t * track = &tracks[nTracks++];
+            track->pos = data + pos + 8;
+            track->end = track->pos + length;
+            track->tick = 0;
+            track->runningStatus = 0;
+            track->done = false;
+            if (!next_delta(track)) {
+                return error;
+            }
+        }
+        pos += 8 + length;
+    }
+    return SUCCESS;
+}
+
+bool MidiReader_t::next_delta(MidiTrack_t * track) {
+    // moves the track on to the time of its next event
+    // a track that runs out without an end of track event just ends there
+    uint32_t delta;
+    if (track->pos == track->end) {
+        track->done = true;
+        return true;
+    }
+    if (!read_varlen(&track->pos, track->end, &delta)) {
+        error = ERROR_INVALID_DATA;
+        return false;
+    }
+    track->tick += delta;
+    return true;
+}
+
+bool MidiReader_t::to_samples(uint64_t tick, uint32_t * sample) {
+    const double samples = tempoSample + (tick - tempoTick)*samplesPerTick + 0.5;
+    if (samples >= 4294967296.0) {
+        // past the end of the engine's 32 bit clock
+        error = ERROR_UNSUPPORTED;
+        return false;
+    }
+    *sample = (uint32_t)samples;
+    return true;
+}
+
+bool MidiReader_t::step_track(MidiTrack_t * track, Event_t * event) {
+    // reads the track's next event, returns true if it was a note on/off (written to event)
+    const uint8_t * end = track->end;
+    if (track->pos == end) {
+        error = ERROR_INVALID_DATA;
+        return false;
+    }
+    uint8_t status = *track->pos;
+    bool isNote = false;
+    uint32_t length;
+    if (status & 0x80) {
+        track->pos++;
+    } else if (track->runningStatus) {
+        // running status: the status byte is left out when it's the same as the last channel message's
+        status = track->runningStatus;
+    } else {
+        error = ERROR_INVALID_DATA;
+        return false;
+    }
+    if (status < 0xF0) {
+        // channel message, program change and channel pressure have 1 data byte, the rest 2
+        const uint32_t dataBytes = ((status & 0xE0) == 0xC0) ? 1 : 2;
+        if ((uint32_t)(end - track->pos) < dataBytes) {
+            error = ERROR_INVALID_DATA;
+            return false;
+        }
+        const uint8_t kind = status & 0xF0;
+        if (kind == 0x80 || kind == 0x90) {
+            // a note on with no velocity is a note off. Channels are merged, the engine only has one
+            event->type = (kind == 0x90 && track->pos[1]) ? pressEvent : releaseEvent;
+            event->note = track->pos[0] & 0x7F;
+            isNote = true;
+        }
+        track->pos += dataBytes;
+        track->runningStatus = status;
+    } else if (status == 0xFF) {
+        // meta event: type, length, data
+        if (track->pos == end) {
+            error = ERROR_INVALID_DATA;
+            return false;
+        }
+        const uint8_t type = *track->pos++;
+        if (!read_varlen(&track->pos, end, &length) || length > (uint32_t)(end - track->pos)) {
+            error = ERROR_INVALID_DATA;
+            return false;
+        }
+        if (type == 0x51 && length == 3 && ticksPerQuarter) {
+            // tempo change (microseconds per quarter note), for every track from this tick on
+            tempoSample += (track->tick - tempoTick)*samplesPerTick;
+            tempoTick = track->tick;
+            samplesPerTick = samplingFrequency*read_be(track->pos, 3)*1e-6/ticksPerQuarter;
+        } else if (type == 0x2F) {
+            track->done = true;
+        }
+        track->pos += length;
+    } else if (status == 0xF0 || status == 0xF7) {
+        // system exclusive: length, data
+        if (!read_varlen(&track->pos, end, &length) || length > (uint32_t)(end - track->pos)) {
+            error = ERROR_INVALID_DATA;
+            return false;
+        }
+        track->pos += length;
+    } else {
+        // system common and real time messages can't appear in a file
+        error = ERROR_INVALID_DATA;
+        return false;
+    }
+    if (!to_samples(track->tick, &time)) {
+        return false;
+    }
+    event->time = time;
+    if (!track->done && !next_delta(track)) {
+        return false;
+    }
+    return isNote;
+}
+
+MxcsError_t MidiReader_t::read(Event_t * events, uint32_t n, uint32_t * count) {
+    // params: events: filled in with up to n note events, in time order
+    //         count: number of events read, less than n once every track has ended
+    *count = 0;
+    if (events == nullptr && n) {
+        return ERROR_INVALID_VALUE;
+    }
+    while (*count < n && error == SUCCESS) {
+        // the next event is the earliest in any track, ties go to the first track
+        MidiTrack_t * next = nullptr;
+        for (uint32_t t = 0; t < nTracks; t++) {
+            if (!tracks[t].done && (next == nullptr || tracks[t].tick < next->tick)) {
+                next = &tracks[t];
+            }
+        }
+        if (next == nullptr) {
+            break;
+        }
+        if (step_track(next, events + *count)) {
+            (*count)++;
+        }
+    }
+    return error;
+}
+
+uint32_t MidiReader_t::get_time() {
+    // sample of the last event read, once everything has been read this is the end of the longest track
+    return time;
+}
+
+uint32_t MidiReader_t::get_tracks() {
+    return nTracks;
+}
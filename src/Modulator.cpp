@@ -10,19 +10,45 @@
 Modulator_t::Modulator_t(float _samplingFrequency) {
     samplingFrequency = _samplingFrequency;
     modRatio = 0;
+    targetRatio = 0;
+    ramping = false;
 }
 
 void Modulator_t::set_freq(float frequency) {
     lfo.set_freq(frequency/samplingFrequency);
 }
 
-void Modulator_t::step(float * signal) {
-    float modCos[blockSize];
-    float modSin[blockSize];
+void Modulator_t::ramp_ratio(float ratio) {
+    targetRatio = ratio;
+    ramping = true;
+}
+
+void Modulator_t::step(float * signal, uint32_t n) {
+    float modCos[chunkSize];
+    float modSin[chunkSize];
 
-    lfo.step(modCos, modSin);
-    for (uint8_t i = 0; i < blockSize; i++) {
-        signal[i] *= modRatio*modCos[i] + 1 - modRatio;
+    if (ramping) {
+        // the depth moves in a straight line to the target, reaching it on the last sample
+        const float startRatio = modRatio;
+        const float ratioStep = (targetRatio - modRatio)/n;
+        for (uint32_t start = 0; start < n; start += chunkSize) {
+            uint32_t len = (n - start < chunkSize) ? n - start : chunkSize;
+            lfo.step(modCos, modSin, len);
+            for (uint32_t i = 0; i < len; i++) {
+                float ratio = startRatio + (start + i + 1)*ratioStep;
+                signal[start+i] *= ratio*modCos[i] + 1 - ratio;
+            }
+        }
+        modRatio = targetRatio;
+        ramping = false;
+        return;
+    }
+    for (uint32_t start = 0; start < n; start += chunkSize) {
+        uint32_t len = (n - start < chunkSize) ? n - start : chunkSize;
+        lfo.step(modCos, modSin, len);
+        for (uint32_t i = 0; i < len; i++) {
+            signal[start+i] *= modRatio*modCos[i] + 1 - modRatio;
+        }
     }
 }
 
@@ -30,16 +56,16 @@ void Modulator_t::step(float * signal) {
 extern "C" {
     void test_modulator(const float f, const float ratio, const unsigned int n, float * out, float fs) {
         Modulator_t modulator(fs);
-        float signal[blockSize];
+        float signal[defaultBlockSize];
 
         modulator.modRatio = ratio;
         modulator.set_freq(f);
-        for(unsigned int i=0; i+blockSize <= n; i+= blockSize) {
-            for(unsigned int j = 0; j < blockSize; j++) {
+        for(unsigned int i=0; i+defaultBlockSize <= n; i+= defaultBlockSize) {
+            for(unsigned int j = 0; j < defaultBlockSize; j++) {
                 signal[j] = 1;
             }
-            modulator.step(signal);
-            for(unsigned int j = 0; j < blockSize; j++) {
+            modulator.step(signal, defaultBlockSize);
+            for(unsigned int j = 0; j < defaultBlockSize; j++) {
                 out[i+j] = signal[j];
             }
         }
@@ -6,6 +6,7 @@
 #include <math.h>
 #include "Oscillator.h"
 #include "Constants.h"
+#include "Kernels.h"
 
 
 Oscillator_t::Oscillator_t() {
@@ -14,10 +15,22 @@ Oscillator_t::Oscillator_t() {
     yjPrev = 0.0;
 }
 
-void Oscillator_t::set_freq(float f) {
+void OscCoeffs_t::set_freq(float f) {
     // f should be relative to fs,
-    c = cosf(2*M_PI*f);
-    s = sinf(2*M_PI*f);
+    // powers of the rotation are stored, so a group of samples can be calculated from one starting sample
+    // calculated in double precision, so the error doesn't depend on the power
+    for (uint32_t k = 0; k < oscLanes; k++) {
+        rotR[k] = cos(2*M_PI*f*(k + 1));
+        rotJ[k] = sin(2*M_PI*f*(k + 1));
+    }
+}
+
+void Oscillator_t::set_freq(float f) {
+    rot.set_freq(f);
+}
+
+void Oscillator_t::set_coeffs(const OscCoeffs_t * coeffs) {
+    rot = *coeffs;
 }
 
 float Oscillator_t::get_phase() {
@@ -27,61 +40,46 @@ float Oscillator_t::get_phase() {
 void Oscillator_t::adjust_phase(float phase) {
     float real = cosf(phase);
     float imag = sinf(phase);
-    yrPrev = real*yrPrev - imag*yjPrev;
-    yjPrev = imag*yrPrev + real*yjPrev;
+    // rotated by phase, from the old values of both, so the magnitude doesn't change
+    float yr = yrPrev;
+    yrPrev = real*yr - imag*yjPrev;
+    yjPrev = imag*yr + real*yjPrev;
 }
 
-void Oscillator_t::step(float * yr, float * yj) {
+void Oscillator_t::step(float * yr, float * yj, uint32_t n) {
     // thinking of it as a complex exponential
-    // y[n] = e^(j*theta)*y[n-1]
+    // y[n+k] = e^(j*theta*(k+1))*y[n-1]
     // alternatively, like a matrix:
-    // (yr[n]  = (cos(theta) -sin(theta) (yr[n-1]
-    //  yj[n]) =  sin(theta)  cos(theta)) yj[n-1])
-    float pwr;
-    float scale;
-
-    // use the state to calculate the first samples in the block
-    yr[0] = c*yrPrev - s*yjPrev;
-    yj[0] = s*yrPrev + c*yjPrev;
-
-    // need to normalise the power, otherwise magnitude will drift due to numerical error
-    // once per block should be enough (depending on block length!)
-    pwr = yr[0]*yr[0] + yj[0]*yj[0];
-    // scale is 1st order taylor series approximation of inverse square root
-    scale = 1.5 - 0.5*pwr;
-    yr[0] = scale*yr[0];
-    yj[0] = scale*yj[0];
-
-    // calculate the rest of the block
-    for (uint8_t i = 1; i < blockSize; i++) {
-        yr[i] = c*yr[i-1] - s*yj[i-1];
-        yj[i] = s*yr[i-1] + c*yj[i-1];
-    }
-
-    // save the last values into the oscillator state
-    yrPrev = yr[blockSize-1];
-    yjPrev = yj[blockSize-1];
+    // (yr[n+k]  = (cos((k+1)*theta) -sin((k+1)*theta) (yr[n-1]
+    //  yj[n+k]) =  sin((k+1)*theta)  cos((k+1)*theta)) yj[n-1])
+    // each group of oscLanes samples only depends on the last sample of the previous group,
+    // so the samples within a group are independent and can be vectorised (see Kernels.cpp)
+    kernels->oscillator(rot.rotR, rot.rotJ, &yrPrev, &yjPrev, yr, yj, n);
 }
 
-void Oscillator_t::step(float * out) {
+void Oscillator_t::step(float * out, uint32_t n) {
     // step function but only with the imaginary (sine) output
-    float cosOut[blockSize];
-    step(cosOut, out);
+    float cosOut[chunkSize];
+    for (uint32_t i = 0; i < n; i += chunkSize) {
+        step(cosOut, out + i, (n - i < chunkSize) ? n - i : chunkSize);
+    }
 }
 
 
 #ifdef SYNTH_TEST_
 extern "C" {
-    void test_oscillator(const float f, const unsigned int n, float * cosOut, float * sinOut) {
+    void test_oscillator(const float f, const unsigned int n, const unsigned int blockSize,\
+                         float * cosOut, float * sinOut) {
         // parameters:  f: normalised frequency (i.e. fraction of fs)
         //              n: number of samples to iterate over.
-        //                  if n is not a multiple of block_size, the last fraction of a block won't be filled in
+        //                  if n is not a multiple of blockSize, the last fraction of a block won't be filled in
+        //              blockSize: number of samples to run at a time
         //              sinOut/cosOut: sin/cos output of the oscillator
 
         Oscillator_t osc;
         osc.set_freq(f);
         for(unsigned int i=0; i+blockSize <= n; i+= blockSize) {
-            osc.step(cosOut+i, sinOut+i);
+            osc.step(cosOut+i, sinOut+i, blockSize);
         }
     }
 }
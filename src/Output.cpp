@@ -0,0 +1,90 @@
+/* MXCS Core PCM Output implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <math.h>
+#include <string.h>
+#include "Output.h"
+
+const float int16Scale = 32768.0f;
+const float int24Scale = 8388608.0f;
+const double int32Scale = 2147483648.0;
+
+uint32_t sample_bytes(SampleFormat_e format) {
+    switch (format) {
+    case formatInt16:
+        return 2;
+    case formatInt24:
+        return 3;
+    default:
+        return 4;
+    }
+}
+
+PcmOutput_t::PcmOutput_t() {
+    // always seeded the same, so renders are repeatable
+    state = ditherSeed;
+    dither = true;
+}
+
+void PcmOutput_t::set_dither(bool _dither) {
+    dither = _dither;
+}
+
+float PcmOutput_t::tpdf() {
+    // the sum of two uniform values (the halves of one random word), triangular between -1 and 1 LSB
+    state ^= state << 13;
+    state ^= state >> 17;
+    state ^= state << 5;
+    return ((float)(state & 0xFFFF) + (float)(state >> 16) - 65535.0f)*(1.0f/65536.0f);
+}
+
+static float clip(float x, float low, float high) {
+    return x < low ? low : (x > high ? high : x);
+}
+
+void PcmOutput_t::convert(const float * in, uint8_t * out, uint32_t n, SampleFormat_e format) {
+    // rounds to nearest (even), after the dither
+    switch (format) {
+    case formatFloat32:
+        memcpy(out, in, n*sizeof(float));
+        break;
+    case formatInt16:
+        for (uint32_t i = 0; i < n; i++) {
+            float x = in[i]*int16Scale + (dither ? tpdf() : 0);
+            int16_t sample = (int16_t)lrintf(clip(x, -int16Scale, int16Scale - 1));
+            memcpy(out + 2*i, &sample, sizeof(sample));
+        }
+        break;
+    case formatInt24:
+        for (uint32_t i = 0; i < n; i++) {
+            float x = in[i]*int24Scale + (dither ? tpdf() : 0);
+            int32_t sample = (int32_t)lrintf(clip(x, -int24Scale, int24Scale - 1));
+            out[3*i] = (uint8_t)sample;
+            out[3*i + 1] = (uint8_t)(sample >> 8);
+            out[3*i + 2] = (uint8_t)(sample >> 16);
+        }
+        break;
+    case formatInt32:
+        // in double precision, the top of the range isn't a float
+        for (uint32_t i = 0; i < n; i++) {
+            double x = in[i]*int32Scale;
+            x = x < -int32Scale ? -int32Scale : (x > int32Scale - 1 ? int32Scale - 1 : x);
+            int32_t sample = (int32_t)lrint(x);
+            memcpy(out + 4*i, &sample, sizeof(sample));
+        }
+        break;
+    }
+}
+
+#ifdef SYNTH_TEST_
+extern "C" {
+    void test_pcm_output(const float * in, uint8_t * out, unsigned int n, unsigned int format, bool dither) {
+        // params: in: n float samples
+        //         out: n samples in format (SampleFormat_e)
+        //         dither: whether to dither
+        PcmOutput_t output;
+        output.set_dither(dither);
+        output.convert(in, out, n, (SampleFormat_e)format);
+    }
+}
+#endif // SYNTH_TEST_
@@ -0,0 +1,44 @@
+/* MXCS Core Profiling implementation
+   copyright Maximilian Cornwell 2024
+*/
+
+#include "Profile.h"
+
+#ifdef SYNTH_PROFILE_
+Profiler_t::Profiler_t() {
+    reset();
+}
+
+void Profiler_t::reset() {
+    for (uint32_t stage = 0; stage < profileStages; stage++) {
+        profile.lastCycles[stage] = 0;
+        profile.totalCycles[stage] = 0;
+    }
+    profile.blocks = 0;
+    profile.load = 0;
+    profile.peakLoad = 0;
+    profile.overruns = 0;
+}
+
+void Profiler_t::end_block(float deadline) {
+    // deadline: time available for the block (in seconds)
+    std::chrono::duration<float> elapsed = std::chrono::steady_clock::now() - blockStart;
+    float load = 100*elapsed.count()/deadline;
+    if (profile.blocks == 0) {
+        profile.load = load;
+    } else {
+        profile.load += (load - profile.load)/loadBlocks;
+    }
+    if (load > profile.peakLoad) {
+        profile.peakLoad = load;
+    }
+    if (load > 100) {
+        profile.overruns++;
+    }
+    profile.blocks++;
+}
+
+const Profile_t * Profiler_t::get_profile() {
+    return &profile;
+}
+#endif // SYNTH_PROFILE_
@@ -0,0 +1,793 @@
+/* MXCS Python extension module
+   copyright Maximilian Cornwell 2024
+*/
+// mxcs._engine: the engine and its building blocks as Python types.
+// Audio goes in and out through the buffer protocol (numpy arrays, array.array('f'), memoryviews..)
+// without being copied, and the GIL is released while rendering.
+// Only built into the extension (make python), everything else ignores this file
+
+#ifdef MXCS_PYTHON_
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <atomic>
+#include <new>
+#include <string.h>
+#include "Blit.h"
+#include "Constants.h"
+#include "Engine.h"
+#include "Filter.h"
+#include "Oscillator.h"
+#include "Wavetable.h"
+
+// A float32, C contiguous buffer, released when it goes out of scope
+class FloatBuffer_t {
+    Py_buffer view;
+    bool acquired;
+
+    public:
+    FloatBuffer_t(): acquired(false) {}
+    ~FloatBuffer_t() {
+        if (acquired) {
+            PyBuffer_Release(&view);
+        }
+    }
+    bool get(PyObject * object, bool writable, const char * name) {
+        // returns false, with an exception set, if object can't be used as a float32 buffer
+        int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | (writable ? PyBUF_WRITABLE : 0);
+        if (PyObject_GetBuffer(object, &view, flags) != 0) {
+            return false;
+        }
+        acquired = true;
+        // native single precision, with or without a byte order prefix
+        const char * format = view.format ? view.format : "B";
+        if (format[0] == '@' || format[0] == '=' || (PY_LITTLE_ENDIAN && format[0] == '<')
+            || (PY_BIG_ENDIAN && (format[0] == '>' || format[0] == '!'))) {
+            format++;
+        }
+        if (strcmp(format, "f") != 0 || view.itemsize != sizeof(float)) {
+            PyErr_Format(PyExc_TypeError, "%s should be a float32 buffer, not format '%s'", name, view.format);
+            return false;
+        }
+        return true;
+    }
+    float * data() {
+        return (float *)view.buf;
+    }
+    uint32_t size() {
+        return (uint32_t)(view.len/sizeof(float));
+    }
+    bool check_size(Py_ssize_t limit, const char * name) {
+        // the kernels count samples with 32 bits
+        if (view.len/(Py_ssize_t)sizeof(float) > limit) {
+            PyErr_Format(PyExc_ValueError, "%s is too long", name);
+            return false;
+        }
+        return true;
+    }
+};
+
+// Objects run with the GIL released, so two threads could try to use one at once
+class BusyGuard_t {
+    std::atomic<bool> * busy;
+    bool acquired;
+
+    public:
+    BusyGuard_t(std::atomic<bool> * _busy): busy(_busy) {
+        acquired = !busy->exchange(true);
+        if (!acquired) {
+            PyErr_SetString(PyExc_RuntimeError, "already in use by another thread");
+        }
+    }
+    ~BusyGuard_t() {
+        if (acquired) {
+            busy->store(false);
+        }
+    }
+    bool ok() {
+        return acquired;
+    }
+};
+
+static bool check_error(MxcsError_t error) {
+    // turns engine error codes into exceptions, returns true on success
+    switch (error) {
+    case SUCCESS:
+        return true;
+    case ERROR_INVALID_PARAMETER:
+        PyErr_SetString(PyExc_ValueError, "invalid parameter");
+        break;
+    case ERROR_INVALID_VALUE:
+        PyErr_SetString(PyExc_ValueError, "invalid value");
+        break;
+    case ERROR_OUT_OF_MEMORY:
+        PyErr_NoMemory();
+        break;
+    case ERROR_QUEUE_FULL:
+        PyErr_SetString(PyExc_OverflowError, "event or command queue full");
+        break;
+    case ERROR_UNSUPPORTED:
+        PyErr_SetString(PyExc_NotImplementedError, "not supported by this build of the engine");
+        break;
+    case ERROR_INVALID_DATA:
+        PyErr_SetString(PyExc_ValueError, "invalid or corrupt data");
+        break;
+    default:
+        PyErr_Format(PyExc_RuntimeError, "engine error %u", error);
+        break;
+    }
+    return false;
+}
+
+template <typename Object_t>
+static PyObject * new_object(PyTypeObject * type, PyObject *, PyObject *) {
+    // the C++ object lives inside the Python one, constructed in place
+    Object_t * self = (Object_t *)type->tp_alloc(type, 0);
+    if (self != nullptr) {
+        new (self) Object_t();
+    }
+    return (PyObject *)self;
+}
+
+template <typename Object_t>
+static void dealloc_object(PyObject * object) {
+    PyTypeObject * type = Py_TYPE(object);
+    ((Object_t *)object)->~Object_t();
+    type->tp_free(object);
+    Py_DECREF(type);
+}
+
+/* Synth: the whole engine, through the C API so the parameters are checked the same way */
+
+struct PySynth_t {
+    PyObject_HEAD
+    MxcsEngine_t * engine;
+    float samplingFrequency;
+    std::atomic<bool> busy;
+    std::atomic<bool> posting;      // the post_ methods can run alongside the rest, but only one at a time
+
+    PySynth_t(): engine(nullptr), samplingFrequency(0), busy(false), posting(false) {}
+    ~PySynth_t() {
+        mxcs_destroy(engine);
+    }
+};
+
+static int synth_init(PyObject * object, PyObject * args, PyObject * kwargs) {
+    PySynth_t * self = (PySynth_t *)object;
+    static const char * keywords[] = {"sampling_frequency", "voices", "block_size", nullptr};
+    float samplingFrequency;
+    unsigned int voices = 16;
+    unsigned int blockSize = defaultBlockSize;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "f|II", (char **)keywords,
+                                     &samplingFrequency, &voices, &blockSize)) {
+        return -1;
+    }
+    if (!(samplingFrequency > 0)) {
+        PyErr_SetString(PyExc_ValueError, "sampling_frequency should be positive");
+        return -1;
+    }
+    BusyGuard_t guard(&self->busy);
+    BusyGuard_t postGuard(&self->posting);
+    if (!guard.ok() || !postGuard.ok()) {
+        return -1;
+    }
+    MxcsEngine_t * engine = mxcs_create(samplingFrequency, voices, blockSize);
+    if (engine == nullptr) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    mxcs_destroy(self->engine);
+    self->engine = engine;
+    self->samplingFrequency = samplingFrequency;
+    return 0;
+}
+
+static bool synth_ready(PySynth_t * self) {
+    if (self->engine == nullptr) {
+        PyErr_SetString(PyExc_RuntimeError, "Synth not initialised");
+        return false;
+    }
+    return true;
+}
+
+static PyObject * synth_set(PyObject * object, PyObject * args) {
+    PySynth_t * self = (PySynth_t *)object;
+    unsigned int parameter;
+    float value;
+    if (!PyArg_ParseTuple(args, "If", &parameter, &value) || !synth_ready(self)) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok() || !check_error(mxcs_set_parameter(self->engine, parameter, value))) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * synth_press(PyObject * object, PyObject * args) {
+    PySynth_t * self = (PySynth_t *)object;
+    unsigned int note;
+    if (!PyArg_ParseTuple(args, "I", &note) || !synth_ready(self)) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok() || !check_error(mxcs_press(self->engine, note))) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * synth_release(PyObject * object, PyObject * args) {
+    PySynth_t * self = (PySynth_t *)object;
+    unsigned int note;
+    if (!PyArg_ParseTuple(args, "I", &note) || !synth_ready(self)) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok() || !check_error(mxcs_release(self->engine, note))) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * synth_schedule(PyObject * object, PyObject * args) {
+    // events: a buffer of Event_t, e.g. a numpy array with mxcs.library.event_dtype
+    PySynth_t * self = (PySynth_t *)object;
+    PyObject * events;
+    if (!PyArg_ParseTuple(args, "O", &events) || !synth_ready(self)) {
+        return nullptr;
+    }
+    Py_buffer view;
+    if (PyObject_GetBuffer(events, &view, PyBUF_C_CONTIGUOUS) != 0) {
+        return nullptr;
+    }
+    bool ok = false;
+    if (view.len % sizeof(Event_t) != 0) {
+        PyErr_Format(PyExc_ValueError, "events should be a buffer of %zu byte events", sizeof(Event_t));
+    } else {
+        BusyGuard_t guard(&self->busy);
+        ok = guard.ok() && check_error(mxcs_schedule(self->engine, (const Event_t *)view.buf,
+                                                     view.len/sizeof(Event_t)));
+    }
+    PyBuffer_Release(&view);
+    if (!ok) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * synth_render(PyObject * object, PyObject * args) {
+    // renders into out, which needs to be a whole number of blocks
+    PySynth_t * self = (PySynth_t *)object;
+    PyObject * out;
+    if (!PyArg_ParseTuple(args, "O", &out) || !synth_ready(self)) {
+        return nullptr;
+    }
+    FloatBuffer_t buffer;
+    if (!buffer.get(out, true, "out") || !buffer.check_size(UINT32_MAX, "out")) {
+        return nullptr;
+    }
+    const uint32_t blockSize = mxcs_block_size(self->engine);
+    if (buffer.size() % blockSize != 0) {
+        PyErr_Format(PyExc_ValueError, "out (%u samples) is not a whole number of blocks (%u samples)",
+                     buffer.size(), blockSize);
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return nullptr;
+    }
+    MxcsError_t error;
+    Py_BEGIN_ALLOW_THREADS
+    error = mxcs_step(self->engine, buffer.data(), buffer.size()/blockSize);
+    Py_END_ALLOW_THREADS
+    if (!check_error(error)) {
+        return nullptr;
+    }
+    Py_INCREF(out);
+    return out;
+}
+
+static PyObject * synth_get_block_size(PyObject * object, void *) {
+    PySynth_t * self = (PySynth_t *)object;
+    if (!synth_ready(self)) {
+        return nullptr;
+    }
+    return PyLong_FromUnsignedLong(mxcs_block_size(self->engine));
+}
+
+static PyObject * synth_get_time(PyObject * object, void *) {
+    PySynth_t * self = (PySynth_t *)object;
+    if (!synth_ready(self)) {
+        return nullptr;
+    }
+    return PyLong_FromUnsignedLong(mxcs_get_time(self->engine));
+}
+
+static PyObject * synth_get_sampling_frequency(PyObject * object, void *) {
+    return PyFloat_FromDouble(((PySynth_t *)object)->samplingFrequency);
+}
+
+static PyObject * synth_post(PyObject * object, PyObject * args, MxcsError_t (*post)(MxcsEngine_t *, unsigned int)) {
+    PySynth_t * self = (PySynth_t *)object;
+    unsigned int note;
+    if (!PyArg_ParseTuple(args, "I", &note) || !synth_ready(self)) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->posting);
+    if (!guard.ok() || !check_error(post(self->engine, note))) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * synth_post_set(PyObject * object, PyObject * args) {
+    PySynth_t * self = (PySynth_t *)object;
+    unsigned int parameter;
+    float value;
+    if (!PyArg_ParseTuple(args, "If", &parameter, &value) || !synth_ready(self)) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->posting);
+    if (!guard.ok() || !check_error(mxcs_post_parameter(self->engine, parameter, value))) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * synth_post_press(PyObject * object, PyObject * args) {
+    return synth_post(object, args, mxcs_post_press);
+}
+
+static PyObject * synth_post_release(PyObject * object, PyObject * args) {
+    return synth_post(object, args, mxcs_post_release);
+}
+
+static PyMethodDef synthMethods[] = {
+    {"set", synth_set, METH_VARARGS, "set(parameter, value): set a parameter (see mxcs.Parameter)"},
+    {"press", synth_press, METH_VARARGS, "press(note): press a MIDI note"},
+    {"release", synth_release, METH_VARARGS, "release(note): release a MIDI note"},
+    {"schedule", synth_schedule, METH_VARARGS,
+     "schedule(events): queue a buffer of events (see mxcs.library.event_dtype), times are in samples"},
+    {"post_set", synth_post_set, METH_VARARGS,
+     "post_set(parameter, value): set a parameter from another thread, at the start of the next block"},
+    {"post_press", synth_post_press, METH_VARARGS, "post_press(note): press a MIDI note from another thread"},
+    {"post_release", synth_post_release, METH_VARARGS, "post_release(note): release a MIDI note from another thread"},
+    {"render", synth_render, METH_VARARGS,
+     "render(out): render into a float32 buffer, a whole number of blocks long, and return it"},
+    {nullptr, nullptr, 0, nullptr}
+};
+
+static PyGetSetDef synthGetSet[] = {
+    {"block_size", synth_get_block_size, nullptr, "samples per block", nullptr},
+    {"time", synth_get_time, nullptr, "time (in samples) at the start of the next block", nullptr},
+    {"sampling_frequency", synth_get_sampling_frequency, nullptr, "sampling frequency (Hz)", nullptr},
+    {nullptr, nullptr, nullptr, nullptr, nullptr}
+};
+
+static PyType_Slot synthSlots[] = {
+    {Py_tp_doc, (void *)"Synth(sampling_frequency, voices=16, block_size=128)\n\n"
+                        "The polyphonic synth, rendered a block at a time"},
+    {Py_tp_new, (void *)new_object<PySynth_t>},
+    {Py_tp_init, (void *)synth_init},
+    {Py_tp_dealloc, (void *)dealloc_object<PySynth_t>},
+    {Py_tp_methods, synthMethods},
+    {Py_tp_getset, synthGetSet},
+    {0, nullptr}
+};
+
+static PyType_Spec synthSpec = {"mxcs._engine.Synth", sizeof(PySynth_t), 0, Py_TPFLAGS_DEFAULT, synthSlots};
+
+/* Generators: anything with set_freq and step(out, n), frequencies are relative to fs */
+
+template <typename Generator_t>
+struct PyGenerator_t {
+    PyObject_HEAD
+    Generator_t generator;
+    std::atomic<bool> busy;
+
+    PyGenerator_t(): busy(false) {}
+};
+
+template <typename Generator_t>
+static PyObject * generator_set_freq(PyObject * object, PyObject * args) {
+    PyGenerator_t<Generator_t> * self = (PyGenerator_t<Generator_t> *)object;
+    float freq;
+    if (!PyArg_ParseTuple(args, "f", &freq)) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return nullptr;
+    }
+    self->generator.set_freq(freq);
+    Py_RETURN_NONE;
+}
+
+template <typename Generator_t>
+static PyObject * generator_step(PyObject * object, PyObject * args) {
+    PyGenerator_t<Generator_t> * self = (PyGenerator_t<Generator_t> *)object;
+    PyObject * out;
+    if (!PyArg_ParseTuple(args, "O", &out)) {
+        return nullptr;
+    }
+    FloatBuffer_t buffer;
+    if (!buffer.get(out, true, "out") || !buffer.check_size(UINT32_MAX, "out")) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return nullptr;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    self->generator.step(buffer.data(), buffer.size());
+    Py_END_ALLOW_THREADS
+    Py_INCREF(out);
+    return out;
+}
+
+template <typename Generator_t>
+struct GeneratorType_t {
+    static PyMethodDef methods[];
+    static PyType_Slot slots[];
+};
+
+template <typename Generator_t>
+PyMethodDef GeneratorType_t<Generator_t>::methods[] = {
+    {"set_freq", generator_set_freq<Generator_t>, METH_VARARGS,
+     "set_freq(freq): set the frequency, relative to the sampling frequency"},
+    {"step", generator_step<Generator_t>, METH_VARARGS, "step(out): fill a float32 buffer, and return it"},
+    {nullptr, nullptr, 0, nullptr}
+};
+
+template <typename Generator_t>
+PyType_Slot GeneratorType_t<Generator_t>::slots[] = {
+    {Py_tp_new, (void *)new_object<PyGenerator_t<Generator_t>>},
+    {Py_tp_dealloc, (void *)dealloc_object<PyGenerator_t<Generator_t>>},
+    {Py_tp_methods, GeneratorType_t<Generator_t>::methods},
+    {0, nullptr}
+};
+
+// the oscillator can also give the cosine, and its phase
+static PyObject * oscillator_step_quadrature(PyObject * object, PyObject * args) {
+    PyGenerator_t<Oscillator_t> * self = (PyGenerator_t<Oscillator_t> *)object;
+    PyObject * cosOut;
+    PyObject * sinOut;
+    if (!PyArg_ParseTuple(args, "OO", &cosOut, &sinOut)) {
+        return nullptr;
+    }
+    FloatBuffer_t cosBuffer;
+    FloatBuffer_t sinBuffer;
+    if (!cosBuffer.get(cosOut, true, "cos_out") || !sinBuffer.get(sinOut, true, "sin_out")
+        || !cosBuffer.check_size(UINT32_MAX, "cos_out")) {
+        return nullptr;
+    }
+    if (cosBuffer.size() != sinBuffer.size()) {
+        PyErr_SetString(PyExc_ValueError, "cos_out and sin_out should be the same size");
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return nullptr;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    self->generator.step(cosBuffer.data(), sinBuffer.data(), cosBuffer.size());
+    Py_END_ALLOW_THREADS
+    Py_RETURN_NONE;
+}
+
+static PyObject * oscillator_get_phase(PyObject * object, void *) {
+    return PyFloat_FromDouble(((PyGenerator_t<Oscillator_t> *)object)->generator.get_phase());
+}
+
+static PyMethodDef oscillatorMethods[] = {
+    {"set_freq", generator_set_freq<Oscillator_t>, METH_VARARGS,
+     "set_freq(freq): set the frequency, relative to the sampling frequency"},
+    {"step", generator_step<Oscillator_t>, METH_VARARGS, "step(out): fill a float32 buffer with a sine, and return it"},
+    {"step_quadrature", oscillator_step_quadrature, METH_VARARGS,
+     "step_quadrature(cos_out, sin_out): fill two float32 buffers with a cosine and sine"},
+    {nullptr, nullptr, 0, nullptr}
+};
+
+static PyGetSetDef oscillatorGetSet[] = {
+    {"phase", oscillator_get_phase, nullptr, "phase of the last sample (radians)", nullptr},
+    {nullptr, nullptr, nullptr, nullptr, nullptr}
+};
+
+static PyType_Slot oscillatorSlots[] = {
+    {Py_tp_doc, (void *)"Oscillator()\n\nQuadrature sine oscillator"},
+    {Py_tp_new, (void *)new_object<PyGenerator_t<Oscillator_t>>},
+    {Py_tp_dealloc, (void *)dealloc_object<PyGenerator_t<Oscillator_t>>},
+    {Py_tp_methods, oscillatorMethods},
+    {Py_tp_getset, oscillatorGetSet},
+    {0, nullptr}
+};
+
+/* Filters: step(in, out=None) filters in place without out */
+
+template <typename Filter_t>
+struct PyFilter_t {
+    PyObject_HEAD
+    Filter_t filter;
+    std::atomic<bool> busy;
+
+    PyFilter_t(): filter(), busy(false) {}
+};
+
+template <typename Filter_t>
+static PyObject * filter_step(PyObject * object, PyObject * args) {
+    PyFilter_t<Filter_t> * self = (PyFilter_t<Filter_t> *)object;
+    PyObject * in;
+    PyObject * out = nullptr;
+    if (!PyArg_ParseTuple(args, "O|O", &in, &out)) {
+        return nullptr;
+    }
+    if (out == Py_None) {
+        out = nullptr;
+    }
+    FloatBuffer_t inBuffer;
+    FloatBuffer_t outBuffer;
+    // in place needs in to be writable
+    if (!inBuffer.get(in, out == nullptr, "in") || !inBuffer.check_size(UINT32_MAX, "in")) {
+        return nullptr;
+    }
+    FloatBuffer_t * outPtr = &inBuffer;
+    if (out != nullptr) {
+        if (!outBuffer.get(out, true, "out")) {
+            return nullptr;
+        }
+        if (outBuffer.size() != inBuffer.size()) {
+            PyErr_SetString(PyExc_ValueError, "in and out should be the same size");
+            return nullptr;
+        }
+        outPtr = &outBuffer;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return nullptr;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    self->filter.step(inBuffer.data(), outPtr->data(), inBuffer.size());
+    Py_END_ALLOW_THREADS
+    PyObject * result = out ? out : in;
+    Py_INCREF(result);
+    return result;
+}
+
+static bool get_coeffs(PyObject * object, uint32_t length, float * coeffs, const char * name) {
+    // length coefficients from a buffer (or sequence) of numbers
+    PyObject * sequence = PySequence_Fast(object, "coefficients should be a sequence");
+    if (sequence == nullptr) {
+        return false;
+    }
+    bool ok = (uint32_t)PySequence_Fast_GET_SIZE(sequence) == length;
+    if (!ok) {
+        PyErr_Format(PyExc_ValueError, "%s should have %u coefficients", name, length);
+    }
+    for (uint32_t i = 0; ok && i < length; i++) {
+        coeffs[i] = (float)PyFloat_AsDouble(PySequence_Fast_GET_ITEM(sequence, i));
+        ok = !PyErr_Occurred();
+    }
+    Py_DECREF(sequence);
+    return ok;
+}
+
+// Biquad(sampling_frequency), configured as a lowpass or highpass, or with coefficients
+struct PyBiquad_t {
+    PyObject_HEAD
+    Biquad_Filter_t filter;
+    std::atomic<bool> busy;
+
+    PyBiquad_t(): filter(1), busy(false) {}    // replaced by __init__, with the sampling frequency
+};
+
+static int biquad_init(PyObject * object, PyObject * args, PyObject * kwargs) {
+    PyBiquad_t * self = (PyBiquad_t *)object;
+    static const char * keywords[] = {"sampling_frequency", nullptr};
+    float samplingFrequency;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "f", (char **)keywords, &samplingFrequency)) {
+        return -1;
+    }
+    if (!(samplingFrequency > 0)) {
+        PyErr_SetString(PyExc_ValueError, "sampling_frequency should be positive");
+        return -1;
+    }
+    // __init__ can be called again, while another thread is stepping the filter
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return -1;
+    }
+    self->filter = Biquad_Filter_t(samplingFrequency);
+    return 0;
+}
+
+static PyObject * biquad_configure(PyObject * object, PyObject * args, bool highpass) {
+    PyBiquad_t * self = (PyBiquad_t *)object;
+    float freq;
+    float res;
+    if (!PyArg_ParseTuple(args, "ff", &freq, &res)) {
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return nullptr;
+    }
+    if (highpass) {
+        self->filter.configure_highpass(freq, res);
+    } else {
+        self->filter.configure_lowpass(freq, res);
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * biquad_configure_lowpass(PyObject * object, PyObject * args) {
+    return biquad_configure(object, args, false);
+}
+
+static PyObject * biquad_configure_highpass(PyObject * object, PyObject * args) {
+    return biquad_configure(object, args, true);
+}
+
+static PyObject * biquad_set_coeffs(PyObject * object, PyObject * args) {
+    PyBiquad_t * self = (PyBiquad_t *)object;
+    PyObject * bObject;
+    PyObject * aObject;
+    float b[3];
+    float a[3];
+    if (!PyArg_ParseTuple(args, "OO", &bObject, &aObject)
+        || !get_coeffs(bObject, 3, b, "b") || !get_coeffs(aObject, 3, a, "a")) {
+        return nullptr;
+    }
+    if (a[0] == 0) {
+        PyErr_SetString(PyExc_ValueError, "a[0] can't be 0");
+        return nullptr;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return nullptr;
+    }
+    self->filter.set_coeffs(b, a);
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef biquadMethods[] = {
+    {"configure_lowpass", biquad_configure_lowpass, METH_VARARGS,
+     "configure_lowpass(freq, res): cutoff (Hz) and resonance (dB)"},
+    {"configure_highpass", biquad_configure_highpass, METH_VARARGS,
+     "configure_highpass(freq, res): cutoff (Hz) and resonance (dB)"},
+    {"set_coeffs", biquad_set_coeffs, METH_VARARGS, "set_coeffs(b, a): 3 numerator and denominator coefficients"},
+    {"step", filter_step<Biquad_Filter_t>, METH_VARARGS,
+     "step(in, out=None): filter a float32 buffer into out (or in place), and return the output"},
+    {nullptr, nullptr, 0, nullptr}
+};
+
+static PyType_Slot biquadSlots[] = {
+    {Py_tp_doc, (void *)"Biquad(sampling_frequency)\n\nSecond order filter"},
+    {Py_tp_new, (void *)new_object<PyBiquad_t>},
+    {Py_tp_init, (void *)biquad_init},
+    {Py_tp_dealloc, (void *)dealloc_object<PyBiquad_t>},
+    {Py_tp_methods, biquadMethods},
+    {0, nullptr}
+};
+
+// SosFilter(b, a): any order up to maxSosOrder, run as second order sections
+static int sos_init(PyObject * object, PyObject * args, PyObject * kwargs) {
+    PyFilter_t<Filter_SOS_t> * self = (PyFilter_t<Filter_SOS_t> *)object;
+    static const char * keywords[] = {"b", "a", nullptr};
+    PyObject * bObject;
+    PyObject * aObject;
+    float b[maxSosOrder + 1];
+    float a[maxSosOrder + 1];
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO", (char **)keywords, &bObject, &aObject)) {
+        return -1;
+    }
+    Py_ssize_t length = PyObject_Length(aObject);
+    if (length < 0) {
+        return -1;
+    }
+    if (length < 1 || length > (Py_ssize_t)maxSosOrder + 1) {
+        PyErr_Format(PyExc_ValueError, "the order should be from 0 to %u", maxSosOrder);
+        return -1;
+    }
+    if (!get_coeffs(bObject, length, b, "b") || !get_coeffs(aObject, length, a, "a")) {
+        return -1;
+    }
+    if (a[0] == 0) {
+        PyErr_SetString(PyExc_ValueError, "a[0] can't be 0");
+        return -1;
+    }
+    BusyGuard_t guard(&self->busy);
+    if (!guard.ok()) {
+        return -1;
+    }
+    self->filter.set_coeffs(b, a, length - 1);
+    return 0;
+}
+
+static PyObject * sos_get_sections(PyObject * object, void *) {
+    return PyLong_FromUnsignedLong(((PyFilter_t<Filter_SOS_t> *)object)->filter.get_sections());
+}
+
+static PyMethodDef sosMethods[] = {
+    {"step", filter_step<Filter_SOS_t>, METH_VARARGS,
+     "step(in, out=None): filter a float32 buffer into out (or in place), and return the output"},
+    {nullptr, nullptr, 0, nullptr}
+};
+
+static PyGetSetDef sosGetSet[] = {
+    {"sections", sos_get_sections, nullptr, "number of second order sections", nullptr},
+    {nullptr, nullptr, nullptr, nullptr, nullptr}
+};
+
+static PyType_Slot sosSlots[] = {
+    {Py_tp_doc, (void *)"SosFilter(b, a)\n\nIIR filter (b and a the same length), factored into second order sections"},
+    {Py_tp_new, (void *)new_object<PyFilter_t<Filter_SOS_t>>},
+    {Py_tp_init, (void *)sos_init},
+    {Py_tp_dealloc, (void *)dealloc_object<PyFilter_t<Filter_SOS_t>>},
+    {Py_tp_methods, sosMethods},
+    {Py_tp_getset, sosGetSet},
+    {0, nullptr}
+};
+
+/* the module */
+
+template <typename Object_t>
+static PyType_Spec make_spec(const char * name, PyType_Slot * slots) {
+    return {name, sizeof(Object_t), 0, Py_TPFLAGS_DEFAULT, slots};
+}
+
+static PyType_Spec oscillatorSpec = make_spec<PyGenerator_t<Oscillator_t>>("mxcs._engine.Oscillator", oscillatorSlots);
+static PyType_Spec blitSpec = make_spec<PyGenerator_t<Blit_t>>("mxcs._engine.Blit",
+                                                               GeneratorType_t<Blit_t>::slots);
+static PyType_Spec bpBlitSpec = make_spec<PyGenerator_t<BpBlit_t>>("mxcs._engine.BpBlit",
+                                                                   GeneratorType_t<BpBlit_t>::slots);
+static PyType_Spec sawtoothSpec = make_spec<PyGenerator_t<Sawtooth_t>>("mxcs._engine.Sawtooth",
+                                                                       GeneratorType_t<Sawtooth_t>::slots);
+static PyType_Spec squareSpec = make_spec<PyGenerator_t<Square_t>>("mxcs._engine.Square",
+                                                                   GeneratorType_t<Square_t>::slots);
+static PyType_Spec triangleSpec = make_spec<PyGenerator_t<Triangle_t>>("mxcs._engine.Triangle",
+                                                                       GeneratorType_t<Triangle_t>::slots);
+static PyType_Spec wavetableSpec = make_spec<PyGenerator_t<Wavetable_t>>("mxcs._engine.Wavetable",
+                                                                         GeneratorType_t<Wavetable_t>::slots);
+static PyType_Spec biquadSpec = make_spec<PyBiquad_t>("mxcs._engine.Biquad", biquadSlots);
+static PyType_Spec sosSpec = make_spec<PyFilter_t<Filter_SOS_t>>("mxcs._engine.SosFilter", sosSlots);
+
+static int add_type(PyObject * module, PyType_Spec * spec) {
+    PyObject * type = PyType_FromModuleAndSpec(module, spec, nullptr);
+    if (type == nullptr) {
+        return -1;
+    }
+    int result = PyModule_AddType(module, (PyTypeObject *)type);
+    Py_DECREF(type);
+    return result;
+}
+
+static int engine_exec(PyObject * module) {
+    PyType_Spec * specs[] = {&synthSpec, &oscillatorSpec, &blitSpec, &bpBlitSpec, &sawtoothSpec,
+                             &squareSpec, &triangleSpec, &wavetableSpec, &biquadSpec, &sosSpec};
+    for (PyType_Spec * spec : specs) {
+        if (add_type(module, spec) != 0) {
+            return -1;
+        }
+    }
+    if (PyModule_AddIntConstant(module, "max_block_size", maxBlockSize) != 0
+        || PyModule_AddIntConstant(module, "max_voices", maxVoices) != 0) {
+        return -1;
+    }
+    return 0;
+}
+
+static PyModuleDef_Slot engineSlots[] = {
+    {Py_mod_exec, (void *)engine_exec},
+    {0, nullptr}
+};
+
+static PyModuleDef engineModule = {
+    PyModuleDef_HEAD_INIT, "mxcs._engine",
+    "MXCS engine, its generators and filters, with buffer protocol I/O", 0,
+    nullptr, engineSlots, nullptr, nullptr, nullptr
+};
+
+PyMODINIT_FUNC PyInit__engine(void) {
+    return PyModuleDef_Init(&engineModule);
+}
+#endif // MXCS_PYTHON_
@@ -0,0 +1,102 @@
+/* MXCS Core Render Cache implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <string.h>
+#include "RenderCache.h"
+
+static uint32_t float_bits(float x) {
+    uint32_t bits;
+    memcpy(&bits, &x, sizeof(bits));
+    return bits;
+}
+
+bool RenderKey_t::operator==(const RenderKey_t & other) const {
+    // compared by their bits, so NaNs (from envelope settings that haven't been set) still match
+    return float_bits(aIncrement) == float_bits(other.aIncrement) &&
+           float_bits(dIncrement) == float_bits(other.dIncrement) &&
+           float_bits(sMag) == float_bits(other.sMag) &&
+           float_bits(rIncrement) == float_bits(other.rIncrement) &&
+           generator == other.generator && note == other.note && gate == other.gate;
+}
+
+size_t RenderKeyHash_t::operator()(const RenderKey_t & key) const {
+    const uint32_t fields[] = {float_bits(key.aIncrement), float_bits(key.dIncrement), float_bits(key.sMag),
+                               float_bits(key.rIncrement), key.generator, key.note, key.gate};
+    uint64_t hash = 14695981039346656037ull;   // FNV-1a, a field at a time
+    for (uint32_t field : fields) {
+        hash = (hash ^ field)*1099511628211ull;
+    }
+    return hash ^ (hash >> 32);
+}
+
+RenderCache_t::RenderCache_t() {
+    budget = 0;
+    clear();
+}
+
+void RenderCache_t::set_budget(size_t bytes) {
+    budget = bytes;
+    evict(budget);
+}
+
+bool RenderCache_t::is_enabled() {
+    return budget > 0;
+}
+
+bool RenderCache_t::fits(size_t samples) {
+    return samples*sizeof(float) <= budget;
+}
+
+std::shared_ptr<const RenderedNote_t> RenderCache_t::lookup(const RenderKey_t & key) {
+    auto found = index.find(key);
+    if (found == index.end()) {
+        stats.misses++;
+        return nullptr;
+    }
+    // moved to the front
+    entries.splice(entries.begin(), entries, found->second);
+    stats.hits++;
+    return found->second->note;
+}
+
+void RenderCache_t::insert(const RenderKey_t & key, std::shared_ptr<RenderedNote_t> note) {
+    // notes bigger than the whole budget aren't kept
+    note->samples.shrink_to_fit();
+    note->amps.shrink_to_fit();
+    const size_t bytes = (note->samples.size() + note->amps.size())*sizeof(float);
+    if (bytes > budget || index.count(key)) {
+        return;
+    }
+    evict(budget - bytes);
+    entries.push_front({key, note, bytes});
+    index[key] = entries.begin();
+    stats.bytes += bytes;
+    stats.entries++;
+}
+
+void RenderCache_t::evict(size_t limit) {
+    // least recently used first, until the notes fit in limit
+    while (stats.bytes > limit) {
+        Entry_t & oldest = entries.back();
+        stats.bytes -= oldest.bytes;
+        stats.entries--;
+        stats.evictions++;
+        index.erase(oldest.key);
+        entries.pop_back();
+    }
+}
+
+void RenderCache_t::bypass() {
+    stats.bypasses++;
+}
+
+void RenderCache_t::clear() {
+    // the notes and the statistics
+    entries.clear();
+    index.clear();
+    memset(&stats, 0, sizeof(stats));
+}
+
+const RenderCacheStats_t * RenderCache_t::get_stats() {
+    return &stats;
+}
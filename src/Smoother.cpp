@@ -0,0 +1,71 @@
+/* MXCS Core Parameter Smoother implementation
+   copyright Maximilian Cornwell 2024
+*/
+#include <math.h>
+#include "Smoother.h"
+
+Smoother_t::Smoother_t(float _value, float _threshold) {
+    value = _value;
+    target = _value;
+    decay = 0;
+    threshold = _threshold;
+}
+
+void Smoother_t::set_time(float time, float samplingFrequency, uint32_t blockSize) {
+    if (time > 0) {
+        decay = expf(-(float)blockSize/(time*samplingFrequency));
+    } else {
+        decay = 0;
+        value = target;
+    }
+}
+
+void Smoother_t::set_target(float _target) {
+    target = _target;
+    if (decay == 0) {
+        value = target;
+    }
+}
+
+void Smoother_t::jump(float _value) {
+    value = _value;
+    target = _value;
+}
+
+bool Smoother_t::is_settled() {
+    return value == target;
+}
+
+float Smoother_t::step() {
+    value = target + (value - target)*decay;
+    if (fabsf(value - target) <= threshold) {
+        value = target;
+    }
+    return value;
+}
+
+float Smoother_t::get_value() {
+    return value;
+}
+
+#ifdef SYNTH_TEST_
+extern "C" {
+    void test_smoother(const float start, const float target, const float time, const float threshold,\
+                       const float fs, const unsigned int blockSize, const unsigned int n, float out[]) {
+        // parameters:  start: initial value
+        //              target: value to smooth towards
+        //              time: time constant (in seconds)
+        //              threshold: distance from the target at which it settles
+        //              fs: sampling frequency
+        //              blockSize: samples per step
+        //              n: number of blocks
+        //              out: value at the end of each block
+        Smoother_t smoother(start, threshold);
+        smoother.set_time(time, fs, blockSize);
+        smoother.set_target(target);
+        for (unsigned int i = 0; i < n; i++) {
+            out[i] = smoother.step();
+        }
+    }
+}
+#endif // SYNTH_TEST_
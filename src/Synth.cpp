@@ -1,26 +1,85 @@
 /* MXCS Core Synthesizer implementation
    copyright Maximilian Cornwell 2023
 */
+#include <math.h>
+#include "Kernels.h"
 #include "Synth.h"
 
 
 const float semitone = 1.0594630943592953;
 const float c_minus_1 = 8.175798915643707;
+const int16_t noVoice = -1;
+const uint32_t noGate = UINT32_MAX;     // the release isn't known when the note is pressed
+// how close a smoothed parameter has to get to its target before it settles
+const float freqThreshold = 0.0001;     // octaves
+const float levelThreshold = 0.001;     // dB
+const float modFreqThreshold = 0.0001;  // Hz
+const float depthThreshold = 0.00001;
+// the envelope a new synth starts with, the same as mxcs.batch.default_patch
+const float defaultAttack = 0.01;       // s
+const float defaultDecay = 0.1;         // s
+const float defaultSustain = -6;        // dB
+const float defaultRelease = 0.1;       // s
 
-Synth_t::Synth_t(float _samplingFrequency): envelopeSettings(_samplingFrequency),
-                                            voice(&envelopeSettings, &generator),
-                                            mod(_samplingFrequency),
-                                            lpFilter(_samplingFrequency),
-                                            hpFilter(_samplingFrequency) {
-    // calculate the frequency table
+Synth_t::Synth_t(float _samplingFrequency, uint16_t _voiceCount, uint32_t _blockSize): envelopeSettings(_samplingFrequency),
+                                                                  mod(_samplingFrequency),
+                                                                  lpFilter(_samplingFrequency, &coeffCache),
+                                                                  hpFilter(_samplingFrequency, &coeffCache),
+                                                                  modFSmoother(0, modFreqThreshold),
+                                                                  modDepthSmoother(0, depthThreshold),
+                                                                  sustainSmoother(defaultSustain, levelThreshold),
+                                                                  lpFSmoother(log2f(20000), freqThreshold),
+                                                                  lpResSmoother(-3, levelThreshold),
+                                                                  hpFSmoother(log2f(20), freqThreshold),
+                                                                  hpResSmoother(-3, levelThreshold),
+                                                                  patches(_samplingFrequency) {
     samplingFrequency = _samplingFrequency;
-    currentNote = 0;
+    // set up the voice pool, all voices start off idle
+    voiceCount = _voiceCount;
+    if (voiceCount > maxVoices) {
+        voiceCount = maxVoices;
+    }
+    if (voiceCount < 1) {
+        voiceCount = 1;
+    }
+    voices.reserve(voiceCount);
+    for (uint16_t i = 0; i < voiceCount; i++) {
+        voices.emplace_back(&envelopeSettings, &generator);
+        voiceNotes[i] = 0;
+        olderVoices[i] = noVoice;
+        newerVoices[i] = noVoice;
+        // pop from the end, so lower voices get used first
+        freeVoices[i] = voiceCount - 1 - i;
+    }
+    freeCount = voiceCount;
+    oldestVoice = noVoice;
+    newestVoice = noVoice;
+    stealPolicy = stealOldest;
+    for (uint8_t i = 0; i < notes; i++) {
+        noteVoices[i] = noVoice;
+    }
+    sampleCount = 0;
+    partOffset = 0;
+    blockStarted = false;
+    settingsVersion = 0;
+    smoothingTime = 0;
+    maxPartition = 0;
+    set_block_size(_blockSize);
+    // calculate the frequency table, and the generator settings for each note
     frequencyTable[0] = c_minus_1/samplingFrequency;
     for(uint8_t i = 1; i < notes; i++) {
         frequencyTable[i] = semitone*(frequencyTable[i-1]);
     }
+    for(uint8_t i = 0; i < notes; i++) {
+        noteCoeffs[i].set_freq(frequencyTable[i]);
+    }
     // configure oscillator type
     generator = sine;
+    // a valid envelope, so a synth that hasn't been configured yet still plays
+    envelopeSettings.set_attack(defaultAttack);
+    envelopeSettings.set_decay(defaultDecay);
+    envelopeSettings.set_sustain(defaultSustain);
+    envelopeSettings.set_release(defaultRelease);
     // initial filter configuration
     lpRes = -3;
     lpF = 20000;
@@ -32,69 +91,650 @@ Synth_t::Synth_t(float _samplingFrequency): envelopeSettings(_samplingFrequency)
 
 void Synth_t::set_attack(float a) {
     envelopeSettings.set_attack(a);
+    settingsVersion++;
 }
 
 void Synth_t::set_decay(float d) {
     envelopeSettings.set_decay(d);
+    settingsVersion++;
 }
 
 void Synth_t::set_sustain(float s) {
-    envelopeSettings.set_sustain(s);
+    // continuous parameters change straight away without smoothing, otherwise they glide in smooth_parameters
+    sustainSmoother.set_target(s);
+    if (sustainSmoother.is_settled()) {
+        envelopeSettings.set_sustain(s);
+        settingsVersion++;
+    }
 }
 
 void Synth_t::set_release(float r) {
     envelopeSettings.set_release(r);
+    settingsVersion++;
 }
 
 void Synth_t::set_mod_f(float freq) {
-    mod.set_freq(freq);
+    modFSmoother.set_target(freq);
+    if (modFSmoother.is_settled()) {
+        mod.set_freq(freq);
+    }
 }
 
 void Synth_t::set_mod_depth(float depth) {
-    mod.modRatio = depth;
+    modDepthSmoother.set_target(depth);
+    if (modDepthSmoother.is_settled()) {
+        mod.modRatio = depth;
+    }
 }
 
 void Synth_t::set_lpf_freq(float freq) {
     lpF = freq;
-    lpFilter.configure_lowpass(lpF, lpRes);
+    lpFSmoother.set_target(log2f(freq));
+    if (lpFSmoother.is_settled() && lpResSmoother.is_settled()) {
+        lpFilter.configure_lowpass(lpF, lpRes);
+    }
 }
 
 void Synth_t::set_lpf_res(float res) {
     lpRes = res;
-    lpFilter.configure_lowpass(lpF, lpRes);
+    lpResSmoother.set_target(res);
+    if (lpFSmoother.is_settled() && lpResSmoother.is_settled()) {
+        lpFilter.configure_lowpass(lpF, lpRes);
+    }
 }
 
 void Synth_t::set_hpf_freq(float freq) {
     hpF = freq;
-    hpFilter.configure_highpass(hpF, hpRes);
+    hpFSmoother.set_target(log2f(freq));
+    if (hpFSmoother.is_settled() && hpResSmoother.is_settled()) {
+        hpFilter.configure_highpass(hpF, hpRes);
+    }
 }
 
 void Synth_t::set_hpf_res(float res){
     hpRes = res;
-    hpFilter.configure_highpass(hpF, hpRes);
+    hpResSmoother.set_target(res);
+    if (hpFSmoother.is_settled() && hpResSmoother.is_settled()) {
+        hpFilter.configure_highpass(hpF, hpRes);
+    }
 }
 
 void Synth_t::set_generator(Generator_e gen) {
     generator = gen;
+    settingsVersion++;
+}
+
+void Synth_t::set_steal_policy(StealPolicy_e policy) {
+    stealPolicy = policy;
+}
+
+void Synth_t::set_dither(bool dither) {
+    output.set_dither(dither);
+}
+
+void Synth_t::set_impulse_response(const float * response, uint32_t length, uint32_t _maxPartition) {
+    // convolves the output with response (e.g. a cabinet or a room), see Convolver_t
+    impulseResponse.assign(response, response + length);
+    maxPartition = _maxPartition;
+    convolver.configure(impulseResponse.data(), length, blockSize, maxPartition);
+}
+
+void Synth_t::set_smoothing(float time) {
+    // time constant (in seconds) for changes to the continuous parameters, 0 changes them straight away
+    smoothingTime = time;
+    update_smoothers();
+}
+
+bool Synth_t::smoothing_settled() {
+    return modFSmoother.is_settled() && modDepthSmoother.is_settled() && sustainSmoother.is_settled() &&\
+           lpFSmoother.is_settled() && lpResSmoother.is_settled() &&\
+           hpFSmoother.is_settled() && hpResSmoother.is_settled();
+}
+
+void Synth_t::update_smoothers() {
+    // the smoothers step once a block, so they depend on the block size too
+    bool settled = smoothing_settled();
+    modFSmoother.set_time(smoothingTime, samplingFrequency, blockSize);
+    modDepthSmoother.set_time(smoothingTime, samplingFrequency, blockSize);
+    sustainSmoother.set_time(smoothingTime, samplingFrequency, blockSize);
+    lpFSmoother.set_time(smoothingTime, samplingFrequency, blockSize);
+    lpResSmoother.set_time(smoothingTime, samplingFrequency, blockSize);
+    hpFSmoother.set_time(smoothingTime, samplingFrequency, blockSize);
+    hpResSmoother.set_time(smoothingTime, samplingFrequency, blockSize);
+    if (!settled && smoothing_settled()) {
+        // smoothing was turned off part way through a glide, jump to the targets
+        mod.set_freq(modFSmoother.get_value());
+        mod.modRatio = modDepthSmoother.get_value();
+        envelopeSettings.set_sustain(sustainSmoother.get_value());
+        settingsVersion++;
+        lpFilter.configure_lowpass(lpF, lpRes);
+        hpFilter.configure_highpass(hpF, hpRes);
+    }
+}
+
+void Synth_t::smooth_parameters() {
+    // a step of each smoother that hasn't settled. The filter coefficients and modulation depth are
+    // interpolated across the block from there, the rest change at the start of it.
+    // Once a filter settles its coefficients come from the exact frequency, as if it had been set directly
+    if (!modFSmoother.is_settled()) {
+        mod.set_freq(modFSmoother.step());
+    }
+    if (!modDepthSmoother.is_settled()) {
+        mod.ramp_ratio(modDepthSmoother.step());
+    }
+    if (!sustainSmoother.is_settled()) {
+        envelopeSettings.set_sustain(sustainSmoother.step());
+        settingsVersion++;
+    }
+    if (!lpFSmoother.is_settled() || !lpResSmoother.is_settled()) {
+        float f = exp2f(lpFSmoother.step());
+        float res = lpResSmoother.step();
+        lpFilter.configure_lowpass(lpFSmoother.is_settled() ? lpF : f, res, true);
+    }
+    if (!hpFSmoother.is_settled() || !hpResSmoother.is_settled()) {
+        float f = exp2f(hpFSmoother.step());
+        float res = hpResSmoother.step();
+        hpFilter.configure_highpass(hpFSmoother.is_settled() ? hpF : f, res, true);
+    }
+}
+
+static MxcsError_t check_parameter(uint32_t parameter, float value) {
+    if (parameter > paramDither) {
+        return ERROR_INVALID_PARAMETER;
+    }
+    if (isnan(value)) {
+        return ERROR_INVALID_VALUE;
+    }
+    if (parameter == paramGenerator && !(value >= sine && value <= wavetable)) {
+        return ERROR_INVALID_VALUE;
+    }
+    if (parameter == paramStealPolicy && !(value >= stealOldest && value <= stealQuietest)) {
+        return ERROR_INVALID_VALUE;
+    }
+    if ((parameter == paramLpfFreq || parameter == paramHpfFreq) && !(value > 0 && isfinite(value))) {
+        // the filters are set up from log2 of the frequency
+        return ERROR_INVALID_VALUE;
+    }
+    if (parameter == paramModFreq && !(value >= 0 && isfinite(value))) {
+        // 0 stops the LFO, as in the default patch
+        return ERROR_INVALID_VALUE;
+    }
+    if (parameter == paramSmoothing && !(value >= 0)) {
+        return ERROR_INVALID_VALUE;
+    }
+    if (parameter == paramDither && !(value >= 0 && value <= 1)) {
+        return ERROR_INVALID_VALUE;
+    }
+    return SUCCESS;
+}
+
+MxcsError_t Synth_t::set_parameter(uint32_t parameter, float value) {
+    // parameter: Parameter_e
+    MxcsError_t error = check_parameter(parameter, value);
+    if (error != SUCCESS) {
+        return error;
+    }
+    switch (parameter)
+    {
+    case paramAttack:
+        set_attack(value);
+        break;
+    case paramDecay:
+        set_decay(value);
+        break;
+    case paramSustain:
+        set_sustain(value);
+        break;
+    case paramRelease:
+        set_release(value);
+        break;
+    case paramModFreq:
+        set_mod_f(value);
+        break;
+    case paramModDepth:
+        set_mod_depth(value);
+        break;
+    case paramLpfFreq:
+        set_lpf_freq(value);
+        break;
+    case paramLpfRes:
+        set_lpf_res(value);
+        break;
+    case paramHpfFreq:
+        set_hpf_freq(value);
+        break;
+    case paramHpfRes:
+        set_hpf_res(value);
+        break;
+    case paramGenerator:
+        set_generator((Generator_e)value);
+        break;
+    case paramStealPolicy:
+        set_steal_policy((StealPolicy_e)value);
+        break;
+    case paramSmoothing:
+        set_smoothing(value);
+        break;
+    case paramDither:
+        set_dither(value != 0);
+        break;
+    }
+    return SUCCESS;
+}
+
+uint16_t Synth_t::get_active_voices() {
+    return voiceCount - freeCount;
+}
+
+void Synth_t::set_block_size(uint32_t size) {
+    // number of samples produced by each step, clamped to 1..maxBlockSize
+    if (size > maxBlockSize) {
+        size = maxBlockSize;
+    }
+    if (size < 1) {
+        size = 1;
+    }
+    blockSize = size;
+    pcmBlock.resize(blockSize);
+    partBlock.resize(blockSize);
+    if (convolver.is_active()) {
+        convolver.configure(impulseResponse.data(), impulseResponse.size(), blockSize, maxPartition);
+    }
+    update_smoothers();
+}
+
+uint32_t Synth_t::get_block_size() {
+    return blockSize;
 }
 
 void Synth_t::press(uint8_t note) {
-    float f = frequencyTable[note];
-    voice.press(f);
-    currentNote = note;
+    press_note(note, noGate);
+}
+
+void Synth_t::press_note(uint8_t note, uint32_t gate) {
+    // With the render cache on, a note is cached when it's pressed on an idle voice and the time of its release
+    // is known (it has already been scheduled). A hit plays back the first rendering of the note, so its
+    // oscillator starts at the phase the first one had rather than wherever the voice's had got to,
+    // and changes to the envelope or generator part way through it are ignored
+    const NoteCoeffs_t * coeffs = &noteCoeffs[note];
+    int16_t voice = noteVoices[note];
+    if (voice != noVoice && voices[voice].is_playing()) {
+        // a cached note can't be retriggered part way through, so it's left to finish and the note gets a new voice
+        noteVoices[note] = noVoice;
+        voice = noVoice;
+    }
+    const bool idle = voice == noVoice && freeCount > 0;
+    if (voice == noVoice) {
+        voice = allocate_voice();
+        noteVoices[note] = voice;
+        voiceNotes[voice] = note;
+    } else {
+        // retriggering a note that is still sounding, it becomes the newest
+        unlink_voice(voice);
+    }
+    link_voice(voice);
+    if (!renderCache.is_enabled()) {
+        voices[voice].press(coeffs);
+        return;
+    }
+    if (!idle || gate == noGate || !renderCache.fits(gate)) {
+        renderCache.bypass();
+        voices[voice].press(coeffs);
+        return;
+    }
+    RenderKey_t key = {envelopeSettings.aIncrement, envelopeSettings.dIncrement, envelopeSettings.sMag,
+                       envelopeSettings.rIncrement, (uint32_t)generator, note, gate};
+    std::shared_ptr<const RenderedNote_t> cached = renderCache.lookup(key);
+    if (cached) {
+        voices[voice].play(cached);
+        return;
+    }
+    voices[voice].press(coeffs);
+    voices[voice].record(gate);
+    recordKeys[voice] = key;
+    recordVersions[voice] = settingsVersion;
+}
+
+uint32_t Synth_t::scheduled_gate(const Event_t * press) {
+    // samples until the note is released, if the next event for it is its release. press is the earliest event
+    for (uint32_t i = 1; i < events.size(); i++) {
+        const Event_t * event = events.at(i);
+        if (event->note == press->note) {
+            return (event->type == releaseEvent) ? event->time - press->time : noGate;
+        }
+    }
+    return noGate;
+}
+
+void Synth_t::set_render_cache(size_t bytes) {
+    renderCache.set_budget(bytes);
+}
+
+const RenderCacheStats_t * Synth_t::get_render_cache_stats() {
+    return renderCache.get_stats();
 }
 
 void Synth_t::release(uint8_t note) {
-    if (note==currentNote) {
-        voice.release();
+    int16_t voice = noteVoices[note];
+    if (voice != noVoice) {
+        // the voice keeps the note until its release finishes,
+        // so a quick re-press doesn't take up another voice
+        voices[voice].release();
     }
 }
 
+bool Synth_t::schedule(Event_t event) {
+    // queue an event to happen at a particular sample, returns false if the queue is full
+    // events in the past happen at the start of the next block
+    return events.push(event);
+}
+
+uint32_t Synth_t::get_time() {
+    return sampleCount;
+}
+
+MxcsError_t Synth_t::post_parameter(uint32_t parameter, float value) {
+    // checked here, so the audio thread can't get a command it can't apply
+    MxcsError_t error = check_parameter(parameter, value);
+    if (error != SUCCESS) {
+        return error;
+    }
+    return commands.push({commandParameter, 0, (uint16_t)parameter, value}) ? SUCCESS : ERROR_QUEUE_FULL;
+}
+
+MxcsError_t Synth_t::post_press(uint8_t note) {
+    if (note >= notes) {
+        return ERROR_INVALID_VALUE;
+    }
+    return commands.push({commandPress, note, 0, 0}) ? SUCCESS : ERROR_QUEUE_FULL;
+}
+
+MxcsError_t Synth_t::post_release(uint8_t note) {
+    if (note >= notes) {
+        return ERROR_INVALID_VALUE;
+    }
+    return commands.push({commandRelease, note, 0, 0}) ? SUCCESS : ERROR_QUEUE_FULL;
+}
+
+MxcsError_t Synth_t::post_patch(const Patch_t * patch) {
+    // everything except the number of voices and block size, which are fixed.
+    // The patch is worked out here, on the control thread, then a command is queued to apply it,
+    // so it keeps its place relative to the other commands
+
+    // checked the same way as each parameter, before anything is published
+    const float values[] = {patch->attack, patch->decay, patch->sustain, patch->release, patch->modFreq,
+                            patch->modDepth, patch->lpfFreq, patch->lpfRes, patch->hpfFreq, patch->hpfRes};
+    for (uint32_t i = 0; i < sizeof(values)/sizeof(values[0]); i++) {
+        const MxcsError_t error = check_parameter(paramAttack + i, values[i]);
+        if (error != SUCCESS) {
+            return error;
+        }
+    }
+    if (patch->generator > wavetable) {
+        return ERROR_INVALID_VALUE;
+    }
+    // once published, the audio thread may take the patch with an earlier command, so the push mustn't fail after it
+    if (commands.full()) {
+        return ERROR_QUEUE_FULL;
+    }
+    SynthPatch_t * next = patches.edit();
+    next->envelope.set_attack(patch->attack);
+    next->envelope.set_decay(patch->decay);
+    next->envelope.set_sustain(patch->sustain);
+    next->envelope.set_release(patch->release);
+    next->sustain = patch->sustain;
+    next->modFreq = patch->modFreq;
+    next->modDepth = patch->modDepth;
+    patches.set_filters(next, patch->lpfFreq, patch->lpfRes, patch->hpfFreq, patch->hpfRes);
+    next->generator = (Generator_e)patch->generator;
+    patches.publish();
+    commands.push({commandPatch, 0, 0, 0});
+    return SUCCESS;
+}
+
+void Synth_t::apply_commands() {
+    Command_t command;
+    while (commands.pop(&command)) {
+        switch (command.type) {
+        case commandParameter:
+            set_parameter(command.parameter, command.value);
+            break;
+        case commandPress:
+            press(command.note);
+            break;
+        case commandRelease:
+            release(command.note);
+            break;
+        case commandPatch:
+            // if later patches have been published already, the newest is applied early (and again later),
+            // which ends up the same as applying them in turn
+            apply_patch(patches.take());
+            break;
+        }
+    }
+}
+
+void Synth_t::apply_patch(const SynthPatch_t * patch) {
+    // copies only, the patch has already been worked out.
+    // With smoothing on the continuous settings glide to it, like setting them one at a time
+    float b[3];
+    float a[3];
+    envelopeSettings = patch->envelope;
+    settingsVersion++;
+    sustainSmoother.set_target(patch->sustain);
+    if (!sustainSmoother.is_settled()) {
+        envelopeSettings.set_sustain(sustainSmoother.get_value());
+    }
+    modFSmoother.set_target(patch->modFreq);
+    if (modFSmoother.is_settled()) {
+        mod.set_freq(patch->modFreq);
+    }
+    modDepthSmoother.set_target(patch->modDepth);
+    if (modDepthSmoother.is_settled()) {
+        mod.modRatio = patch->modDepth;
+    }
+    lpF = patch->lpF;
+    lpRes = patch->lpRes;
+    hpF = patch->hpF;
+    hpRes = patch->hpRes;
+    lpFSmoother.set_target(log2f(lpF));
+    lpResSmoother.set_target(lpRes);
+    if (lpFSmoother.is_settled() && lpResSmoother.is_settled()) {
+        for (uint32_t i = 0; i < 3; i++) {
+            b[i] = patch->lpB[i];
+            a[i] = patch->lpA[i];
+        }
+        lpFilter.set_coeffs(b, a);
+    }
+    hpFSmoother.set_target(log2f(hpF));
+    hpResSmoother.set_target(hpRes);
+    if (hpFSmoother.is_settled() && hpResSmoother.is_settled()) {
+        for (uint32_t i = 0; i < 3; i++) {
+            b[i] = patch->hpB[i];
+            a[i] = patch->hpA[i];
+        }
+        hpFilter.set_coeffs(b, a);
+    }
+    generator = patch->generator;
+}
+
+void Synth_t::apply_event(const Event_t * event) {
+    if (event->type == pressEvent) {
+        press_note(event->note, renderCache.is_enabled() ? scheduled_gate(event) : noGate);
+    } else {
+        release(event->note);
+    }
+}
+
+int16_t Synth_t::allocate_voice() {
+    if (freeCount) {
+        freeCount--;
+        return freeVoices[freeCount];
+    }
+    return steal_voice();
+}
+
+int16_t Synth_t::steal_voice() {
+    // only called when every voice is active, so the active list is full
+    int16_t voice = oldestVoice;
+    if (stealPolicy == stealQuietest) {
+        // the only O(voices) path, and only taken when the pool is exhausted
+        float quietest = voices[voice].get_amp();
+        for (int16_t v = newerVoices[voice]; v != noVoice; v = newerVoices[v]) {
+            float amp = voices[v].get_amp();
+            if (amp < quietest) {
+                quietest = amp;
+                voice = v;
+            }
+        }
+    }
+    unlink_voice(voice);
+    if (noteVoices[voiceNotes[voice]] == voice) {
+        noteVoices[voiceNotes[voice]] = noVoice;
+    }
+    return voice;
+}
+
+void Synth_t::link_voice(int16_t voice) {
+    // add to the newest end of the active list
+    olderVoices[voice] = newestVoice;
+    newerVoices[voice] = noVoice;
+    if (newestVoice == noVoice) {
+        oldestVoice = voice;
+    } else {
+        newerVoices[newestVoice] = voice;
+    }
+    newestVoice = voice;
+}
+
+void Synth_t::unlink_voice(int16_t voice) {
+    int16_t older = olderVoices[voice];
+    int16_t newer = newerVoices[voice];
+    if (older == noVoice) {
+        oldestVoice = newer;
+    } else {
+        newerVoices[older] = newer;
+    }
+    if (newer == noVoice) {
+        newestVoice = older;
+    } else {
+        olderVoices[newer] = older;
+    }
+}
+
+void Synth_t::free_voice(int16_t voice) {
+    // a cached note left to finish after its note was pressed again no longer has the note
+    unlink_voice(voice);
+    if (noteVoices[voiceNotes[voice]] == voice) {
+        noteVoices[voiceNotes[voice]] = noVoice;
+    }
+    freeVoices[freeCount] = voice;
+    freeCount++;
+}
+
+void Synth_t::mix_voices(float * out, uint32_t n) {
+    for (uint32_t i = 0; i < n; i++) {
+        out[i] = 0;
+    }
+    // only the active voices are run
+    int16_t voice = oldestVoice;
+    while (voice != noVoice) {
+        int16_t next = newerVoices[voice];
+        // each voice is run a chunk at a time, so the buffer stays small however long the block is
+        for (uint32_t start = 0; start < n; start += chunkSize) {
+            uint32_t len = (n - start < chunkSize) ? n - start : chunkSize;
+            voices[voice].step(voiceBuffer, len);
+            kernels->accumulate(out + start, voiceBuffer, len);
+        }
+        if (!voices[voice].is_active()) {
+            if (voices[voice].is_recording()) {
+                std::shared_ptr<RenderedNote_t> recording = voices[voice].take_recording();
+                // unless the settings changed while it was playing
+                if (recordVersions[voice] == settingsVersion) {
+                    renderCache.insert(recordKeys[voice], recording);
+                }
+            }
+            free_voice(voice);
+        }
+        voice = next;
+    }
+}
+
+void Synth_t::start_block() {
+    // commands and smoothing happen once at the start of each block, which can be before step if it's flushed
+    if (blockStarted) {
+        return;
+    }
+    profiler.start_block();
+    apply_commands();
+    smooth_parameters();
+    blockStarted = true;
+}
+
+uint32_t Synth_t::run_events(float * out, uint32_t offset) {
+    // voices are run from offset up to each event in the block, then the event is applied,
+    // so events are sample accurate. Returns how far into the block the voices have been run
+    while (!events.empty()) {
+        const Event_t * event = events.peek();
+        int32_t eventOffset = (int32_t)(event->time - sampleCount);
+        if (eventOffset >= (int32_t)blockSize) {
+            break;
+        }
+        if (eventOffset > (int32_t)offset) {
+            mix_voices(out + offset, eventOffset - offset);
+            offset = eventOffset;
+        }
+        apply_event(event);
+        events.pop();
+    }
+    return offset;
+}
+
+void Synth_t::flush_events() {
+    // the voices are run up to the last event queued for the next block, into partBlock.
+    // step carries on from there
+    start_block();
+    partOffset = run_events(partBlock.data(), partOffset);
+}
+
 void Synth_t::step(float * out) {
-    voice.step(out);
-    mod.step(out);
-    lpFilter.step(out, out);
-    hpFilter.step(out, out);
+    // without events the whole block is run at once
+    start_block();
+    for (uint32_t i = 0; i < partOffset; i++) {
+        out[i] = partBlock[i];
+    }
+    uint32_t offset = run_events(out, partOffset);
+    mix_voices(out + offset, blockSize - offset);
+    partOffset = 0;
+    blockStarted = false;
+    sampleCount += blockSize;
+    profiler.end_stage(stageVoices);
+    // modulation and filtering are shared, and can be done a block at a time
+    mod.step(out, blockSize);
+    profiler.end_stage(stageMod);
+    lpFilter.step(out, out, blockSize);
+    profiler.end_stage(stageLpf);
+    hpFilter.step(out, out, blockSize);
+    profiler.end_stage(stageHpf);
+    if (convolver.is_active()) {
+        convolver.step(out, out);
+    }
+    profiler.end_stage(stageConvolver);
+    profiler.end_block(blockSize/samplingFrequency);
+}
+
+void Synth_t::step_pcm(uint8_t * out, SampleFormat_e format) {
+    // rendered into the synth's own block, then converted into out in one pass
+    step(pcmBlock.data());
+    output.convert(pcmBlock.data(), out, blockSize, format);
+}
+
+const Profile_t * Synth_t::get_profile() {
+    return profiler.get_profile();
+}
+
+void Synth_t::reset_profile() {
+    profiler.reset();
 }
 
 #ifdef SYNTH_TEST_
@@ -106,7 +746,7 @@ float * Synth_t::get_freq_table() {
 extern "C" {
     void test_synth(const float a, const float d, const float s, const float r,\
                     const float modDepth, const float modFreq, const unsigned int gen,\
-                    const float fs,\
+                    const unsigned int voices, const float fs,\
                     const unsigned int presses, unsigned int pressNs[], uint8_t pressNotes[],\
                     const unsigned int releases, unsigned int releaseNs[], uint8_t releaseNotes[],\
                     const unsigned int n, float envOut[]) {
@@ -116,8 +756,9 @@ extern "C" {
         //              r: release time (in samples)
         //              modDepth: modulation depth
         //              modFreq: modulation frequency
-        //              fs: sampling frequency
         //              gen: type of generator
+        //              voices: number of voices in the pool
+        //              fs: sampling frequency
         //              presses: number of presses
         //              pressNs: times at which to press
         //              pressNotes: MIDI notes to press at each time step
@@ -127,7 +768,7 @@ extern "C" {
         //              n: number of samples to iterate over.
         //                  if n is not a multiple of block_size, the last fraction of a block won't be filled in
         //              envOut: generated envelope
-        Synth_t synth(fs);
+        Synth_t synth(fs, voices);
         unsigned int pressCount = 0;
         unsigned int releaseCount = 0;
         synth.set_attack(a);
@@ -137,13 +778,14 @@ extern "C" {
         synth.set_mod_depth(modDepth);
         synth.set_mod_f(modFreq);
         synth.set_generator((Generator_e)gen);
-        for(unsigned int i=0; i+blockSize <= n; i+= blockSize) {
-            if(pressCount < presses && i >= pressNs[pressCount]) {
-                synth.press(pressNotes[pressCount]);
+        for(unsigned int i=0; i+defaultBlockSize <= n; i+= defaultBlockSize) {
+            // queue up everything that happens during this block
+            while(pressCount < presses && pressNs[pressCount] < i + defaultBlockSize) {
+                synth.schedule({pressNs[pressCount], pressEvent, pressNotes[pressCount]});
                 pressCount++;
             }
-            if(releaseCount < releases && i >= releaseNs[releaseCount]) {
-                synth.release(releaseNotes[releaseCount]);
+            while(releaseCount < releases && releaseNs[releaseCount] < i + defaultBlockSize) {
+                synth.schedule({releaseNs[releaseCount], releaseEvent, releaseNotes[releaseCount]});
                 releaseCount++;
             }
             synth.step(envOut + i);
@@ -3,48 +3,184 @@
 */
 
 #include <stdint.h>
+#include <string.h>
+#include <vector>
 #include "Voice.h"
 #include "Constants.h"
+#include "Kernels.h"
 
 
+void NoteCoeffs_t::set_freq(float f) {
+    sine.set_freq(f);
+    blit.set_freq(f);
+    bpBlit.set_bp_freq(f);
+    wavetable.set_freq(f);
+}
+
 Voice_t::Voice_t(EnvelopeSettings_t * settings, Generator_e * _generator): envelope(settings) {
     generator = _generator;
+    coeffs = nullptr;
+    configured = UINT32_MAX;    // nothing to set until the first press
+    playIndex = 0;
 }
 
-void Voice_t::step(float * out) {
-    float envOut[blockSize];
+void Voice_t::step(float * out, uint32_t n) {
+    float envOut[chunkSize];
 
+    if (playback) {
+        play_cached(out, n);
+        return;
+    }
+    if (!(configured & (1 << *generator))) {
+        configure(*generator);
+    }
     switch (*generator)
     {
     case sine:
-        osc.step(out);
+        osc.step(out, n);
         break;
 
     case blit:
-        blitOsc.step(out);
+        blitOsc.step(out, n);
         break;
 
     case bpblit:
-        bpBlitOsc.step(out);
+        bpBlitOsc.step(out, n);
+        break;
+
+    case sawtooth:
+        sawtoothOsc.step(out, n);
+        break;
+
+    case square:
+        squareOsc.step(out, n);
+        break;
+
+    case triangle:
+        triangleOsc.step(out, n);
+        break;
+
+    case wavetable:
+        wavetableOsc.step(out, n);
         break;
     }
-    envelope.step(envOut);
 
-    // apply envelope to osc out
-    for (uint8_t i=0; i < blockSize; i++) {
-        out[i] *= envOut[i];
+    // apply envelope to osc out, a chunk at a time
+    for (uint32_t start = 0; start < n; start += chunkSize) {
+        uint32_t len = (n - start < chunkSize) ? n - start : chunkSize;
+        envelope.step(envOut, len);
+        kernels->multiply(out + start, envOut, len);
     }
+    if (recording) {
+        recording->samples.insert(recording->samples.end(), out, out + n);
+        while (recording->amps.size()*renderAmpStride < recording->samples.size()) {
+            recording->amps.push_back(envelope.get_amp());
+        }
+    }
+}
+
+void Voice_t::play_cached(float * out, uint32_t n) {
+    // silence after the end, until the voice is freed
+    const uint32_t length = playback->samples.size();
+    const uint32_t len = (playIndex < length) ? ((length - playIndex < n) ? length - playIndex : n) : 0;
+    memcpy(out, playback->samples.data() + playIndex, len*sizeof(float));
+    memset(out + len, 0, (n - len)*sizeof(float));
+    playIndex += len;
 }
 
-void Voice_t::press(float f) {
+void Voice_t::configure(Generator_e gen) {
+    // A generator that isn't running doesn't move on, so setting it up the first time it runs
+    // leaves it in the same state as setting them all up on the press
+    switch (gen)
+    {
+    case sine:
+        osc.set_coeffs(&coeffs->sine);
+        break;
+
+    case blit:
+        blitOsc.set_coeffs(&coeffs->blit);
+        break;
+
+    case bpblit:
+        bpBlitOsc.set_coeffs(&coeffs->bpBlit);
+        break;
+
+    case sawtooth:
+        sawtoothOsc.set_coeffs(&coeffs->blit);
+        break;
+
+    case square:
+        squareOsc.set_coeffs(&coeffs->bpBlit);
+        break;
+
+    case triangle:
+        triangleOsc.set_coeffs(&coeffs->bpBlit);
+        break;
+
+    case wavetable:
+        wavetableOsc.set_coeffs(&coeffs->wavetable);
+        break;
+    }
+    configured |= 1 << gen;
+}
+
+void Voice_t::press(const NoteCoeffs_t * note) {
+    // anything cached or being recorded is dropped.
+    // note has to outlive the press, only the generator that's running is set to it (see configure)
+    playback.reset();
+    recording.reset();
     envelope.press();
-    osc.set_freq(f);
-    blitOsc.set_freq(f);
-    bpBlitOsc.set_freq(f);
+    coeffs = note;
+    configured = 0;
+}
+
+void Voice_t::play(std::shared_ptr<const RenderedNote_t> note) {
+    // the envelope and generators are left alone, they aren't run until the next press
+    recording.reset();
+    playback = note;
+    playIndex = 0;
+}
+
+void Voice_t::record(uint32_t expectedLength) {
+    recording = std::make_shared<RenderedNote_t>();
+    recording->samples.reserve(expectedLength);
+}
+
+std::shared_ptr<RenderedNote_t> Voice_t::take_recording() {
+    return std::move(recording);
+}
+
+bool Voice_t::is_playing() {
+    return playback != nullptr;
+}
+
+bool Voice_t::is_recording() {
+    return recording != nullptr;
 }
 
 void Voice_t::release() {
-    envelope.release();
+    // a cached note already has its release
+    if (!playback) {
+        envelope.release();
+    }
+}
+
+bool Voice_t::is_active() {
+    if (playback) {
+        return playIndex < playback->samples.size();
+    }
+    return envelope.is_active();
+}
+
+float Voice_t::get_amp() {
+    if (playback) {
+        if (playback->amps.empty()) {
+            return 0;
+        }
+        uint32_t i = playIndex/renderAmpStride;
+        return playback->amps[(i < playback->amps.size()) ? i : playback->amps.size() - 1];
+    }
+    return envelope.get_amp();
 }
 
 
@@ -70,22 +206,66 @@ extern "C" {
         EnvelopeSettings_t settings(fs);
         Generator_e generator = (Generator_e)gen;
         Voice_t voice(&settings, &generator);
+        NoteCoeffs_t note;
+        note.set_freq(f);
         unsigned int pressCount = 0;
         unsigned int releaseCount = 0;
         settings.set_attack(a);
         settings.set_decay(d);
         settings.set_sustain(s);
         settings.set_release(r);
-        for(unsigned int i=0; i+blockSize <= n; i+= blockSize) {
-            if(pressCount < presses && i >= pressNs[pressCount]) {
-                voice.press(f);
-                pressCount++;
+        for(unsigned int i=0; i+defaultBlockSize <= n; i+= defaultBlockSize) {
+            // run up to each press/release in the block, so they happen on the right sample
+            unsigned int offset = 0;
+            while((pressCount < presses && pressNs[pressCount] < i + defaultBlockSize) ||
+                  (releaseCount < releases && releaseNs[releaseCount] < i + defaultBlockSize)) {
+                bool isPress = pressCount < presses &&
+                               (releaseCount == releases || pressNs[pressCount] <= releaseNs[releaseCount]);
+                unsigned int eventN = isPress ? pressNs[pressCount] : releaseNs[releaseCount];
+                if (eventN > i + offset) {
+                    voice.step(envOut + i + offset, eventN - i - offset);
+                    offset = eventN - i;
+                }
+                if (isPress) {
+                    voice.press(&note);
+                    pressCount++;
+                } else {
+                    voice.release();
+                    releaseCount++;
+                }
             }
-            if(releaseCount < releases && i >= releaseNs[releaseCount]) {
-                voice.release();
-                releaseCount++;
+            voice.step(envOut + i + offset, defaultBlockSize - offset);
+        }
+    }
+
+    void test_voice_setup(const unsigned int steps, const float freqs[], const unsigned int gens[],
+                          const bool eager, const float fs, float out[]) {
+        // parameters:  steps: number of blocks to run
+        //              freqs: frequency (normalised) to press at the start of each block, 0 for no press
+        //              gens: generator to run each block with
+        //              eager: set every generator up on each press, rather than when it first runs
+        //              fs: sampling frequency
+        //              out: steps*defaultBlockSize samples
+        EnvelopeSettings_t settings(fs);
+        Generator_e generator = sine;
+        Voice_t voice(&settings, &generator);
+        std::vector<NoteCoeffs_t> notes(steps);
+        settings.set_attack(0.001);
+        settings.set_decay(0.01);
+        settings.set_sustain(-6);
+        settings.set_release(0.01);
+        for (unsigned int i = 0; i < steps; i++) {
+            if (freqs[i] > 0) {
+                notes[i].set_freq(freqs[i]);
+                voice.press(&notes[i]);
+                for (unsigned int gen = sine; eager && gen <= wavetable; gen++) {
+                    // running no samples sets the generator up
+                    generator = (Generator_e)gen;
+                    voice.step(out, 0);
+                }
             }
-            voice.step(envOut + i);
+            generator = (Generator_e)gens[i];
+            voice.step(out + i*defaultBlockSize, defaultBlockSize);
         }
     }
 }
@@ -0,0 +1,106 @@
+/* MXCS Core Wavetable implementation
+   copyright Maximilian Cornwell 2024
+*/
+
+#include <math.h>
+#include "Wavetable.h"
+#include "Constants.h"
+
+
+const uint32_t fractionBits = 32 - tableBits;
+const float fractionScale = 1.f/(1 << fractionBits);
+
+SawTables_t::SawTables_t() {
+    // sum(sin(k*phase)/k)*2/pi, which ramps down from 1 to -1 over a period.
+    // Built from the fewest harmonics up, each level adds its extra harmonics to the one above it.
+    // The sines come from a table, sin(2*pi*k*n/N) is sine[k*n mod N]
+    double sine[tableSize];
+    double saw[tableSize] = {0};
+    for (uint32_t i = 0; i < tableSize; i++) {
+        sine[i] = sin(2*M_PI*i/tableSize);
+    }
+    uint32_t harmonics = 0;
+    for (int32_t level = mipLevels - 1; level >= 0; level--) {
+        for (uint32_t k = harmonics + 1; k <= (maxHarmonics >> level); k++) {
+            double amplitude = 2/(M_PI*k);
+            for (uint32_t i = 0; i < tableSize; i++) {
+                saw[i] += amplitude*sine[(k*i) & (tableSize - 1)];
+            }
+        }
+        harmonics = maxHarmonics >> level;
+        for (uint32_t i = 0; i < tableSize; i++) {
+            levels[level][i] = saw[i];
+        }
+        levels[level][tableSize] = saw[0];
+    }
+}
+
+const SawTables_t * saw_tables() {
+    // built on first use, which is when the first voice is made (thread safe since C++11)
+    static const SawTables_t tables;
+    return &tables;
+}
+
+Wavetable_t::Wavetable_t(const SawTables_t * _tables) {
+    tables = _tables;
+    phase = 0;
+    set_freq(0);
+}
+
+void WavetableCoeffs_t::set_freq(float freq) {
+    if (freq >= 0.5) {
+        freq = 0; // frequencies above nyquist are unsupported
+    }
+    increment = (uint32_t)(freq*4294967296.0);
+    // the level with the most harmonics that all stay below maxHarmonicFreq
+    level = 0;
+    while (level < mipLevels - 1 && (maxHarmonics >> level)*freq > maxHarmonicFreq) {
+        level++;
+    }
+}
+
+void Wavetable_t::set_freq(float freq) {
+    WavetableCoeffs_t coeffs;
+    coeffs.set_freq(freq);
+    set_coeffs(&coeffs);
+}
+
+void Wavetable_t::set_coeffs(const WavetableCoeffs_t * coeffs) {
+    increment = coeffs->increment;
+    table = tables->levels[coeffs->level];
+}
+
+void Wavetable_t::step(float * out, uint32_t n) {
+    // the top bits of the phase index the table, the rest interpolate between samples
+    const float * table_ = table;
+    uint32_t phase_ = phase;
+    const uint32_t increment_ = increment;
+    for (uint32_t i = 0; i < n; i++) {
+        uint32_t index = phase_ >> fractionBits;
+        float fraction = (phase_ & ((1 << fractionBits) - 1))*fractionScale;
+        out[i] = table_[index] + fraction*(table_[index + 1] - table_[index]);
+        phase_ += increment_;
+    }
+    phase = phase_;
+}
+
+
+#ifdef SYNTH_TEST_
+extern "C" {
+    void test_wavetable(float * out, float f, unsigned int samples) {
+        Wavetable_t wavetable;
+
+        wavetable.set_freq(f);
+        for(unsigned int i = 0; i + defaultBlockSize <= samples; i+=defaultBlockSize) {
+            wavetable.step(&out[i], defaultBlockSize);
+        }
+    }
+
+    void test_wavetable_level(float * out, unsigned int level) {
+        // copies out a level of the table
+        for (unsigned int i = 0; i < tableSize; i++) {
+            out[i] = saw_tables()->levels[level][i];
+        }
+    }
+}
+#endif // SYNTH_TEST_
@@ -0,0 +1,210 @@
+''' Benchmarks for the DSP blocks and the full synth, timed in C++ through test.so
+    copyright Maximilian Cornwell 2024
+
+    python -m test.benchmark --output baseline.json     # time everything, save the results
+    python -m test.benchmark --compare baseline.json    # time everything, flag anything slower than the baseline
+    python -m test.benchmark --isa generic avx2 avx512  # time each instruction set the kernels are built for
+
+    The fir_ blocks compare ways of convolving with a long impulse response (decaying noise, 4096 or 65536 taps).
+    None of them add latency beyond the block: the output of each block includes its own input.
+    fir_direct_4k is direct form, it costs the number of taps in multiply adds per sample at any block size.
+    fir_fft_ partitions the response uniformly into blocks (Convolver_t), so each block costs two FFTs
+    plus a complex multiply add per bin for each block in the response. That makes it far cheaper than direct form
+    with blocks of 32 or more, but with tiny blocks there are so many partitions that it's slower.
+    fir_fft_nu_64k grows the partitions from the block up to 8192 samples, which keeps small blocks cheap,
+    though the big partitions are only transformed on every few blocks, so some blocks take longer than others.
+    With big blocks there are only a few partitions anyway, and the bigger FFTs cost more than they save.
+
+    note_on presses a note on every voice (256 of them) each block, and runs each one for a sample.
+    The generator settings for every note are worked out when the synth is made, and only the generator that's
+    running is set to them, so the cost is mostly copying those settings in.
+    '''
+import argparse
+import ctypes
+import datetime
+import json
+import platform
+import sys
+
+from test.constants import sampling_frequencies
+
+
+block_sizes = [32, 128, 1024]
+default_duration = 0.5      # seconds of audio per timing
+default_repeats = 5         # the fastest repeat is kept, it's the one least disturbed by everything else running
+default_threshold = 0.1     # slowdown (as a fraction) that counts as a regression
+isa_names = ['generic', 'avx2', 'avx512']   # matches Isa_e
+
+
+class BenchmarkInterface:
+    ''' Interface for the benchmark functions '''
+    testlib = ctypes.CDLL('test.so')
+
+    def setUp(self):
+        ''' Define the functions '''
+        self.testlib.benchmark_count.restype = ctypes.c_uint
+        self.testlib.benchmark_name.argtypes = [ctypes.c_uint]
+        self.testlib.benchmark_name.restype = ctypes.c_char_p
+        self.testlib.benchmark_optimised.restype = ctypes.c_bool
+        # block, block size, fs, samples
+        self.testlib.benchmark_block.argtypes = [ctypes.c_uint, ctypes.c_uint, ctypes.c_float, ctypes.c_uint]
+        self.testlib.benchmark_block.restype = ctypes.c_double
+        self.testlib.mxcs_get_isa.restype = ctypes.c_uint
+        self.testlib.mxcs_set_isa.argtypes = [ctypes.c_uint]
+        self.testlib.mxcs_set_isa.restype = ctypes.c_uint32
+        self.testlib.mxcs_isa_supported.argtypes = [ctypes.c_uint]
+        self.testlib.mxcs_isa_supported.restype = ctypes.c_bool
+
+    def names(self) -> list:
+        ''' Names of the blocks that can be timed, in order '''
+        return [self.testlib.benchmark_name(i).decode() for i in range(self.testlib.benchmark_count())]
+
+    def optimised(self) -> bool:
+        ''' Whether test.so was built with optimisation '''
+        return self.testlib.benchmark_optimised()
+
+    def isa(self) -> str:
+        ''' Instruction set the kernels are running with '''
+        return isa_names[self.testlib.mxcs_get_isa()]
+
+    def supported_isas(self) -> list:
+        ''' Instruction sets this CPU can run '''
+        return [name for isa, name in enumerate(isa_names) if self.testlib.mxcs_isa_supported(isa)]
+
+    def set_isa(self, name: str):
+        ''' Run the kernels with an instruction set, by name '''
+        if name not in self.supported_isas():
+            raise ValueError(f'unsupported instruction set {name}, this CPU supports {", ".join(self.supported_isas())}')
+        self.testlib.mxcs_set_isa(isa_names.index(name))
+
+    def time_block(self, block: int, block_size: int, fs: float, samples: int) -> float:
+        ''' Time taken (in seconds) for block to process samples, block_size at a time '''
+        seconds = self.testlib.benchmark_block(block, block_size, fs, samples)
+        if seconds < 0:
+            raise ValueError(f'invalid benchmark: {block=}, {block_size=}')
+        return seconds
+
+
+def run_benchmarks(blocks: list = None, sizes: list = None, fss: list = None,
+                   duration: float = default_duration, repeats: int = default_repeats, isas: list = None) -> dict:
+    ''' Time each block at every block size and sampling frequency, with each instruction set
+        (by default, the one picked for this CPU). Returns the results with some metadata, in the form saved as JSON '''
+    interface = BenchmarkInterface()
+    interface.setUp()
+    default_isa = interface.isa()
+    isas = [default_isa] if isas is None else isas
+    for isa in isas:
+        interface.set_isa(isa)
+    names = interface.names()
+    blocks = names if blocks is None else blocks
+    sizes = block_sizes if sizes is None else sizes
+    fss = sampling_frequencies if fss is None else fss
+    for name in blocks:
+        if name not in names:
+            raise ValueError(f'unknown block {name}, the blocks are {", ".join(names)}')
+    results = []
+    for isa in isas:
+        interface.set_isa(isa)
+        for name in blocks:
+            for block_size in sizes:
+                for fs in fss:
+                    samples = int(duration*fs)
+                    samples -= samples % block_size
+                    seconds = min(interface.time_block(names.index(name), block_size, fs, samples)
+                                  for _ in range(repeats))
+                    results.append({'block': name, 'isa': isa, 'block_size': block_size, 'fs': fs,
+                                    'ns_per_sample': 1e9*seconds/samples,
+                                    'realtime_factor': samples/(fs*seconds)})
+    interface.set_isa(default_isa)
+    metadata = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'machine': platform.machine(),
+                'processor': platform.processor(),
+                'platform': platform.platform(),
+                'optimised': interface.optimised(),
+                'default_isa': default_isa,
+                'duration': duration,
+                'repeats': repeats}
+    return {'metadata': metadata, 'results': results}
+
+
+def result_key(result: dict) -> tuple:
+    ''' What a result is matched on between runs '''
+    return (result['block'], result['isa'], result['block_size'], result['fs'])
+
+
+def compare(results: dict, baseline: dict) -> list:
+    ''' Compare results against a baseline, returns (result, baseline result, slowdown) for every result in both,
+        where slowdown is the fractional increase in ns/sample '''
+    baseline_results = {result_key(result): result for result in baseline['results']}
+    comparisons = []
+    for result in results['results']:
+        reference = baseline_results.get(result_key(result))
+        if reference is not None:
+            slowdown = result['ns_per_sample']/reference['ns_per_sample'] - 1
+            comparisons.append((result, reference, slowdown))
+    return comparisons
+
+
+def regressions(comparisons: list, threshold: float = default_threshold) -> list:
+    ''' The comparisons that are slower than the baseline by more than threshold '''
+    return [comparison for comparison in comparisons if comparison[2] > threshold]
+
+
+def print_results(results: dict):
+    ''' Print a table of the results '''
+    print(f'{"block":<18}{"isa":<8}{"block size":>12}{"fs":>8}{"ns/sample":>12}{"x realtime":>12}')
+    for result in results['results']:
+        print(f'{result["block"]:<18}{result["isa"]:<8}{result["block_size"]:>12}{result["fs"]:>8g}'
+              f'{result["ns_per_sample"]:>12.2f}{result["realtime_factor"]:>12.0f}')
+
+
+def print_comparisons(comparisons: list, threshold: float):
+    ''' Print a table of the comparisons, marking regressions '''
+    print(f'{"block":<18}{"isa":<8}{"block size":>12}{"fs":>8}{"baseline":>12}{"ns/sample":>12}{"change":>9}')
+    for result, reference, slowdown in comparisons:
+        flag = '  REGRESSION' if slowdown > threshold else ''
+        print(f'{result["block"]:<18}{result["isa"]:<8}{result["block_size"]:>12}{result["fs"]:>8g}'
+              f'{reference["ns_per_sample"]:>12.2f}{result["ns_per_sample"]:>12.2f}{100*slowdown:>8.1f}%{flag}')
+
+
+def main(argv: list = None) -> int:
+    ''' Run the benchmarks from the command line, returns 1 if there were regressions '''
+    parser = argparse.ArgumentParser(description='Time the DSP blocks in test.so')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=default_threshold,
+                        help='slowdown, as a fraction, that counts as a regression')
+    parser.add_argument('--blocks', nargs='+', help='only time these blocks')
+    parser.add_argument('--isa', nargs='+', help='instruction sets to time (generic, avx2, avx512), '
+                        'by default the one picked for this CPU')
+    parser.add_argument('--block-sizes', nargs='+', type=int, help='block sizes to time')
+    parser.add_argument('--fs', nargs='+', type=float, help='sampling frequencies to time')
+    parser.add_argument('--duration', type=float, default=default_duration,
+                        help='seconds of audio per timing')
+    parser.add_argument('--repeats', type=int, default=default_repeats, help='timings per result, the fastest is kept')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.blocks, args.block_sizes, args.fs, args.duration, args.repeats, args.isa)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    if not args.compare:
+        print_results(results)
+        return 0
+
+    with open(args.compare, encoding='utf-8') as file:
+        baseline = json.load(file)
+    for field in ['machine', 'processor', 'optimised', 'default_isa']:
+        if baseline['metadata'].get(field) != results['metadata'][field]:
+            print(f'warning: {field} differs from the baseline '
+                  f'({baseline["metadata"].get(field)} vs {results["metadata"][field]})')
+    comparisons = compare(results, baseline)
+    print_comparisons(comparisons, args.threshold)
+    slower = regressions(comparisons, args.threshold)
+    if slower:
+        print(f'{len(slower)} regression(s) over {100*args.threshold:.0f}%')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
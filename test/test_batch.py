@@ -0,0 +1,77 @@
+''' Tests for batched rendering
+    copyright Maximilian Cornwell 2024 '''
+import unittest
+
+from test.constants import block_size, sampling_frequency
+from test.test_synth import SynthInterface
+from test.test_voice import generators
+
+import numpy as np
+
+from mxcs import make_events, make_patches, render_batch
+
+
+class TestBatch(SynthInterface, unittest.TestCase):
+    ''' Tests for render_batch '''
+    debug = False
+    presses = [0, 20*block_size, 40*block_size]
+    press_notes = [60, 64, 67]
+    releases = [60*block_size, 70*block_size, 80*block_size]
+    release_notes = [60, 64, 67]
+
+    def make_test_patches(self) -> np.ndarray:
+        ''' A spread of patches covering every generator '''
+        gens = list(generators.values())
+        count = 3*len(gens)
+        return make_patches(count, generator=np.tile(gens, 3),
+                            attack=np.repeat([0.01, 0.05, 0.1], len(gens)),
+                            decay=0.05, sustain=-6, release=0.05,
+                            mod_depth=np.linspace(0, 1, count), mod_freq=2)
+
+    def test_matches_single(self):
+        ''' Each row of the batch should match rendering the patch on its own '''
+        n_samples = 200*block_size
+        patches = self.make_test_patches()
+        events = make_events(self.presses, self.press_notes, self.releases, self.release_notes)
+        result = render_batch(patches, events, n_samples, sampling_frequency)
+        for patch, out in zip(patches, result.out):
+            with self.subTest(f'{patch}'):
+                self.set_adsr(patch['attack'], patch['decay'], patch['sustain'], patch['release'],
+                              sampling_frequency)
+                self.mod_depth = patch['mod_depth']
+                self.mod_freq = patch['mod_freq']
+                self.generator = list(generators)[patch['generator']]
+                reference = self.run_synth(self.presses, self.press_notes, self.releases, self.release_notes,
+                                           n_samples, sampling_frequency)
+                np.testing.assert_array_equal(reference, out)
+
+    def test_workers(self):
+        ''' The number of workers shouldn't change the output, every patch should be timed '''
+        n_samples = 50*block_size + block_size//2
+        patches = self.make_test_patches()
+        events = [make_events(self.presses, [note + i]*3, self.releases, [note + i]*3)
+                  for i, note in enumerate(len(patches)*[48])]
+        serial = render_batch(patches, events, n_samples, sampling_frequency, workers=1)
+        parallel = render_batch(patches, events, n_samples, sampling_frequency, workers=4)
+        np.testing.assert_array_equal(serial.out, parallel.out)
+        self.assertEqual((len(patches), n_samples), parallel.out.shape)
+        self.assertEqual(len(patches), len(parallel.timings))
+        self.assertTrue(np.all(parallel.timings > 0))
+        # the partial block at the end should be filled in as well
+        self.assertTrue(np.all(np.abs(parallel.out[:, -block_size//2:]) > 0))
+
+    def test_mismatched_events(self):
+        ''' There needs to be one event array per patch '''
+        with self.assertRaises(ValueError):
+            render_batch(make_patches(3), [make_events([0], [60], [], [])], block_size, sampling_frequency)
+
+
+def main():
+    ''' For Debugging/Testing '''
+    batch_test = TestBatch()
+    batch_test.setUp()
+    batch_test.test_matches_single()
+    batch_test.test_workers()
+
+if __name__=='__main__':
+    main()
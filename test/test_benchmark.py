@@ -0,0 +1,78 @@
+''' Tests for the benchmark suite
+    copyright Maximilian Cornwell 2024 '''
+import json
+import unittest
+
+from test.benchmark import BenchmarkInterface, compare, regressions, run_benchmarks
+from test.constants import sampling_frequency
+
+
+class TestBenchmark(BenchmarkInterface, unittest.TestCase):
+    ''' Checks the benchmarks run, and that the comparison flags regressions '''
+
+    def test_blocks(self):
+        ''' Every block should run at every block size, and take some time '''
+        names = self.names()
+        self.assertEqual(len(names), len(set(names)))
+        for block, name in enumerate(names):
+            for block_size in [1, 128, 8192]:
+                with self.subTest(f'{name}, {block_size=}'):
+                    self.assertGreater(self.time_block(block, block_size, sampling_frequency, 8192), 0)
+
+    def test_invalid(self):
+        ''' Invalid blocks and block sizes should be rejected '''
+        for block, block_size in [(len(self.names()), 128), (0, 0), (0, 8193)]:
+            with self.subTest(f'{block=}, {block_size=}'):
+                with self.assertRaises(ValueError):
+                    self.time_block(block, block_size, sampling_frequency, 8192)
+        with self.assertRaises(ValueError):
+            run_benchmarks(['not a block'])
+        with self.assertRaises(ValueError):
+            run_benchmarks(['oscillator'], isas=['not an isa'])
+
+    def test_results(self):
+        ''' The results should cover every combination, and survive being saved as JSON '''
+        results = run_benchmarks(['oscillator', 'synth_sine'], [16, 128], [44100, 48000], 0.01, 1)
+        self.assertEqual(8, len(results['results']))
+        for result in results['results']:
+            self.assertGreater(result['ns_per_sample'], 0)
+            self.assertAlmostEqual(1e9/(result['fs']*result['ns_per_sample']), result['realtime_factor'],
+                                   delta=1e-9*result['realtime_factor'])
+        self.assertEqual(results, json.loads(json.dumps(results)))
+        # compared with itself, nothing changes
+        comparisons = compare(results, results)
+        self.assertEqual(8, len(comparisons))
+        self.assertEqual([], regressions(comparisons))
+        # every instruction set the CPU supports can be timed, and the default is put back afterwards
+        default_isa = self.isa()
+        isas = self.supported_isas()
+        results = run_benchmarks(['oscillator'], [128], [44100], 0.01, 1, isas)
+        self.assertEqual(isas, [result['isa'] for result in results['results']])
+        self.assertEqual(default_isa, results['metadata']['default_isa'])
+        self.assertEqual(default_isa, self.isa())
+
+    def test_compare(self):
+        ''' Only slowdowns over the threshold are regressions, results missing from either side are skipped '''
+        def make(times: dict) -> dict:
+            return {'metadata': {}, 'results': [{'block': block, 'isa': 'generic', 'block_size': 128, 'fs': 44100,
+                                                 'ns_per_sample': ns, 'realtime_factor': 1e9/(44100*ns)}
+                                                for block, ns in times.items()]}
+        baseline = make({'blit': 10, 'oscillator': 5, 'envelope': 2, 'biquad': 4})
+        results = make({'blit': 12, 'oscillator': 5.25, 'envelope': 1, 'modulator': 3})
+        comparisons = compare(results, baseline)
+        self.assertEqual(['blit', 'oscillator', 'envelope'], [result['block'] for result, _, _ in comparisons])
+        self.assertEqual(['blit'], [result['block'] for result, _, _ in regressions(comparisons, 0.1)])
+        self.assertEqual(['blit', 'oscillator'], [result['block'] for result, _, _ in regressions(comparisons, 0.01)])
+
+
+def main():
+    ''' For Debugging/Testing '''
+    benchmark_test = TestBenchmark()
+    benchmark_test.setUp()
+    benchmark_test.test_blocks()
+    benchmark_test.test_invalid()
+    benchmark_test.test_results()
+    benchmark_test.test_compare()
+
+if __name__=='__main__':
+    main()
@@ -14,6 +14,14 @@ def to_db(vector: np.ndarray) -> np.ndarray:
     """ Convert data in vector to db """
     return 20*np.log10(np.abs(vector))
 
+def msinc(phase: np.ndarray, m: float) -> np.ndarray:
+    """ sin(m*phase)/(m*sin(phase)), the ratio of cosines near the peaks """
+    top = np.sin(m*phase)
+    bottom = m*np.sin(phase)
+    peaks = np.abs(bottom) < 1e-6
+    bottom[peaks] = 1
+    return np.where(peaks, np.cos(m*phase)/np.cos(phase), top/bottom)
+
 class BlitInterface:
     ''' Interface for BLIT functions '''
     testlib = ctypes.CDLL('test.so')
@@ -24,6 +32,7 @@ class BlitInterface:
         self.testlib.test_blit_m.argtypes = [float_pointer, float_pointer, ctypes.c_int]
         self.testlib.test_blit.argtypes = [float_pointer, ctypes.c_float, ctypes.c_int]
         self.testlib.test_bp_blit.argtypes = [float_pointer, ctypes.c_float, ctypes.c_int]
+        self.testlib.test_integrated_blit.argtypes = [float_pointer, ctypes.c_float, ctypes.c_uint, ctypes.c_int]
 
     def run_blit(self, freq: float, num_samples: int) -> np.ndarray:
         ''' wrapper around blit test function, generates its own co/sines '''
@@ -39,6 +48,13 @@ class BlitInterface:
         self.testlib.test_bp_blit(p_out, freq/sampling_frequency, len(out))
         return out
 
+    def run_integrated_blit(self, freq: float, gen: int, num_samples: int) -> np.ndarray:
+        ''' wrapper around the sawtooth (0), square (1) and triangle (2) test function '''
+        out = np.zeros(num_samples, dtype=np.single)
+        p_out = out.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+        self.testlib.test_integrated_blit(p_out, freq/sampling_frequency, gen, len(out))
+        return out
+
     def run_blit_m(self, freqs: list) -> list:
         ''' Wrapper around msinc function '''
         out = np.zeros(len(freqs), dtype=np.single)
@@ -130,6 +146,51 @@ class TestBlit(BlitInterface, unittest.TestCase):
                 self.assertAlmostEqual(freq, freqs[peaks[0]], delta=resolution, msg='BLIT fundamental frequency')
                 self.assertAlmostEqual(ratio*freq, mean_spacing, delta=0.01*freq, msg='BLIT harmonic spacing equal to target')
 
+    def test_integrated(self):
+        ''' The sawtooth, square and triangle should match integrating the BLITs with lfilter,
+            from long before the output starts, as they start in their steady state '''
+        num_samples = 2**14
+        pre_roll = 2**16
+        radius = 0.999
+        triangle_leak = 0.05    # relative to the triangle's frequency, in radians per sample
+        b = [1, -1]
+        a = [1, -2*radius, radius**2]
+        test_freqs = 440*2**((np.arange(21, 109, 8)-69)/12)
+        # the last partial block isn't filled in
+        usable = num_samples - num_samples % 128 - 128
+        # the oscillators start from phase 0 on the sample before the output
+        n = np.arange(1 - pre_roll, 1)
+        for freq in test_freqs:
+            f = freq/sampling_frequency
+            blit_m = self.run_blit_m([freq])[0]
+            bp_blit_m = self.run_blit_m([2*freq])[0] - 1
+            blit = np.concatenate([msinc(np.pi*f*n, blit_m), self.run_blit(freq, num_samples)[:usable]])
+            bp_blit = np.concatenate([msinc(2*np.pi*f*n, bp_blit_m), self.run_bp_blit(freq, num_samples)[:usable]])
+            square = sig.lfilter(b, a, 2*bp_blit)
+            # the triangle's leak is widened for higher notes
+            tri_radius = min(radius, 1 - triangle_leak*2*np.pi*f)
+            tri_a = [1, -2*tri_radius, tri_radius**2]
+            triangle = sig.lfilter(b, tri_a, 4*f*sig.lfilter(b, tri_a, 2*bp_blit))
+            references = [('sawtooth', 0, 0.4, sig.lfilter(b, a, 2*(blit - 1/blit_m))),
+                          ('square', 1, 0.2, square),
+                          ('triangle', 2, 0.2, triangle)]
+            for name, gen, upper, reference in references:
+                if freq < upper*sampling_frequency:
+                    with self.subTest(f'{name}, {freq=:.2f}'):
+                        reference = reference[pre_roll:]
+                        vector = self.run_integrated_blit(freq, gen, num_samples)[:usable]
+                        if self.debug:
+                            _, axt = plt.subplots()
+                            axt.plot(vector, label='Output')
+                            axt.plot(reference, ls=':', label='lfilter')
+                            axt.grid(True)
+                            axt.legend()
+                            axt.set_xlabel('Sample')
+                            axt.set_ylabel('Magnitude')
+                            axt.set_title(f'{name} ({freq:.2f} Hz)')
+                            plt.show()
+                        np.testing.assert_allclose(vector, reference, rtol=0, atol=1e-4*np.max(np.abs(reference)))
+
 
 def main():
     ''' For Debugging/Testing '''
@@ -138,6 +199,7 @@ def main():
     # blit_test.debug = True
     blit_test.test_blit_m()
     blit_test.test_blit_freq()
+    blit_test.test_integrated()
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,252 @@
+''' Tests for controlling the engine from another thread
+    copyright Maximilian Cornwell 2024 '''
+import ctypes
+import threading
+import unittest
+
+from test.constants import block_size, sampling_frequency
+
+import numpy as np
+
+from mxcs import Engine, Generator, make_patches, MxcsError, Parameter
+from mxcs.library import ERROR_QUEUE_FULL
+
+
+command_queue_size = 1024   # matches commandQueueSize
+
+
+class ControlInterface:
+    ''' ctypes wrapper around the command queue and patch buffer test functions '''
+    testlib = ctypes.CDLL('test.so')
+
+    def setUp(self):
+        ''' Define the functions '''
+        self.testlib.test_command_queue_create.restype = ctypes.c_void_p
+        self.testlib.test_command_queue_destroy.argtypes = [ctypes.c_void_p]
+        self.testlib.test_command_queue_push.argtypes = [ctypes.c_void_p, ctypes.c_uint]
+        self.testlib.test_command_queue_push.restype = ctypes.c_bool
+        self.testlib.test_command_queue_pop.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint)]
+        self.testlib.test_command_queue_pop.restype = ctypes.c_bool
+        self.testlib.test_patch_buffer_create.argtypes = [ctypes.c_float]
+        self.testlib.test_patch_buffer_create.restype = ctypes.c_void_p
+        self.testlib.test_patch_buffer_destroy.argtypes = [ctypes.c_void_p]
+        self.testlib.test_patch_buffer_publish.argtypes = [ctypes.c_void_p, ctypes.c_float]
+        self.testlib.test_patch_buffer_take.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_float)]
+        self.testlib.test_patch_buffer_take.restype = ctypes.c_bool
+
+    def push(self, queue: int, value: int) -> bool:
+        ''' Push a command made from value, false if the queue is full '''
+        return self.testlib.test_command_queue_push(queue, value)
+
+    def pop(self, queue: int) -> int | None:
+        ''' Pop a command, returns its value (-1 if it was torn) or None if the queue is empty '''
+        value = ctypes.c_uint()
+        if not self.testlib.test_command_queue_pop(queue, ctypes.byref(value)):
+            return None
+        return ctypes.c_int(value.value).value
+
+
+class TestControl(ControlInterface, unittest.TestCase):
+    ''' The queue and patch buffer should pass everything between threads intact and in order, without locks '''
+
+    def test_command_queue(self):
+        ''' Hammer the queue from two threads, every command should arrive once, in order '''
+        n_commands = 200000
+        queue = self.testlib.test_command_queue_create()
+        self.addCleanup(self.testlib.test_command_queue_destroy, queue)
+        # fills up, and empties
+        self.assertIsNone(self.pop(queue))
+        for i in range(command_queue_size):
+            self.assertTrue(self.push(queue, i))
+        self.assertFalse(self.push(queue, command_queue_size))
+        self.assertEqual(list(range(command_queue_size)), [self.pop(queue) for _ in range(command_queue_size)])
+        self.assertIsNone(self.pop(queue))
+        received = []
+
+        def produce():
+            for i in range(n_commands):
+                # the producer never blocks, it has to try again
+                while not self.push(queue, i):
+                    pass
+
+        def consume():
+            while len(received) < n_commands:
+                value = self.pop(queue)
+                if value is not None:
+                    received.append(value)
+
+        threads = [threading.Thread(target=produce), threading.Thread(target=consume)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(list(range(n_commands)), received)
+
+    def test_patch_buffer(self):
+        ''' Patches published while the consumer reads should never be seen half written, or out of order '''
+        n_patches = 100000
+        buffer = self.testlib.test_patch_buffer_create(sampling_frequency)
+        self.addCleanup(self.testlib.test_patch_buffer_destroy, buffer)
+        self.testlib.test_patch_buffer_publish(buffer, 0)
+        taken = []
+        torn = [0]
+
+        def produce():
+            for i in range(1, n_patches + 1):
+                self.testlib.test_patch_buffer_publish(buffer, i)
+
+        def consume():
+            value = ctypes.c_float()
+            while not taken or taken[-1] < n_patches:
+                if not self.testlib.test_patch_buffer_take(buffer, ctypes.byref(value)):
+                    torn[0] += 1
+                taken.append(value.value)
+
+        threads = [threading.Thread(target=produce), threading.Thread(target=consume)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(0, torn[0])
+        self.assertTrue(np.all(np.diff(taken) >= 0))
+        self.assertEqual(n_patches, taken[-1])
+
+
+class TestPosting(unittest.TestCase):
+    ''' Changes posted to the engine should end up the same as setting them directly '''
+    patch = make_patches(1, attack=0.02, decay=0.1, sustain=-9, release=0.2, mod_freq=3, mod_depth=0.3,
+                         lpf_freq=3000, lpf_res=3, hpf_freq=100, hpf_res=-3, generator=Generator.TRIANGLE)[0]
+
+    def test_order(self):
+        ''' Posted commands and patches apply at the start of the next block, in the order they were posted '''
+        with Engine(sampling_frequency) as engine, Engine(sampling_frequency) as reference:
+            other = self.patch.copy()
+            other['lpf_freq'] = 500
+            other['generator'] = Generator.SQUARE
+            engine.post_patch(self.patch)
+            engine.post_set(Parameter.ATTACK, 0.2)
+            engine.post_patch(other)
+            engine.post_set(Parameter.LPF_FREQ, 8000)
+            engine.post_press(60)
+            engine.post_press(64)
+            engine.post_release(64)
+            for patch in [self.patch, other]:
+                reference.apply_patch(patch)
+            reference.set(Parameter.ATTACK, 0.2)
+            reference.apply_patch(other)
+            reference.set(Parameter.LPF_FREQ, 8000)
+            reference.press(60)
+            reference.press(64)
+            reference.release(64)
+            np.testing.assert_array_equal(reference.render_blocks(100), engine.render_blocks(100))
+            # invalid changes are rejected when they're posted
+            for post, args in [(engine.post_set, (99, 0)), (engine.post_set, (Parameter.GENERATOR, 20)),
+                               (engine.post_press, (128,)), (engine.post_release, (200,)),
+                               (engine.post_patch, (make_patches(1, generator=20),))]:
+                with self.subTest(f'{post.__name__}{args}'):
+                    with self.assertRaises(MxcsError):
+                        post(*args)
+
+    def test_queue_full(self):
+        ''' The queue never waits, so it fills up if nothing is rendered '''
+        with Engine(sampling_frequency) as engine:
+            for _ in range(command_queue_size):
+                engine.post_set(Parameter.LPF_FREQ, 1000)
+            with self.assertRaises(MxcsError) as context:
+                engine.post_press(60)
+            self.assertEqual(ERROR_QUEUE_FULL, context.exception.code)
+            engine.render_blocks(1)
+            engine.post_press(60)
+
+    def test_rejected_patch(self):
+        ''' A patch that's rejected, because a field is invalid or the queue is full, is never applied '''
+        with Engine(sampling_frequency) as engine, Engine(sampling_frequency) as reference:
+            for field, value in [('attack', np.nan), ('sustain', np.nan), ('mod_freq', -1), ('mod_freq', np.inf),
+                                 ('lpf_freq', 0), ('hpf_freq', np.inf), ('lpf_res', np.nan), ('generator', 20)]:
+                with self.subTest(field=field, value=value):
+                    patch = self.patch.copy()
+                    patch[field] = value
+                    with self.assertRaises(MxcsError):
+                        engine.post_patch(patch)
+            # the patch already queued takes the newest one published when it's applied
+            other = self.patch.copy()
+            other['generator'] = Generator.SQUARE
+            engine.post_patch(other)
+            for _ in range(command_queue_size - 1):
+                engine.post_press(60)
+            with self.assertRaises(MxcsError) as context:
+                engine.post_patch(self.patch)
+            self.assertEqual(ERROR_QUEUE_FULL, context.exception.code)
+            reference.apply_patch(other)
+            for _ in range(command_queue_size - 1):
+                reference.press(60)
+            np.testing.assert_array_equal(reference.render_blocks(100), engine.render_blocks(100))
+
+    def test_stress(self):
+        ''' Post thousands of changes while another thread renders, the engine should end up in the final state '''
+        n_posts = 20000
+        rng = np.random.default_rng(0)
+        rendering = threading.Event()
+        posted = threading.Event()
+        rendered = [0]
+        engine = Engine(sampling_frequency)
+        self.addCleanup(engine.close)
+        engine.apply_patch(self.patch)
+
+        def render():
+            out = np.empty(8*block_size, dtype=np.single)
+            rendering.set()
+            while not posted.is_set():
+                engine.render(out)
+                # nothing is pressed, so every change is silent
+                self.assertFalse(np.any(out))
+                rendered[0] += 8
+
+        def post():
+            rendering.wait()
+            parameters = [Parameter.ATTACK, Parameter.DECAY, Parameter.SUSTAIN, Parameter.RELEASE,
+                          Parameter.MOD_DEPTH, Parameter.LPF_FREQ, Parameter.LPF_RES,
+                          Parameter.HPF_FREQ, Parameter.HPF_RES, Parameter.GENERATOR]
+            for i in range(n_posts):
+                parameter = parameters[i % len(parameters)]
+                value = rng.integers(0, 7) if parameter == Parameter.GENERATOR else rng.uniform(0.01, 2000)
+                while True:
+                    try:
+                        if i % 100 == 0:
+                            engine.post_patch(make_patches(1, lpf_freq=value, mod_freq=self.patch['mod_freq']))
+                        else:
+                            engine.post_set(parameter, value)
+                        break
+                    except MxcsError as error:
+                        self.assertEqual(ERROR_QUEUE_FULL, error.code)
+            engine.post_patch(self.patch)
+            posted.set()
+
+        threads = [threading.Thread(target=render), threading.Thread(target=post)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreater(rendered[0], 0)
+        with Engine(sampling_frequency) as reference:
+            reference.apply_patch(self.patch)
+            reference.render_blocks(rendered[0])
+            engine.press(60)
+            reference.press(60)
+            np.testing.assert_array_equal(reference.render_blocks(200), engine.render_blocks(200))
+
+
+def main():
+    ''' For Debugging/Testing '''
+    control_test = TestControl()
+    control_test.setUp()
+    control_test.test_command_queue()
+    control_test.test_patch_buffer()
+    posting_test = TestPosting()
+    posting_test.test_order()
+    posting_test.test_queue_full()
+    posting_test.test_rejected_patch()
+    posting_test.test_stress()
+
+if __name__=='__main__':
+    main()
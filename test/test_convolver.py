@@ -0,0 +1,175 @@
+''' Tests for the FFT and the partitioned convolver
+    copyright Maximilian Cornwell 2024 '''
+import ctypes
+import unittest
+
+from test.constants import block_size, sampling_frequency
+
+import numpy as np
+
+from mxcs import Engine, make_patches
+
+
+partition_growth = 4    # matches partitionGrowth
+
+
+def response(length: int, seed: int = 0) -> np.ndarray:
+    ''' Noise decaying by 60 dB, like a room '''
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-1, 1, length)*np.exp(-6.9*np.arange(length)/length)).astype(np.single)
+
+
+def stage_count(length: int, size: int, max_partition: int) -> int:
+    ''' Stages the convolver should cut a response into '''
+    offset = 0
+    stages = 0
+    while offset < length:
+        covered = length - offset
+        if size*partition_growth <= max_partition and covered > (partition_growth - 1)*size:
+            covered = (partition_growth - 1)*size
+        offset += covered
+        size *= partition_growth
+        stages += 1
+    return stages
+
+
+class ConvolverInterface:
+    ''' Interface to the FFT and convolver test functions '''
+    testlib = ctypes.CDLL('test.so')
+
+    def setUp(self):
+        ''' Define the functions '''
+        float_pointer = ctypes.POINTER(ctypes.c_float)
+        self.testlib.test_fft.argtypes = [float_pointer, float_pointer, float_pointer, float_pointer, ctypes.c_uint]
+        # response, length, block size, max partition, in, out, n
+        self.testlib.test_convolver.argtypes = [float_pointer, ctypes.c_uint, ctypes.c_uint, ctypes.c_uint,
+                                                float_pointer, float_pointer, ctypes.c_uint]
+        self.testlib.test_convolver.restype = ctypes.c_uint
+
+    def fft(self, samples: np.ndarray) -> tuple:
+        ''' The spectrum of samples, and samples transformed back from it '''
+        samples = np.ascontiguousarray(samples, dtype=np.single)
+        re = np.zeros(len(samples)//2 + 1, dtype=np.single)
+        im = np.zeros(len(samples)//2 + 1, dtype=np.single)
+        out = np.zeros(len(samples), dtype=np.single)
+        float_pointer = ctypes.POINTER(ctypes.c_float)
+        self.testlib.test_fft(samples.ctypes.data_as(float_pointer), re.ctypes.data_as(float_pointer),
+                              im.ctypes.data_as(float_pointer), out.ctypes.data_as(float_pointer), len(samples))
+        return re + 1j*im, out
+
+    def convolve(self, ir: np.ndarray, samples: np.ndarray, size: int, max_partition: int = 0) -> tuple:
+        ''' samples convolved with ir, a block of size at a time. Returns the output and the number of stages '''
+        ir = np.ascontiguousarray(ir, dtype=np.single)
+        samples = np.ascontiguousarray(samples, dtype=np.single)
+        out = np.zeros(len(samples), dtype=np.single)
+        float_pointer = ctypes.POINTER(ctypes.c_float)
+        stages = self.testlib.test_convolver(ir.ctypes.data_as(float_pointer), len(ir), size, max_partition,
+                                             samples.ctypes.data_as(float_pointer),
+                                             out.ctypes.data_as(float_pointer), len(samples))
+        return out, stages
+
+
+class TestConvolver(ConvolverInterface, unittest.TestCase):
+    ''' Tests for Fft_t, Convolver_t and convolution in the engine '''
+
+    def assert_convolved(self, expected: np.ndarray, out: np.ndarray):
+        ''' Equal to within the rounding of the FFTs, relative to the size of the output '''
+        np.testing.assert_allclose(out, expected, rtol=0, atol=2e-6*np.abs(expected).max())
+
+    def test_fft(self):
+        ''' The spectrum should match numpy's, and transform back to the input '''
+        rng = np.random.default_rng(0)
+        for size in [2, 4, 8, 16, 256, 4096, 65536]:
+            with self.subTest(size=size):
+                samples = rng.uniform(-1, 1, size).astype(np.single)
+                spectrum, out = self.fft(samples)
+                expected = np.fft.rfft(samples.astype(np.double))
+                np.testing.assert_allclose(spectrum, expected, rtol=0, atol=2e-6*np.abs(expected).max())
+                np.testing.assert_allclose(out, samples, rtol=0, atol=1e-5)
+        # a single bin
+        spectrum, _ = self.fft(np.cos(2*np.pi*5*np.arange(64)/64))
+        expected = np.zeros(33)
+        expected[5] = 32
+        np.testing.assert_allclose(spectrum, expected, atol=1e-5)
+
+    def test_uniform(self):
+        ''' Partitions of a block should give the same output as direct convolution, for any block size '''
+        for length in [1, 7, 128, 1000, 5000]:
+            for size in [1, 32, 100, block_size]:
+                if size == 1 and length > 1000:
+                    continue
+                with self.subTest(length=length, size=size):
+                    ir = response(length)
+                    samples = np.random.default_rng(length).uniform(-1, 1, 2*length + 10*size).astype(np.single)
+                    samples = samples[:len(samples) - len(samples) % size]
+                    out, stages = self.convolve(ir, samples, size)
+                    self.assertEqual(1, stages)
+                    self.assert_convolved(np.convolve(samples.astype(np.double), ir)[:len(samples)], out)
+        # an impulse gives back the response, with no latency
+        ir = response(1000)
+        impulse = np.zeros(2048, dtype=np.single)
+        impulse[0] = 1
+        out, _ = self.convolve(ir, impulse, block_size)
+        self.assert_convolved(np.concatenate([ir, np.zeros(1048)]), out)
+        # no response, no output
+        out, stages = self.convolve(np.zeros(0), impulse, block_size)
+        self.assertEqual(0, stages)
+        np.testing.assert_array_equal(0, out)
+
+    def test_non_uniform(self):
+        ''' Partitions growing from the block size should give the same output too, with fewer partitions '''
+        ir = response(20000, 1)
+        samples = np.random.default_rng(2).uniform(-1, 1, 30000).astype(np.single)
+        for size in [16, 100, block_size]:
+            for max_partition in [size, 4*size, 16*size, 2**20]:
+                with self.subTest(size=size, max_partition=max_partition):
+                    trimmed = samples[:len(samples) - len(samples) % size]
+                    out, stages = self.convolve(ir, trimmed, size, max_partition)
+                    self.assertEqual(stage_count(len(ir), size, max_partition), stages)
+                    self.assert_convolved(np.convolve(trimmed.astype(np.double), ir)[:len(trimmed)], out)
+        self.assertEqual(1, stage_count(len(ir), block_size, 0))
+        self.assertEqual(6, stage_count(len(ir), 16, 2**20))   # 16, 64, ..., 16384 samples
+        # a response shorter than the first stage only needs that stage
+        self.assertEqual(1, self.convolve(ir[:300], samples[:1024], block_size, 2**20)[1])
+
+    def test_engine(self):
+        ''' The engine's output should be convolved with the response after everything else '''
+        patch = make_patches(1, generator=1, release=0.05, lpf_freq=8000)[0]
+        ir = response(3000)
+        for max_partition in [0, 16*block_size]:
+            with self.subTest(max_partition=max_partition), \
+                 Engine(sampling_frequency) as engine, Engine(sampling_frequency) as reference:
+                engine.set_impulse_response(ir, max_partition)
+                for synth in [engine, reference]:
+                    synth.apply_patch(patch)
+                    synth.press(60)
+                    synth.schedule_release(60, 20*block_size)
+                out = engine.render_blocks(100)
+                dry = reference.render_blocks(100)
+                self.assert_convolved(np.convolve(dry.astype(np.double), ir)[:len(dry)], out)
+                # taken out again, it goes straight back to the dry output
+                engine.set_impulse_response([])
+                engine.press(64)
+                reference.press(64)
+                np.testing.assert_array_equal(reference.render_blocks(20), engine.render_blocks(20))
+        # a unit impulse changes nothing, give or take rounding
+        with Engine(sampling_frequency, block_size=100) as engine, \
+             Engine(sampling_frequency, block_size=100) as reference:
+            engine.set_impulse_response([1])
+            for synth in [engine, reference]:
+                synth.apply_patch(patch)
+                synth.press(67)
+            np.testing.assert_allclose(engine.render_blocks(50), reference.render_blocks(50), rtol=0, atol=1e-6)
+
+
+def main():
+    ''' For Debugging/Testing '''
+    convolver_test = TestConvolver()
+    convolver_test.setUp()
+    convolver_test.test_fft()
+    convolver_test.test_uniform()
+    convolver_test.test_non_uniform()
+    convolver_test.test_engine()
+
+if __name__=='__main__':
+    main()
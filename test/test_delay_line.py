@@ -4,6 +4,7 @@ import ctypes
 import unittest
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.signal as sig
 
 class DelayLineInterface:
     ''' Interface for delay line test function '''
@@ -15,6 +16,19 @@ class DelayLineInterface:
         float_pointer = ctypes.POINTER(ctypes.c_float)
         self.testlib.test_delay_line.argtypes = [float_pointer, float_pointer, uint32_pointer,
                                                  ctypes.c_uint, float_pointer, ctypes.c_uint]
+        self.testlib.test_delay_line_capacity.argtypes = [ctypes.c_uint]
+        self.testlib.test_delay_line_capacity.restype = ctypes.c_uint
+        # in, out, ioLen, blockSize, delay, lineMemory, lineLength
+        self.testlib.test_delay_line_block.argtypes = [float_pointer, float_pointer, ctypes.c_uint, ctypes.c_uint,
+                                                       ctypes.c_uint, float_pointer, ctypes.c_uint]
+        # in, out, delays, ioLen, allpass, lineMemory, lineLength
+        self.testlib.test_delay_line_fractional.argtypes = [float_pointer, float_pointer, float_pointer,
+                                                            ctypes.c_uint, ctypes.c_uint,
+                                                            float_pointer, ctypes.c_uint]
+
+    def line_memory(self, line_length: int) -> np.ndarray:
+        ''' Memory for a delay line, rounded up to the capacity it needs '''
+        return np.empty(max(self.testlib.test_delay_line_capacity(line_length), 1), dtype=np.single)
 
     def run_delay_line(self, data_in: list, delays: list, line_length: int) -> np.ndarray:
         ''' Actually run the delay line '''
@@ -26,13 +40,36 @@ class DelayLineInterface:
         p_data_out = data_out.ctypes.data_as(p_float)
         delays = np.array(delays, dtype=np.uint32)
         p_delays = delays.ctypes.data_as(p_uint32)
-        memory = np.empty(line_length, dtype=np.single)
+        memory = self.line_memory(line_length)
         p_memory = memory.ctypes.data_as(p_float)
         self.testlib.test_delay_line(p_data_in, p_data_out, p_delays,\
                                      len(data_in), p_memory, line_length)
 
         return data_out
 
+    def run_block(self, data_in: list, block_size: int, delay: int, line_length: int) -> np.ndarray:
+        ''' Write and read the delay line a block at a time '''
+        p_float = ctypes.POINTER(ctypes.c_float)
+        data_in = np.array(data_in, dtype=np.single)
+        data_out = np.zeros_like(data_in)
+        memory = self.line_memory(line_length)
+        self.testlib.test_delay_line_block(data_in.ctypes.data_as(p_float), data_out.ctypes.data_as(p_float),
+                                           len(data_in), block_size, delay,
+                                           memory.ctypes.data_as(p_float), line_length)
+        return data_out
+
+    def run_fractional(self, data_in: list, delays: list, allpass: bool, line_length: int) -> np.ndarray:
+        ''' Read the delay line with fractional delays '''
+        p_float = ctypes.POINTER(ctypes.c_float)
+        data_in = np.array(data_in, dtype=np.single)
+        data_out = np.zeros_like(data_in)
+        delays = np.array(delays, dtype=np.single)
+        memory = self.line_memory(line_length)
+        self.testlib.test_delay_line_fractional(data_in.ctypes.data_as(p_float), data_out.ctypes.data_as(p_float),
+                                                delays.ctypes.data_as(p_float), len(data_in), allpass,
+                                                memory.ctypes.data_as(p_float), line_length)
+        return data_out
+
 
 class TestDelayLine(DelayLineInterface, unittest.TestCase):
     '''Tests For the Delay Line'''
@@ -83,6 +120,52 @@ class TestDelayLine(DelayLineInterface, unittest.TestCase):
 
             self.assertTrue((model_out == test_out).all(), 'Model delay is equal to Implementation')
 
+    def test_capacity(self):
+        ''' Capacity should be the next power of 2 '''
+        for length, capacity in [(0, 0), (1, 1), (2, 2), (3, 4), (100, 128), (128, 128), (10000, 16384)]:
+            with self.subTest(f'{length=}'):
+                self.assertEqual(capacity, self.testlib.test_delay_line_capacity(length))
+
+    def test_block(self):
+        ''' Block writes/reads should match delaying sample by sample, including across the wrap '''
+        test_length = 128*16
+        samples_in = np.random.default_rng(1234).uniform(-1, 1, size=test_length).astype(dtype=np.single)
+        for line_length in [128, 200, 1000]:
+            for block_size in [1, 16, 128]:
+                # a read needs delay + block_size to fit in the line
+                for delay in [d for d in [0, 1, 37, line_length - block_size] if d + block_size <= line_length]:
+                    with self.subTest(f'{line_length=}, {block_size=}, {delay=}'):
+                        test_out = self.run_block(samples_in, block_size, delay, line_length)
+                        model_out = np.append(np.zeros(delay), samples_in)[:test_length]
+                        np.testing.assert_array_equal(model_out, test_out)
+
+    def test_fractional(self):
+        ''' Check linear and allpass interpolated reads against models of the interpolators '''
+        test_length = 1024
+        samples_in = np.random.default_rng(1234).uniform(-1, 1, size=test_length).astype(dtype=np.single)
+        for delay in [0.5, 3.25, 10.05, 10.9, 99.75]:
+            whole = int(delay)
+            fraction = delay - whole
+            delayed = np.append(np.zeros(whole + 1), samples_in)
+            with self.subTest(f'linear {delay=}'):
+                test_out = self.run_fractional(samples_in, delay*np.ones(test_length), False, 128)
+                model_out = (1 - fraction)*delayed[1:test_length + 1] + fraction*delayed[:test_length]
+                np.testing.assert_allclose(model_out, test_out, atol=1e-6)
+            with self.subTest(f'allpass {delay=}'):
+                test_out = self.run_fractional(samples_in, delay*np.ones(test_length), True, 128)
+                if fraction < 0.1 and whole > 0:
+                    whole -= 1
+                    fraction += 1
+                eta = (1 - fraction)/(1 + fraction)
+                model_in = np.append(np.zeros(whole), samples_in)[:test_length]
+                model_out = sig.lfilter([eta, 1], [1, eta], model_in)
+                np.testing.assert_allclose(model_out, test_out, atol=1e-5)
+                # the delay of a low frequency should be close to the fractional delay
+                n = np.arange(test_length)
+                w = 2*np.pi*0.01
+                sine_out = self.run_fractional(np.sin(w*n), delay*np.ones(test_length), True, 128)
+                np.testing.assert_allclose(sine_out[200:], np.sin(w*(n - delay))[200:], atol=1e-3)
+
 
 def main():
     ''' For Debugging/Testing '''
@@ -91,6 +174,8 @@ def main():
     delay_test.debug = True
     delay_test.test_basic()
     delay_test.test_random_delays()
+    delay_test.test_block()
+    delay_test.test_fractional()
 
 
 if __name__=='__main__':
@@ -0,0 +1,317 @@
+''' Tests for the persistent engine interface
+    copyright Maximilian Cornwell 2024 '''
+import ctypes
+import unittest
+
+from test.constants import block_size, sampling_frequencies
+from test.test_synth import SynthInterface
+from test.test_voice import generators
+
+import numpy as np
+
+from mxcs import Engine, Isa, make_events, make_patches, MxcsError, Parameter, get_isa, set_isa, supported_isas
+from mxcs.engine import profile_to_dict
+from mxcs.library import engine_lib, ERROR_UNSUPPORTED, profile_dtype, profile_stages
+
+
+class EngineInterface(SynthInterface):
+    ''' Runs the same settings through the engine handle and the one-shot test function '''
+
+    def make_engine(self, fs: float, size: int = block_size) -> Engine:
+        ''' Create an engine configured with the current settings '''
+        engine = Engine(fs, self.voices, size)
+        engine.configure(attack=self.attack_seconds, decay=self.decay_seconds,
+                         sustain=self.sustain, release=self.release_seconds,
+                         mod_depth=self.mod_depth, mod_freq=self.mod_freq,
+                         generator=generators[self.generator])
+        return engine
+
+    def run_engine(self, events: list, n_blocks: int, chunk: int, fs: float) -> np.ndarray:
+        ''' Render n_blocks, chunk blocks at a time. Events are (block, press, note) '''
+        out = np.zeros(n_blocks*block_size, dtype=np.single)
+        with self.make_engine(fs) as engine:
+            for start in range(0, n_blocks, chunk):
+                end = min(start + chunk, n_blocks)
+                cursor = start
+                for block, press, note in events:
+                    if start <= block < end:
+                        # render up to the event
+                        engine.render(out[cursor*block_size:block*block_size])
+                        cursor = block
+                        if press:
+                            engine.press(note)
+                        else:
+                            engine.release(note)
+                engine.render(out[cursor*block_size:end*block_size])
+        return out
+
+
+class TestEngine(EngineInterface, unittest.TestCase):
+    ''' Tests for the engine handle API '''
+    debug = False
+
+    def test_matches_one_shot(self):
+        ''' Rendering incrementally should match rendering everything at once '''
+        n_blocks = 400
+        events = [(10, True, 60), (50, True, 67), (100, False, 60), (150, False, 67), (200, True, 72)]
+        presses = [(block, note) for block, press, note in events if press]
+        releases = [(block, note) for block, press, note in events if not press]
+        for fs in sampling_frequencies:
+            self.set_adsr(0.01, 0.05, -6, 0.1, fs)
+            self.mod_depth = 0.5
+            self.mod_freq = 2
+            for gen in generators:
+                self.generator = gen
+                reference = self.run_synth([block_size*b for b, _ in presses], [n for _, n in presses],
+                                           [block_size*b for b, _ in releases], [n for _, n in releases],
+                                           n_blocks*block_size, fs)
+                for chunk in [1, 7, n_blocks]:
+                    with self.subTest(f'{gen}, {chunk=}, {fs=}'):
+                        out = self.run_engine(events, n_blocks, chunk, fs)
+                        np.testing.assert_array_equal(reference, out)
+
+    def test_schedule(self):
+        ''' Scheduled events should be sample accurate, and match the one shot test function '''
+        n_blocks = 400
+        presses = [100, 1000, 1001, 7000, 12345]
+        p_notes = [60, 64, 67, 60, 72]
+        releases = [5000, 5000, 20000, 30001]
+        r_notes = [60, 67, 64, 72]
+        self.set_adsr(0.01, 0.05, -6, 0.1, sampling_frequencies[0])
+        reference = self.run_synth(presses, p_notes, releases, r_notes,
+                                   n_blocks*block_size, sampling_frequencies[0])
+        for chunk in [1, 7, n_blocks]:
+            with self.subTest(f'{chunk=}'):
+                out = np.zeros(n_blocks*block_size, dtype=np.single)
+                with self.make_engine(sampling_frequencies[0]) as engine:
+                    # out of order, and all at once
+                    for note, time in zip(r_notes, releases):
+                        engine.schedule_release(note, time)
+                    for note, time in zip(p_notes, presses):
+                        engine.schedule_press(note, time)
+                    for start in range(0, n_blocks, chunk):
+                        self.assertEqual(start*block_size, engine.time)
+                        engine.render(out[start*block_size:(start + chunk)*block_size])
+                np.testing.assert_array_equal(reference, out)
+
+    def test_generator_change(self):
+        ''' A generator switched to part way through a note should play it like it was pressed with that generator '''
+        fs = 44100
+        self.set_adsr(0.001, 0.01, -6, 0.1, fs)
+        window = np.hanning(64*block_size)
+        for gen in generators:
+            with self.subTest(gen), self.make_engine(fs) as engine, self.make_engine(fs) as reference:
+                engine.configure(generator=generators['sine'])
+                reference.configure(generator=generators[gen])
+                for synth in [engine, reference]:
+                    synth.press(57)
+                    synth.render_blocks(20)
+                engine.configure(generator=generators[gen])
+                # the phase differs, but not the spectrum, once the highpass has settled after the switch
+                for synth in [engine, reference]:
+                    synth.render_blocks(20)
+                expected = np.abs(np.fft.rfft(window*reference.render_blocks(64)))
+                out = np.abs(np.fft.rfft(window*engine.render_blocks(64)))
+                np.testing.assert_allclose(out, expected, rtol=0, atol=1e-2*expected.max())
+
+    def test_render_in_place(self):
+        ''' The engine should write straight into the buffer it is given '''
+        with Engine(sampling_frequencies[0]) as engine:
+            engine.configure(attack=0.001, decay=0.001, sustain=0, release=0.1)
+            engine.press(69)
+            out = np.zeros((4, block_size), dtype=np.single)
+            result = engine.render(out)
+            self.assertIs(result, out)
+            self.assertGreater(np.max(np.abs(out[-1])), 0)
+            result = engine.render(out[2:])
+            self.assertTrue(np.shares_memory(result, out))
+
+    def test_block_sizes(self):
+        ''' Other block sizes should sound the same as the default, with events at the same samples '''
+        n_samples = 8192*8
+        presses = [100, 1000, 1001, 7000, 12345]
+        p_notes = [60, 64, 67, 60, 72]
+        # voices are freed at the end of a block, so a reused voice's phase depends on the block size.
+        # All the releases come after the presses to avoid that
+        releases = [20000, 20000, 25000, 30001]
+        r_notes = [60, 67, 64, 72]
+        fs = sampling_frequencies[0]
+        self.set_adsr(0.01, 0.05, -6, 0.1, fs)
+        for gen in generators:
+            self.generator = gen
+            outputs = {}
+            for size in [16, 128, 1000, 8192]:
+                out = np.zeros(n_samples, dtype=np.single)
+                with self.make_engine(fs, size) as engine:
+                    self.assertEqual(size, engine.block_size)
+                    for note, time in zip(p_notes, presses):
+                        engine.schedule_press(note, time)
+                    for note, time in zip(r_notes, releases):
+                        engine.schedule_release(note, time)
+                    usable = n_samples - n_samples % size
+                    engine.render(out[:usable])
+                    outputs[size] = out[:usable]
+            for size, out in outputs.items():
+                with self.subTest(f'{gen}, block size {size}'):
+                    reference = outputs[block_size][:out.size]
+                    # the oscillators renormalise and the BLIT phase is synced per chunk, so the rounding
+                    # differs between block sizes, by an amount relative to the level
+                    np.testing.assert_allclose(out, reference, atol=1e-3*np.max(np.abs(reference)))
+
+    def test_default_patch(self):
+        ''' A new engine should play the default patch before it's configured, rather than NaNs '''
+        n_blocks = 100
+        outputs = []
+        for configure in [False, True]:
+            with Engine(sampling_frequencies[0]) as engine:
+                if configure:
+                    engine.apply_patch(make_patches(1)[0])
+                engine.press(60)
+                out = engine.render_blocks(n_blocks//2)
+                engine.release(60)
+                outputs.append(np.concatenate([out, engine.render_blocks(n_blocks//2)]))
+        self.assertTrue(np.all(np.isfinite(outputs[0])))
+        self.assertGreater(np.max(np.abs(outputs[0])), 0.1)
+        np.testing.assert_array_equal(outputs[0], outputs[1])
+
+    def test_flush_events(self):
+        ''' Flushing the queue part way through scheduling a block shouldn't change the output '''
+        n_blocks = 50
+        notes = 40 + np.arange(300) % 48
+        events = make_events(np.arange(300)//6, notes, 50 + np.arange(300)//6, notes)
+        self.set_adsr(0.01, 0.05, -6, 0.1, sampling_frequencies[0])
+        outputs = []
+        for split in [None, 1, 300, 599]:
+            with self.make_engine(sampling_frequencies[0]) as engine:
+                if split is None:
+                    engine.schedule(events)
+                else:
+                    engine.schedule(events[:split])
+                    engine.flush_events()
+                    engine.flush_events()
+                    engine.schedule(events[split:])
+                outputs.append(engine.render_blocks(n_blocks))
+        for out in outputs[1:]:
+            np.testing.assert_array_equal(outputs[0], out)
+
+    def test_errors(self):
+        ''' Invalid arguments should raise exceptions, not crash '''
+        with Engine(sampling_frequencies[0]) as engine:
+            with self.assertRaises(MxcsError):
+                engine.press(128)
+            with self.assertRaises(MxcsError):
+                engine.release(200)
+            with self.assertRaises(MxcsError):
+                engine.set(99, 0)
+            with self.assertRaises(MxcsError):
+                engine.set(Parameter.GENERATOR, 50)
+            # NaN fails every range check, and the filters take log2 of their frequency
+            invalid = [(Parameter.GENERATOR, np.nan), (Parameter.STEAL_POLICY, np.nan), (Parameter.ATTACK, np.nan),
+                       (Parameter.LPF_FREQ, 0), (Parameter.LPF_FREQ, -100), (Parameter.LPF_FREQ, np.inf),
+                       (Parameter.HPF_FREQ, 0), (Parameter.HPF_FREQ, np.nan),
+                       (Parameter.MOD_FREQ, -1), (Parameter.MOD_FREQ, np.inf), (Parameter.DITHER, np.nan)]
+            for parameter, value in invalid:
+                with self.subTest(f'{parameter.name} = {value}'):
+                    with self.assertRaises(MxcsError):
+                        engine.set(parameter, value)
+            # the engine should be unharmed
+            engine.press(60)
+            self.assertTrue(np.all(np.isfinite(engine.render_blocks(10))))
+            with self.assertRaises(ValueError):
+                engine.render(np.zeros(block_size + 1, dtype=np.single))
+            with self.assertRaises(ctypes.ArgumentError):
+                engine.render(np.zeros(block_size, dtype=np.double))
+        for fs in [0, -48000, np.nan]:
+            with self.assertRaises(ValueError):
+                Engine(fs)
+            self.assertFalse(engine_lib.mxcs_create(fs, 16, block_size))
+
+    def test_profile(self):
+        ''' test.so is built with SYNTH_PROFILE_, so every stage should be timed and the load measured.
+            The plain engine leaves profiling out, and says so '''
+        testlib = ctypes.CDLL('test.so')
+        testlib.mxcs_create.argtypes = [ctypes.c_float, ctypes.c_uint, ctypes.c_uint]
+        testlib.mxcs_create.restype = ctypes.c_void_p
+        testlib.mxcs_destroy.argtypes = [ctypes.c_void_p]
+        testlib.mxcs_press.argtypes = [ctypes.c_void_p, ctypes.c_uint]
+        testlib.mxcs_step.argtypes = [ctypes.c_void_p, np.ctypeslib.ndpointer(dtype=np.single), ctypes.c_uint]
+        testlib.mxcs_get_profile.argtypes = [ctypes.c_void_p, np.ctypeslib.ndpointer(dtype=profile_dtype)]
+        testlib.mxcs_reset_profile.argtypes = [ctypes.c_void_p]
+        blocks = 100
+        for fs in sampling_frequencies:
+            with self.subTest(f'{fs=}'):
+                handle = testlib.mxcs_create(fs, self.voices, block_size)
+                profile = np.zeros(1, dtype=profile_dtype)
+                try:
+                    for note in [60, 64, 67]:
+                        testlib.mxcs_press(handle, note)
+                    testlib.mxcs_step(handle, np.zeros(blocks*block_size, dtype=np.single), blocks)
+                    self.assertEqual(testlib.mxcs_get_profile(handle, profile), 0)
+                    result = profile_to_dict(profile[0])
+                    self.assertEqual(result['blocks'], blocks)
+                    for stage in profile_stages:
+                        self.assertGreater(result['last_cycles'][stage], 0)
+                        self.assertGreaterEqual(result['total_cycles'][stage], result['last_cycles'][stage])
+                    self.assertGreater(result['load'], 0)
+                    self.assertGreaterEqual(result['peak_load'], result['load'])
+                    self.assertLessEqual(result['overruns'], blocks)
+                    self.assertEqual(testlib.mxcs_reset_profile(handle), 0)
+                    testlib.mxcs_get_profile(handle, profile)
+                    result = profile_to_dict(profile[0])
+                    self.assertEqual(result['blocks'], 0)
+                    self.assertEqual(sum(result['total_cycles'].values()), 0)
+                finally:
+                    testlib.mxcs_destroy(handle)
+        with Engine(sampling_frequencies[0]) as engine:
+            with self.assertRaises(MxcsError) as context:
+                engine.profile()
+            self.assertEqual(context.exception.code, ERROR_UNSUPPORTED)
+            with self.assertRaises(MxcsError):
+                engine.reset_profile()
+
+    def test_isa(self):
+        ''' Every instruction set the CPU supports should sound the same. Only some use FMA, so the
+            rounding differs, and the oscillators' phases drift apart slowly.
+            The best one should be picked by default, and unsupported ones refused '''
+        n_blocks = 200
+        events = [(10, True, 60), (20, True, 64), (30, True, 67), (150, False, 64)]
+        supported = supported_isas()
+        self.assertIn(Isa.GENERIC, supported)
+        self.assertEqual(max(supported), get_isa())
+        self.set_adsr(0.01, 0.05, -6, 0.1, sampling_frequencies[0])
+        try:
+            for gen in generators:
+                self.generator = gen
+                set_isa(Isa.GENERIC)
+                reference = self.run_engine(events, n_blocks, n_blocks, sampling_frequencies[0])
+                for isa in supported:
+                    with self.subTest(f'{gen}, {isa.name}'):
+                        set_isa(isa)
+                        self.assertEqual(isa, get_isa())
+                        out = self.run_engine(events, n_blocks, n_blocks, sampling_frequencies[0])
+                        np.testing.assert_allclose(out, reference, atol=1e-3*np.max(np.abs(reference)))
+            for isa in set(Isa) - set(supported):
+                with self.assertRaises(MxcsError):
+                    set_isa(isa)
+            with self.assertRaises(MxcsError):
+                set_isa(len(Isa))
+        finally:
+            set_isa(max(supported))
+
+
+def main():
+    ''' For Debugging/Testing '''
+    engine_test = TestEngine()
+    engine_test.setUp()
+    engine_test.test_matches_one_shot()
+    engine_test.test_generator_change()
+    engine_test.test_render_in_place()
+    engine_test.test_block_sizes()
+    engine_test.test_default_patch()
+    engine_test.test_flush_events()
+    engine_test.test_errors()
+    engine_test.test_profile()
+    engine_test.test_isa()
+
+if __name__=='__main__':
+    main()
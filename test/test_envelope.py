@@ -19,18 +19,20 @@ class EnvelopeInterface:
     sustain = 0
     release = 0
     release_seconds = 0
+    block_size = block_size
     testlib = ctypes.CDLL('test.so')
 
     def setUp(self):
         ''' Load in the test object file and define the function '''
         float_pointer = ctypes.POINTER(ctypes.c_float)
         uint_pointer = ctypes.POINTER(ctypes.c_uint)
-        # attack, decay, sustain, release, presses, pressNs, releases, releaseNs, n, fs, envOut
+        # attack, decay, sustain, release, presses, pressNs, releases, releaseNs, n, blockSize, fs, envOut
         self.testlib.test_envelope.argtypes = [ctypes.c_float, ctypes.c_float,
                                                ctypes.c_float, ctypes.c_float,
                                                ctypes.c_uint, uint_pointer,
                                                ctypes.c_uint, uint_pointer,
-                                               ctypes.c_uint, ctypes.c_float, float_pointer]
+                                               ctypes.c_uint, ctypes.c_uint,
+                                               ctypes.c_float, float_pointer]
 
     def run_env(self, presses: list, releases: list, n_samples: int, fs: float) -> np.ndarray:
         ''' Run the Envelope Generator. Output is attack float'''
@@ -43,7 +45,7 @@ class EnvelopeInterface:
                                     self.sustain, self.release_seconds,
                                     len(presses), presses_p,
                                     len(releases), releases_p,
-                                    len(out), fs, out_p)
+                                    len(out), self.block_size, fs, out_p)
         return out
 
     def set_adsr(self, attack: float, decay: float, sustain: float, release: float, fs: float):
@@ -241,6 +243,58 @@ class TestEnvelope(EnvelopeInterface, unittest.TestCase):
                 # make sure the minima isn't at the end of the press region
                 self.assertGreater(press_region[-1], press_minimum)
 
+    def test_event_timing(self):
+        ''' Check that presses and releases happen on the sample they are given,
+            including several in one block '''
+        n_samples = 20*block_size
+        self.set_adsr(0.001, 0.001, -6, 0.01, sampling_frequency)
+        for press_time, release_time in [(0, 5*block_size), (1, 5*block_size + 1),
+                                         (block_size - 1, 10*block_size + 77)]:
+            with self.subTest(f'{press_time=}, {release_time=}'):
+                vector = self.run_env([press_time], [release_time], n_samples, sampling_frequency)
+                self.assertTrue(np.all(vector[:press_time] == 0))
+                self.assertGreater(vector[press_time], 0)
+                # should be in sustain right up until the release
+                self.assertEqual(vector[release_time - 2], vector[release_time - 1])
+                self.assertLess(vector[release_time], vector[release_time - 1])
+        # several presses and releases in the same block
+        presses = [3*block_size + 5, 3*block_size + 40, 3*block_size + 90]
+        releases = [3*block_size + 20, 3*block_size + 60]
+        vector = self.run_env(presses, releases, n_samples, sampling_frequency)
+        derivative = np.diff(vector)
+        self.assertEqual(0, vector[presses[0] - 1])
+        self.assertGreater(vector[presses[0]], 0)
+        for press in presses[1:]:
+            self.assertLess(derivative[press - 2], 0)
+            self.assertGreater(derivative[press - 1], 0)
+        for release in releases:
+            self.assertGreater(derivative[release - 2], 0)
+            self.assertLess(derivative[release - 1], 0)
+
+    def test_segments(self):
+        ''' Ramping a whole block at once should match running one sample at a time,
+            with the stage transitions on the same samples '''
+        n_samples = 2*sampling_frequency
+        for attack, decay, sustain, release in [(0.01, 0.1, -6, 0.2), (0.5, 0.01, -40, 0.05),
+                                                (0.001, 0.3, 0, 0.001), (0.1, 0.1, -20, 1)]:
+            self.set_adsr(attack, decay, sustain, release, sampling_frequency)
+            presses = [100, int(0.4*sampling_frequency) + 3, int(0.45*sampling_frequency)]
+            releases = [int(0.3*sampling_frequency) + 50, int(0.7*sampling_frequency) + 1]
+            with self.subTest(f'{attack=}, {decay=}, {sustain=}, {release=}'):
+                self.block_size = 1
+                reference = self.run_env(presses, releases, n_samples, sampling_frequency)
+                self.block_size = block_size
+                vector = self.run_env(presses, releases, n_samples, sampling_frequency)
+                # rounding builds up differently over long stages, so they can drift slightly
+                np.testing.assert_allclose(vector, reference, rtol=1e-3, atol=1e-5)
+                # the peak of each attack happens on the same sample
+                np.testing.assert_array_equal(np.flatnonzero(reference == 1), np.flatnonzero(vector == 1))
+                # and the envelope switches on and off within a sample
+                ref_edges = np.flatnonzero(np.diff(reference == 0))
+                edges = np.flatnonzero(np.diff(vector == 0))
+                self.assertEqual(len(ref_edges), len(edges))
+                np.testing.assert_allclose(edges, ref_edges, atol=1)
+
 
 def main():
     ''' For Debugging/Testing '''
@@ -249,6 +303,7 @@ def main():
     # env_test.debug = True
     env_test.test_basic_envelope()
     env_test.test_double_press()
+    env_test.test_segments()
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,236 @@
+''' Tests for the mxcs._engine extension module (built with make python)
+    copyright Maximilian Cornwell 2024 '''
+import array
+import threading
+import unittest
+
+from test.constants import block_size, sampling_frequency
+from test.test_blit import BlitInterface
+from test.test_filter import FilterInterface
+from test.test_oscillator import OscillatorInterface
+from test.test_voice import generators
+from test.test_wavetable import WavetableInterface
+
+import numpy as np
+import scipy.signal as sig
+
+from mxcs import Engine, Parameter
+from mxcs.library import event_dtype, PRESS_EVENT, RELEASE_EVENT
+
+try:
+    from mxcs import _engine
+except ImportError:
+    _engine = None
+
+
+def run_blocks(step, n_samples: int, size: int = block_size) -> np.ndarray:
+    ''' Call step(out) a block at a time, like the test.so functions do '''
+    out = np.zeros(n_samples, dtype=np.single)
+    for start in range(0, n_samples - size + 1, size):
+        step(out[start:start + size])
+    return out
+
+
+@unittest.skipIf(_engine is None, 'mxcs._engine is not built')
+class TestExtension(BlitInterface, FilterInterface, OscillatorInterface, WavetableInterface, unittest.TestCase):
+    ''' The extension should give the same results as the ctypes interfaces, without copying '''
+
+    def setUp(self):
+        ''' Define the test.so functions used as references '''
+        BlitInterface.setUp(self)
+        FilterInterface.setUp(self)
+        OscillatorInterface.setUp(self)
+        WavetableInterface.setUp(self)
+
+    def make_synth(self, gen: int, size: int = block_size):
+        ''' A synth and an engine with the same settings '''
+        synth = _engine.Synth(sampling_frequency, 16, size)
+        engine = Engine(sampling_frequency, 16, size)
+        settings = {Parameter.ATTACK: 0.01, Parameter.DECAY: 0.05, Parameter.SUSTAIN: -6,
+                    Parameter.RELEASE: 0.1, Parameter.MOD_FREQ: 2, Parameter.MOD_DEPTH: 0.5,
+                    Parameter.GENERATOR: gen}
+        for parameter, value in settings.items():
+            synth.set(parameter, value)
+            engine.set(parameter, value)
+        return synth, engine
+
+    def test_synth(self):
+        ''' The synth should match the engine, with events pressed directly or scheduled '''
+        n_blocks = 200
+        events = np.array([(100, PRESS_EVENT, 60), (1000, PRESS_EVENT, 64), (1001, PRESS_EVENT, 67),
+                           (12000, RELEASE_EVENT, 60), (20000, RELEASE_EVENT, 64)], dtype=event_dtype)
+        for gen, value in generators.items():
+            with self.subTest(gen):
+                synth, engine = self.make_synth(value)
+                with engine:
+                    synth.schedule(events)
+                    engine.schedule(events)
+                    synth.press(72)
+                    engine.press(72)
+                    out = np.zeros(n_blocks*block_size, dtype=np.single)
+                    self.assertIs(out, synth.render(out))
+                    np.testing.assert_array_equal(engine.render_blocks(n_blocks), out)
+                    self.assertEqual(engine.time, synth.time)
+                self.assertEqual(block_size, synth.block_size)
+                self.assertEqual(sampling_frequency, synth.sampling_frequency)
+
+    def test_generators(self):
+        ''' Each generator should match its test function '''
+        n_samples = 2**12
+        freq = 440
+        oscillator = _engine.Oscillator()
+        oscillator.set_freq(freq/sampling_frequency)
+        cos_out = np.zeros(n_samples, dtype=np.single)
+        sin_out = np.zeros(n_samples, dtype=np.single)
+        for start in range(0, n_samples, block_size):
+            oscillator.step_quadrature(cos_out[start:start + block_size], sin_out[start:start + block_size])
+        self.set_f(freq, sampling_frequency)
+        np.testing.assert_array_equal(self.run_osc(n_samples), cos_out + 1j*sin_out)
+        self.assertAlmostEqual(np.angle(cos_out[-1] + 1j*sin_out[-1]), oscillator.phase, places=5)
+        references = {'blit': (_engine.Blit, lambda: self.run_blit(freq, n_samples)),
+                      'bp_blit': (_engine.BpBlit, lambda: self.run_bp_blit(freq, n_samples)),
+                      'sawtooth': (_engine.Sawtooth, lambda: self.run_integrated_blit(freq, 0, n_samples)),
+                      'square': (_engine.Square, lambda: self.run_integrated_blit(freq, 1, n_samples)),
+                      'triangle': (_engine.Triangle, lambda: self.run_integrated_blit(freq, 2, n_samples)),
+                      'wavetable': (_engine.Wavetable, lambda: self.run_wavetable(freq, n_samples))}
+        for name, (generator_type, run_reference) in references.items():
+            with self.subTest(name):
+                generator = generator_type()
+                generator.set_freq(freq/sampling_frequency)
+                reference = run_reference()
+                # the BLIT test functions leave their last block empty
+                usable = n_samples - block_size
+                out = run_blocks(generator.step, usable)
+                np.testing.assert_array_equal(reference[:usable], out)
+
+    def test_filters(self):
+        ''' The biquad should match its test function, in place or not, and the SOS filter scipy '''
+        rng = np.random.default_rng(0)
+        samples_in = rng.standard_normal(block_size*8).astype(np.single)
+        for ftype, reference in [('lp', self.run_lp), ('hp', self.run_hp)]:
+            with self.subTest(ftype):
+                expected = reference(1000, 6, samples_in, sampling_frequency)
+                biquad = _engine.Biquad(sampling_frequency)
+                configure = biquad.configure_lowpass if ftype == 'lp' else biquad.configure_highpass
+                configure(1000, 6)
+                out = np.zeros_like(samples_in)
+                for start in range(0, len(samples_in), block_size):
+                    biquad.step(samples_in[start:start + block_size], out[start:start + block_size])
+                np.testing.assert_array_equal(expected, out)
+                biquad = _engine.Biquad(sampling_frequency)
+                configure = biquad.configure_lowpass if ftype == 'lp' else biquad.configure_highpass
+                configure(1000, 6)
+                in_place = samples_in.copy()
+                self.assertIs(in_place, biquad.step(in_place))
+                np.testing.assert_array_equal(expected, in_place)
+        b, a = sig.butter(6, 0.1)
+        sos = _engine.SosFilter(b, a)
+        self.assertEqual(3, sos.sections)
+        np.testing.assert_allclose(sos.step(samples_in.copy()), sig.lfilter(b, a, samples_in), atol=1e-3)
+
+    def test_buffers(self):
+        ''' Anything exporting a contiguous float32 buffer should be written to in place '''
+        oscillator = _engine.Oscillator()
+        oscillator.set_freq(0.01)
+        reference = run_blocks(oscillator.step, 64, 64)
+        buffers = {'array': lambda: array.array('f', [0]*64),
+                   'memoryview': lambda: memoryview(bytearray(64*4)).cast('f'),
+                   '2d numpy': lambda: np.zeros((8, 8), dtype=np.single),
+                   'numpy view': lambda: np.zeros(128, dtype=np.single)[64:]}
+        for name, make_buffer in buffers.items():
+            with self.subTest(name):
+                oscillator = _engine.Oscillator()
+                oscillator.set_freq(0.01)
+                buffer = make_buffer()
+                self.assertIs(buffer, oscillator.step(buffer))
+                np.testing.assert_array_equal(reference, np.frombuffer(memoryview(buffer).cast('B'), np.single))
+        with self.assertRaises(TypeError):
+            oscillator.step(np.zeros(64))
+        with self.assertRaises(TypeError):
+            oscillator.step(bytearray(64))
+        with self.assertRaises(ValueError):
+            oscillator.step(np.zeros(128, dtype=np.single)[::2])
+        read_only = np.zeros(64, dtype=np.single)
+        read_only.flags.writeable = False
+        with self.assertRaises(ValueError):
+            oscillator.step(read_only)
+
+    def test_errors(self):
+        ''' Invalid arguments should raise exceptions, not crash '''
+        synth = _engine.Synth(sampling_frequency)
+        with self.assertRaises(ValueError):
+            synth.set(99, 0)
+        with self.assertRaises(ValueError):
+            synth.set(Parameter.GENERATOR, 50)
+        with self.assertRaises(ValueError):
+            synth.press(128)
+        with self.assertRaises(ValueError):
+            synth.render(np.zeros(block_size + 1, dtype=np.single))
+        with self.assertRaises(ValueError):
+            synth.schedule(bytearray(3))
+        with self.assertRaises(ValueError):
+            _engine.Synth(0)
+        with self.assertRaises(ValueError):
+            _engine.Biquad(sampling_frequency).set_coeffs([1, 0], [1, 0, 0])
+        with self.assertRaises(ValueError):
+            _engine.SosFilter([1]*20, [1]*20)
+        with self.assertRaises(ValueError):
+            _engine.Biquad(sampling_frequency).step(np.zeros(4, dtype=np.single), np.zeros(5, dtype=np.single))
+
+    def test_threads(self):
+        ''' The GIL is released while rendering, so synths can be rendered from several threads at once '''
+        n_blocks = 400
+        outputs = {}
+        serial = {}
+        for gen, value in generators.items():
+            synth, engine = self.make_synth(value)
+            engine.close()
+            synth.press(60)
+            serial[gen] = synth.render(np.zeros(n_blocks*block_size, dtype=np.single))
+
+        def render(gen: str, value: int):
+            synth, engine = self.make_synth(value)
+            engine.close()
+            synth.press(60)
+            outputs[gen] = synth.render(np.zeros(n_blocks*block_size, dtype=np.single))
+
+        threads = [threading.Thread(target=render, args=item) for item in generators.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for gen, out in serial.items():
+            with self.subTest(gen):
+                np.testing.assert_array_equal(out, outputs[gen])
+        # a filter can't be set up again while another thread is stepping it
+        b, a = sig.butter(6, 0.1)
+        for make_filter, init in [(lambda: _engine.Biquad(sampling_frequency),
+                                   lambda biquad: biquad.__init__(sampling_frequency)),
+                                  (lambda: _engine.SosFilter(b, a), lambda sos: sos.__init__(b, a))]:
+            in_use = 0
+            filter_ = make_filter()
+            thread = threading.Thread(target=filter_.step, args=(np.ones(2**24, dtype=np.single),))
+            thread.start()
+            while thread.is_alive():
+                try:
+                    init(filter_)
+                except RuntimeError:
+                    in_use += 1
+            thread.join()
+            self.assertGreater(in_use, 0)
+            init(filter_)
+
+
+def main():
+    ''' For Debugging/Testing '''
+    extension_test = TestExtension()
+    extension_test.setUp()
+    extension_test.test_synth()
+    extension_test.test_generators()
+    extension_test.test_filters()
+    extension_test.test_buffers()
+    extension_test.test_errors()
+    extension_test.test_threads()
+
+if __name__=='__main__':
+    main()
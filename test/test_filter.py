@@ -15,6 +15,7 @@ DFII = 1
 TDFI = 2
 TDFII = 3
 BIQUAD = 4
+SOS = 5
 
 
 class FilterInterface:
@@ -28,12 +29,26 @@ class FilterInterface:
         self.testlib.test_filter.argtypes = [ctypes.c_uint, ctypes.c_uint,
                                              float_pointer, float_pointer, float_pointer,
                                              ctypes.c_uint, float_pointer, float_pointer]
+        self.testlib.test_delay_line_capacity.argtypes = [ctypes.c_uint]
+        self.testlib.test_delay_line_capacity.restype = ctypes.c_uint
+        self.testlib.test_sos_zpk.argtypes = [ctypes.c_uint, float_pointer, float_pointer,
+                                              ctypes.c_uint, float_pointer, float_pointer, ctypes.c_float,
+                                              ctypes.c_uint, float_pointer, float_pointer]
+        self.testlib.test_sos_sections.argtypes = [ctypes.c_uint, float_pointer, float_pointer]
+        self.testlib.test_sos_sections.restype = ctypes.c_uint
         self.testlib.test_lowpass.argtypes = [ctypes.c_float, ctypes.c_float,
                                               ctypes.c_uint,
                                               float_pointer, float_pointer, ctypes.c_float]
         self.testlib.test_highpass.argtypes = [ctypes.c_float, ctypes.c_float,
                                                ctypes.c_uint,
                                                float_pointer, float_pointer, ctypes.c_float]
+        # highpass, nSettings, freqs, ress, ioLength, input, output, fs, stats
+        self.testlib.test_cached_biquad.argtypes = [ctypes.c_uint, ctypes.c_uint, float_pointer, float_pointer,
+                                                    ctypes.c_uint, float_pointer, float_pointer, ctypes.c_float,
+                                                    ctypes.POINTER(ctypes.c_uint)]
+        # b, a, bEnd, aEnd, ioLength, input, output
+        self.testlib.test_biquad_ramp.argtypes = [float_pointer, float_pointer, float_pointer, float_pointer,
+                                                  ctypes.c_uint, float_pointer, float_pointer]
 
     def run_filter(self, b: np.ndarray, a: np.ndarray, samples_in: np.ndarray, filter_type=DFI) -> np.ndarray:
         ''' Run the filter '''
@@ -46,13 +61,44 @@ class FilterInterface:
         io_length = len(samples_in)
         samples_in = np.array(samples_in, dtype=np.single)
         samples_in_p = samples_in.ctypes.data_as(p_float)
-        memory = np.empty(2*order, dtype=np.single) if filter_type in [DFI, TDFI] else np.empty(order, dtype=np.single)
+        # delay lines round their memory up to a power of 2, the second order section filter doesn't need any
+        if filter_type == DFI:
+            memory_length = 2*self.testlib.test_delay_line_capacity(order)
+        elif filter_type == DFII:
+            memory_length = self.testlib.test_delay_line_capacity(order)
+        elif filter_type == TDFI:
+            memory_length = 2*order
+        else:
+            memory_length = max(order, 1)
+        memory = np.empty(memory_length, dtype=np.single)
         memory_p = memory.ctypes.data_as(p_float)
         samples_out = np.empty(io_length, dtype=np.single)
         samples_out_p = samples_out.ctypes.data_as(p_float)
         self.testlib.test_filter(filter_type, order, memory_p, b_p, a_p, io_length, samples_in_p, samples_out_p)
         return samples_out
 
+    def run_zpk(self, zeros: np.ndarray, poles: np.ndarray, gain: float, samples_in: np.ndarray) -> np.ndarray:
+        ''' Run a second order section filter, configured from zeros/poles/gain '''
+        p_float = ctypes.POINTER(ctypes.c_float)
+        zeros = np.asarray(zeros, dtype=complex)
+        poles = np.asarray(poles, dtype=complex)
+        parts = [np.ascontiguousarray(part, dtype=np.single)
+                 for part in (zeros.real, zeros.imag, poles.real, poles.imag)]
+        samples_in = np.array(samples_in, dtype=np.single)
+        samples_out = np.empty(len(samples_in), dtype=np.single)
+        self.testlib.test_sos_zpk(len(zeros), parts[0].ctypes.data_as(p_float), parts[1].ctypes.data_as(p_float),
+                                  len(poles), parts[2].ctypes.data_as(p_float), parts[3].ctypes.data_as(p_float),
+                                  gain, len(samples_in), samples_in.ctypes.data_as(p_float),
+                                  samples_out.ctypes.data_as(p_float))
+        return samples_out
+
+    def sos_sections(self, b: np.ndarray, a: np.ndarray) -> int:
+        ''' Number of sections a second order section filter uses for b/a '''
+        p_float = ctypes.POINTER(ctypes.c_float)
+        b_p = np.array(b, dtype=np.single).ctypes.data_as(p_float)
+        a_p = np.array(a, dtype=np.single).ctypes.data_as(p_float)
+        return self.testlib.test_sos_sections(len(a) - 1, b_p, a_p)
+
     def run_lp(self, freq: float, res: float, samples_in: np.ndarray, fs: float) -> np.ndarray:
         ''' Run the biquad in lowpass configuration '''
         io_length = len(samples_in)
@@ -75,6 +121,22 @@ class FilterInterface:
         self.testlib.test_highpass(freq, res, io_length, samples_in_p, samples_out_p, fs)
         return samples_out
 
+    def run_cached(self, highpass: bool, freqs: list, ress: list, samples_in: np.ndarray, fs: float):
+        ''' Run a biquad for each frequency/resonance, sharing one coefficient cache.
+            Returns the outputs (one row per setting), and the cache hits and misses '''
+        p_float = ctypes.POINTER(ctypes.c_float)
+        io_length = len(samples_in)
+        freqs = np.array(freqs, dtype=np.single)
+        ress = np.array(ress, dtype=np.single)
+        samples_in = np.array(samples_in, dtype=np.single)
+        samples_out = np.empty((len(freqs), io_length), dtype=np.single)
+        stats = np.zeros(2, dtype=np.uintc)
+        self.testlib.test_cached_biquad(highpass, len(freqs), freqs.ctypes.data_as(p_float),
+                                        ress.ctypes.data_as(p_float), io_length,
+                                        samples_in.ctypes.data_as(p_float), samples_out.ctypes.data_as(p_float),
+                                        fs, stats.ctypes.data_as(ctypes.POINTER(ctypes.c_uint)))
+        return samples_out, stats[0], stats[1]
+
 def evaluate_f(x: np.ndarray, y: np.ndarray, f: float, fs: float) -> complex:
     ''' Calculate foureir transform at a particular frequency'''
     mod = np.exp((2j*np.pi*f/fs)*np.arange(len(x)))
@@ -123,6 +185,63 @@ class TestFilter(FilterInterface, unittest.TestCase):
                         plt.close(fig)
                     np.testing.assert_allclose(ref, out, atol=2**-23)
 
+    def test_sos_response(self):
+        ''' Check that the second order section filter matches the direct implementation of b/a '''
+        n = 128*16
+        input_sig = np.random.default_rng(1234).normal(0, 0.5, n)
+        for a, b in ([([1, 0], [1, 0]),
+                      ([1, 0], [0, 1]),
+                      ([1, 0, 0], [0, 0, 1]),
+                      ([1, 0, 0, 0], [0, 0, 0, 1]),
+                      ([1, 0.5], [1, 0]),
+                      ([1, 0, 0.5], [1, 0, 0]),
+                      ([1, 0, 0, 0.5], [1, 0, 0, 0]),
+                    ]):
+            with self.subTest(f'{a=}, {b=}'):
+                ref = sig.lfilter(b, a, input_sig)
+                out = self.run_filter(b, a, input_sig, filter_type=SOS)
+                # rounding is a little different to running the whole polynomial
+                np.testing.assert_allclose(ref, out, atol=1e-6)
+        # designed filters, up to the order where b/a are still usable in single precision
+        for order in [2, 3, 4, 6, 8]:
+            for design, args in [('butter', []), ('cheby1', [1]), ('ellip', [1, 40])]:
+                for cutoff in [0.2, 0.5]:
+                    with self.subTest(f'{design} {order=}, {cutoff=}'):
+                        b, a = getattr(sig, design)(order, *args, cutoff)
+                        b = np.array(b, dtype=np.single)
+                        a = np.array(a, dtype=np.single)
+                        ref = sig.lfilter(b, a, input_sig)
+                        out = self.run_filter(b, a, input_sig, filter_type=SOS)
+                        self.assertLess(np.linalg.norm(out - ref)/np.linalg.norm(ref), 1e-5)
+                        self.assertEqual((order + 1)//2, self.sos_sections(b, a))
+
+    def test_sos_high_order(self):
+        ''' Check that high order filters work from their zeros and poles, against scipy's sosfilt '''
+        n = 128*64
+        input_sig = np.random.default_rng(1234).normal(0, 0.5, n)
+        for order in [12, 16]:
+            for design, args in [('butter', []), ('cheby1', [1]), ('ellip', [1, 60])]:
+                for cutoff in [0.05, 0.2, 0.5]:
+                    with self.subTest(f'{design} {order=}, {cutoff=}'):
+                        zeros, poles, gain = getattr(sig, design)(order, *args, cutoff, output='zpk')
+                        # compare against the same (single precision) values
+                        zeros = zeros.astype(np.csingle)
+                        poles = poles.astype(np.csingle)
+                        gain = np.single(gain)
+                        ref = sig.sosfilt(sig.zpk2sos(zeros, poles, gain), input_sig.astype(np.single))
+                        out = self.run_zpk(zeros, poles, gain, input_sig)
+                        if self.debug:
+                            _, ax = plt.subplots()
+                            ax.plot(ref, label='reference')
+                            ax.plot(out, label='output')
+                            ax.plot(ref - out, label='error')
+                            ax.legend()
+                            ax.grid(True)
+                            ax.set_title(f'{design} {order=}, {cutoff=}')
+                            plt.show()
+                        # state is kept in single precision, so the sharpest filters are slightly less accurate
+                        self.assertLess(np.linalg.norm(out - ref)/np.linalg.norm(ref), 2e-3)
+
     def test_biquads(self):
         """ Check that the frequency response matches expected """
         N = 128*2**6
@@ -179,6 +298,94 @@ class TestFilter(FilterInterface, unittest.TestCase):
                                 if 10*f < fs:
                                     np.testing.assert_allclose(h[freqs>10*f], 0, atol=3)
 
+    def test_cached_biquads(self):
+        ''' Cached coefficients are quantised, but should be very close to calculating them directly '''
+        N = 128*2**6
+        input_sig = np.zeros(N)
+        input_sig[0] = 1
+        freqs = [100, 500, 1000, 5000, 10000, 20000]
+        ress = [-3, 0, 6, 12, 18, 24]
+        settings = [(f, res) for f in freqs for res in ress]
+        for fs in sampling_frequencies:
+            for highpass, filt in [(False, self.run_lp), (True, self.run_hp)]:
+                # everything twice, so the second time should all be hits
+                outputs, hits, misses = self.run_cached(highpass, [f for f, _ in 2*settings],
+                                                        [res for _, res in 2*settings], input_sig, fs)
+                self.assertEqual(len(settings), misses)
+                self.assertEqual(len(settings), hits)
+                for (f, res), output_sig in zip(2*settings, outputs):
+                    with self.subTest(f'{highpass=}, {f=}, {res=}, {fs=}'):
+                        reference = filt(f, res, input_sig, fs)
+                        # around the corner, further out the response is down in the rounding error
+                        for f_test in [f/2, f, min(2*f, 0.45*fs)]:
+                            cached = 20*np.log10(np.abs(evaluate_f(input_sig, output_sig, f_test, fs)))
+                            direct = 20*np.log10(np.abs(evaluate_f(input_sig, reference, f_test, fs)))
+                            self.assertAlmostEqual(cached, direct, delta=0.1)
+
+    def test_biquad_in_place(self):
+        ''' The synth filters its output in place, which should be the same as filtering into another buffer '''
+        rng = np.random.default_rng(0)
+        samples_in = rng.standard_normal(128*8).astype(np.single)
+        p_float = ctypes.POINTER(ctypes.c_float)
+        for ftype, function, filt in [('lp', self.testlib.test_lowpass, self.run_lp),
+                                      ('hp', self.testlib.test_highpass, self.run_hp)]:
+            with self.subTest(ftype):
+                reference = filt(1000, 6, samples_in, sampling_frequency)
+                samples = samples_in.copy()
+                function(1000, 6, len(samples), samples.ctypes.data_as(p_float), samples.ctypes.data_as(p_float),
+                         sampling_frequency)
+                np.testing.assert_array_equal(samples, reference)
+
+    def test_cache_eviction(self):
+        ''' The cache has a fixed size, a sweep bigger than it should still give the right coefficients '''
+        N = 128*8
+        input_sig = np.zeros(N)
+        input_sig[0] = 1
+        n_freqs = 1000
+        freqs = np.geomspace(20, 20000, n_freqs)
+        ress = np.full(n_freqs, 6)
+        # sweep up then down
+        freqs = np.concatenate([freqs, freqs[::-1]])
+        ress = np.concatenate([ress, ress])
+        outputs, hits, misses = self.run_cached(False, freqs, ress, input_sig, sampling_frequency)
+        self.assertEqual(2*n_freqs, hits + misses)
+        # neighbouring frequencies share entries, but it doesn't all fit
+        self.assertGreater(misses, 256)
+        self.assertGreater(hits, 0)
+        for f, output_sig in list(zip(freqs, outputs))[::37]:
+            with self.subTest(f'{f=}'):
+                reference = self.run_lp(f, 6, input_sig, sampling_frequency)
+                cached = 20*np.log10(np.abs(evaluate_f(input_sig, output_sig, f, sampling_frequency)))
+                direct = 20*np.log10(np.abs(evaluate_f(input_sig, reference, f, sampling_frequency)))
+                self.assertAlmostEqual(cached, direct, delta=0.1)
+
+    def test_biquad_ramp(self):
+        ''' Ramped coefficients should move in a straight line over the first block, then stay put '''
+        rng = np.random.default_rng(0)
+        samples_in = rng.standard_normal(128*4).astype(np.single)
+        p_float = ctypes.POINTER(ctypes.c_float)
+        coeffs = [sig.butter(2, 0.02), sig.butter(2, 0.4), sig.butter(2, 0.1, 'highpass')]
+        for (b, a), (b_end, a_end) in [(coeffs[0], coeffs[1]), (coeffs[1], coeffs[0]), (coeffs[0], coeffs[2])]:
+            b, a, b_end, a_end = (np.array(x, dtype=np.single) for x in (b, a, b_end, a_end))
+            out = np.zeros_like(samples_in)
+            self.testlib.test_biquad_ramp(b.ctypes.data_as(p_float), a.ctypes.data_as(p_float),
+                                          b_end.ctypes.data_as(p_float), a_end.ctypes.data_as(p_float),
+                                          len(samples_in), samples_in.ctypes.data_as(p_float),
+                                          out.ctypes.data_as(p_float))
+            # transposed direct form II, with the coefficients for each sample
+            b_k = b + np.arange(1, 129)[:, np.newaxis]*(b_end - b)/128
+            a_k = a + np.arange(1, 129)[:, np.newaxis]*(a_end - a)/128
+            b_k = np.concatenate([b_k, np.tile(b_end, (len(samples_in) - 128, 1))])
+            a_k = np.concatenate([a_k, np.tile(a_end, (len(samples_in) - 128, 1))])
+            reference = np.zeros(len(samples_in))
+            s0 = s1 = 0
+            for i, x in enumerate(samples_in):
+                y = b_k[i, 0]*x + s0
+                s0 = s1 + b_k[i, 1]*x - a_k[i, 1]*y
+                s1 = b_k[i, 2]*x - a_k[i, 2]*y
+                reference[i] = y
+            np.testing.assert_allclose(out, reference, atol=1e-5)
+
 
 def main():
     ''' For Debugging/Testing '''
@@ -186,7 +393,13 @@ def main():
     filter_test.setUp()
     filter_test.debug = True
     filter_test.test_response()
+    filter_test.test_sos_response()
+    filter_test.test_sos_high_order()
     filter_test.test_biquads()
+    filter_test.test_cached_biquads()
+    filter_test.test_cache_eviction()
+    filter_test.test_biquad_in_place()
+    filter_test.test_biquad_ramp()
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,181 @@
+''' Tests for reading Standard MIDI Files
+    copyright Maximilian Cornwell 2024 '''
+import contextlib
+import io
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+from test.constants import sampling_frequency
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+from mxcs import make_patches, MidiReader, MxcsError, read_midi, render_batch, render_to_wav
+from mxcs.__main__ import main as cli_main
+from mxcs.library import ERROR_INVALID_DATA, ERROR_UNSUPPORTED, event_dtype, PRESS_EVENT, RELEASE_EVENT
+
+
+def varlen(value: int) -> bytes:
+    ''' MIDI variable length quantity '''
+    groups = [value & 0x7F]
+    value >>= 7
+    while value:
+        groups.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(groups))
+
+
+def track(events: list) -> bytes:
+    ''' A track chunk from (delta ticks, message bytes) pairs, ended with an end of track event '''
+    data = b''.join(varlen(delta) + message for delta, message in events) + b'\x00\xff\x2f\x00'
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+
+def smf(midi_format: int, division: int, tracks: list, chunks: bytes = b'') -> bytes:
+    ''' A Standard MIDI File, extra chunks go between the header and the tracks '''
+    return b'MThd' + struct.pack('>IHHH', 6, midi_format, len(tracks), division) + chunks + b''.join(tracks)
+
+
+def tempo(microseconds: int) -> bytes:
+    ''' Set tempo meta event '''
+    return b'\xff\x51\x03' + microseconds.to_bytes(3, 'big')
+
+
+class TestMidi(unittest.TestCase):
+    ''' Tests for MidiReader and rendering MIDI files '''
+
+    def setUp(self):
+        ''' Each test writes into its own directory '''
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, data: bytes, name: str = 'score.mid') -> str:
+        ''' Write a file into the test directory '''
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+
+    def read(self, data: bytes, fs: float = sampling_frequency) -> tuple:
+        ''' All the events in a file and its end time, as tuples '''
+        events, end = read_midi(self.write(data), fs)
+        return [tuple(event) for event in events.tolist()], end
+
+    def test_tempo_map(self):
+        ''' Tempo changes in the first track apply to every track. Running status, note on with no velocity,
+            other channel messages, sysex, meta events and unknown chunks should all be handled '''
+        conductor = track([(0, tempo(500000)), (0, b'\xff\x03\x05Title'), (960, tempo(250000))])
+        notes = track([(0, b'\xc0\x05'), (0, b'\x90\x3c\x40'), (240, b'\xb0\x07\x64'), (240, b'\x90\x3c\x00'),
+                       (0, b'\xf0\x03\x7e\x09\x01'), (960, b'\x91\x3e\x7f'), (0, b'\x3f\x50'),
+                       (480, b'\xe1\x00\x40'), (0, b'\x81\x3e\x00'), (0, b'\x3f\x00'), (480, b'\xd1\x10')])
+        data = smf(1, 480, [conductor, notes], b'XFIH' + struct.pack('>I', 3) + b'abc')
+        events, end = self.read(data)
+        # 2 beats at 120 bpm, then 240 bpm
+        self.assertEqual([(0, PRESS_EVENT, 60), (22050, RELEASE_EVENT, 60),
+                          (55125, PRESS_EVENT, 62), (55125, PRESS_EVENT, 63),
+                          (66150, RELEASE_EVENT, 62), (66150, RELEASE_EVENT, 63)], events)
+        self.assertEqual(77175, end)
+        # the tempo map is in seconds, so it scales with the sampling frequency
+        self.assertEqual(([(2*time, event_type, note) for time, event_type, note in events], 2*end),
+                         self.read(data, 2*sampling_frequency))
+
+    def test_smpte(self):
+        ''' SMPTE time divisions ignore tempo events '''
+        notes = track([(0, tempo(250000)), (500, b'\x90\x40\x40'), (1000, b'\x80\x40\x40')])
+        # 25 fps, 40 ticks per frame
+        events, end = self.read(smf(0, (0x100 - 25) << 8 | 40, [notes]))
+        self.assertEqual([(22050, PRESS_EVENT, 64), (66150, RELEASE_EVENT, 64)], events)
+        self.assertEqual(66150, end)
+
+    def test_chunks(self):
+        ''' Tracks should be merged into time order (ties in track order), however many events are read at a time '''
+        rng = np.random.default_rng(0)
+        tracks = []
+        expected = []
+        for track_index in range(5):
+            deltas = rng.integers(0, 50, 2000)
+            notes = rng.integers(0, 128, 2000)
+            presses = rng.integers(0, 2, 2000)
+            tracks.append(track([(int(delta), bytes([0x90 + track_index, note, 100*press]))
+                                 for delta, note, press in zip(deltas, notes, presses)]))
+            ticks = np.cumsum(deltas)
+            expected += [(tick, track_index, i, press, note) for i, (tick, note, press)
+                         in enumerate(zip(ticks.tolist(), notes.tolist(), presses.tolist()))]
+        expected.sort()
+        # 96 ticks per quarter note at 120 bpm
+        expected = [(int(tick*sampling_frequency/192 + 0.5), press, note) for tick, _, _, press, note in expected]
+        path = self.write(smf(1, 96, tracks))
+        events, _ = read_midi(path, sampling_frequency)
+        self.assertEqual(expected, [tuple(event) for event in events.tolist()])
+        for chunk in [1, 7, 1000, 100000]:
+            with self.subTest(chunk=chunk):
+                with MidiReader(path, sampling_frequency, chunk) as reader:
+                    chunks = list(reader)
+                self.assertTrue(all(len(events) == chunk for events in chunks[:-1]))
+                np.testing.assert_array_equal(events, np.concatenate(chunks))
+
+    def test_invalid(self):
+        ''' Malformed files should raise errors rather than read out of bounds '''
+        notes = track([(0, b'\x90\x3c\x40'), (100, b'\x80\x3c\x40')])
+        for name, data, code in [('no header', b'MTrk' + bytes(10), ERROR_INVALID_DATA),
+                                 ('truncated header', smf(0, 96, [notes])[:12], ERROR_INVALID_DATA),
+                                 ('truncated track', smf(0, 96, [notes])[:-6], ERROR_INVALID_DATA),
+                                 ('no running status', smf(0, 96, [track([(0, b'\x3c\x40')])]), ERROR_INVALID_DATA),
+                                 ('truncated message', smf(0, 96, [notes[:-4] + b'\x00\x90']), ERROR_INVALID_DATA),
+                                 ('long varlen', smf(0, 96, [track([(2**28, b'\x90\x3c\x40')])]),
+                                  ERROR_INVALID_DATA),
+                                 ('zero division', smf(0, 0, [notes]), ERROR_INVALID_DATA),
+                                 ('format 3', smf(3, 96, [notes]), ERROR_UNSUPPORTED),
+                                 ('too long', smf(0, 1, [track([(2**27, tempo(2**24 - 1))]*4)]), ERROR_UNSUPPORTED)]:
+            with self.subTest(name):
+                with self.assertRaises(MxcsError) as context:
+                    self.read(data)
+                self.assertEqual(code, context.exception.code)
+        # a track without an end of track event just ends
+        data = smf(0, 96, [notes[:-4]])
+        data = data[:18] + struct.pack('>I', len(data) - 22) + data[22:]
+        self.assertEqual(([(0, PRESS_EVENT, 60), (22969, RELEASE_EVENT, 60)], 22969), self.read(data))
+        self.assertEqual(([], 0), self.read(smf(0, 96, [])))
+
+    def test_render(self):
+        ''' A file should render the same streamed as read all at once, and from the command line '''
+        rng = np.random.default_rng(1)
+        deltas = rng.integers(0, 48, 400)
+        notes = 48 + rng.integers(0, 24, 400)
+        messages = [bytes([0x90, note, 64]) for note in notes[:200]] + [bytes([0x80, note, 0]) for note in notes[:200]]
+        order = rng.permutation(400)
+        data = smf(0, 96, [track([(0, tempo(400000))] + [(int(delta), messages[i]) for delta, i in zip(deltas, order)])])
+        path = self.write(data)
+        patch = make_patches(1, generator=3, release=0.05)[0]
+        events, end = read_midi(path, sampling_frequency)
+        n_samples = end + sampling_frequency
+        reference = render_batch(patch[np.newaxis], events, n_samples, sampling_frequency).out[0]
+        out_path = os.path.join(self.directory.name, 'out.wav')
+        with MidiReader(path, sampling_frequency, 16) as reader:
+            render_to_wav(out_path, patch, reader, n_samples, sampling_frequency, 1000)
+        np.testing.assert_array_equal(reference, wav.read(out_path)[1])
+        patch_path = os.path.join(self.directory.name, 'patch.json')
+        with open(patch_path, 'w', encoding='utf-8') as file:
+            json.dump({'generator': 'sawtooth', 'release': 0.05}, file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(0, cli_main(['render', patch_path, path, out_path, '--fs', str(sampling_frequency)]))
+        np.testing.assert_array_equal(reference, wav.read(out_path)[1])
+        self.assertEqual(event_dtype, events.dtype)
+
+
+def main():
+    ''' For Debugging/Testing '''
+    midi_test = TestMidi()
+    midi_test.setUp()
+    midi_test.test_tempo_map()
+    midi_test.test_smpte()
+    midi_test.test_chunks()
+    midi_test.test_invalid()
+    midi_test.test_render()
+    midi_test.directory.cleanup()
+
+if __name__=='__main__':
+    main()
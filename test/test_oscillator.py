@@ -15,12 +15,13 @@ import scipy.signal as sig
 class OscillatorInterface:
     ''' ctypes wrapper around test shared object file'''
     freq = 0
+    block_size = block_size
     testlib = ctypes.CDLL('test.so')
 
     def setUp(self):
         ''' Load in the test object file and define the function '''
         float_pointer = ctypes.POINTER(ctypes.c_float)
-        self.testlib.test_oscillator.argtypes = [ctypes.c_float, ctypes.c_int,
+        self.testlib.test_oscillator.argtypes = [ctypes.c_float, ctypes.c_int, ctypes.c_uint,
                                                  float_pointer, float_pointer]
 
     def run_osc(self, n_samples: int) -> np.ndarray:
@@ -29,7 +30,7 @@ class OscillatorInterface:
         cos_out_p = cos_out.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
         sin_out = np.zeros(n_samples, dtype=np.single)
         sin_out_p = sin_out.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
-        self.testlib.test_oscillator(self.freq, n_samples, cos_out_p, sin_out_p)
+        self.testlib.test_oscillator(self.freq, n_samples, self.block_size, cos_out_p, sin_out_p)
         return cos_out + 1j*sin_out
 
     def set_f(self, freq: float, fs: float):
@@ -103,6 +104,20 @@ class TestOscillator(OscillatorInterface, unittest.TestCase):
         self.assertAlmostEqual(np.min(power), 1., delta=self.power_accuracy)
         self.assertAlmostEqual(np.max(power), 1., delta=self.power_accuracy)
 
+    def test_block_sizes(self):
+        ''' The amplitude should stay accurate for short and long blocks '''
+        n_samples = sampling_frequency*10
+        freq = 1000
+        self.set_f(freq, sampling_frequency)
+        for size in [13, 16, 128, 1024, 8192]:
+            with self.subTest(f'block size {size}'):
+                self.block_size = size
+                vector = self.run_osc(n_samples)[:n_samples - n_samples % size]
+                power = np.abs(vector)**2
+                self.assertAlmostEqual(np.min(power), 1., delta=self.power_accuracy)
+                self.assertAlmostEqual(np.max(power), 1., delta=self.power_accuracy)
+        self.block_size = block_size
+
 def main():
     ''' For debugging/plotting '''
     osc_test = TestOscillator()
@@ -110,6 +125,7 @@ def main():
     # osc_test.debug = True
     osc_test.test_sine_frequency()
     osc_test.test_sine_amplitude()
+    osc_test.test_block_sizes()
 
 if __name__=='__main__':
     main()
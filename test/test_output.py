@@ -0,0 +1,190 @@
+''' Tests for the PCM output stage
+    copyright Maximilian Cornwell 2024 '''
+import contextlib
+import ctypes
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from test.constants import block_size, sampling_frequency
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+from mxcs import Engine, make_patches, MxcsError, Parameter, pcm_buffer, render_to_wav, SampleFormat
+from mxcs.__main__ import main as cli_main
+from mxcs.engine import sample_bytes
+from mxcs.library import event_dtype, PRESS_EVENT, RELEASE_EVENT
+
+
+dither_seed = 2463534242    # matches ditherSeed
+full_scales = {SampleFormat.INT16: 2**15, SampleFormat.INT24: 2**23, SampleFormat.INT32: 2**31}
+
+
+def unpack(samples: np.ndarray, sample_format: SampleFormat) -> np.ndarray:
+    ''' Values of samples, unpacking packed 24 bit samples '''
+    if sample_format == SampleFormat.INT24:
+        samples = samples.reshape(-1, 3).astype(np.int32)
+        return (samples[:, 0] | samples[:, 1] << 8 | samples[:, 2] << 16) << 8 >> 8
+    if sample_format == SampleFormat.FLOAT32:
+        return samples
+    return samples.astype(np.int64)
+
+
+def tpdf(n: int) -> np.ndarray:
+    ''' The dither the output stage adds, in LSBs '''
+    state = dither_seed
+    dither = np.zeros(n, dtype=np.single)
+    for i in range(n):
+        state ^= (state << 13) & 0xFFFFFFFF
+        state ^= state >> 17
+        state ^= (state << 5) & 0xFFFFFFFF
+        dither[i] = (np.single(state & 0xFFFF) + np.single(state >> 16) - np.single(65535))*np.single(2**-16)
+    return dither
+
+
+def quantise(samples: np.ndarray, sample_format: SampleFormat, dither: np.ndarray = None) -> np.ndarray:
+    ''' Reference conversion, rounding to nearest even and clipping '''
+    scale = full_scales[sample_format]
+    if sample_format == SampleFormat.INT32:
+        values = samples.astype(np.double)*scale
+    else:
+        values = samples*np.single(scale) + (0 if dither is None else dither)
+    return np.rint(np.clip(values, -scale, scale - 1)).astype(np.int64)
+
+
+class OutputInterface:
+    ''' Interface to the PCM output test function '''
+    testlib = ctypes.CDLL('test.so')
+
+    def setUp(self):
+        ''' Define the function '''
+        self.testlib.test_pcm_output.argtypes = [ctypes.POINTER(ctypes.c_float), ctypes.c_void_p,
+                                                 ctypes.c_uint, ctypes.c_uint, ctypes.c_bool]
+
+    def convert(self, samples: np.ndarray, sample_format: SampleFormat, dither: bool) -> np.ndarray:
+        ''' Convert float samples with a new output stage, returns the values '''
+        samples = np.ascontiguousarray(samples, dtype=np.single)
+        out = pcm_buffer(len(samples), sample_format)
+        self.testlib.test_pcm_output(samples.ctypes.data_as(ctypes.POINTER(ctypes.c_float)), out.ctypes.data,
+                                     len(samples), sample_format, dither)
+        return unpack(out, sample_format)
+
+
+class TestOutput(OutputInterface, unittest.TestCase):
+    ''' Tests for PcmOutput_t, and rendering straight to integer samples '''
+
+    def test_conversion(self):
+        ''' Without dither, samples should be rounded to the nearest step and clipped to full scale '''
+        rng = np.random.default_rng(0)
+        samples = np.concatenate([rng.uniform(-1.2, 1.2, 5000), [-2, -1, -0.5, 0, 0.5, 1 - 2**-24, 1, 2]])
+        samples = samples.astype(np.single)
+        for sample_format in full_scales:
+            with self.subTest(sample_format.name):
+                np.testing.assert_array_equal(quantise(samples, sample_format),
+                                              self.convert(samples, sample_format, False))
+        np.testing.assert_array_equal(samples, self.convert(samples, SampleFormat.FLOAT32, False))
+
+    def test_dither(self):
+        ''' 16 and 24 bit samples get triangular dither of +/-1 LSB, 32 bit samples aren't dithered '''
+        rng = np.random.default_rng(1)
+        samples = rng.uniform(-0.5, 0.5, 20000).astype(np.single)
+        dither = tpdf(len(samples))
+        self.assertAlmostEqual(np.mean(dither), 0, delta=0.01)
+        self.assertAlmostEqual(np.var(dither), 1/6, delta=0.01)
+        self.assertLess(np.abs(dither).max(), 1)
+        for sample_format in [SampleFormat.INT16, SampleFormat.INT24]:
+            with self.subTest(sample_format.name):
+                out = self.convert(samples, sample_format, True)
+                np.testing.assert_array_equal(quantise(samples, sample_format, dither), out)
+                # the total error is the rounding plus the dither
+                error = out - samples.astype(np.double)*full_scales[sample_format]
+                self.assertAlmostEqual(np.mean(error), 0, delta=0.01)
+                self.assertAlmostEqual(np.var(error), 1/4, delta=0.01)
+        np.testing.assert_array_equal(quantise(samples, SampleFormat.INT32),
+                                      self.convert(samples, SampleFormat.INT32, True))
+        # a signal below an LSB is lost when it's just rounded, but survives in the noise with dither
+        quiet = (0.4*np.sin(2*np.pi*np.arange(20000)/50)/2**15).astype(np.single)
+        self.assertFalse(np.any(self.convert(quiet, SampleFormat.INT16, False)))
+        correlation = np.mean(self.convert(quiet, SampleFormat.INT16, True)*np.sin(2*np.pi*np.arange(20000)/50))
+        self.assertAlmostEqual(correlation, 0.2, delta=0.02)
+
+    def test_engine(self):
+        ''' Rendering to integers should be the same as rendering to float then converting '''
+        patch = make_patches(1, generator=3, release=0.05, lpf_freq=5000)[0]
+        for dither in [False, True]:
+            for sample_format in full_scales:
+                with self.subTest(sample_format.name, dither=dither), \
+                     Engine(sampling_frequency) as engine, Engine(sampling_frequency) as reference:
+                    for synth in [engine, reference]:
+                        synth.apply_patch(patch)
+                        synth.set(Parameter.DITHER, dither)
+                        synth.press(60)
+                    out = engine.render_blocks(50, sample_format)
+                    self.assertEqual((50*block_size, 3) if sample_format == SampleFormat.INT24 else (50*block_size,),
+                                     out.shape)
+                    expected = reference.render_blocks(50)
+                    dither_lsb = tpdf(len(expected)) if dither and sample_format != SampleFormat.INT32 else None
+                    np.testing.assert_array_equal(quantise(expected, sample_format, dither_lsb),
+                                                  unpack(out, sample_format))
+        with Engine(sampling_frequency) as engine:
+            with self.assertRaises(TypeError):
+                engine.render_pcm(np.zeros(block_size, dtype=np.int32), SampleFormat.INT16)
+            with self.assertRaises(ValueError):
+                engine.render_pcm(np.zeros(block_size + 1, dtype=np.int16), SampleFormat.INT16)
+            with self.assertRaises(ValueError):
+                engine.render_pcm(np.zeros(3*block_size + 1, dtype=np.uint8), SampleFormat.INT24)
+            with self.assertRaises(MxcsError):
+                engine.set(Parameter.DITHER, 2)
+
+    def test_wav(self):
+        ''' Integer WAV files should hold exactly what the engine renders, from Python and the command line '''
+        patch = make_patches(1, generator=5, release=0.05)[0]
+        events = np.array([(0, PRESS_EVENT, 60), (3000, RELEASE_EVENT, 60)], dtype=event_dtype)
+        n_samples = 10000
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.wav')
+            score_path = os.path.join(directory, 'score.json')
+            patch_path = os.path.join(directory, 'patch.json')
+            with open(score_path, 'w', encoding='utf-8') as file:
+                json.dump({'events': [[0, 'press', 60], [3000/sampling_frequency, 'release', 60]],
+                           'duration': n_samples/sampling_frequency}, file)
+            with open(patch_path, 'w', encoding='utf-8') as file:
+                json.dump({'generator': 'triangle', 'release': 0.05}, file)
+            for sample_format in full_scales:
+                with self.subTest(sample_format.name):
+                    with Engine(sampling_frequency) as engine:
+                        engine.apply_patch(patch)
+                        engine.schedule(events)
+                        expected = unpack(engine.render_blocks(80, sample_format), sample_format)[:n_samples]
+                    render_to_wav(path, patch, events, n_samples, sampling_frequency, 1000, sample_format)
+                    fs, samples = wav.read(path)
+                    self.assertEqual(sampling_frequency, fs)
+                    # scipy puts 24 bit samples in the top of 32 bits
+                    if sample_format == SampleFormat.INT24:
+                        samples = samples >> 8
+                    np.testing.assert_array_equal(expected, samples)
+                    # RIFF, JUNK, fmt and data, without a fact chunk
+                    self.assertEqual(12 + 36 + 24 + 8 + n_samples*sample_bytes[sample_format], os.path.getsize(path))
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        self.assertEqual(0, cli_main(['render', patch_path, score_path, path, '--chunk', '1000',
+                                                      '--fs', str(sampling_frequency),
+                                                      '--format', sample_format.name.lower()]))
+                    samples = wav.read(path)[1]
+                    np.testing.assert_array_equal(expected, samples >> 8 if sample_format == SampleFormat.INT24
+                                                  else samples)
+
+
+def main():
+    ''' For Debugging/Testing '''
+    output_test = TestOutput()
+    output_test.setUp()
+    output_test.test_conversion()
+    output_test.test_dither()
+    output_test.test_engine()
+    output_test.test_wav()
+
+if __name__=='__main__':
+    main()
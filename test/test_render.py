@@ -0,0 +1,145 @@
+''' Tests for streaming renders into WAV files
+    copyright Maximilian Cornwell 2024 '''
+import contextlib
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from test.constants import block_size, sampling_frequency
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+from mxcs import Generator, make_events, make_patches, render_batch, render_to_wav, WavWriter
+from mxcs.__main__ import main as cli_main
+
+
+class TestRender(unittest.TestCase):
+    ''' Tests for render_to_wav and python -m mxcs render '''
+    patch = make_patches(1, generator=Generator.SAWTOOTH, attack=0.01, decay=0.05, sustain=-6, release=0.05,
+                         mod_depth=0.5, mod_freq=2)[0]
+
+    def setUp(self):
+        ''' Each test writes into its own directory '''
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name: str) -> str:
+        ''' A file in the test directory '''
+        return os.path.join(self.directory.name, name)
+
+    def render(self, events: np.ndarray, n_samples: int, **kwargs) -> np.ndarray:
+        ''' Render into a WAV file and read it back '''
+        stats = render_to_wav(self.path('out.wav'), self.patch, events, n_samples, sampling_frequency, **kwargs)
+        self.assertEqual(n_samples, stats.samples)
+        self.assertGreater(stats.realtime_factor, 0)
+        fs, out = wav.read(self.path('out.wav'))
+        self.assertEqual(sampling_frequency, fs)
+        self.assertEqual(np.float32, out.dtype)
+        return out
+
+    def test_matches_batch(self):
+        ''' Streaming should give the same output as rendering everything at once, whatever the chunk size '''
+        n_samples = 300*block_size + 17
+        events = make_events([0, 1000, 5000], [60, 64, 67], [20000, 30000, 35000], [60, 64, 67])
+        reference = render_batch(self.patch[np.newaxis], events, n_samples, sampling_frequency).out[0]
+        for chunk in [1, 1000, 2**16, 2**20]:
+            with self.subTest(chunk=chunk):
+                np.testing.assert_array_equal(reference, self.render(events, n_samples, chunk=chunk))
+
+    def test_many_events(self):
+        ''' Chunks with more events than the engine can queue should be split up '''
+        n_samples = 2*sampling_frequency
+        times = np.arange(0, n_samples, 16)
+        notes = 40 + (times//16) % 48
+        events = make_events(times, notes, times + 8, notes)
+        reference = render_batch(self.patch[np.newaxis], events, n_samples, sampling_frequency).out[0]
+        np.testing.assert_array_equal(reference, self.render(events, n_samples))
+
+    def test_crowded_block(self):
+        ''' Blocks with more events than the engine can queue should be scheduled a queue full at a time '''
+        n_samples = 100*block_size
+        # 1100 events in the first block, half on its first sample
+        notes = 30 + np.arange(1100) % 60
+        events = make_events(np.repeat([0, 10], 550), notes, np.full(1100, 5000), notes)
+        self.assertEqual(1100, np.sum(events['time'] < block_size))
+        reference = render_batch(self.patch[np.newaxis], events, n_samples, sampling_frequency).out[0]
+        self.assertGreater(np.max(np.abs(reference)), 0.1)
+        for chunk in [1, 2**16]:
+            with self.subTest(chunk=chunk):
+                np.testing.assert_array_equal(reference, self.render(events, n_samples, chunk=chunk))
+
+    def test_rf64(self):
+        ''' Files too big for RIFF should be written as RF64 '''
+        samples = np.random.default_rng(0).standard_normal(10000).astype(np.single)
+        for max_riff_size, header in [(2**32 - 1, b'RIFF'), (1000, b'RF64')]:
+            with self.subTest(header):
+                with WavWriter(self.path('out.wav'), sampling_frequency) as writer:
+                    writer.max_riff_size = max_riff_size
+                    writer.write(samples[:3000])
+                    writer.write(samples[3000:])
+                with open(self.path('out.wav'), 'rb') as file:
+                    self.assertEqual(header, file.read(4))
+                fs, out = wav.read(self.path('out.wav'))
+                self.assertEqual(sampling_frequency, fs)
+                np.testing.assert_array_equal(samples, out)
+
+    def test_memory(self):
+        ''' Memory use shouldn't grow with the duration '''
+        def peak_memory(seconds: int) -> int:
+            n_samples = seconds*sampling_frequency
+            times = np.arange(0, n_samples, sampling_frequency//4)
+            events = make_events(times, 60 + times % 12, times + 1000, 60 + times % 12)
+            tracemalloc.start()
+            render_to_wav(self.path('out.wav'), self.patch, events, n_samples, sampling_frequency)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+        short = peak_memory(2)
+        long = peak_memory(30)
+        # only the events should take more space
+        self.assertLess(long - short, 2**16)
+
+    def test_cli(self):
+        ''' python -m mxcs render, with the duration from the score, the command line or the last event '''
+        with open(self.path('patch.json'), 'w', encoding='utf-8') as file:
+            json.dump({'generator': 'sawtooth', 'attack': 0.01, 'decay': 0.05, 'sustain': -6, 'release': 0.05,
+                       'mod_depth': 0.5, 'mod_freq': 2}, file)
+        score = {'events': [[0.5, 'press', 64], [0, 'press', 60], [1, 'release', 60], [1.5, 'release', 64]]}
+        for duration, args, expected in [(2, [], 2), (2, ['--duration', '0.5'], 0.5), (None, ['--tail', '0.25'], 1.75)]:
+            with self.subTest(args=args):
+                with open(self.path('score.json'), 'w', encoding='utf-8') as file:
+                    json.dump(score | ({'duration': duration} if duration else {}), file)
+                with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                    status = cli_main(['render', self.path('patch.json'), self.path('score.json'),
+                                       self.path('out.wav'), '--fs', str(sampling_frequency)] + args)
+                self.assertEqual(0, status)
+                self.assertIn('x real time', stdout.getvalue())
+                n_samples = round(expected*sampling_frequency)
+                events = make_events([0, 0.5*sampling_frequency], [60, 64],
+                                     [sampling_frequency, 1.5*sampling_frequency], [60, 64])
+                reference = render_batch(self.patch[np.newaxis], events, n_samples, sampling_frequency).out[0]
+                np.testing.assert_array_equal(reference, wav.read(self.path('out.wav'))[1])
+        with open(self.path('patch.json'), 'w', encoding='utf-8') as file:
+            json.dump({'cutoff': 1000}, file)
+        with self.assertRaises(ValueError):
+            cli_main(['render', self.path('patch.json'), self.path('score.json'), self.path('out.wav')])
+
+
+def main():
+    ''' For Debugging/Testing '''
+    render_test = TestRender()
+    render_test.setUp()
+    render_test.test_matches_batch()
+    render_test.test_many_events()
+    render_test.test_crowded_block()
+    render_test.test_rf64()
+    render_test.test_memory()
+    render_test.test_cli()
+    render_test.directory.cleanup()
+
+if __name__=='__main__':
+    main()
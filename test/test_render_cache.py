@@ -0,0 +1,175 @@
+''' Tests for the render cache
+    copyright Maximilian Cornwell 2024 '''
+import unittest
+
+from test.constants import block_size, sampling_frequency
+
+import numpy as np
+
+from mxcs import Engine, make_patches, Parameter
+from mxcs.library import event_dtype, PRESS_EVENT, RELEASE_EVENT
+
+
+class TestRenderCache(unittest.TestCase):
+    ''' Tests for caching the output of repeated notes '''
+    period = 8192   # samples between notes, long enough for each one to finish
+    patch = make_patches(1, generator=1, attack=0.005, decay=0.05, sustain=-6, release=0.05)[0]
+
+    def score(self, notes: list) -> np.ndarray:
+        ''' Events for (note, gate) pairs, one every period samples '''
+        events = []
+        for i, (note, gate) in enumerate(notes):
+            events += [(i*self.period + 100, PRESS_EVENT, note), (i*self.period + 100 + gate, RELEASE_EVENT, note)]
+        return np.array(events, dtype=event_dtype)
+
+    def render(self, notes: list, budget: int, **settings) -> tuple:
+        ''' Each note's period of the output, and the cache statistics '''
+        with Engine(sampling_frequency) as engine:
+            engine.apply_patch(self.patch)
+            engine.configure(**settings)
+            engine.set_render_cache(budget)
+            engine.schedule(self.score(notes))
+            out = engine.render_blocks(len(notes)*self.period//block_size)
+            return out.reshape(len(notes), self.period), engine.render_cache_stats()
+
+    def test_hits(self):
+        ''' Repeats of a note should play back the first one '''
+        notes = [(60, 3000)]*10
+        out, stats = self.render(notes, 10**7)
+        self.assertEqual({'hits': 9, 'misses': 1, 'bypasses': 0, 'evictions': 0, 'entries': 1},
+                         {name: value for name, value in stats.items() if name != 'bytes'})
+        # the note, and an envelope amplitude for every 128 samples of it
+        self.assertGreater(stats['bytes'], 4*3000)
+        self.assertLess(stats['bytes'], 4*self.period)
+        # after the first, the filters have the same (silent) state at the start of each
+        for i in range(2, len(notes)):
+            np.testing.assert_array_equal(out[1], out[i])
+        np.testing.assert_allclose(out[0], out[1], rtol=0, atol=1e-6)
+        # rendering the first one is no different
+        uncached, stats = self.render(notes, 0)
+        self.assertEqual(0, sum(stats.values()))
+        np.testing.assert_array_equal(uncached[0], out[0])
+        # rendered every time, the oscillator starts from a different phase
+        self.assertGreater(np.abs(uncached[1] - uncached[0]).max(), 0.1)
+
+    def test_keys(self):
+        ''' A note repeated with a different gate, note or generator is a different entry '''
+        notes = [(60, 3000), (60, 2000), (62, 3000), (60, 3000), (62, 3000), (60, 2000)]
+        out, stats = self.render(notes, 10**7)
+        self.assertEqual((3, 3, 3), (stats['hits'], stats['misses'], stats['entries']))
+        # the filters are still ringing a little from the note before
+        np.testing.assert_allclose(out[0], out[3], rtol=0, atol=1e-4)
+        np.testing.assert_allclose(out[2], out[4], rtol=0, atol=1e-4)
+        np.testing.assert_allclose(out[1], out[5], rtol=0, atol=1e-4)
+        for generator in range(7):
+            with self.subTest(generator=generator):
+                _, stats = self.render([(60, 3000)]*3, 10**7, generator=generator)
+                self.assertEqual((2, 1), (stats['hits'], stats['misses']))
+        # the same note with a different envelope
+        with Engine(sampling_frequency) as engine:
+            engine.apply_patch(self.patch)
+            engine.set_render_cache(10**7)
+            engine.schedule(self.score([(60, 3000)]*4))
+            engine.render_blocks(2*self.period//block_size)
+            engine.set(Parameter.RELEASE, 0.02)
+            engine.render_blocks(2*self.period//block_size)
+            stats = engine.render_cache_stats()
+            self.assertEqual((2, 2, 2), (stats['hits'], stats['misses'], stats['entries']))
+
+    def test_bypass(self):
+        ''' Notes without a scheduled release, or that can't start from an idle voice, aren't cached '''
+        with Engine(sampling_frequency, voices=1) as engine:
+            engine.apply_patch(self.patch)
+            engine.set_render_cache(10**7)
+            for _ in range(3):
+                engine.press(60)
+                engine.render_blocks(20)
+                engine.release(60)
+                engine.render_blocks(40)
+            stats = engine.render_cache_stats()
+            self.assertEqual((0, 0, 3), (stats['hits'], stats['misses'], stats['bypasses']))
+            # the release comes later than the press is applied
+            engine.schedule_press(60, engine.time)
+            engine.render_blocks(20)
+            engine.schedule_release(60, engine.time)
+            engine.render_blocks(40)
+            # stolen from another note
+            time = engine.time
+            engine.schedule(np.array([(time, PRESS_EVENT, 60), (time + 1000, PRESS_EVENT, 64),
+                                      (time + 2000, RELEASE_EVENT, 64)], dtype=event_dtype))
+            engine.render_blocks(60)
+            stats = engine.render_cache_stats()
+            self.assertEqual((0, 0, 6, 0), (stats['hits'], stats['misses'], stats['bypasses'], stats['entries']))
+        # longer than the whole budget
+        _, stats = self.render([(60, 3000)]*2, 3000*4 - 1)
+        self.assertEqual((0, 0, 2), (stats['hits'], stats['misses'], stats['bypasses']))
+
+    def test_changes(self):
+        ''' A note whose settings change while it's recorded isn't kept '''
+        with Engine(sampling_frequency) as engine:
+            engine.apply_patch(self.patch)
+            engine.set_render_cache(10**7)
+            engine.schedule(self.score([(60, 3000)]*2))
+            engine.render_blocks(10)
+            engine.set(Parameter.GENERATOR, 1)
+            engine.render_blocks(2*self.period//block_size - 10)
+            stats = engine.render_cache_stats()
+            self.assertEqual((0, 2, 1), (stats['hits'], stats['misses'], stats['entries']))
+
+    def test_budget(self):
+        ''' The least recently used notes are evicted to stay within the budget '''
+        _, stats = self.render([(60, 3000)], 10**7)
+        size = stats['bytes']
+        # room for two notes, three take turns
+        notes = [(60, 3000), (62, 3000), (64, 3000)]*3
+        _, stats = self.render(notes, 2*size + size//2)
+        self.assertEqual((0, 9, 7, 2), (stats['hits'], stats['misses'], stats['evictions'], stats['entries']))
+        self.assertLessEqual(stats['bytes'], 2*size + size//2)
+        # two take turns, with the third now and then
+        notes = [(60, 3000), (62, 3000)]*3 + [(64, 3000), (62, 3000), (64, 3000), (60, 3000)]
+        _, stats = self.render(notes, 2*size + size//2)
+        self.assertEqual((6, 4, 2, 2), (stats['hits'], stats['misses'], stats['evictions'], stats['entries']))
+        # turned off, everything goes
+        with Engine(sampling_frequency) as engine:
+            engine.apply_patch(self.patch)
+            engine.set_render_cache(10**7)
+            engine.schedule(self.score([(60, 3000), (62, 3000)]))
+            engine.render_blocks(2*self.period//block_size)
+            self.assertEqual(2, engine.render_cache_stats()['entries'])
+            engine.set_render_cache(0)
+            stats = engine.render_cache_stats()
+            self.assertEqual((0, 0, 2), (stats['entries'], stats['bytes'], stats['evictions']))
+
+    def test_retrigger(self):
+        ''' A cached note pressed again while it's playing is left to finish, the new press gets another voice '''
+        # a third press during the release of the second, which is played from the cache
+        events = np.concatenate([self.score([(60, 3000), (60, 3000)]),
+                                 np.array([(self.period + 3400, PRESS_EVENT, 60),
+                                           (self.period + 6000, RELEASE_EVENT, 60)], dtype=event_dtype)])
+        with Engine(sampling_frequency) as engine, Engine(sampling_frequency) as reference:
+            for synth in [engine, reference]:
+                synth.apply_patch(self.patch)
+                synth.set_render_cache(10**7)
+            engine.schedule(events)
+            reference.schedule(self.score([(60, 3000), (60, 3000)]))
+            out = engine.render_blocks(3*self.period//block_size)
+            expected = reference.render_blocks(3*self.period//block_size)
+            # the same up to the third press, then both notes sound
+            np.testing.assert_array_equal(expected[:self.period + 3400], out[:self.period + 3400])
+            self.assertGreater(np.abs(out - expected)[self.period + 3400:].max(), 0.1)
+            stats = engine.render_cache_stats()
+            self.assertEqual((1, 2, 2), (stats['hits'], stats['misses'], stats['entries']))
+
+
+def main():
+    ''' For Debugging/Testing '''
+    render_cache_test = TestRenderCache()
+    render_cache_test.test_hits()
+    render_cache_test.test_keys()
+    render_cache_test.test_bypass()
+    render_cache_test.test_changes()
+    render_cache_test.test_budget()
+    render_cache_test.test_retrigger()
+
+if __name__=='__main__':
+    main()
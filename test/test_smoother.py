@@ -0,0 +1,143 @@
+''' Tests for parameter smoothing
+    copyright Maximilian Cornwell 2024 '''
+import ctypes
+import unittest
+
+from test.constants import block_size, sampling_frequency, sampling_frequencies
+
+import numpy as np
+
+from mxcs import Engine, make_patches, MxcsError, Parameter
+
+
+class SmootherInterface:
+    ''' Interface to the smoother test function '''
+    testlib = ctypes.CDLL('test.so')
+
+    def setUp(self):
+        ''' Define the function '''
+        # start, target, time, threshold, fs, blockSize, n, out
+        self.testlib.test_smoother.argtypes = [ctypes.c_float, ctypes.c_float, ctypes.c_float, ctypes.c_float,
+                                               ctypes.c_float, ctypes.c_uint, ctypes.c_uint,
+                                               ctypes.POINTER(ctypes.c_float)]
+
+    def run_smoother(self, start: float, target: float, time: float, threshold: float,
+                     fs: float, size: int, n: int) -> np.ndarray:
+        ''' Value at the end of each of n blocks '''
+        out = np.zeros(n, dtype=np.single)
+        self.testlib.test_smoother(start, target, time, threshold, fs, size, n,
+                                   out.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
+        return out
+
+
+class TestSmoother(SmootherInterface, unittest.TestCase):
+    ''' Tests for Smoother_t and smoothing in the engine '''
+    settings = {'attack': 0.001, 'decay': 0.01, 'sustain': 0, 'mod_freq': 3}
+    # continuous parameters, changed from the first value to the second
+    changes = [('mod_depth', 0, 0.8), ('mod_freq', 3, 20), ('sustain', 0, -20), ('lpf_freq', 20000, 150),
+               ('lpf_res', -3, 12), ('hpf_freq', 20, 2000), ('hpf_res', -3, 12)]
+
+    def test_smoother(self):
+        ''' The value should close in on the target exponentially with the time constant, then settle on it exactly '''
+        for fs in sampling_frequencies:
+            for size in [1, block_size, 1000]:
+                for time in [0.001, 0.01, 0.1]:
+                    with self.subTest(fs=fs, size=size, time=time):
+                        n = int(5*time*fs/size) + 10
+                        out = self.run_smoother(10, 2, time, 1e-3, fs, size, n)
+                        expected = 2 + 8*np.exp(-np.arange(1, n + 1)*size/(time*fs))
+                        settled = np.abs(expected - 2) <= 1e-3
+                        np.testing.assert_allclose(out[~settled], expected[~settled], rtol=1e-4)
+                        self.assertTrue(np.all(out[settled] == 2))
+                        self.assertTrue(np.all(np.diff(out) <= 0))
+        # no smoothing jumps straight there
+        np.testing.assert_array_equal(self.run_smoother(10, 2, 0, 1e-3, sampling_frequency, block_size, 3), 2)
+
+    def render_change(self, name: str, before: float, after: float, smoothing: float,
+                      blocks: int = 200) -> np.ndarray:
+        ''' A held note with a parameter changed between blocks 40 and 41 '''
+        settings = self.settings.copy()
+        settings[name] = before
+        with Engine(sampling_frequency) as engine:
+            engine.configure(**settings)
+            engine.set(Parameter.SMOOTHING, smoothing)
+            engine.press(45)
+            out = engine.render_blocks(40)
+            engine.set(Parameter[name.upper()], after)
+            return np.concatenate([out, engine.render_blocks(blocks)])
+
+    def test_clicks(self):
+        ''' A sudden change to a continuous parameter shouldn't make a step in the output, with smoothing on '''
+        for name, before, after in self.changes:
+            with self.subTest(name):
+                steps = np.abs(np.diff(self.render_change(name, before, after, 0.01)))
+                # the largest step in the sine before the change
+                steady = steps[20*block_size:40*block_size].max()
+                self.assertLess(steps[40*block_size - 1:].max(), 1.4*steady)
+                if name in ['mod_depth', 'lpf_freq', 'lpf_res', 'hpf_freq']:
+                    steps = np.abs(np.diff(self.render_change(name, before, after, 0)))
+                    self.assertGreater(steps[40*block_size - 1:].max(), 10*steady)
+
+    def test_settles(self):
+        ''' Once it has settled, the engine should sound the same as if the change had been made directly '''
+        for name, before, after in self.changes:
+            with self.subTest(name):
+                smoothed = self.render_change(name, before, after, 0.01, 600)
+                direct = self.render_change(name, before, after, 0, 600)
+                # the oscillator has moved on by a different amount
+                # (give or take rounding, which the high pass filter amplifies)
+                if name != 'mod_freq':
+                    np.testing.assert_allclose(smoothed[-100*block_size:], direct[-100*block_size:], atol=2e-3)
+        # turning smoothing off part way through a glide jumps to the target
+        with Engine(sampling_frequency) as smoothed, Engine(sampling_frequency) as direct:
+            for engine in [smoothed, direct]:
+                engine.configure(**self.settings)
+                engine.press(45)
+                engine.render_blocks(10)
+            smoothed.set(Parameter.SMOOTHING, 1)
+            for engine in [smoothed, direct]:
+                engine.configure(lpf_freq=300, hpf_res=6, sustain=-6)
+            smoothed.render_blocks(10)
+            direct.render_blocks(10)
+            smoothed.set(Parameter.SMOOTHING, 0)
+            np.testing.assert_allclose(smoothed.render_blocks(500)[-100*block_size:],
+                                       direct.render_blocks(500)[-100*block_size:], atol=2e-3)
+
+    def test_patches(self):
+        ''' Patches glide too, posted or applied directly '''
+        patches = make_patches(2, lpf_freq=[500, 4000], lpf_res=[0, 6], hpf_freq=[30, 200],
+                               sustain=[-3, -12], mod_depth=[0.2, 0.6], mod_freq=[2, 5])
+        with Engine(sampling_frequency) as posted, Engine(sampling_frequency) as applied:
+            for engine in [posted, applied]:
+                engine.apply_patch(patches[0])
+                engine.set(Parameter.SMOOTHING, 0.05)
+                engine.press(60)
+                steady = np.abs(np.diff(engine.render_blocks(50)[-20*block_size:])).max()
+            posted.post_patch(patches[1])
+            applied.apply_patch(patches[1])
+            out = applied.render_blocks(100)
+            np.testing.assert_array_equal(out, posted.render_blocks(100))
+            self.assertLess(np.abs(np.diff(out)).max(), 1.4*steady)
+
+    def test_errors(self):
+        ''' The time constant can't be negative '''
+        with Engine(sampling_frequency) as engine:
+            for value in [-1, np.nan]:
+                with self.assertRaises(MxcsError):
+                    engine.set(Parameter.SMOOTHING, value)
+                with self.assertRaises(MxcsError):
+                    engine.post_set(Parameter.SMOOTHING, value)
+
+
+def main():
+    ''' For Debugging/Testing '''
+    smoother_test = TestSmoother()
+    smoother_test.setUp()
+    smoother_test.test_smoother()
+    smoother_test.test_clicks()
+    smoother_test.test_settles()
+    smoother_test.test_patches()
+    smoother_test.test_errors()
+
+if __name__=='__main__':
+    main()
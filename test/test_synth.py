@@ -16,6 +16,7 @@ class SynthInterface(VoiceInterface):
     ''' Interface for the synth '''
     mod_depth = 0
     mod_freq = 0
+    voices = 16
 
     def setUp(self):
         ''' Load in the test object file and define the function '''
@@ -26,14 +27,14 @@ class SynthInterface(VoiceInterface):
         # a, d,
         # s, r,
         # modDepth, modFreq,
-        # generator, fs
+        # generator, voices, fs
         # presses, pressNs, pressNotes,
         # releases, releaseNs, releaseNotes,
         # n, envOut
         self.testlib.test_synth.argtypes = [ctypes.c_float, ctypes.c_float,
                                                 ctypes.c_float, ctypes.c_float,
                                                 ctypes.c_float, ctypes.c_float,
-                                                ctypes.c_uint, ctypes.c_float,
+                                                ctypes.c_uint, ctypes.c_uint, ctypes.c_float,
                                                 ctypes.c_uint, uint_pointer, uint8_pointer,
                                                 ctypes.c_uint, uint_pointer, uint8_pointer,
                                                 ctypes.c_uint, float_pointer]
@@ -52,7 +53,7 @@ class SynthInterface(VoiceInterface):
         self.testlib.test_synth(self.attack_seconds, self.decay_seconds,
                                     self.sustain, self.release_seconds,
                                     self.mod_depth, self.mod_freq,
-                                    generators[self.generator], fs,
+                                    generators[self.generator], self.voices, fs,
                                     len(presses), presses_p, p_notes_p,
                                     len(releases), releases_p, r_notes_p,
                                     len(out), out_p)
@@ -123,6 +124,60 @@ class TestSynth(SynthInterface, TestVoice, TestModulator):
             # check the frequency is within half a cent of the desired note
             self.assertLess(np.max(np.abs(error_cents)), 0.5)
 
+    def find_notes(self, vector: np.ndarray, fs: float) -> list:
+        ''' Find the MIDI notes present in vector '''
+        f_vector = 20*np.log10(np.abs(np.fft.rfft(vector*sig.windows.hann(len(vector)))))
+        freqs = np.fft.rfftfreq(len(vector), 1/fs)
+        peaks, _ = sig.find_peaks(f_vector, height=np.max(f_vector)-20)
+        if self.debug:
+            _, ax1 = plt.subplots()
+            ax1.plot(freqs, f_vector)
+            ax1.scatter(freqs[peaks], f_vector[peaks], label='Peaks')
+            ax1.grid(True)
+            ax1.set_xlabel('Frequency (Hz)')
+            ax1.set_ylabel('Magnitude (dB)')
+            plt.show()
+        return [int(round(69 + 12*np.log2(f/440))) for f in freqs[peaks]]
+
+    def test_polyphony(self):
+        ''' Check that every note of a chord is played '''
+        fs = 44100
+        n_samples = 2**15
+        self.generator = 'sine'
+        self.set_adsr(0.001, 0.01, 0, 0.01, fs)
+        for chord in [[60], [60, 64, 67], [48, 55, 60, 64, 67, 72, 76, 79]]:
+            with self.subTest(f'{chord}'):
+                vector = self.run_synth(len(chord)*[0], chord, [], [], n_samples, fs)
+                self.assertEqual(chord, self.find_notes(vector, fs))
+
+    def test_voice_stealing(self):
+        ''' Check that the oldest note is stolen once all voices are in use '''
+        fs = 44100
+        n_samples = 2**16
+        self.generator = 'sine'
+        self.voices = 2
+        self.set_adsr(0.001, 0.01, 0, 0.01, fs)
+        presses = [0, 1000, 2000]
+        notes = [60, 64, 67]
+        vector = self.run_synth(presses, notes, [], [], n_samples, fs)
+        self.assertEqual([64, 67], self.find_notes(vector[4000:], fs))
+
+    def test_event_timing(self):
+        ''' Check that notes start on the sample they are pressed, even when there
+            are lots of presses in a single block '''
+        fs = 44100
+        n_samples = 2**15
+        self.generator = 'sine'
+        self.set_adsr(0.001, 0.01, 0, 0.01, fs)
+        chord = [48, 55, 60, 64, 67, 72, 76, 79]
+        for first_press in [0, 1, 200, 1000]:
+            with self.subTest(f'{first_press=}'):
+                presses = [first_press + 13*i for i in range(len(chord))]
+                vector = self.run_synth(presses, chord, [], [], n_samples, fs)
+                self.assertTrue(np.all(vector[:first_press] == 0))
+                self.assertNotEqual(0, vector[first_press])
+                self.assertEqual(chord, self.find_notes(vector, fs))
+
     def play_notes(self):
         ''' Play a series of notes, show a spectrogram, save as a wav '''
         sampling_frequency = 44100
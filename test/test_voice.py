@@ -3,7 +3,7 @@
 import ctypes
 import unittest
 
-from test.constants import sampling_frequency, sampling_frequencies
+from test.constants import block_size, sampling_frequency, sampling_frequencies
 from test.test_envelope import EnvelopeInterface
 from test.test_oscillator import OscillatorInterface
 
@@ -14,11 +14,19 @@ import scipy.signal as sig
 
 generators = {'sine': 0,
               'blit': 1,
-              'bp_blit': 2}
+              'bp_blit': 2,
+              'sawtooth': 3,
+              'square': 4,
+              'triangle': 5,
+              'wavetable': 6}
 
 upper_frequencies = {'sine': 0.5,
                      'blit': 0.4,
-                     'bp_blit': 0.2}
+                     'bp_blit': 0.2,
+                     'sawtooth': 0.4,
+                     'square': 0.2,
+                     'triangle': 0.2,
+                     'wavetable': 0.4}
 
 class VoiceInterface(EnvelopeInterface, OscillatorInterface):
     ''' Interface class for voice module '''
@@ -44,6 +52,20 @@ class VoiceInterface(EnvelopeInterface, OscillatorInterface):
                                                ctypes.c_uint, uint_pointer,
                                                ctypes.c_uint, ctypes.c_float,
                                                float_pointer]
+        # steps, freqs, gens, eager, fs, out
+        self.testlib.test_voice_setup.argtypes = [ctypes.c_uint, float_pointer, uint_pointer,
+                                                  ctypes.c_bool, ctypes.c_float, float_pointer]
+
+    def run_voice_setup(self, freqs: list, gens: list, eager: bool, fs: float) -> np.ndarray:
+        ''' A block per entry of freqs (pressed if it isn't 0) and gens (the generator to run) '''
+        float_pointer = ctypes.POINTER(ctypes.c_float)
+        out = np.zeros(len(freqs)*block_size, dtype=np.single)
+        freqs = np.array(freqs, dtype=np.single)
+        gens = np.array(gens, dtype=np.uintc)
+        self.testlib.test_voice_setup(len(freqs), freqs.ctypes.data_as(float_pointer),
+                                      gens.ctypes.data_as(ctypes.POINTER(ctypes.c_uint)),
+                                      eager, fs, out.ctypes.data_as(float_pointer))
+        return out
 
     def run_voice_module(self, presses: list, releases: list, n_samples: int, fs: float) -> np.ndarray:
         ''' Run the Voice. Output is a float'''
@@ -80,6 +102,24 @@ class TestVoice(VoiceInterface, unittest.TestCase):
         ''' Run the implementation for the test '''
         return self.run_voice_module(presses, releases, n_samples, fs)
 
+    def test_generator_setup(self):
+        ''' Setting a generator up when it first runs should sound the same as setting them all up on each press,
+            even for one that sat out the notes in between '''
+        fs = 44100
+        notes = [220, 330, 440, 262, 600]
+        for gen, value in generators.items():
+            with self.subTest(gen):
+                freqs = []
+                gens = []
+                # switched to half way through every other note
+                for i, note in enumerate(notes):
+                    freqs += [note/fs] + [0]*19
+                    gens += [0]*10 + [value if i % 2 == 0 else 0]*10
+                lazy = self.run_voice_setup(freqs, gens, False, fs)
+                eager = self.run_voice_setup(freqs, gens, True, fs)
+                # the same, to within the rounding of the oscillators' phase adjustments
+                np.testing.assert_allclose(lazy, eager, rtol=0, atol=1e-4)
+
     def test_envelope(self):
         ''' Check that the envelope is being applied '''
         for fs in sampling_frequencies:
@@ -123,7 +163,7 @@ class TestVoice(VoiceInterface, unittest.TestCase):
         ''' Check the frequency of the voice '''
         n_samples = self.calculate_length(self.freq_precision)
         self.set_adsr(0.001, 0.01, 1, 0.01, sampling_frequency)
-        for gen in ['sine', 'blit', 'bp_blit']:
+        for gen in generators:
             self.generator = gen
             for freq in self.test_notes:
                 self.set_f(freq, sampling_frequency)
@@ -166,6 +206,7 @@ def main():
     voice_test = TestVoice()
     voice_test.setUp()
     # voice_test.debug = True
+    voice_test.test_generator_setup()
     voice_test.test_envelope()
     voice_test.test_frequency()
 
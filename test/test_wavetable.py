@@ -0,0 +1,115 @@
+''' Tests for the wavetable oscillator
+    copyright Maximilian Cornwell 2024 '''
+import ctypes
+import unittest
+
+from test.constants import sampling_frequency
+from test.test_blit import to_db
+
+import matplotlib.pyplot as plt
+import numpy as np
+import scipy.signal as sig
+
+
+table_size = 2048
+mip_levels = 10
+max_harmonics = table_size//4
+
+
+class WavetableInterface:
+    ''' Interface for wavetable functions '''
+    testlib = ctypes.CDLL('test.so')
+
+    def setUp(self):
+        ''' Load in the test object file and define the function '''
+        float_pointer = ctypes.POINTER(ctypes.c_float)
+        self.testlib.test_wavetable.argtypes = [float_pointer, ctypes.c_float, ctypes.c_uint]
+        self.testlib.test_wavetable_level.argtypes = [float_pointer, ctypes.c_uint]
+
+    def run_wavetable(self, freq: float, num_samples: int) -> np.ndarray:
+        ''' wrapper around wavetable test function '''
+        out = np.zeros(num_samples, dtype=np.single)
+        p_out = out.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+        self.testlib.test_wavetable(p_out, freq/sampling_frequency, len(out))
+        return out
+
+    def run_level(self, level: int) -> np.ndarray:
+        ''' Get a level of the sawtooth tables '''
+        out = np.zeros(table_size, dtype=np.single)
+        p_out = out.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+        self.testlib.test_wavetable_level(p_out, level)
+        return out
+
+
+class TestWavetable(WavetableInterface, unittest.TestCase):
+    ''' Test class for the wavetable oscillator '''
+    debug = False
+    test_freqs = 440*2**((np.arange(21, 128, 4)-69)/12)
+
+    def test_levels(self):
+        ''' Each level should be a sawtooth with half the harmonics of the one before '''
+        k = np.arange(1, table_size//2)
+        for level in range(mip_levels):
+            with self.subTest(f'{level=}'):
+                spectrum = np.fft.rfft(self.run_level(level))[1:table_size//2]/(table_size/2)
+                harmonics = max_harmonics >> level
+                expected = np.where(k <= harmonics, 2/(np.pi*k), 0)
+                np.testing.assert_allclose(-spectrum.imag, expected, atol=1e-6)
+                np.testing.assert_allclose(spectrum.real, 0, atol=1e-6)
+
+    def test_frequency(self):
+        ''' Test the fundamental and the harmonic spacing '''
+        num_samples = 2**14
+        for freq in self.test_freqs:
+            if freq < 0.4*sampling_frequency:
+                with self.subTest(f'{freq=:.2f}'):
+                    vector = self.run_wavetable(freq, num_samples)
+                    fdomain = to_db(np.fft.rfft(vector*sig.windows.hann(num_samples)))
+                    freqs = np.arange(1+num_samples//2)*sampling_frequency/num_samples
+                    peaks, _  = sig.find_peaks(fdomain, height=np.max(fdomain)-60)
+                    resolution = sampling_frequency/num_samples
+                    self.assertAlmostEqual(freq, freqs[peaks[0]], delta=resolution)
+                    if len(peaks) > 1:
+                        self.assertAlmostEqual(freq, np.mean(np.diff(freqs[peaks])), delta=0.01*freq)
+
+    def test_aliasing(self):
+        ''' Everything away from the harmonics (aliasing and interpolation images) should be well below
+            the fundamental, and no harmonic above 0.4 fs should be generated '''
+        num_samples = 2**16
+        freqs = np.arange(1+num_samples//2)*sampling_frequency/num_samples
+        window = sig.windows.blackmanharris(num_samples)
+        for freq in self.test_freqs:
+            if freq < 0.4*sampling_frequency:
+                with self.subTest(f'{freq=:.2f}'):
+                    vector = self.run_wavetable(freq, num_samples)
+                    fdomain = to_db(np.fft.rfft(vector*window))
+                    fdomain -= np.max(fdomain)
+                    # distance to the nearest harmonic, in bins
+                    harmonic = freqs/freq
+                    distance = np.abs(harmonic - np.round(harmonic))*freq*num_samples/sampling_frequency
+                    harmonic_bins = (distance < 8) & (np.round(harmonic) >= 1) & (freqs < 0.4*sampling_frequency)
+                    if self.debug:
+                        _, axf = plt.subplots()
+                        axf.plot(freqs, fdomain, label='Spectrum')
+                        axf.plot(freqs[~harmonic_bins], fdomain[~harmonic_bins], ls='', marker='.',
+                                 label='Away from harmonics')
+                        axf.grid(True)
+                        axf.legend()
+                        axf.set_xlabel('Frequency')
+                        axf.set_ylabel('Magnitude (dB)')
+                        axf.set_title(f'Wavetable ({freq:.2f} Hz)')
+                        plt.show()
+                    self.assertLess(np.max(fdomain[~harmonic_bins]), -60)
+
+
+def main():
+    ''' For Debugging/Testing '''
+    wavetable_test = TestWavetable()
+    wavetable_test.setUp()
+    # wavetable_test.debug = True
+    wavetable_test.test_levels()
+    wavetable_test.test_frequency()
+    wavetable_test.test_aliasing()
+
+if __name__=='__main__':
+    main()